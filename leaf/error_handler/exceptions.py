@@ -106,4 +106,13 @@ class InterpreterError(LEAFError):
     """
     def __init__(self, reason: str,severity: SeverityLevel=SeverityLevel.INFO):
         message = f"Error within the interpreter: {reason}."
-        super().__init__(message,severity)
\ No newline at end of file
+        super().__init__(message,severity)
+
+class BufferEvictionError(LEAFError):
+    """
+    Buffered messages were evicted to keep a buffer within its caps.
+    """
+    def __init__(self, reason: str,output_module: Any=None,severity: SeverityLevel=SeverityLevel.INFO) -> None:
+        message = f"Buffered messages were evicted: {reason}."
+        super().__init__(message,severity)
+        self.client = output_module
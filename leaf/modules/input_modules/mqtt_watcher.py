@@ -19,11 +19,19 @@ from leaf.error_handler.error_holder import ErrorHolder
 from leaf.error_handler.exceptions import AdapterBuildError, LEAFError
 from leaf.error_handler.exceptions import ClientUnreachableError
 from leaf.error_handler.exceptions import SeverityLevel
+from leaf.utility.mqtt_connection import SharedMQTTConnection
+from leaf.utility.mqtt_connection import acquire_connection
+from leaf.utility.mqtt_connection import release_connection
+from leaf.utility.reconnect import ConnectionState
+from leaf.utility.reconnect import ReconnectScheduler
+from leaf.utility.reconnect import reconnect_paho_client
 
 FIRST_RECONNECT_DELAY = 1
 RECONNECT_RATE = 2
 MAX_RECONNECT_COUNT = 12
-MAX_RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 60
+# Fraction of each reconnect delay that is randomised.
+RECONNECT_JITTER = 0.5
 
 logger = get_logger(__name__, log_file="input_module.log")
 
@@ -43,7 +51,8 @@ class MQTTEventWatcher(EventWatcher):
                  transport: Literal["tcp", "websockets", "unix"] = "tcp",
                  tls: bool = False,
                  callbacks: Optional[List[Callable]] = None, 
-                 error_holder: Optional[ErrorHolder] = None) -> None:
+                 error_holder: Optional[ErrorHolder] = None,
+                 shared_connection: bool = False) -> None:
 
         super().__init__(metadata_manager, callbacks=callbacks, 
                          error_holder=error_holder)
@@ -75,19 +84,29 @@ class MQTTEventWatcher(EventWatcher):
             self._username = username
             self._password = password
 
-        self.client = mqtt.Client(
-            callback_api_version=CallbackAPIVersion.VERSION2,
-            client_id=clientid,
-            protocol=self._protocol,
-            transport=transport,
-        )
+        self._transport = transport
+        self._shared_connection = shared_connection
+        self._connection: Optional[SharedMQTTConnection] = None
+        self.connection_state = ConnectionState()
+        self._reconnector: Optional[ReconnectScheduler] = None
+        # A shared client is taken from the connection on start.
+        self.client: Optional[mqtt.Client] = None
+        if not shared_connection:
+            self.client = mqtt.Client(
+                callback_api_version=CallbackAPIVersion.VERSION2,
+                client_id=clientid,
+                protocol=self._protocol,
+                transport=transport,
+                # Reconnects are scheduled by on_disconnect.
+                reconnect_on_failure=False,
+            )
 
-        self.client.on_connect = self.on_connect
-        self.client.on_connect_fail = self.on_connect_fail
-        self.client.on_disconnect = self.on_disconnect
-        self.client.on_message = self.on_message
+            self.client.on_connect = self.on_connect
+            self.client.on_connect_fail = self.on_connect_fail
+            self.client.on_disconnect = self.on_disconnect
+            self.client.on_message = self.on_message
 
-        if tls:
+        if tls and self.client is not None:
             try:
                 self.client.tls_set()
                 self.client.tls_insecure_set(True)
@@ -113,6 +132,11 @@ class MQTTEventWatcher(EventWatcher):
         """
         super().start()
         try:
+            if self._shared_connection:
+                self._start_shared()
+                return
+            if self.client is None:
+                return
             if self._username and self._password:
                 self.client.username_pw_set(self._username, 
                                             self._password)
@@ -129,11 +153,45 @@ class MQTTEventWatcher(EventWatcher):
                     f"Error connecting to broker: {e}", 
                     output_module=self))
 
+    def _start_shared(self) -> None:
+        """
+        Join the shared connection for this broker and credentials.
+        Subscriptions are made by the connection once it is open and
+        renewed after the connection reconnects.
+        """
+        if self._connection is None:
+            self._connection = acquire_connection(
+                self,
+                self._broker,
+                self._port,
+                self._username,
+                self._password,
+                self._protocol,
+                self._transport,
+                self._tls,
+                on_connect=self.on_connect,
+                on_disconnect=self.on_disconnect,
+                on_message=self.on_message,
+            )
+            self.client = self._connection.client
+        self._connection.connect(self)
+        for topic in self._topic_event_map.keys():
+            self.subscribe(topic)
+
     def stop(self) -> None:
         """
         Disconnect from the MQTT broker and stop the threaded loop.
         """
         try:
+            if self._shared_connection:
+                if self._connection is not None:
+                    release_connection(self._connection, self)
+                    self._connection = None
+                return
+            if self._reconnector is not None:
+                self._reconnector.cancel()
+            if self.client is None:
+                return
             if self.client.is_connected():
                 self.client.disconnect()
                 time.sleep(0.5)
@@ -179,7 +237,10 @@ class MQTTEventWatcher(EventWatcher):
             str: The subscribed topic.
         """
         logger.debug(f"Subscribing to {topic}")
-        self.client.subscribe(topic)
+        if self._connection is not None:
+            self._connection.subscribe(self, topic)
+        elif self.client is not None:
+            self.client.subscribe(topic)
         return topic
 
     def unsubscribe(self, topic: str) -> str:
@@ -193,7 +254,10 @@ class MQTTEventWatcher(EventWatcher):
             str: The unsubscribed topic.
         """
 
-        self.client.unsubscribe(topic)
+        if self._connection is not None:
+            self._connection.unsubscribe(self, topic)
+        elif self.client is not None:
+            self.client.unsubscribe(topic)
         return topic
     
     def on_connect(
@@ -215,6 +279,16 @@ class MQTTEventWatcher(EventWatcher):
             rc (int): The connection result code.
             metadata (Optional[Any]): Additional metadata (if any).
         """
+        if rc == 0:
+            outage = self.connection_state.set_connected()
+            if self._reconnector is not None:
+                self._reconnector.connected()
+            if outage is not None:
+                logger.info(f"Connection to {self._broker} restored after {outage:.1f}s.")
+                if not self._shared_connection:
+                    # A clean session loses its subscriptions.
+                    for topic in self._topic_event_map.keys():
+                        self.subscribe(topic)
         if rc != 0:
             error_messages = {
                 1: "Unacceptable protocol version",
@@ -272,21 +346,34 @@ class MQTTEventWatcher(EventWatcher):
             rc (int): The disconnection result code.
             properties (Optional[Any]): Additional metadata (if any).
         """
-        if rc != mqtt.MQTT_ERR_SUCCESS:
-            reconnect_count, reconnect_delay = 0, FIRST_RECONNECT_DELAY
-            while reconnect_count < MAX_RECONNECT_COUNT:
-                time.sleep(reconnect_delay)
-                try:
-                    client.reconnect()
-                    return
-                except Exception:
-                    reconnect_delay = min(
-                        reconnect_delay * RECONNECT_RATE, MAX_RECONNECT_DELAY
-                    )
-                    reconnect_count += 1
-            self._handle_exception(
-                ClientUnreachableError("Failed to reconnect.", output_module=self)
-            )
+        self.connection_state.set_disconnected(outage=rc != mqtt.MQTT_ERR_SUCCESS)
+        if rc != mqtt.MQTT_ERR_SUCCESS and not self._shared_connection:
+            if self._reconnector is None:
+                self._reconnector = ReconnectScheduler(
+                    lambda: reconnect_paho_client(self.client),
+                    lambda: self._handle_exception(ClientUnreachableError(
+                        "Failed to reconnect.", output_module=self)),
+                    first_delay=FIRST_RECONNECT_DELAY,
+                    multiplier=RECONNECT_RATE,
+                    max_delay=MAX_RECONNECT_DELAY,
+                    max_attempts=MAX_RECONNECT_COUNT,
+                    jitter=RECONNECT_JITTER,
+                    name=f"MQTTReconnect-{self._broker}",
+                )
+            # Returns straight away so paho's network thread isn't held up.
+            self._reconnector.schedule()
+
+    def wait_for_connection(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the client is connected to the broker.
+
+        Args:
+            timeout (Optional[float]): Maximum seconds to wait, None waits forever.
+
+        Returns:
+            bool: True if connected, False if the wait timed out.
+        """
+        return self.connection_state.wait_connected(timeout)
 
     def is_connected(self) -> bool:
         """
@@ -295,4 +382,4 @@ class MQTTEventWatcher(EventWatcher):
         Returns:
             bool: True if the client is connected, False otherwise.
         """
-        return self.client.is_connected()
+        return self.client is not None and self.client.is_connected()
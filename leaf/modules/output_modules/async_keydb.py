@@ -0,0 +1,734 @@
+import asyncio
+import itertools
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Coroutine, NamedTuple, Optional
+
+import redis
+from redis import asyncio as aioredis
+
+from leaf.error_handler.error_holder import ErrorHolder
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.error_handler.exceptions import ClientUnreachableError
+from leaf.modules.output_modules.keydb import BACKLOG_INDEX_KEY
+from leaf.modules.output_modules.keydb import DRAIN_CHUNK_SIZE
+from leaf.modules.output_modules.keydb import age_index_key
+from leaf.modules.output_modules.keydb import bytes_index_key
+from leaf.modules.output_modules.keydb import decode_message
+from leaf.modules.output_modules.keydb import describe_redis_error
+from leaf.modules.output_modules.keydb import encode_message
+from leaf.modules.output_modules.keydb import payload_size
+from leaf.modules.output_modules.output_module import OutputModule
+from leaf.utility.async_bridge import AsyncBridge
+from leaf.utility.async_bridge import acquire_bridge
+from leaf.utility.async_bridge import release_bridge
+from leaf.utility.logger.logger_utils import get_logger
+from leaf.utility.serializers import get_serializer
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+DEFAULT_MAX_CONNECTIONS = 16
+DEFAULT_QUEUE_SIZE = 10000
+# Messages written per pipeline by the writer task.
+WRITE_CHUNK_SIZE = 500
+# Seconds synchronous calls wait for KeyDB.
+REQUEST_TIMEOUT = 5
+CONNECT_TIMEOUT = 2
+
+
+class PoolKey(NamedTuple):
+    """
+    Identifies connection pools that can be shared.
+    """
+    host: str
+    port: int
+    db: int
+
+
+_pools: dict[PoolKey, aioredis.ConnectionPool] = {}
+_pool_users: dict[PoolKey, set[int]] = {}
+_pools_lock = threading.Lock()
+
+
+def _acquire_pool(user: object, key: PoolKey,
+                  max_connections: int) -> aioredis.ConnectionPool:
+    """
+    Get the connection pool of a server, creating it for the first user.
+    Pools belong to the bridge loop, every connection is opened there.
+
+    Args:
+        user (object): The module that will use the pool.
+        key (PoolKey): The server and database.
+        max_connections (int): Size of a new pool.
+
+    Returns:
+        aioredis.ConnectionPool: The pool.
+    """
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = aioredis.ConnectionPool(
+                host=key.host, port=key.port, db=key.db,
+                max_connections=max_connections,
+                socket_connect_timeout=CONNECT_TIMEOUT,
+            )
+            _pools[key] = pool
+            _pool_users[key] = set()
+            logger.info(f"Opened KeyDB connection pool to {key.host}:{key.port}, DB: {key.db}")
+        _pool_users[key].add(id(user))
+        return pool
+
+
+def _release_pool(user: object, key: PoolKey) -> Optional[aioredis.ConnectionPool]:
+    """
+    Unregister a user of a pool.
+
+    Args:
+        user (object): The module that used the pool.
+        key (PoolKey): The server and database.
+
+    Returns:
+        Optional[aioredis.ConnectionPool]: The pool if this was its
+            last user, for the caller to disconnect.
+    """
+    with _pools_lock:
+        users = _pool_users.get(key)
+        if users is None:
+            return None
+        users.discard(id(user))
+        if users:
+            return None
+        del _pool_users[key]
+        return _pools.pop(key)
+
+
+class AsyncKEYDB(OutputModule):
+    """
+    A KeyDB output built on the asyncio Redis client. Requests run on
+    a shared event loop thread (see leaf.utility.async_bridge) with a
+    connection pool per server shared by every instance in the process.
+
+    transmit never waits on KeyDB, it queues the message and returns.
+    A writer task on the loop takes everything queued and writes it in
+    one transactional pipeline, an RPUSH per key plus the backlog index
+    updates, so messages are stored exactly as the KEYDB output stores
+    them and either module can replay them. Messages that can't be
+    queued or written go to the fallback.
+
+    Reads have a synchronous form for the OutputModule interface and
+    an awaitable one, transmit_async, retrieve_async, pop_async and
+    pop_all_messages_async, for adapters running in an event loop.
+    Only list storage is supported.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 6379,
+        db: int = 0,
+        fallback: Optional[OutputModule] = None,
+        error_holder: Optional[ErrorHolder] = None,
+        serializer: str = "json",
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        backlog_key: str = BACKLOG_INDEX_KEY,
+    ) -> None:
+        """
+        Initialize the module, connections are opened when first used.
+
+        Args:
+            host (str): The KeyDB server hostname or IP address.
+            port (int): The port for KeyDB connection (default is 6379).
+            db (int): The database number to connect to (default is 0).
+            fallback (Optional[OutputModule]): Fallback module to use
+                     if KeyDB operations fail.
+            error_holder (Optional[ErrorHolder]): Optional error holder
+                         for tracking errors.
+            serializer (str): Value encoding, see leaf.utility.serializers.
+            max_connections (int): Size of the connection pool, taken from
+                         the first module connecting to the server.
+            queue_size (int): Messages that can wait for the writer before
+                         transmit hands them to the fallback.
+            backlog_key (str): Key of the backlog index hash.
+        """
+        super().__init__(fallback=fallback, error_holder=error_holder)
+        if not isinstance(max_connections, int) or max_connections <= 0:
+            raise AdapterBuildError("KeyDB max_connections must be a positive integer.")
+        if not isinstance(queue_size, int) or queue_size <= 0:
+            raise AdapterBuildError("KeyDB queue_size must be a positive integer.")
+        self._serializer = get_serializer(serializer)
+        self.host: str = host
+        self.port: int = port
+        self.db: int = db
+        self._max_connections: int = max_connections
+        self._queue_size: int = queue_size
+        self._backlog_key: str = backlog_key
+        self._bytes_key: str = bytes_index_key(backlog_key)
+        self._backlog_checked: bool = False
+
+        # (topic, payload, fallback data) waiting for the writer.
+        self._queue: deque[tuple[str, Any, Any]] = deque()
+        self._bridge: Optional[AsyncBridge] = None
+        self._client: Optional[aioredis.Redis] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task[None]] = None
+        # Held while writing so pipelines land in order.
+        self._write_lock: Optional[asyncio.Lock] = None
+        self.connect()
+
+    def _handle_redis_error(self, exception: redis.RedisError) -> None:
+        """
+        Report a Redis error through the error handler.
+
+        Args:
+            exception (redis.RedisError): The Redis exception that occurred.
+        """
+        message, severity = describe_redis_error(exception, self.host, self.port)
+        try:
+            self._handle_exception(
+                ClientUnreachableError(message, output_module=self, severity=severity)
+            )
+        except ClientUnreachableError as e:
+            # Without an error holder the error would be raised on the loop.
+            if self._bridge is None or not self._bridge.in_loop():
+                raise
+            logger.error(str(e))
+
+    def _redis(self) -> Any:
+        """
+        Returns:
+            Any: The client, untyped like the pipelines, as redis-py
+                 types its commands for the sync client too.
+
+        Raises:
+            redis.ConnectionError: If the output isn't connected.
+        """
+        if self._client is None:
+            raise redis.ConnectionError("Not connected to KeyDB.")
+        return self._client
+
+    def connect(self) -> None:
+        """
+        Attach to the shared event loop and connection pool and start
+        the writer task.
+        """
+        if self._client is not None:
+            return
+        self._bridge = acquire_bridge(self)
+        pool = _acquire_pool(self, PoolKey(self.host, self.port, self.db),
+                             self._max_connections)
+        self._client = aioredis.Redis(connection_pool=pool)
+        self._bridge.run(self._start_writer())
+        logger.info(f"Connected to KeyDB server at {self.host}:{self.port}, DB: {self.db}")
+
+    async def _start_writer(self) -> None:
+        """
+        Create the writer task, on the bridge loop.
+        """
+        self._wakeup = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self._writer = asyncio.create_task(self._write_loop(self._wakeup))
+
+    def disconnect(self) -> None:
+        """
+        Write what is queued, stop the writer and release the
+        connection pool and event loop.
+        """
+        bridge = self._bridge
+        if self._client is None or bridge is None:
+            logger.info("Already disconnected from KeyDB.")
+            return
+        try:
+            bridge.run(self._stop_writer(), REQUEST_TIMEOUT)
+        except (RuntimeError, TimeoutError) as e:
+            logger.warning(f"Failed to stop the KeyDB writer: {e}")
+        client, self._client = self._client, None
+        pool = _release_pool(self, PoolKey(self.host, self.port, self.db))
+        if pool is not None:
+            try:
+                bridge.run(pool.disconnect(), REQUEST_TIMEOUT)
+            except (RuntimeError, TimeoutError) as e:
+                logger.warning(f"Failed to close the KeyDB pool: {e}")
+        self._bridge = None
+        release_bridge(self)
+        # Whatever could not be written before stopping.
+        for topic, _, data in self._take_queued(len(self._queue)):
+            self.fallback(topic, data)
+        logger.info("Disconnected from KeyDB.")
+
+    async def _stop_writer(self) -> None:
+        """
+        Write everything queued, then cancel the writer task.
+        """
+        await self._flush_queue()
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+
+    def is_connected(self) -> bool:
+        """
+        Check if the KeyDB server answers a PING.
+
+        Returns:
+            bool: True if connected, False otherwise.
+        """
+        bridge = self._bridge
+        if self._client is None or bridge is None:
+            return False
+        try:
+            return bool(bridge.run(self._redis().ping(), REQUEST_TIMEOUT))
+        except (redis.RedisError, OSError) as e:
+            logger.debug(f"KeyDB at {self.host}:{self.port} is unreachable: {e}")
+            return False
+
+    async def is_connected_async(self) -> bool:
+        """
+        Awaitable form of is_connected.
+
+        Returns:
+            bool: True if connected, False otherwise.
+        """
+        bridge = self._bridge
+        if self._client is None or bridge is None:
+            return False
+        try:
+            return bool(await bridge.run_async(self._redis().ping()))
+        except (redis.RedisError, OSError) as e:
+            logger.debug(f"KeyDB at {self.host}:{self.port} is unreachable: {e}")
+            return False
+
+    def transmit(self, topic: str, data: Optional[Any] = None) -> bool:
+        """
+        Queue a message for the writer task, without waiting on KeyDB.
+
+        Args:
+            topic (str): The key name under which the data will be stored.
+            data (Optional[Any]): The data to append to the list in KeyDB.
+
+        Returns:
+            bool: True if queued, otherwise the result of the fallback.
+        """
+        return self._guarded_transmit(self._transmit, topic, data)
+
+    def _transmit(self, topic: str, data: Optional[Any] = None) -> bool:
+        """
+        Transmit a message, see transmit.
+        """
+        encoded = encode_message(self._serializer, data)
+        if encoded is None:
+            return False
+        payload, data = encoded
+        wakeup, bridge = self._wakeup, self._bridge
+        if self._client is None or wakeup is None or bridge is None \
+                or len(self._queue) >= self._queue_size:
+            return self.fallback(topic, data)
+        self._queue.append((topic, payload, data))
+        # Read outside the loop, the writer clears the event before
+        # taking the queue so a message is never left behind.
+        if not wakeup.is_set():
+            bridge.loop.call_soon_threadsafe(wakeup.set)
+        return True
+
+    async def transmit_async(self, topic: str, data: Optional[Any] = None) -> bool:
+        """
+        Write a message to KeyDB and wait for it to be stored.
+
+        Args:
+            topic (str): The key name under which the data will be stored.
+            data (Optional[Any]): The data to append to the list in KeyDB.
+
+        Returns:
+            bool: True if stored, otherwise the result of the fallback.
+        """
+        encoded = encode_message(self._serializer, data)
+        if encoded is None:
+            return False
+        payload, data = encoded
+        bridge = self._bridge
+        if self._client is not None and bridge is not None:
+            batch = [(topic, payload, data)]
+            if await bridge.run_async(self._write_batch(batch, fallback=False)):
+                return True
+        return await asyncio.to_thread(self.fallback, topic, data)
+
+    def _take_queued(self, count: int) -> list[tuple[str, Any, Any]]:
+        """
+        Take up to count queued messages.
+
+        Args:
+            count (int): Maximum number of messages.
+
+        Returns:
+            list[tuple[str, Any, Any]]: The messages, oldest first.
+        """
+        taken: list[tuple[str, Any, Any]] = []
+        while self._queue and len(taken) < count:
+            taken.append(self._queue.popleft())
+        return taken
+
+    async def _write_loop(self, wakeup: asyncio.Event) -> None:
+        """
+        Writer task body, writes the queue in pipelines whenever
+        messages are added. Errors are logged so the task keeps running.
+
+        Args:
+            wakeup (asyncio.Event): Set when messages are queued.
+        """
+        while True:
+            await wakeup.wait()
+            wakeup.clear()
+            try:
+                await self._flush_queue()
+            except Exception as e:
+                logger.error(f"Failed to write queued messages to KeyDB: {e}")
+
+    async def _flush_queue(self) -> None:
+        """
+        Write everything queued, WRITE_CHUNK_SIZE messages per pipeline,
+        after any write already under way.
+        """
+        if self._write_lock is None:
+            return
+        async with self._write_lock:
+            while self._queue:
+                await self._write_batch(self._take_queued(WRITE_CHUNK_SIZE))
+
+    async def _write_batch(self, batch: list[tuple[str, Any, Any]],
+                           fallback: bool = True) -> bool:
+        """
+        Write messages in one transactional pipeline, an RPUSH per key
+        and the matching backlog index update.
+
+        Args:
+            batch (list[tuple[str, Any, Any]]): Topic, payload and
+                  fallback data of each message, oldest first.
+            fallback (bool): Hand the messages to the fallback if the
+                  write fails.
+
+        Returns:
+            bool: True if written.
+        """
+        topics: dict[str, list[Any]] = {}
+        for topic, payload, _ in batch:
+            topics.setdefault(topic, []).append(payload)
+        try:
+            async with self._redis().pipeline(transaction=True) as pipeline:
+                for topic, payloads in topics.items():
+                    pipeline.rpush(topic, *payloads)
+                    pipeline.hincrby(self._backlog_key, topic, len(payloads))
+                    pipeline.hincrby(self._bytes_key, topic,
+                                     sum(payload_size(p) for p in payloads))
+                await pipeline.execute()
+            logger.debug(f"Wrote {len(batch)} messages to {len(topics)} keys in KeyDB.")
+            OutputModule.reset_failure_count()
+            return True
+        except (redis.RedisError, OSError) as e:
+            if not isinstance(e, redis.RedisError):
+                e = redis.ConnectionError(str(e))
+            self._handle_redis_error(e)
+        if fallback:
+            # Fallbacks are synchronous, keep them off the loop.
+            await asyncio.to_thread(self._fallback_batch, batch)
+        return False
+
+    def _fallback_batch(self, batch: list[tuple[str, Any, Any]]) -> None:
+        """
+        Hand messages that couldn't be written to the fallback.
+
+        Args:
+            batch (list[tuple[str, Any, Any]]): The messages.
+        """
+        for topic, _, data in batch:
+            self.fallback(topic, data)
+
+    def flush_writes(self, timeout: Optional[float] = REQUEST_TIMEOUT) -> None:
+        """
+        Wait until every queued message has been written.
+
+        Args:
+            timeout (Optional[float]): Maximum seconds to wait.
+        """
+        if self._client is not None and self._bridge is not None:
+            self._bridge.run(self._flush_queue(), timeout)
+
+    def _call(self, request: Callable[[], Coroutine[Any, Any, Any]], default: Any) -> Any:
+        """
+        Run a request on the bridge for a synchronous caller.
+
+        Args:
+            request (Callable[[], Coroutine[Any, Any, Any]]): Makes the coroutine.
+            default (Any): Returned if not connected or the request fails.
+
+        Returns:
+            Any: The request's result.
+        """
+        bridge = self._bridge
+        if self._client is None or bridge is None:
+            return default
+        try:
+            return bridge.run(request(), REQUEST_TIMEOUT)
+        except redis.RedisError as e:
+            self._handle_redis_error(e)
+        except (OSError, TimeoutError) as e:
+            self._handle_redis_error(redis.ConnectionError(str(e)))
+        return default
+
+    async def _call_async(self, request: Callable[[], Coroutine[Any, Any, Any]],
+                          default: Any) -> Any:
+        """
+        Await a request run on the bridge.
+
+        Args:
+            request (Callable[[], Coroutine[Any, Any, Any]]): Makes the coroutine.
+            default (Any): Returned if not connected or the request fails.
+
+        Returns:
+            Any: The request's result.
+        """
+        bridge = self._bridge
+        if self._client is None or bridge is None:
+            return default
+        try:
+            return await bridge.run_async(request())
+        except redis.RedisError as e:
+            self._handle_redis_error(e)
+        except OSError as e:
+            self._handle_redis_error(redis.ConnectionError(str(e)))
+        return default
+
+    async def _take(self, key: str, count: int) -> list[Any]:
+        """
+        Take up to count messages from the head of a key and update
+        the backlog index in the same transaction, correcting it once
+        the key is drained. The key is watched so a write in between
+        makes the take retry.
+
+        Args:
+            key (str): The key.
+            count (int): Maximum number of messages.
+
+        Returns:
+            list[Any]: The decoded messages, oldest first.
+        """
+        async def take(pipeline: Any) -> list[bytes]:
+            messages: list[bytes] = await pipeline.lrange(key, 0, count - 1)
+            pipeline.multi()
+            if messages:
+                pipeline.ltrim(key, len(messages), -1)
+                pipeline.hincrby(self._backlog_key, key, -len(messages))
+                pipeline.hincrby(self._bytes_key, key, -sum(len(m) for m in messages))
+            return messages
+
+        messages = await self._redis().transaction(take, key, value_from_callable=True)
+        if len(messages) < count:
+            await self._reconcile_backlog(key)
+        return [decode_message(self._serializer, m) for m in messages]
+
+    async def _reconcile_backlog(self, key: str) -> None:
+        """
+        Set the index count of a key to its length, see KEYDB.
+
+        Args:
+            key (str): The key.
+        """
+        async def update(pipeline: Any) -> None:
+            size = await pipeline.llen(key)
+            pipeline.multi()
+            if size:
+                pipeline.hset(self._backlog_key, key, size)
+            else:
+                pipeline.hdel(self._backlog_key, key)
+                pipeline.hdel(self._bytes_key, key)
+                pipeline.delete(age_index_key(self._backlog_key, key))
+
+        await self._redis().transaction(update, key)
+
+    async def _backlog_topics(self) -> dict[str, int]:
+        """
+        HSCAN the backlog index, checking it against the stored keys
+        before the first replay.
+
+        Returns:
+            dict[str, int]: Message counts of the keys with messages.
+        """
+        if not self._backlog_checked:
+            keys = {key async for key in self._redis().scan_iter(
+                count=DRAIN_CHUNK_SIZE, _type="list")}
+            keys.update([topic async for topic, _ in self._redis().hscan_iter(
+                self._backlog_key, count=DRAIN_CHUNK_SIZE)])
+            for key in keys:
+                await self._reconcile_backlog(key.decode("utf-8"))
+            self._backlog_checked = True
+        topics = {}
+        async for topic, count in self._redis().hscan_iter(self._backlog_key,
+                                                           count=DRAIN_CHUNK_SIZE):
+            if int(count) > 0:
+                topics[topic.decode("utf-8")] = int(count)
+        return topics
+
+    async def _get_backlog(self, topic: str) -> int:
+        """
+        HGET the index count of a key.
+
+        Args:
+            topic (str): The key.
+
+        Returns:
+            int: Number of messages buffered under the key, 0 if none.
+        """
+        count = await self._redis().hget(self._backlog_key, topic)
+        return max(int(count), 0) if count else 0
+
+    async def _drained(self, topics: Optional[dict[str, int]] = None) -> Optional[tuple[str, Any]]:
+        """
+        Take the oldest message of the first key in the backlog.
+
+        Args:
+            topics (Optional[dict[str, int]]): Keys to try, the backlog
+                   index if not given.
+
+        Returns:
+            Optional[tuple[str, Any]]: The key and the parsed value, or None.
+        """
+        for key in topics if topics is not None else await self._backlog_topics():
+            messages = await self._take(key, 1)
+            if messages:
+                message = messages[0]
+                if isinstance(message, str):
+                    message = self._serializer.loads(message)
+                return key, message
+        return None
+
+    def retrieve(self, key: str) -> Optional[Any]:
+        """
+        Remove and return the oldest value of a key.
+
+        Args:
+            key (str): The key name.
+
+        Returns:
+            Optional[Any]: The value as a UTF-8 string (decoded object
+                           for binary serializers), or None if not found.
+        """
+        messages = self._call(lambda: self._take(key, 1), [])
+        return messages[0] if messages else None
+
+    async def retrieve_async(self, key: str) -> Optional[Any]:
+        """
+        Awaitable form of retrieve.
+        """
+        messages = await self._call_async(lambda: self._take(key, 1), [])
+        return messages[0] if messages else None
+
+    def retrieve_many(self, key: str, count: Optional[int] = None) -> list[Any]:
+        """
+        Remove and return up to count values of a key in one transaction.
+
+        Args:
+            key (str): The key name.
+            count (Optional[int]): Maximum number of values to take,
+                                   DRAIN_CHUNK_SIZE if not given.
+
+        Returns:
+            list[Any]: The values, decoded as by retrieve, empty if none.
+        """
+        messages: list[Any] = self._call(lambda: self._take(key, count or DRAIN_CHUNK_SIZE), [])
+        return messages
+
+    def get_backlog(self, topic: str) -> int:
+        """
+        Number of messages buffered under a key, from the backlog index.
+
+        Args:
+            topic (str): The key.
+
+        Returns:
+            int: The number of messages, 0 if none or not connected.
+        """
+        count: int = self._call(lambda: self._get_backlog(topic), 0)
+        return count
+
+    def get_backlog_topics(self) -> dict[str, int]:
+        """
+        Every key holding messages and its count, from the backlog index.
+
+        Returns:
+            dict[str, int]: Message counts by key.
+        """
+        topics: dict[str, int] = self._call(self._backlog_topics, {})
+        return topics
+
+    def pop(self, key: Optional[str] = None) -> Optional[tuple[str, Any]]:
+        """
+        Retrieve and remove the oldest record of a key, or of a key
+        taken from the backlog index if none is given.
+
+        Args:
+            key (Optional[str]): The key of the record to retrieve and remove.
+
+        Returns:
+            Optional[tuple[str, Any]]: A tuple of the key and the retrieved
+                                       value, or None if there is none.
+        """
+        topics = {key: 1} if key is not None else None
+        record: Optional[tuple[str, Any]] = self._call(lambda: self._drained(topics), None)
+        return record
+
+    async def pop_async(self, key: Optional[str] = None) -> Optional[tuple[str, Any]]:
+        """
+        Awaitable form of pop.
+        """
+        topics = {key: 1} if key is not None else None
+        record: Optional[tuple[str, Any]] = await self._call_async(
+            lambda: self._drained(topics), None)
+        return record
+
+    def pop_all_messages(self) -> Any:
+        """
+        Yield every buffered message, draining each key listed in the
+        backlog index in chunks of DRAIN_CHUNK_SIZE, followed by those
+        of the fallback.
+
+        Yields:
+            tuple[str, Any]: Key and decoded value.
+        """
+        if self._client is not None:
+            self._call(self._flush_queue, None)
+            for key in self.get_backlog_topics():
+                while True:
+                    messages = self.retrieve_many(key, DRAIN_CHUNK_SIZE)
+                    for message in messages:
+                        yield key, message
+                    if len(messages) < DRAIN_CHUNK_SIZE:
+                        break
+        if self._fallback is not None:
+            yield from self._fallback.pop_all_messages()
+
+    async def pop_all_messages_async(self) -> AsyncIterator[tuple[str, Any]]:
+        """
+        Async generator form of pop_all_messages, the fallback's
+        messages are read off the event loop.
+
+        Yields:
+            tuple[str, Any]: Key and decoded value.
+        """
+        if self._client is not None:
+            await self._call_async(self._flush_queue, None)
+            for key in await self._call_async(self._backlog_topics, {}):
+                while True:
+                    messages = await self._call_async(
+                        lambda: self._take(key, DRAIN_CHUNK_SIZE), [])
+                    for message in messages:
+                        yield key, message
+                    if len(messages) < DRAIN_CHUNK_SIZE:
+                        break
+        if self._fallback is not None:
+            remaining = self._fallback.pop_all_messages()
+            while True:
+                chunk = await asyncio.to_thread(
+                    lambda: list(itertools.islice(remaining, DRAIN_CHUNK_SIZE)))
+                for message in chunk:
+                    yield message
+                if len(chunk) < DRAIN_CHUNK_SIZE:
+                    break
@@ -1,22 +1,119 @@
 import json
 import os
 import random
+import time
 from typing import Any
+from typing import Iterable
 from typing import Optional
 from typing import Union
+from typing import cast
 from leaf.modules.output_modules.output_module import OutputModule
 from leaf.error_handler.error_holder import ErrorHolder
+from leaf.error_handler.exceptions import AdapterBuildError
 from leaf.error_handler.exceptions import ClientUnreachableError
 from leaf.error_handler.exceptions import SeverityLevel
+from leaf.utility.durability import FileSyncer
+from leaf.utility.durability import atomic_write
+from leaf.utility.durability import build_fsync_policy
+from leaf.utility.journal import DEFAULT_COMPACT_INTERVAL
+from leaf.utility.journal import DEFAULT_COMPACT_THRESHOLD
+from leaf.utility.journal import DEFAULT_SEGMENT_AGE
+from leaf.utility.journal import DEFAULT_SEGMENT_BYTES
+from leaf.utility.journal import Journal
+from leaf.utility.journal import JournalRecord
+from leaf.utility.logger.logger_utils import get_logger
+from leaf.utility.serializers import get_serializer
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+STORAGE_MODES = ("document", "journal")
+# Records consumed at once while draining a journal.
+DRAIN_CHUNK_SIZE = 500
 
 
 class FILE(OutputModule):
+    """
+    Buffers messages on disk. In document storage the file is one
+    JSON object of topic -> messages, rewritten on every change. In
+    journal storage filename is a directory of append-only newline
+    delimited segments, so transmitting is a single append however
+    much is buffered and the messages are streamed back out in the
+    order they were written. Each segment has an index of its topics
+    so the messages of one topic are read with seeks, and segments
+    left mostly consumed by draining single topics are compacted in
+    the background.
+
+    Journal records carry a checksum, and with atomic_writes documents
+    are replaced atomically, so a crash loses at most the records that
+    hadn't been written yet. How often writes are forced to disk is
+    set by the fsync policy, in document storage the interval policy
+    syncs the first write after the interval has passed.
+    """
     def __init__(self, filename: str, fallback: Optional[OutputModule] = None, 
-                 error_holder: Optional[ErrorHolder] = None) -> None:
+                 error_holder: Optional[ErrorHolder] = None,
+                 serializer: str = "json",
+                 storage: str = "document",
+                 segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 segment_age: float = DEFAULT_SEGMENT_AGE,
+                 fsync: Union[str, dict[str, Any]] = "never",
+                 atomic_writes: bool = False,
+                 compact_threshold: float = DEFAULT_COMPACT_THRESHOLD,
+                 compact_interval: float = DEFAULT_COMPACT_INTERVAL) -> None:
+        """
+        Initialise the FILE output.
+
+        Args:
+            filename (str): The JSON file, or the journal directory.
+            fallback (Optional[OutputModule]): Output used when writing fails.
+            error_holder (Optional[ErrorHolder]): Error tracking mechanism.
+            serializer (str): Name of a text serializer.
+            storage (str): "document" or "journal".
+            segment_bytes (int): Size at which a journal segment is rotated.
+            segment_age (float): Seconds after which a journal segment is rotated.
+            fsync (Union[str, dict[str, Any]]): The fsync mode, "never",
+                   "always", "every" or "interval", or a mapping with the
+                   mode and its records or interval.
+            atomic_writes (bool): Write the JSON document to a temporary
+                   file and rename it over the document, so a crash never
+                   leaves it half written. The document is rewritten in
+                   place by default.
+            compact_threshold (float): Fraction of consumed bytes at which
+                   a rotated journal segment is compacted.
+            compact_interval (float): Seconds between journal compaction runs.
+        """
         super().__init__(fallback=fallback, error_holder=error_holder)
         self.filename = filename
+        # The file is a single JSON document, so only JSON serializers fit.
+        self._serializer = get_serializer(serializer)
+        if self._serializer.binary:
+            raise AdapterBuildError(
+                f"FILE output can't use the binary serializer '{serializer}'."
+            )
+        if storage not in STORAGE_MODES:
+            raise AdapterBuildError(
+                f"Unknown FILE storage '{storage}', expected one of "
+                f"{', '.join(STORAGE_MODES)}."
+            )
+        for name, value in (("segment_bytes", segment_bytes), ("segment_age", segment_age),
+                            ("compact_interval", compact_interval)):
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+                raise AdapterBuildError(f"FILE {name} must be a positive number.")
+        if not isinstance(compact_threshold, (int, float)) or isinstance(compact_threshold, bool) \
+                or not 0 < compact_threshold <= 1:
+            raise AdapterBuildError("FILE compact_threshold must be between 0 and 1.")
+        fsync_policy = build_fsync_policy(fsync)
+        self._syncer = FileSyncer(fsync_policy)
+        self._atomic_writes = atomic_writes
+        self._journal: Optional[Journal] = None
+        if storage == "journal":
+            self._journal = Journal(filename, self._serializer,
+                                    max_segment_bytes=segment_bytes,
+                                    max_segment_age=segment_age,
+                                    fsync=fsync_policy,
+                                    compact_threshold=compact_threshold,
+                                    compact_interval=compact_interval)
 
-    def _handle_file_error(self, error) -> None:
+    def _handle_file_error(self, error: Exception) -> None:
         """
         Handles file-related exceptions consistently 
         with a structured error message.
@@ -41,20 +138,121 @@ class FILE(OutputModule):
                                                       output_module=self,
                                                       severity=severity))
 
-    def transmit(self, topic: str, data: Optional[Union[str, dict]] = None) -> bool:
+    def _write_document(self, file_data: dict[str, Any]) -> None:
+        """
+        Replace the JSON document. With atomic_writes the new version
+        is written next to it and renamed over it, so a crash never
+        leaves it half written.
+
+        Args:
+            file_data (dict[str, Any]): The topics and their messages.
+        """
+        # FILE only takes text serializers.
+        content = cast(str, self._serializer.dumps(file_data, pretty=True))
+        sync = self._syncer.record()
+        if self._atomic_writes:
+            atomic_write(self.filename, content, sync=sync)
+        else:
+            with open(self.filename, 'w') as f:
+                f.write(content)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        if sync:
+            self._syncer.synced()
+
+    def _quarantine(self) -> None:
+        """
+        Move an unreadable JSON document aside instead of overwriting
+        it, so the messages it holds can still be recovered by hand.
+        """
+        corrupt = f"{self.filename}.corrupt-{int(time.time())}"
+        logger.warning(f"'{self.filename}' isn't valid JSON, moving it to "
+                       f"'{corrupt}' and starting a new file.")
+        os.replace(self.filename, corrupt)
+
+    def transmit(self, topic: str, data: Optional[Union[str, dict[str, Any]]] = None) -> bool:
         """
         Transmit data to the file associated with a specific topic.
         """
+        return self._guarded_transmit(self._transmit, topic, data)
+
+    def _transmit(self, topic: str, data: Optional[Union[str, dict[str, Any]]] = None) -> bool:
+        """
+        Transmit a message, see transmit.
+        """
+        if self._journal is not None:
+            return self._append(self._journal, topic, data)
         try:
-            if os.path.exists(self.filename):
-                with open(self.filename, 'r') as f:
-                    try:
-                        file_data = json.load(f)
-                    except json.JSONDecodeError:
-                        file_data = {}
-            else:
+            self._update_document([(topic, data)])
+            return True
+
+        except (OSError, IOError, json.JSONDecodeError) as e:
+            self._handle_file_error(e)
+            return self.fallback(topic, data)
+
+    def transmit_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Transmit several messages with a single journal append, or a
+        single rewrite of the JSON document.
+
+        Args:
+            messages (Iterable[tuple[str, Any]]): Topics and data.
+
+        Returns:
+            bool: True if the messages were stored here or in the fallback.
+        """
+        return self._guarded_transmit_many(self._transmit_many, messages)
+
+    def _transmit_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Transmit several messages, see transmit_many.
+        """
+        messages = list(messages)
+        if self._journal is not None:
+            records = [(topic, data) for topic, data in messages if data is not None]
+            if not records:
+                return True
+            try:
+                self._journal.append_many(records)
+                OutputModule.reset_failure_count()
+                return True
+            except (OSError, TypeError, ValueError) as e:
+                self._handle_file_error(e)
+                return self.fallback_many(records)
+        if not messages:
+            return True
+        try:
+            self._update_document(messages)
+            return True
+        except (OSError, IOError, json.JSONDecodeError) as e:
+            self._handle_file_error(e)
+            return self.fallback_many(messages)
+
+    def _update_document(self, messages: list[tuple[str, Any]]) -> None:
+        """
+        Add messages to the JSON document, reading and replacing it once.
+
+        Args:
+            messages (list[tuple[str, Any]]): Topics and data, a topic
+                      is added without a message for None.
+
+        Raises:
+            OSError: If the document can't be read or written.
+        """
+        if os.path.exists(self.filename):
+            with open(self.filename, 'r') as f:
+                try:
+                    file_data = self._serializer.loads(f.read())
+                except json.JSONDecodeError:
+                    file_data = None
+            if file_data is None:
+                self._quarantine()
                 file_data = {}
+        else:
+            file_data = {}
 
+        for topic, data in messages:
             if topic in file_data:
                 if not isinstance(file_data[topic], list):
                     file_data[topic] = [file_data[topic]]
@@ -64,25 +262,65 @@ class FILE(OutputModule):
             if data is not None:
                 file_data[topic].append(data)
 
-            with open(self.filename, 'w') as f:
-                json.dump(file_data, f, indent=4)
-            # Reset global failure counter on successful transmission
+        self._write_document(file_data)
+        # Reset global failure counter on successful transmission
+        OutputModule.reset_failure_count()
+
+    def _append(self, journal: Journal, topic: str, data: Optional[Union[str, dict[str, Any]]]) -> bool:
+        """
+        Append a message to the journal.
+
+        Args:
+            journal (Journal): The output's journal.
+            topic (str): The message topic.
+            data (Optional[Union[str, dict[str, Any]]]): The message, nothing is written for None.
+
+        Returns:
+            bool: True if the message was stored here or in the fallback.
+        """
+        if data is None:
+            return True
+        try:
+            journal.append(topic, data)
             OutputModule.reset_failure_count()
             return True
-
-        except (OSError, IOError, json.JSONDecodeError) as e:
+        except (OSError, TypeError, ValueError) as e:
             self._handle_file_error(e)
             return self.fallback(topic, data)
 
+    def _take(self, journal: Journal, topic: Optional[str] = None,
+              limit: Optional[int] = 1) -> list[JournalRecord]:
+        """
+        Remove the oldest messages from the journal.
+
+        Args:
+            journal (Journal): The output's journal.
+            topic (Optional[str]): Only take messages of this topic.
+            limit (Optional[int]): Maximum number of messages, None for all.
+
+        Returns:
+            list[JournalRecord]: The records, empty on error.
+        """
+        try:
+            return journal.take(topic, limit)
+        except OSError as e:
+            self._handle_file_error(e)
+            return []
+
     def retrieve(self, topic: str) -> Any | None:
         """
-        Retrieve data associated with a specific topic.
+        Retrieve data associated with a specific topic. In journal
+        storage the oldest message of the topic is removed and returned,
+        as the fallback drainers of other outputs expect.
         """
+        if self._journal is not None:
+            records = self._take(self._journal, topic)
+            return records[0].data if records else None
         try:
             if os.path.exists(self.filename):
                 with open(self.filename, 'r') as f:
                     try:
-                        file_data = json.load(f)
+                        file_data = self._serializer.loads(f.read())
                     except json.JSONDecodeError as e:
                         self._handle_file_error(e)
                         return None
@@ -95,12 +333,13 @@ class FILE(OutputModule):
             self._handle_file_error(e)
             return None
     
-    def pop(self, key: str = None) -> tuple[str, Any] | None:
+    def pop(self, key: Optional[str] = None) -> tuple[str, Any] | None:
         """
         Retrieve and remove a record from the file. 
         If a specific key is provided, retrieve and remove all values under that key.
         If no key is provided, retrieve and remove one element from a random key's list.
-        The key is removed when the last element is taken.
+        The key is removed when the last element is taken. In journal
+        storage the oldest record is taken instead of a random one.
 
         Args:
             key (Optional[str]): The key of the record to retrieve and remove. 
@@ -111,13 +350,20 @@ class FILE(OutputModule):
                                     or None if the key does not exist or the 
                                     file is empty.
         """
+        if self._journal is not None:
+            records = self._take(self._journal, key, None if key is not None else 1)
+            if not records:
+                return None
+            if key is not None:
+                return key, [record.data for record in records]
+            return records[0].topic, records[0].data
         try:
             if not os.path.exists(self.filename):
                 return None
 
             with open(self.filename, 'r') as f:
                 try:
-                    file_data = json.load(f)
+                    file_data = self._serializer.loads(f.read())
                 except json.JSONDecodeError as e:
                     self._handle_file_error(e)
                     return None
@@ -125,8 +371,7 @@ class FILE(OutputModule):
             if key is not None:
                 if key in file_data:
                     values = file_data.pop(key)
-                    with open(self.filename, 'w') as f:
-                        json.dump(file_data, f, indent=4)
+                    self._write_document(file_data)
                     return key, values
                 else:
                     return None
@@ -147,14 +392,65 @@ class FILE(OutputModule):
                 popped_value = values
                 file_data.pop(random_key)
 
-            with open(self.filename, 'w') as f:
-                json.dump(file_data, f, indent=4)
+            self._write_document(file_data)
             return random_key, popped_value
 
         except (OSError, IOError, json.JSONDecodeError) as e:
             self._handle_file_error(e)
             return None
     
+    def _document_topics(self) -> list[str]:
+        """
+        Returns:
+            list[str]: The topics in the JSON document, in the order
+                       they were first written, empty on error.
+        """
+        try:
+            if not os.path.exists(self.filename):
+                return []
+            with open(self.filename, 'r') as f:
+                return list(self._serializer.loads(f.read()))
+        except (OSError, json.JSONDecodeError) as e:
+            self._handle_file_error(e)
+            return []
+
+    def pop_all_messages(self) -> Any:
+        """
+        Yield all messages held by the module and its fallback. The
+        journal is streamed and the messages are consumed in chunks
+        once they have been yielded. The JSON document is drained a
+        topic at a time, oldest message first, rewriting it once per
+        topic rather than once per message.
+
+        Yields:
+            tuple[str, Any]: The topic and message.
+        """
+        if self._journal is None:
+            for topic in self._document_topics():
+                popped = self.pop(topic)
+                if popped is None:
+                    continue
+                values = popped[1]
+                for value in values if isinstance(values, list) else [values]:
+                    yield topic, value
+            if self._fallback is not None:
+                yield from self._fallback.pop_all_messages()
+            return
+        consumed = []
+        try:
+            with self._journal.reading():
+                for record in self._journal.records():
+                    yield record.topic, record.data
+                    consumed.append(record)
+                    if len(consumed) >= DRAIN_CHUNK_SIZE:
+                        self._journal.consume(consumed)
+                        consumed = []
+                self._journal.consume(consumed)
+        except OSError as e:
+            self._handle_file_error(e)
+        if self._fallback is not None:
+            yield from self._fallback.pop_all_messages()
+
     def is_connected(self) -> bool:
         """
         Check if the FILE module is always connected.
@@ -172,7 +468,8 @@ class FILE(OutputModule):
         
     def disconnect(self) -> None:
         """
-        Disconnect method for FILE module (no-op as files are always accessible).
+        Disconnect method for FILE module, closes the journal's open segment.
         """
-        pass
+        if self._journal is not None:
+            self._journal.close()
 
@@ -0,0 +1,548 @@
+import gzip
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Iterable, Optional
+
+import httpx
+from paho.mqtt.client import topic_matches_sub
+
+from leaf.error_handler.error_holder import ErrorHolder
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.error_handler.exceptions import ClientUnreachableError
+from leaf.error_handler.exceptions import SeverityLevel
+from leaf.modules.output_modules.output_module import OutputModule
+from leaf.utility.batching import MessageBatcher
+from leaf.utility.batching import build_batch_policies
+from leaf.utility.logger.logger_utils import get_logger
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+# Status codes worth retrying, anything else below 200 or from 300 fails at once.
+RETRY_STATUS = (408, 425, 429, 500, 502, 503, 504)
+# Time allowed to send what is batched and queued when the output disconnects.
+DRAIN_TIMEOUT = 5
+
+
+class _Request:
+    """
+    A batch of messages bound for one endpoint.
+    """
+
+    def __init__(self, url: str, messages: list[tuple[str, Any]]) -> None:
+        self.url = url
+        self.messages = messages
+
+
+class HTTP(OutputModule):
+    """
+    Posts messages to REST ingestion endpoints. Messages are batched
+    per endpoint and each batch is sent as one JSON array of
+    {"topic", "data"} objects, gzip compressed by default, over a
+    pooled keep-alive client shared by a fixed number of sender
+    threads, which bounds the requests in flight.
+
+    A request that fails with a connection error, a timeout or a
+    status such as 429 or 503 is retried with exponential backoff,
+    honouring Retry-After. Once the retries are used up, or on any
+    other error status, the batch goes to the fallback and the
+    failure is reported.
+
+    Topics are routed to endpoints by MQTT topic filters, the first
+    that matches wins and url takes the rest::
+
+        OUTPUTS:
+          - plugin: HTTP
+            url: https://ingest.example.org/leaf
+            endpoints:
+              "+/+/+/experiment/+/measurement/#": https://ingest.example.org/points
+            headers:
+              Authorization: Bearer ...
+            batch:
+              max_count: 500
+              max_linger_ms: 1000
+            fallback: KEYDB
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        fallback: Optional[OutputModule] = None,
+        error_holder: Optional[ErrorHolder] = None,
+        endpoints: Optional[dict[str, str]] = None,
+        headers: Optional[dict[str, str]] = None,
+        batch: Optional[dict[str, Any]] = None,
+        compress: bool = True,
+        http2: bool = False,
+        timeout: float = 10.0,
+        max_concurrency: int = 4,
+        queue_size: int = 100,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ) -> None:
+        """
+        Initialize the HTTP output.
+
+        Args:
+            url (Optional[str]): Endpoint of the topics no endpoints
+                       filter matches.
+            fallback (Optional[OutputModule]): Fallback module taking the
+                     batches that can't be delivered.
+            error_holder (Optional[ErrorHolder]): Optional error holder
+                         for tracking errors.
+            endpoints (Optional[dict[str, str]]): Endpoints keyed by MQTT
+                       topic filter.
+            headers (Optional[dict[str, str]]): Headers sent with every request.
+            batch (Optional[dict[str, Any]]): max_count, max_bytes and
+                   max_linger_ms of the batch of an endpoint.
+            compress (bool): gzip the request bodies.
+            http2 (bool): Use HTTP/2, which needs the h2 package.
+            timeout (float): Seconds allowed for each request.
+            max_concurrency (int): Requests in flight at once, and the
+                       size of the connection pool.
+            queue_size (int): Batches waiting for a sender before new
+                       ones go to the fallback.
+            max_retries (int): Retries of a failed request.
+            backoff (float): Seconds before the first retry, doubled
+                     after each one.
+            max_backoff (float): Longest wait between retries.
+        """
+        super().__init__(fallback=fallback, error_holder=error_holder)
+        if url is None and not endpoints:
+            raise AdapterBuildError("HTTP needs a url or endpoints.")
+        if endpoints is not None and not isinstance(endpoints, dict):
+            raise AdapterBuildError("HTTP endpoints must map topic filters to urls.")
+        for name, value in (("max_concurrency", max_concurrency),
+                            ("queue_size", queue_size)):
+            if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+                raise AdapterBuildError(f"HTTP {name} must be a positive integer.")
+        if not isinstance(max_retries, int) or isinstance(max_retries, bool) \
+                or max_retries < 0:
+            raise AdapterBuildError("HTTP max_retries must be a non-negative integer.")
+        for name, seconds in (("timeout", timeout), ("backoff", backoff),
+                              ("max_backoff", max_backoff)):
+            if not isinstance(seconds, (int, float)) or isinstance(seconds, bool) or seconds <= 0:
+                raise AdapterBuildError(f"HTTP {name} must be a positive number.")
+        if http2:
+            try:
+                import h2  # type: ignore # noqa: F401
+            except ImportError:
+                raise AdapterBuildError(
+                    "HTTP/2 needs the h2 package, install it with 'pip install httpx[http2]'."
+                )
+
+        self._url = url
+        self._endpoints = dict(endpoints or {})
+        self._route_cache: dict[str, Optional[str]] = {}
+        self._headers = {"Content-Type": "application/json", **(headers or {})}
+        if compress:
+            self._headers["Content-Encoding"] = "gzip"
+        self._compress = compress
+        self._http2 = http2
+        self._timeout = timeout
+        self._max_concurrency = max_concurrency
+        self._queue_size = queue_size
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        if batch is not None and "topics" in batch:
+            raise AdapterBuildError("HTTP batches are per endpoint, topics can't be given.")
+        self._batch_policy, _ = build_batch_policies(batch or {})
+
+        self._client: Optional[httpx.Client] = None
+        self._batcher: Optional[MessageBatcher] = None
+        self._requests: deque[_Request] = deque()
+        self._condition = threading.Condition()
+        self._workers: list[threading.Thread] = []
+        self._running = False
+        self._closing = threading.Event()
+        self._in_flight = 0
+        self._stats: dict[str, int] = {
+            "requests": 0,
+            "sent": 0,
+            "retries": 0,
+            "failed": 0,
+            "fallback": 0,
+            "raw_bytes": 0,
+            "sent_bytes": 0,
+        }
+        self.connect()
+
+    def connect(self) -> None:
+        """
+        Open the connection pool and start the sender threads.
+        """
+        with self._condition:
+            if self._client is not None:
+                return
+            self._client = httpx.Client(
+                http2=self._http2,
+                timeout=self._timeout,
+                limits=httpx.Limits(max_connections=self._max_concurrency,
+                                    max_keepalive_connections=self._max_concurrency),
+                headers=self._headers,
+            )
+            self._closing.clear()
+            self._running = True
+            self._batcher = MessageBatcher(self._enqueue, default=self._batch_policy,
+                                           name="HTTP-batcher",
+                                           on_error=self._batch_failed)
+            self._workers = [
+                threading.Thread(target=self._worker_loop, name=f"HTTP-sender-{i}",
+                                 daemon=True)
+                for i in range(self._max_concurrency)
+            ]
+            for worker in self._workers:
+                worker.start()
+        urls = sorted(set(self._endpoints.values()) | ({self._url} if self._url else set()))
+        logger.info(f"HTTP output posting to {', '.join(urls)}.")
+
+    def disconnect(self) -> None:
+        """
+        Send what is batched and queued, within DRAIN_TIMEOUT seconds,
+        then close the connection pool. Batches still queued after
+        that go to the fallback.
+        """
+        with self._condition:
+            batcher, self._batcher = self._batcher, None
+        if batcher is not None:
+            batcher.close()
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+            workers, self._workers = self._workers, []
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        for worker in workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        # Stop retrying, what is left is handed to the fallback.
+        self._closing.set()
+        for worker in workers:
+            worker.join()
+        with self._condition:
+            left = list(self._requests)
+            self._requests.clear()
+            client, self._client = self._client, None
+        for request in left:
+            self._to_fallback(request)
+        if client is not None:
+            client.close()
+            logger.info("Disconnected HTTP output.")
+
+    def is_connected(self) -> bool:
+        """
+        Returns:
+            bool: True while the connection pool is open.
+        """
+        return self._client is not None
+
+    def transmit(self, topic: str, data: Any = None) -> bool:
+        """
+        Add a message to the batch of its endpoint.
+
+        Args:
+            topic (str): The topic.
+            data (Any): The payload.
+
+        Returns:
+            bool: True if the message was batched or handed to the
+                  fallback, False otherwise.
+        """
+        return self.transmit_many([(topic, data)])
+
+    def transmit_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Add several messages to the batches of their endpoints.
+
+        Args:
+            messages (Iterable[tuple[str, Any]]): Topics and data.
+
+        Returns:
+            bool: True if every message was batched or handed to the
+                  fallback, False otherwise.
+        """
+        return self._guarded_transmit_many(self._transmit_many, messages)
+
+    def _transmit_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Transmit several messages, see transmit_many.
+        """
+        if not self.is_enabled():
+            logger.warning(
+                f"{self.__class__.__name__} - transmit called with module disabled."
+            )
+            return False
+        batched = True
+        queued = False
+        unrouted = []
+        for topic, data in messages:
+            url = self._route(topic)
+            batcher = self._batcher
+            if url is None:
+                logger.warning(f"No HTTP endpoint for {topic}.")
+                unrouted.append((topic, data))
+            elif batcher is not None and batcher.add(url, (topic, data)):
+                queued = True
+            else:
+                unrouted.append((topic, data))
+        if queued:
+            # The senders report whether the batches got through.
+            self._defer_outcome()
+        if unrouted:
+            batched = self.fallback_many(unrouted)
+        return batched
+
+    def _route(self, topic: str) -> Optional[str]:
+        """
+        Find the endpoint of a topic.
+
+        Args:
+            topic (str): The topic.
+
+        Returns:
+            Optional[str]: The url, None if no filter matches and
+                           there is no default url.
+        """
+        if topic in self._route_cache:
+            return self._route_cache[topic]
+        url = self._url
+        for pattern, endpoint in self._endpoints.items():
+            if topic_matches_sub(pattern, topic):
+                url = endpoint
+                break
+        self._route_cache[topic] = url
+        return url
+
+    def _enqueue(self, url: str, messages: list[tuple[str, Any]]) -> None:
+        """
+        Queue a flushed batch for the senders, or hand it to the
+        fallback when queue_size batches are already waiting.
+
+        Args:
+            url (str): The endpoint.
+            messages (list[tuple[str, Any]]): The topics and data.
+        """
+        request = _Request(url, messages)
+        with self._condition:
+            if self._running and len(self._requests) < self._queue_size:
+                self._requests.append(request)
+                self._condition.notify()
+                return
+        logger.warning(f"HTTP queue is full, {len(messages)} messages for "
+                       f"{url} handed to the fallback.")
+        self._to_fallback(request)
+
+    def _batch_failed(self, url: str, messages: list[tuple[str, Any]],
+                      error: Exception) -> None:
+        """
+        Batcher error callback, hands a batch that couldn't be queued
+        to the fallback.
+
+        Args:
+            url (str): The endpoint.
+            messages (list[tuple[str, Any]]): The topics and data.
+            error (Exception): Why it couldn't be queued.
+        """
+        self._to_fallback(_Request(url, messages))
+
+    def _worker_loop(self) -> None:
+        """
+        Sender thread body, posts queued batches until disconnected.
+        """
+        while True:
+            with self._condition:
+                while not self._requests and self._running:
+                    self._condition.wait()
+                if not self._requests:
+                    return
+                request = self._requests.popleft()
+                self._in_flight += 1
+            try:
+                self._background_send(self._deliver, request)
+            except Exception as e:
+                logger.error(f"HTTP output failed on {request.url}: {e}")
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+
+    def _deliver(self, request: _Request) -> None:
+        """
+        Post a batch, handing it to the fallback if it can't be delivered.
+
+        Args:
+            request (_Request): The batch.
+        """
+        try:
+            error = self._post(request)
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+        if error is not None:
+            self._fail(request, error)
+
+    def _post(self, request: _Request) -> Optional[str]:
+        """
+        Post a batch, retrying with backoff.
+
+        Args:
+            request (_Request): The batch.
+
+        Returns:
+            Optional[str]: None once delivered, otherwise why it wasn't.
+        """
+        body = self._encode(request)
+        if body is None:
+            return "messages can't be encoded as JSON"
+        attempt = 0
+        while True:
+            client = self._client
+            if client is None:
+                return "output disconnected"
+            retry_after = None
+            try:
+                response = client.post(request.url, content=body)
+                status = response.status_code
+                if 200 <= status < 300:
+                    with self._condition:
+                        self._stats["requests"] += 1
+                        self._stats["sent"] += len(request.messages)
+                        self._stats["sent_bytes"] += len(body)
+                    return None
+                error = f"status {status}"
+                retryable = status in RETRY_STATUS
+                retry_after = self._retry_after(response)
+            except httpx.HTTPError as e:
+                error = str(e) or e.__class__.__name__
+                retryable = isinstance(e, httpx.TransportError)
+            if not retryable or attempt >= self._max_retries or self._closing.is_set():
+                return error
+            delay = retry_after if retry_after is not None else \
+                min(self._backoff * 2 ** attempt, self._max_backoff)
+            attempt += 1
+            with self._condition:
+                self._stats["retries"] += 1
+            logger.debug(f"Retrying HTTP post to {request.url} in {delay:g}s: {error}")
+            if self._closing.wait(delay):
+                return error
+
+    def _fail(self, request: _Request, error: str) -> None:
+        """
+        Hand a batch that couldn't be delivered to the fallback and
+        report the failure.
+
+        Args:
+            request (_Request): The batch.
+            error (str): Why it wasn't delivered.
+        """
+        with self._condition:
+            self._stats["failed"] += 1
+        self._to_fallback(request)
+        self._handle_exception(ClientUnreachableError(
+            f"Failed to post {len(request.messages)} messages to {request.url}: {error}",
+            output_module=self,
+            severity=SeverityLevel.WARNING,
+        ))
+
+    def _encode(self, request: _Request) -> Optional[bytes]:
+        """
+        Encode a batch as a JSON array of {"topic", "data"} objects,
+        compressed if configured.
+
+        Args:
+            request (_Request): The batch.
+
+        Returns:
+            Optional[bytes]: The request body, None if it can't be encoded.
+        """
+        try:
+            body = json.dumps([{"topic": topic, "data": data}
+                               for topic, data in request.messages],
+                              separators=(",", ":")).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            logger.error(f"Can't encode messages for {request.url}: {e}")
+            return None
+        with self._condition:
+            self._stats["raw_bytes"] += len(body)
+        if self._compress:
+            body = gzip.compress(body, compresslevel=6)
+        return body
+
+    def _retry_after(self, response: httpx.Response) -> Optional[float]:
+        """
+        Read a Retry-After header given in seconds.
+
+        Args:
+            response (httpx.Response): The response.
+
+        Returns:
+            Optional[float]: The delay, capped at max_backoff, None
+                             if there is none.
+        """
+        value = response.headers.get("Retry-After")
+        try:
+            return min(max(float(value), 0.0), self._max_backoff) if value else None
+        except ValueError:
+            return None
+
+    def _to_fallback(self, request: _Request) -> None:
+        """
+        Hand an undelivered batch to the fallback.
+
+        Args:
+            request (_Request): The batch.
+        """
+        with self._condition:
+            self._stats["fallback"] += len(request.messages)
+        self.fallback_many(request.messages)
+
+    def flush(self, topic: str) -> None:
+        """
+        Send the pending batch of a topic's endpoint now.
+
+        Args:
+            topic (str): The topic.
+        """
+        url = self._route(topic)
+        batcher = self._batcher
+        if url is not None and batcher is not None:
+            batcher.flush(url)
+
+    def get_http_stats(self) -> dict[str, int]:
+        """
+        Report the requests that succeeded and the messages they
+        carried, the retries, the requests that failed for good,
+        the messages handed to the fallback, the bytes encoded and
+        sent after compression, and the batches queued and in flight.
+
+        Returns:
+            dict[str, int]: The counters.
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._requests)
+            stats["in_flight"] = self._in_flight
+        batcher = self._batcher
+        stats["batched"] = batcher.pending_count() if batcher is not None else 0
+        return stats
+
+    def subscribe(self, topic: str) -> None:
+        """
+        HTTP endpoints can't be subscribed to.
+
+        Args:
+            topic (str): Unused.
+        """
+        return None
+
+    def pop(self, key: Optional[str] = None) -> None:
+        """
+        Posted messages can't be popped, those that failed are
+        held by the fallback.
+
+        Args:
+            key (Optional[str]): Unused.
+
+        Returns:
+            None: Always.
+        """
+        return None
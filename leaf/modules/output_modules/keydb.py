@@ -1,18 +1,159 @@
 import json
+import math
+import socket
+import threading
+import time
+from collections import deque
 
-from typing import Optional, Any
+from typing import Iterable, Optional, Any
 
 import redis
-from redis.typing import ResponseT
 
 from leaf.error_handler.error_holder import ErrorHolder
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.error_handler.exceptions import BufferEvictionError
 from leaf.error_handler.exceptions import ClientUnreachableError
 from leaf.error_handler.exceptions import SeverityLevel
 from leaf.modules.output_modules.output_module import OutputModule
+from leaf.utility.batching import BatchPolicy
+from leaf.utility.batching import build_batch_policies
 from leaf.utility.logger.logger_utils import get_logger
+from leaf.utility.retention import RetentionPolicy
+from leaf.utility.retention import build_retention_policy
+from leaf.utility.serializers import Serializer
+from leaf.utility.serializers import get_serializer
+from leaf.utility.topic_classes import classify_topic
 
 logger = get_logger(__name__, log_file="output_module.log")
 
+# Messages taken per read or XREADGROUP when draining the buffer.
+DRAIN_CHUNK_SIZE = 500
+
+STORAGE_MODES = ("list", "stream")
+# Field of a stream entry holding the encoded message.
+STREAM_FIELD = b"d"
+# Hash of key -> number of buffered messages, kept up to date by
+# every write and read so the backlog is known without scanning.
+BACKLOG_INDEX_KEY = "leaf:backlog"
+# Width in seconds of the write time buckets that message ages are
+# tracked in, when a maximum age is configured.
+AGE_BUCKET_SECONDS = 60
+
+EVICTION_ACTIONS = {"drop_oldest": "dropped", "downsample": "downsampled",
+                    "spill": "spilled to the fallback"}
+
+
+def bytes_index_key(backlog_key: str) -> str:
+    """
+    Returns:
+        str: Key of the hash of key -> buffered bytes, in list storage.
+    """
+    return f"{backlog_key}:bytes"
+
+
+def order_marker_key(backlog_key: str) -> str:
+    """
+    Returns:
+        str: Key set once lists written newest first have been reordered,
+             kept apart from the index keys that a drain removes.
+    """
+    return f"leaf:list-order:{backlog_key}"
+
+
+def age_index_key(backlog_key: str, topic: str) -> str:
+    """
+    Returns:
+        str: Key of the hash of write time bucket -> messages of a topic.
+    """
+    return f"{backlog_key}:age:{topic}"
+
+
+def payload_size(payload: Any) -> int:
+    """
+    Returns:
+        int: Size in bytes of an encoded message as stored.
+    """
+    return len(payload.encode("utf-8")) if isinstance(payload, str) else len(payload)
+
+
+def encode_message(serializer: Serializer, data: Any) -> Optional[tuple[Any, Any]]:
+    """
+    Validate and encode a message for storage.
+
+    Args:
+        serializer (Serializer): The value encoding.
+        data (Any): A JSON string or a JSON compatible object.
+
+    Returns:
+        Optional[tuple[Any, Any]]: The encoded value and what to give
+            a fallback if it can't be stored, None if the data is invalid.
+    """
+    if data is None:
+        logger.warning("No data provided to transmit.")
+        return None
+    elif isinstance(data, str):
+        try:
+            # Validate JSON, text serializers store the string as it is.
+            if serializer.binary:
+                data = json.loads(data)
+            else:
+                serializer.loads(data)
+        except ValueError:
+            logger.error(f"Invalid JSON string: {data}")
+            return None
+    elif not isinstance(data, (dict, list, tuple, int, float, bool)):
+        logger.error(f"Unsupported data type: {type(data).__name__}")
+        return None
+
+    payload = serializer.encode(data)
+    if isinstance(payload, str):
+        # Fallbacks keep text payloads as stored, binary ones as the original data.
+        data = payload
+    return payload, data
+
+
+def decode_message(serializer: Serializer, message: bytes) -> Any:
+    """
+    Decode a stored message.
+
+    Args:
+        serializer (Serializer): The value encoding.
+        message (bytes): The stored value.
+
+    Returns:
+        Any: A UTF-8 string, or a decoded object for binary serializers.
+    """
+    if serializer.binary:
+        return serializer.loads(message)
+    return message.decode("utf-8")
+
+
+def describe_redis_error(exception: redis.RedisError, host: str,
+                         port: int) -> tuple[str, SeverityLevel]:
+    """
+    Describe a Redis error for the error holder.
+
+    Args:
+        exception (redis.RedisError): The Redis exception that occurred.
+        host (str): The KeyDB server.
+        port (int): The KeyDB port.
+
+    Returns:
+        tuple[str, SeverityLevel]: The message and its severity.
+    """
+    if isinstance(exception, redis.AuthenticationError):
+        return f"Authentication failed for KeyDB at {host}:{port}", SeverityLevel.CRITICAL
+    if isinstance(exception, redis.ConnectionError):
+        if "Network is unreachable" in str(exception):
+            return f"Network unreachable for KeyDB at {host}:{port}", SeverityLevel.ERROR
+        if "Connection refused" in str(exception):
+            return f"Connection refused for KeyDB at {host}:{port}", SeverityLevel.WARNING
+        return (f"Failed to connect to KeyDB at {host}:{port}: {str(exception)}",
+                SeverityLevel.CRITICAL)
+    if isinstance(exception, redis.TimeoutError):
+        return f"Connection to KeyDB at {host}:{port} timed out.", SeverityLevel.ERROR
+    return f"Redis error for KeyDB: {str(exception)}", SeverityLevel.WARNING
+
 
 class KEYDB(OutputModule):
     """
@@ -20,6 +161,38 @@ class KEYDB(OutputModule):
     server. This class provides methods to connect to KeyDB, transmit
     data, retrieve data, and handle errors consistently. If connection
     or transmission fails, a fallback module can be used if provided.
+    Values are encoded with the configured serializer, JSON strings
+    are stored as given. Each key holds a list that is appended to
+    at the tail and read from the head, so messages come back in the
+    order they were written. With batching enabled, writes are held and
+    flushed in one pipeline with a single multi-value RPUSH per key.
+
+    In stream storage each key is a Redis stream instead, appended to
+    with XADD (optionally trimmed to a maximum length) and read through
+    a consumer group. Entries are read ahead in chunks and only
+    acknowledged and deleted once the reader comes back for more, so
+    a message taken just before the process dies is delivered again
+    after a restart rather than lost.
+
+    Either way a backlog index, a hash of key to message count, is
+    updated in the same transaction as every write and by every read,
+    so the backlog of a topic is a single HGET and replay only visits
+    keys that hold messages. A key's count is corrected from its actual
+    length whenever it is drained. List storage also tracks the bytes
+    buffered per key.
+
+    Versions before the backlog index pushed to the head of each list,
+    newest first, and kept no index. On the first connect to a database
+    the part of every list that isn't counted in the index is reversed
+    in place and indexed, so those messages replay oldest first too and
+    pop() finds them. This is done once per database, an older version
+    still writing to it after the upgrade would mix the orders again.
+
+    With retention caps the buffer is checked every check_interval
+    seconds, and messages over a per-topic or total cap on count,
+    bytes or age are evicted oldest first. Total caps evict from
+    measurement topics first, largest first. Each eviction is counted
+    and reported to the error holder as a BufferEvictionError at INFO.
     """
 
     def __init__(
@@ -29,6 +202,15 @@ class KEYDB(OutputModule):
         db: int = 0,
         fallback: Optional[OutputModule] = None,
         error_holder: Optional[ErrorHolder] = None,
+        serializer: str = "json",
+        batch: Optional[dict[str, Any]] = None,
+        storage: str = "list",
+        stream_maxlen: Optional[int] = None,
+        stream_group: str = "leaf",
+        stream_consumer: Optional[str] = None,
+        backlog_key: str = BACKLOG_INDEX_KEY,
+        retention: Optional[dict[str, Any]] = None,
+        reorder_legacy_lists: bool = False,
     ) -> None:
         """
         Initialize the KEYDB adapter with KeyDB connection details and
@@ -42,12 +224,98 @@ class KEYDB(OutputModule):
                      if KeyDB operations fail.
             error_holder (Optional[ErrorHolder]): Optional error holder
                          for tracking errors.
+            serializer (str): Value encoding, see leaf.utility.serializers
+                         ("json", "fastjson", "msgpack" or "cbor").
+            batch (Optional[dict[str, Any]]): Hold writes and flush them in
+                         one pipeline once max_count messages or max_bytes
+                         are pending, or the oldest has waited max_linger_ms.
+                         Writes go straight to KeyDB when not given.
+            storage (str): "list" or "stream".
+            stream_maxlen (Optional[int]): Approximate number of entries a
+                         stream is trimmed to, unbounded if not given.
+            stream_group (str): Consumer group that replays the streams.
+            stream_consumer (Optional[str]): Name of this reader in the group,
+                         the host name by default. Must stay the same across
+                         restarts for unacknowledged entries to be redelivered.
+            backlog_key (str): Key of the backlog index hash.
+            retention (Optional[dict[str, Any]]): Caps on the buffer and the
+                         eviction policy, see leaf.utility.retention. List
+                         storage only, streams are capped with stream_maxlen.
+            reorder_legacy_lists (bool): Migrate lists written newest first
+                         by versions without a backlog index so they replay
+                         oldest first. Every list in the database is checked,
+                         so only enable it for a database used by LEAF alone.
+                         Runs once per database.
         """
         super().__init__(fallback=fallback, error_holder=error_holder)
+        self._serializer = get_serializer(serializer)
         self.host: str = host
         self.port: int = port
         self.db: int = db
         self._client: Optional[redis.StrictRedis] = None
+
+        if storage not in STORAGE_MODES:
+            raise AdapterBuildError(
+                f"Unknown KEYDB storage '{storage}', expected one of "
+                f"{', '.join(STORAGE_MODES)}."
+            )
+        if stream_maxlen is not None and (not isinstance(stream_maxlen, int)
+                                          or stream_maxlen <= 0):
+            raise AdapterBuildError("Stream maxlen must be a positive integer.")
+        self._storage: str = storage
+        self._stream_maxlen: Optional[int] = stream_maxlen
+        self._stream_group: str = stream_group
+        self._stream_consumer: str = stream_consumer or socket.gethostname()
+        self._stream_lock = threading.RLock()
+        # Keys whose consumer group exists.
+        self._stream_groups: set[str] = set()
+        # Keys whose entries left pending by an earlier run were read.
+        self._stream_recovered: set[str] = set()
+        # Entries read ahead but not yet handed out, per key.
+        self._stream_buffer: dict[str, deque[tuple[bytes, Any]]] = {}
+        # Entries handed out and waiting to be acknowledged, per key.
+        self._stream_unacked: dict[str, list[bytes]] = {}
+        self._backlog_key: str = backlog_key
+        self._bytes_key: str = bytes_index_key(backlog_key)
+        # Whether the index has been checked against the stored keys.
+        self._backlog_checked: bool = False
+        # Whether lists written newest first have been reordered,
+        # only checked when the migration is asked for.
+        self._order_checked: bool = not reorder_legacy_lists
+
+        self._retention: Optional[RetentionPolicy] = None
+        if retention is not None:
+            if storage != "list":
+                raise AdapterBuildError(
+                    "KEYDB retention needs list storage, cap streams with stream_maxlen."
+                )
+            self._retention = build_retention_policy(retention)
+        # topic -> cap -> messages evicted
+        self._evictions: dict[str, dict[str, int]] = {}
+        self._retention_lock = threading.Lock()
+        self._retention_condition = threading.Condition()
+        self._retention_thread: Optional[threading.Thread] = None
+        self._retention_running: bool = False
+
+        self._batch_policy: Optional[BatchPolicy] = None
+        if batch is not None:
+            self._batch_policy, topics = build_batch_policies(batch)
+            if topics is not None:
+                raise AdapterBuildError("KEYDB batches don't take per-topic options.")
+        # topic -> [(payload, fallback data)]
+        self._pending: dict[str, list[tuple[Any, Any]]] = {}
+        self._pending_count: int = 0
+        self._pending_bytes: int = 0
+        self._pending_deadline: Optional[float] = None
+        self._batch_condition = threading.Condition()
+        # Held while a batch is written so batches land in order.
+        self._flush_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        if self._batch_policy is not None:
+            self._flusher = threading.Thread(
+                target=self._linger_loop, name=f"KEYDBFlusher-{host}", daemon=True
+            )
+            self._flusher.start()
         self.connect()
 
     def _handle_redis_error(self, exception: redis.RedisError) -> None:
@@ -58,26 +326,7 @@ class KEYDB(OutputModule):
         Args:
             exception (redis.RedisError): The Redis exception that occurred.
         """
-        if isinstance(exception, redis.AuthenticationError):
-            message = f"Authentication failed for KeyDB at {self.host}:{self.port}"
-            severity = SeverityLevel.CRITICAL
-        elif isinstance(exception, redis.ConnectionError):
-            if "Network is unreachable" in str(exception):
-                message = f"Network unreachable for KeyDB at {self.host}:{self.port}"
-                severity = SeverityLevel.ERROR
-            elif "Connection refused" in str(exception):
-                message = f"Connection refused for KeyDB at {self.host}:{self.port}"
-                severity = SeverityLevel.WARNING
-            else:
-                message = f"Failed to connect to KeyDB at {self.host}:{self.port}: {str(exception)}"
-                severity = SeverityLevel.CRITICAL
-        elif isinstance(exception, redis.TimeoutError):
-            message = f"Connection to KeyDB at {self.host}:{self.port} timed out."
-            severity = SeverityLevel.ERROR
-        else:
-            message = f"Redis error for KeyDB: {str(exception)}"
-            severity = SeverityLevel.WARNING
-
+        message, severity = describe_redis_error(exception, self.host, self.port)
         self._handle_exception(
             ClientUnreachableError(message, output_module=self, severity=severity)
         )
@@ -94,6 +343,94 @@ class KEYDB(OutputModule):
             logger.info(f"Connected to KeyDB server at {self.host}:{self.port}, DB: {self.db}")
         except redis.RedisError as e:
             self._handle_redis_error(e)
+            return
+        self._start_retention()
+        self._reorder_legacy_lists()
+
+    def _start_retention(self) -> None:
+        """
+        Start the thread enforcing the retention caps, if retention
+        is configured and it isn't running.
+        """
+        if self._retention is None:
+            return
+        with self._retention_condition:
+            if self._retention_running:
+                return
+            self._retention_running = True
+            self._retention_thread = threading.Thread(
+                target=self._retention_loop, args=(self._retention,),
+                name=f"KEYDBRetention-{self.host}", daemon=True
+            )
+            self._retention_thread.start()
+
+    def _stop_retention(self) -> None:
+        """
+        Stop the thread enforcing the retention caps and wait for it to end.
+        """
+        with self._retention_condition:
+            self._retention_running = False
+            self._retention_condition.notify_all()
+            thread, self._retention_thread = self._retention_thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _reorder_legacy_lists(self) -> None:
+        """
+        Reverse the messages older versions pushed to the head of a
+        list, those not counted in the backlog index, and index them.
+        Only with reorder_legacy_lists, done once per database and tried
+        again before the first replay if the server can't be reached yet.
+        """
+        if self._storage != "list" or self._order_checked or self._client is None:
+            return
+        marker = order_marker_key(self._backlog_key)
+        try:
+            if self._client.get(marker):
+                self._order_checked = True
+                return
+            reordered = 0
+            for key in self._client.scan_iter(count=DRAIN_CHUNK_SIZE, _type="list"):
+                if isinstance(key, bytes):
+                    key = key.decode("utf-8")
+                reordered += self._reorder_legacy_list(key)
+            self._client.set(marker, "rpush")
+            self._order_checked = True
+            if reordered:
+                logger.info(f"Reordered {reordered} KeyDB messages written newest first.")
+        except redis.RedisError as e:
+            logger.warning(f"Can't check KeyDB lists for messages written newest first: {e}")
+
+    def _reorder_legacy_list(self, key: str) -> int:
+        """
+        Reverse the head of a list that isn't counted in the backlog
+        index. The key and index are watched so a write in between
+        makes the update retry.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            int: Number of messages reordered.
+        """
+        def update(pipeline: Any) -> int:
+            size: int = pipeline.llen(key)
+            counted = int(pipeline.hget(self._backlog_key, key) or 0)
+            legacy = size - max(counted, 0)
+            if legacy <= 0:
+                return 0
+            messages = pipeline.lrange(key, 0, legacy - 1)
+            pipeline.multi()
+            # LPUSH of the head, newest first, puts it back oldest first.
+            pipeline.ltrim(key, legacy, -1)
+            pipeline.lpush(key, *messages)
+            pipeline.hset(self._backlog_key, key, size)
+            pipeline.hincrby(self._bytes_key, key, sum(len(m) for m in messages))
+            return legacy
+
+        reordered: int = self._redis().transaction(update, key, self._backlog_key,
+                                                   value_from_callable=True)
+        return reordered
 
     def transmit(self, topic: str, data: Optional[Any] = None) -> bool:
         """
@@ -109,29 +446,29 @@ class KEYDB(OutputModule):
             bool: True if the data was successfully transmitted,
                 False if a fallback was used.
         """
-        if data is None:
-            logger.warning("No data provided to transmit.")
-            return False
-        elif isinstance(data, (dict, list, tuple, int, float, bool)):
-            data = json.dumps(data)
-        elif isinstance(data, str):
-            try:
-                # Validate JSON, then normalize as JSON string
-                parsed = json.loads(data)
-                data = json.dumps(parsed)
-            except json.JSONDecodeError:
-                logger.error(f"Invalid JSON string: {data}")
-                return False
-        else:
-            logger.error(f"Unsupported data type: {type(data).__name__}")
+        return self._guarded_transmit(self._transmit, topic, data)
+
+    def _transmit(self, topic: str, data: Optional[Any] = None) -> bool:
+        """
+        Transmit a message, see transmit.
+        """
+        encoded = encode_message(self._serializer, data)
+        if encoded is None:
             return False
+        payload, data = encoded
 
         if self._client is None:
             return self.fallback(topic, data)
 
+        if self._batch_policy is not None:
+            self._add_to_batch(self._batch_policy, topic, payload, data)
+            return True
+
         try:
-            self._client.lpush(topic, data)
-            logger.info(f"Pushed data to key '{topic}' in KeyDB {self._client} with {self._client.llen(topic)} rows.")
+            pipeline = self._client.pipeline(transaction=True)
+            self._write(pipeline, topic, [payload])
+            pipeline.execute()
+            logger.debug(f"Pushed data to key '{topic}' in KeyDB.")
             # Reset global failure counter on successful transmission
             OutputModule.reset_failure_count()
             return True
@@ -139,23 +476,561 @@ class KEYDB(OutputModule):
             self._handle_redis_error(e)
             return self.fallback(topic, data)
 
+    def transmit_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Transmit several messages in one pipeline, with a single
+        RPUSH per key in list storage. Messages keep their order per
+        key. With batching enabled they are added to the batch.
+
+        Args:
+            messages (Iterable[tuple[str, Any]]): Keys and data.
+
+        Returns:
+            bool: True if every message was written or stored by the
+                  fallback, False if any couldn't be encoded.
+        """
+        return self._guarded_transmit_many(self._transmit_many, messages)
+
+    def _transmit_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Transmit several messages, see transmit_many.
+        """
+        valid = True
+        grouped: dict[str, list[tuple[Any, Any]]] = {}
+        for topic, data in messages:
+            encoded = encode_message(self._serializer, data)
+            if encoded is None:
+                valid = False
+                continue
+            grouped.setdefault(topic, []).append(encoded)
+        if not grouped:
+            return valid
+
+        if self._batch_policy is not None and self._client is not None:
+            for topic, entries in grouped.items():
+                for payload, data in entries:
+                    self._add_to_batch(self._batch_policy, topic, payload, data)
+            return valid
+
+        try:
+            if self._client is None:
+                raise redis.ConnectionError("Not connected to KeyDB.")
+            pipeline = self._client.pipeline(transaction=True)
+            for topic, entries in grouped.items():
+                self._write(pipeline, topic, [payload for payload, _ in entries])
+            pipeline.execute()
+            logger.debug(f"Pushed messages to {len(grouped)} keys in KeyDB.")
+            OutputModule.reset_failure_count()
+            return valid
+        except redis.RedisError as e:
+            if self._client is not None:
+                self._handle_redis_error(e)
+            return self.fallback_many(
+                (topic, data) for topic, entries in grouped.items() for _, data in entries
+            ) and valid
+
+    def _write(self, pipeline: Any, topic: str, payloads: list[Any]) -> None:
+        """
+        Append encoded messages to a key, with one RPUSH in list
+        storage or an XADD per message in stream storage, and add
+        them to the backlog index.
+
+        Args:
+            pipeline (Any): A transactional pipeline, so the index
+                            changes along with the key.
+            topic (str): The key.
+            payloads (list[Any]): The encoded messages, oldest first.
+        """
+        if self._storage == "list":
+            pipeline.rpush(topic, *payloads)
+            pipeline.hincrby(self._bytes_key, topic, sum(payload_size(p) for p in payloads))
+            if self._retention is not None and self._retention.topic.max_age is not None:
+                bucket = int(time.time() // AGE_BUCKET_SECONDS)
+                pipeline.hincrby(age_index_key(self._backlog_key, topic), bucket, len(payloads))
+        else:
+            for payload in payloads:
+                pipeline.xadd(topic, {STREAM_FIELD: payload},
+                              maxlen=self._stream_maxlen, approximate=True)
+        pipeline.hincrby(self._backlog_key, topic, len(payloads))
+
+    def _decode(self, message: bytes) -> Any:
+        """
+        Decode a stored message.
+
+        Args:
+            message (bytes): The stored value.
+
+        Returns:
+            Any: A UTF-8 string, or a decoded object for binary serializers.
+        """
+        return decode_message(self._serializer, message)
+
+    def _add_to_batch(self, policy: BatchPolicy, topic: str, payload: Any,
+                      data: Any) -> None:
+        """
+        Hold a write until its batch is flushed, flushing
+        straight away once the batch is full.
+
+        Args:
+            policy (BatchPolicy): The output's batch policy.
+            topic (str): The key to push to.
+            payload (Any): The encoded value.
+            data (Any): What to give the fallback if the write fails.
+        """
+        with self._batch_condition:
+            self._pending.setdefault(topic, []).append((payload, data))
+            self._pending_count += 1
+            self._pending_bytes += len(payload)
+            if self._pending_deadline is None:
+                self._pending_deadline = time.monotonic() + policy.max_linger_ms / 1000
+                self._batch_condition.notify()
+            full = (self._pending_count >= policy.max_count or
+                    self._pending_bytes >= policy.max_bytes)
+        if full:
+            self.flush_batch()
+
+    def flush_batch(self) -> None:
+        """
+        Write every held message to KeyDB in one pipeline, a single
+        RPUSH per key. If the pipeline fails the messages go to the
+        fallback instead.
+        """
+        with self._flush_lock:
+            with self._batch_condition:
+                pending = self._pending
+                if not pending:
+                    return
+                self._pending = {}
+                count = self._pending_count
+                self._pending_count = 0
+                self._pending_bytes = 0
+                self._pending_deadline = None
+            try:
+                if self._client is None:
+                    raise redis.ConnectionError("Not connected to KeyDB.")
+                pipeline = self._client.pipeline(transaction=True)
+                for topic, messages in pending.items():
+                    self._write(pipeline, topic, [payload for payload, _ in messages])
+                pipeline.execute()
+                logger.debug(f"Flushed {count} messages to {len(pending)} keys in KeyDB.")
+                OutputModule.reset_failure_count()
+                return
+            except redis.RedisError as e:
+                self._handle_redis_error(e)
+        self.fallback_many(
+            (topic, data) for topic, messages in pending.items() for _, data in messages
+        )
+
+    def _linger_loop(self) -> None:
+        """
+        Flush the held writes once the oldest has waited its linger time.
+        """
+        while True:
+            with self._batch_condition:
+                while (self._pending_deadline is None or
+                       self._pending_deadline > time.monotonic()):
+                    timeout = None
+                    if self._pending_deadline is not None:
+                        timeout = self._pending_deadline - time.monotonic()
+                    self._batch_condition.wait(timeout)
+            try:
+                self.flush_batch()
+            except Exception as e:
+                logger.error(f"Failed to flush KeyDB batch: {e}")
+
     def is_connected(self) -> bool:
         """
-        Check if the connection to KeyDB is established.
+        Check if the KeyDB server answers a PING.
 
         Returns:
             bool: True if connected, False otherwise.
         """
-        # TODO Have a thread running to check for content and if present process it to the registered MQTT output module if alive
-        topics = self._client.keys()
-        if topics:
-            logger.info(f"Found existing keys in KeyDB: {topics}")
-            for topic in topics:
-                topic = topic.decode("utf-8")
-                self.retrieve(topic)
-        else:
-            logger.debug("No existing keys found in KeyDB.")
-        return self._client is not None
+        if self._client is None:
+            return False
+        try:
+            return bool(self._client.ping())
+        except redis.RedisError as e:
+            logger.debug(f"KeyDB at {self.host}:{self.port} is unreachable: {e}")
+            return False
+
+    def _redis(self) -> Any:
+        """
+        The client, for the helpers that only run once connected. The
+        redis-py commands are typed for its sync and async clients at
+        once, so it is handed out untyped, like the pipelines.
+
+        Returns:
+            Any: The client.
+
+        Raises:
+            redis.ConnectionError: If the output isn't connected.
+        """
+        if self._client is None:
+            raise redis.ConnectionError("Not connected to KeyDB.")
+        return self._client
+
+    def get_backlog(self, topic: str) -> int:
+        """
+        Number of messages buffered under a key, from the backlog index.
+
+        Args:
+            topic (str): The key.
+
+        Returns:
+            int: The number of messages, 0 if none or not connected.
+        """
+        if self._client is None:
+            return 0
+        try:
+            count = self._redis().hget(self._backlog_key, topic)
+        except redis.RedisError as e:
+            self._handle_redis_error(e)
+            return 0
+        return max(int(count), 0) if count else 0
+
+    def get_backlog_topics(self) -> dict[str, int]:
+        """
+        Every key holding messages and its count, from the backlog index.
+
+        Returns:
+            dict[str, int]: Message counts by key.
+        """
+        if self._client is None:
+            return {}
+        try:
+            return self._backlog_topics()
+        except redis.RedisError as e:
+            self._handle_redis_error(e)
+            return {}
+
+    def _backlog_topics(self) -> dict[str, int]:
+        """
+        HSCAN the backlog index.
+
+        Returns:
+            dict[str, int]: Message counts of the keys with messages.
+        """
+        topics = {}
+        for topic, count in self._redis().hscan_iter(self._backlog_key,
+                                                     count=DRAIN_CHUNK_SIZE):
+            if int(count) > 0:
+                if isinstance(topic, bytes):
+                    topic = topic.decode("utf-8")
+                topics[topic] = int(count)
+        return topics
+
+    def rebuild_backlog_index(self) -> None:
+        """
+        Correct the backlog index from the stored keys, found with
+        SCAN, for example after messages were written by a version
+        that kept no index. Done once before the first replay.
+        """
+        if self._client is None:
+            return
+        self._reorder_legacy_lists()
+        try:
+            keys = set(self._client.scan_iter(count=DRAIN_CHUNK_SIZE, _type=self._storage))
+            keys.update(topic for topic, _ in
+                        self._client.hscan_iter(self._backlog_key, count=DRAIN_CHUNK_SIZE))
+            for key in keys:
+                if isinstance(key, bytes):
+                    key = key.decode("utf-8")
+                self._reconcile_backlog(key)
+            self._backlog_checked = True
+            logger.info(f"Checked the KeyDB backlog index against {len(keys)} keys.")
+        except redis.RedisError as e:
+            self._handle_redis_error(e)
+
+    def _take_list(self, key: str, count: int) -> list[bytes]:
+        """
+        Remove up to count values from the head of a list and take them
+        off the backlog index in one transaction, like the writes. The
+        key is watched so a write in between makes the take retry.
+
+        Args:
+            key (str): The key.
+            count (int): Maximum number of values to take.
+
+        Returns:
+            list[bytes]: The removed values, oldest first.
+        """
+        def take(pipeline: Any) -> list[bytes]:
+            messages: list[bytes] = pipeline.lrange(key, 0, count - 1)
+            pipeline.multi()
+            if messages:
+                pipeline.ltrim(key, len(messages), -1)
+                pipeline.hincrby(self._backlog_key, key, -len(messages))
+                pipeline.hincrby(self._bytes_key, key, -sum(len(m) for m in messages))
+            return messages
+
+        taken: list[bytes] = self._redis().transaction(take, key, value_from_callable=True)
+        return taken
+
+    def _reconcile_backlog(self, key: str) -> None:
+        """
+        Set the index count of a key to its length, removing the key
+        and its byte count and ages from the index when empty. The key is watched so a write in
+        between makes the update retry.
+
+        Args:
+            key (str): The key.
+        """
+        def update(pipeline: Any) -> None:
+            if self._storage == "list":
+                size = pipeline.llen(key)
+            else:
+                size = pipeline.xlen(key)
+            pipeline.multi()
+            if size:
+                pipeline.hset(self._backlog_key, key, size)
+            else:
+                pipeline.hdel(self._backlog_key, key)
+                if self._storage == "list":
+                    pipeline.hdel(self._bytes_key, key)
+                    pipeline.delete(age_index_key(self._backlog_key, key))
+
+        self._redis().transaction(update, key)
+
+    def get_eviction_stats(self) -> dict[str, dict[str, int]]:
+        """
+        Report the messages evicted to keep the buffer within its caps.
+
+        Returns:
+            dict[str, dict[str, int]]: Messages evicted per topic and cap.
+        """
+        with self._retention_lock:
+            return {topic: dict(caps) for topic, caps in self._evictions.items()}
+
+    def _retention_loop(self, retention: RetentionPolicy) -> None:
+        """
+        Enforce the retention caps every check_interval seconds,
+        until _stop_retention is called.
+
+        Args:
+            retention (RetentionPolicy): The retention policy.
+        """
+        while True:
+            with self._retention_condition:
+                self._retention_condition.wait_for(lambda: not self._retention_running,
+                                                   retention.check_interval)
+                if not self._retention_running:
+                    return
+            if self._client is None:
+                continue
+            try:
+                self.enforce_retention()
+            except Exception as e:
+                logger.error(f"Failed to enforce KeyDB retention: {e}")
+
+    def enforce_retention(self) -> int:
+        """
+        Evict messages over the retention caps, first per topic by
+        age, count and bytes, then over all topics.
+
+        Returns:
+            int: The number of messages evicted.
+        """
+        retention = self._retention
+        if retention is None or self._client is None:
+            return 0
+        evicted: dict[tuple[str, str], int] = {}
+        try:
+            counts = self._backlog_topics()
+            sizes = {}
+            if counts:
+                values = self._redis().hmget(self._bytes_key, list(counts))
+                sizes = {t: max(int(v or 0), 0) for t, v in zip(counts, values)}
+            for topic in list(counts):
+                self._enforce_topic(retention, topic, counts, sizes, evicted)
+            self._enforce_total(retention, counts, sizes, evicted)
+        except redis.RedisError as e:
+            self._handle_redis_error(e)
+        self._report_evictions(retention, evicted)
+        return sum(evicted.values())
+
+    def _enforce_topic(self, retention: RetentionPolicy, topic: str, counts: dict[str, int],
+                       sizes: dict[str, int], evicted: dict[tuple[str, str], int]) -> None:
+        """
+        Evict the messages of a topic over the per-topic caps.
+
+        Args:
+            retention (RetentionPolicy): The retention policy.
+            topic (str): The key.
+            counts (dict[str, int]): Messages per key, updated.
+            sizes (dict[str, int]): Bytes per key, updated.
+            evicted (dict[tuple[str, str], int]): Evictions per key and cap, updated.
+        """
+        limits = retention.topic
+        if limits.max_age is not None:
+            self._enforce_age(retention, topic, limits.max_age, counts, sizes, evicted)
+        if limits.max_count is not None and counts[topic] > limits.max_count:
+            self._evict(retention, topic, counts[topic] - limits.max_count, "topic max_count",
+                        counts, sizes, evicted)
+        if limits.max_bytes is not None and sizes.get(topic, 0) > limits.max_bytes:
+            self._evict(retention, topic, self._messages_over(topic, sizes[topic] - limits.max_bytes,
+                                                   counts, sizes),
+                        "topic max_bytes", counts, sizes, evicted)
+
+    def _enforce_age(self, retention: RetentionPolicy, topic: str, max_age: float,
+                     counts: dict[str, int], sizes: dict[str, int],
+                     evicted: dict[tuple[str, str], int]) -> None:
+        """
+        Evict the messages of a topic written more than max_age seconds
+        ago. Messages are taken from the head of the list, so those
+        left from the oldest write time buckets are the ones already
+        read, the rest are evicted and the buckets deleted.
+
+        Args:
+            retention (RetentionPolicy): The retention policy.
+            topic (str): The key.
+            max_age (float): Maximum age in seconds.
+            counts (dict[str, int]): Messages per key, updated.
+            sizes (dict[str, int]): Bytes per key, updated.
+            evicted (dict[tuple[str, str], int]): Evictions per key and cap, updated.
+        """
+        buckets = {int(b): int(n) for b, n in
+                   self._redis().hgetall(age_index_key(self._backlog_key, topic)).items()}
+        cutoff = int((time.time() - max_age) // AGE_BUCKET_SECONDS)
+        stale = [b for b in buckets if b < cutoff]
+        if not stale:
+            return
+        consumed = max(sum(buckets.values()) - counts[topic], 0)
+        expired = max(sum(buckets[b] for b in stale) - consumed, 0)
+        self._evict(retention, topic, expired, "topic max_age", counts, sizes, evicted,
+                    stale_buckets=stale)
+
+    def _enforce_total(self, retention: RetentionPolicy, counts: dict[str, int],
+                       sizes: dict[str, int], evicted: dict[tuple[str, str], int]) -> None:
+        """
+        Evict messages over the total caps, from measurement topics
+        first and the largest topics first.
+
+        Args:
+            retention (RetentionPolicy): The retention policy.
+            counts (dict[str, int]): Messages per key, updated.
+            sizes (dict[str, int]): Bytes per key, updated.
+            evicted (dict[tuple[str, str], int]): Evictions per key and cap, updated.
+        """
+        limits = retention.total
+        for cap, limit, amounts in (("total max_count", limits.max_count, counts),
+                                    ("total max_bytes", limits.max_bytes, sizes)):
+            if limit is None:
+                continue
+            excess = sum(amounts.values()) - limit
+            order = sorted(amounts, key=lambda t: (classify_topic(t) != "measurement",
+                                                   -amounts[t]))
+            for topic in order:
+                if excess <= 0:
+                    break
+                if amounts is counts:
+                    count = min(excess, counts[topic])
+                else:
+                    count = self._messages_over(topic, excess, counts, sizes)
+                before = amounts[topic]
+                self._evict(retention, topic, count, cap, counts, sizes, evicted)
+                excess -= before - amounts[topic]
+
+    def _messages_over(self, topic: str, excess: int, counts: dict[str, int],
+                       sizes: dict[str, int]) -> int:
+        """
+        Args:
+            topic (str): The key.
+            excess (int): Bytes to free.
+            counts (dict[str, int]): Messages per key.
+            sizes (dict[str, int]): Bytes per key.
+
+        Returns:
+            int: The number of the topic's messages, of average size,
+                 that hold excess bytes.
+        """
+        if not counts[topic] or not sizes.get(topic):
+            return 0
+        average = sizes[topic] / counts[topic]
+        return min(counts[topic], math.ceil(excess / average))
+
+    def _evict(self, retention: RetentionPolicy, topic: str, count: int, cap: str,
+               counts: dict[str, int], sizes: dict[str, int],
+               evicted: dict[tuple[str, str], int],
+               stale_buckets: Optional[list[int]] = None) -> None:
+        """
+        Evict the oldest count messages of a topic under the policy, in
+        a transaction that retries if the list changes in between.
+        Downsampling removes count messages from the oldest 2 * count
+        (half of the oldest count for the age cap), keeping the rest
+        evenly spaced.
+
+        Args:
+            retention (RetentionPolicy): The retention policy.
+            topic (str): The key.
+            count (int): The number of messages over the cap.
+            cap (str): The cap, for reporting.
+            counts (dict[str, int]): Messages per key, updated.
+            sizes (dict[str, int]): Bytes per key, updated.
+            evicted (dict[tuple[str, str], int]): Evictions per key and cap, updated.
+            stale_buckets (Optional[list[int]]): Age buckets to delete.
+        """
+        downsample = (retention.policy == "downsample" and
+                      classify_topic(topic) == "measurement")
+
+        def evict(pipeline: Any) -> list[bytes]:
+            length = pipeline.llen(topic)
+            remove = min(count, length)
+            take = remove
+            if downsample and stale_buckets is None:
+                take = min(2 * remove, length)
+            elif downsample:
+                remove = take // 2
+            messages = pipeline.lrange(topic, 0, take - 1) if take else []
+            keep = take - remove
+            positions = {int(i * take / keep) for i in range(keep)} if keep else set()
+            kept = [m for i, m in enumerate(messages) if i in positions]
+            removed = [m for i, m in enumerate(messages) if i not in positions]
+            pipeline.multi()
+            if take:
+                pipeline.ltrim(topic, take, -1)
+            if kept:
+                pipeline.lpush(topic, *reversed(kept))
+            if removed:
+                pipeline.hincrby(self._backlog_key, topic, -len(removed))
+                pipeline.hincrby(self._bytes_key, topic, -sum(len(m) for m in removed))
+            if stale_buckets:
+                pipeline.hdel(age_index_key(self._backlog_key, topic), *stale_buckets)
+            return removed
+
+        removed = self._redis().transaction(evict, topic, value_from_callable=True)
+        if not removed:
+            return
+        counts[topic] = max(counts[topic] - len(removed), 0)
+        sizes[topic] = max(sizes.get(topic, 0) - sum(len(m) for m in removed), 0)
+        evicted[(topic, cap)] = evicted.get((topic, cap), 0) + len(removed)
+        if retention.policy == "spill":
+            if self._fallback is None:
+                logger.warning(f"No fallback to spill {len(removed)} messages of {topic} to.")
+                return
+            for message in removed:
+                self._fallback.transmit(topic, self._decode(message))
+
+    def _report_evictions(self, retention: RetentionPolicy,
+                          evicted: dict[tuple[str, str], int]) -> None:
+        """
+        Count the evictions of a check and report them to the error holder.
+
+        Args:
+            retention (RetentionPolicy): The retention policy.
+            evicted (dict[tuple[str, str], int]): Evictions per key and cap.
+        """
+        if not evicted:
+            return
+        action = EVICTION_ACTIONS[retention.policy]
+        with self._retention_lock:
+            for (topic, cap), count in evicted.items():
+                caps = self._evictions.setdefault(topic, {})
+                caps[cap] = caps.get(cap, 0) + count
+        for (topic, cap), count in evicted.items():
+            reason = f"{count} messages of {topic} over the {cap} cap were {action}"
+            logger.info(reason)
+            if self._error_holder is not None:
+                self._error_holder.add_error(BufferEvictionError(reason, output_module=self))
 
     def disconnect(self) -> None:
         """
@@ -164,13 +1039,16 @@ class KEYDB(OutputModule):
 
         Logs the disconnection status.
         """
+        self._stop_retention()
         if self._client is not None:
+            self.flush_batch()
+            self._ack_streams()
             self._client = None
             logger.info("Disconnected from KeyDB.")
         else:
             logger.info("Already disconnected from KeyDB.")
 
-    def retrieve(self, key: str) -> Optional[str]:
+    def retrieve(self, key: str) -> Optional[Any]:
         """
         Retrieve data from KeyDB for a given key.
 
@@ -178,28 +1056,215 @@ class KEYDB(OutputModule):
             key (str): The key name for which to retrieve data.
 
         Returns:
-            Optional[str]: The retrieved data as a UTF-8 decoded
-                           string, or None if not found.
+            Optional[Any]: The retrieved data as a UTF-8 decoded
+                           string (decoded object for binary
+                           serializers), or None if not found.
         """
         if self._client is None:
             return None
         try:
-            message = self._client.lpop(key)
-            return message.decode("utf-8") if message else None
+            if self._storage == "stream":
+                messages = self._take_stream(key, 1)
+                return messages[0] if messages else None
+            messages = self._take_list(key, 1)
+            if not messages:
+                self._reconcile_backlog(key)
+                return None
+            return self._decode(messages[0])
         except redis.RedisError as e:
             self._handle_redis_error(e)
             return None
 
+    def retrieve_many(self, key: str, count: Optional[int] = None) -> list[Any]:
+        """
+        Remove and return up to count values of a key in one
+        transaction, oldest first. In stream storage the values are only
+        acknowledged by the next read of the key.
+
+        Args:
+            key (str): The key name.
+            count (Optional[int]): Maximum number of values to take,
+                                   DRAIN_CHUNK_SIZE if not given.
+
+        Returns:
+            list[Any]: The values, decoded as by retrieve, empty if none.
+        """
+        if self._client is None:
+            return []
+        count = count or DRAIN_CHUNK_SIZE
+        try:
+            if self._storage == "stream":
+                return self._take_stream(key, count)
+            messages = self._take_list(key, count)
+            if len(messages) < count:
+                self._reconcile_backlog(key)
+        except redis.RedisError as e:
+            self._handle_redis_error(e)
+            return []
+        return [self._decode(m) for m in messages]
+
+    def _take_stream(self, key: str, count: int) -> list[Any]:
+        """
+        Hand out up to count entries of a stream, reading a new chunk
+        once those read ahead are used up. Entries handed out earlier
+        are acknowledged before reading, the caller having come back
+        for more.
+
+        Args:
+            key (str): The stream key.
+            count (int): Maximum number of entries.
+
+        Returns:
+            list[Any]: The decoded messages, oldest first.
+        """
+        with self._stream_lock:
+            buffer = self._stream_buffer.setdefault(key, deque())
+            if not buffer:
+                self._ack_stream(key)
+                buffer.extend(self._read_stream(key, max(count, DRAIN_CHUNK_SIZE)))
+            taken = [buffer.popleft() for _ in range(min(count, len(buffer)))]
+            self._stream_unacked.setdefault(key, []).extend(i for i, _ in taken)
+            return [message for _, message in taken]
+
+    def _read_stream(self, key: str, count: int) -> list[tuple[bytes, Any]]:
+        """
+        Read entries of a stream through the consumer group. Entries
+        delivered to this consumer before a restart and never
+        acknowledged are read first.
+
+        Args:
+            key (str): The stream key.
+            count (int): Maximum number of entries.
+
+        Returns:
+            list[tuple[bytes, Any]]: Entry IDs and decoded messages.
+        """
+        if not self._ensure_group(key):
+            return []
+        entries = []
+        if key not in self._stream_recovered:
+            entries = self._read_group(key, "0", count)
+            if len(entries) < count:
+                self._stream_recovered.add(key)
+        if not entries:
+            entries = self._read_group(key, ">", count)
+        messages = []
+        for entry_id, fields in entries:
+            payload = fields.get(STREAM_FIELD) if fields else None
+            if payload is None:
+                # Trimmed before it was acknowledged.
+                self._stream_unacked.setdefault(key, []).append(entry_id)
+                continue
+            messages.append((entry_id, self._decode(payload)))
+        return messages
+
+    def _read_group(self, key: str, start: str, count: int) -> list[tuple[bytes, Any]]:
+        """
+        XREADGROUP a single stream.
+
+        Args:
+            key (str): The stream key.
+            start (str): "0" for pending entries, ">" for new ones.
+            count (int): Maximum number of entries.
+
+        Returns:
+            list[tuple[bytes, Any]]: Entry IDs and fields.
+        """
+        response = self._redis().xreadgroup(
+            self._stream_group, self._stream_consumer, {key: start}, count=count
+        )
+        return list(response[0][1]) if response else []
+
+    def _ensure_group(self, key: str) -> bool:
+        """
+        Create the consumer group of a stream if it doesn't exist,
+        starting from the first entry.
+
+        Args:
+            key (str): The stream key.
+
+        Returns:
+            bool: False if there is no stream under the key.
+        """
+        if key in self._stream_groups:
+            return True
+        try:
+            self._redis().xgroup_create(key, self._stream_group, id="0")
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                return False
+        self._stream_groups.add(key)
+        return True
+
+    def _ack_stream(self, key: str) -> None:
+        """
+        Acknowledge and delete the entries handed out for a stream.
+
+        Args:
+            key (str): The stream key.
+        """
+        with self._stream_lock:
+            ids = self._stream_unacked.pop(key, None)
+            if not ids:
+                return
+            pipeline = self._redis().pipeline(transaction=True)
+            pipeline.xack(key, self._stream_group, *ids)
+            pipeline.xdel(key, *ids)
+            pipeline.hincrby(self._backlog_key, key, -len(ids))
+            pipeline.execute()
+
+    def _ack_streams(self) -> None:
+        """
+        Acknowledge everything handed out, the rest of what was read
+        ahead stays pending and is read again after a restart.
+        """
+        if self._storage != "stream":
+            return
+        try:
+            for key in list(self._stream_unacked):
+                self._ack_stream(key)
+        except redis.RedisError as e:
+            self._handle_redis_error(e)
+
+    def pop_all_messages(self) -> Any:
+        """
+        Yield every buffered message, draining each key listed in the
+        backlog index in chunks of DRAIN_CHUNK_SIZE, followed by those
+        of the fallback.
+
+        Yields:
+            tuple[str, Any]: Key and decoded value.
+        """
+        self.flush_batch()
+        if self._client is not None:
+            if not self._backlog_checked:
+                self.rebuild_backlog_index()
+            keys = self.get_backlog_topics()
+            for key in keys:
+                while True:
+                    messages = self.retrieve_many(key, DRAIN_CHUNK_SIZE)
+                    for message in messages:
+                        yield key, message
+                    if len(messages) < DRAIN_CHUNK_SIZE:
+                        break
+                # Everything yielded has been handled once we get here.
+                self._ack_streams()
+                if self._storage == "stream":
+                    try:
+                        self._reconcile_backlog(key)
+                    except redis.RedisError as e:
+                        self._handle_redis_error(e)
+        if self._fallback is not None:
+            yield from self._fallback.pop_all_messages()
+
     def pop(self, key: Optional[str] = None) -> Optional[tuple[str, Any]]:
         """
-        Retrieve and remove a record from KeyDB.
-        If a specific key is provided, retrieve and remove all values under
-        that key. If no key is provided, retrieve and remove one element from
-        a random key's list. The key is removed when the last element is taken.
+        Retrieve and remove the oldest record of a key from KeyDB, or
+        of a key taken from the backlog index if none is given.
 
         Args:
             key (Optional[str]): The key of the record to retrieve and remove.
-                                If None, a random record is retrieved and removed.
+                                If None, any buffered record is retrieved and removed.
 
         Returns:
             Optional[tuple[str, Any]]: A tuple of the key and the retrieved value,
@@ -211,52 +1276,41 @@ class KEYDB(OutputModule):
             return None
 
         try:
-            if key is not None:
-                result = self._client.lpop(key)
-                if result:
-                    # Content is already popped
-                    # self._client.delete(key)
-                    # If the key is empty after popping, delete it
-                    if self._client.get(key) is None:
-                        self._client.delete(key)
-                    return key, json.loads(result.decode("utf-8"))
-                return None
-
-            random_key: ResponseT = self._client.randomkey()
-            if not random_key:
-                logger.info("No keys available in KeyDB.")
-                return None
-            if isinstance(random_key, bytes):
-                # Decode bytes to string if necessary
-                random_key = random_key.decode("utf-8")
-
-            logger.info(f"Popping from key '{random_key}' in KeyDB.")
-            result = self._client.lpop(random_key)
-
-            if not result:
-                return None
-
-            result = json.loads(result.decode("utf-8"))
-            if result:
-                # Check if empty
-                if self._client.llen(random_key) is None:
-                    logger.info(f"Key '{random_key}' is empty after popping.")
-                    self._client.delete(random_key)
-                logger.info(f"Popped key '{random_key}' from KeyDB.")
-                return random_key, result
-            # if isinstance(result, list):
-            #     popped_value = result.pop(0)
-            #     if result:
-            #         self._client.set(random_key, json.dumps(result))
-            #     else:
-            #         self._client.delete(random_key)
-            #     return random_key, popped_value
-
-            logger.error(
-                f"Unexpected value type for key '{random_key}'. Deleting key."
-            )
-            self._client.delete(random_key)
+            if self._storage == "stream":
+                return self._pop_stream(key)
+            keys = [key] if key is not None else self._backlog_topics()
+            for list_key in keys:
+                result = self._take_list(list_key, 1)
+                if not result:
+                    self._reconcile_backlog(list_key)
+                    continue
+                logger.debug(f"Popped key '{list_key}' from KeyDB.")
+                return list_key, self._serializer.loads(result[0])
             return None
         except redis.RedisError as e:
             self._handle_redis_error(e)
             return None
+
+    def _pop_stream(self, key: Optional[str]) -> Optional[tuple[str, Any]]:
+        """
+        Take and acknowledge one entry of a stream, or of the first
+        stream in the backlog index if no key is given.
+
+        Args:
+            key (Optional[str]): The stream key.
+
+        Returns:
+            Optional[tuple[str, Any]]: The key and the decoded value, or None.
+        """
+        keys = [key] if key is not None else self._backlog_topics()
+        for stream_key in keys:
+            messages = self._take_stream(stream_key, 1)
+            if messages:
+                self._ack_stream(stream_key)
+                message = messages[0]
+                if isinstance(message, str):
+                    message = self._serializer.loads(message)
+                return stream_key, message
+            self._ack_stream(stream_key)
+            self._reconcile_backlog(stream_key)
+        return None
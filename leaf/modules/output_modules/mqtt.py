@@ -1,28 +1,85 @@
+import functools
 import json
 import logging
+import queue
+import threading
 import time
+from collections import OrderedDict
 from socket import error as socket_error
 from socket import gaierror
-from typing import Literal, Union, Optional, Any
+from typing import Callable, Iterable, Literal, NamedTuple, Union, Optional, Any
 
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from paho.mqtt.reasoncodes import ReasonCode
 
 from leaf.error_handler.error_holder import ErrorHolder
 from leaf.error_handler.exceptions import AdapterBuildError, LEAFError
 from leaf.error_handler.exceptions import ClientUnreachableError
 from leaf.error_handler.exceptions import SeverityLevel
 from leaf.modules.output_modules.output_module import OutputModule
+from leaf.utility.batching import MessageBatcher
+from leaf.utility.batching import build_batch_policies
+from leaf.utility.batching import make_batch
+from leaf.utility.compression import COMPRESSION_PROPERTY
+from leaf.utility.compression import COMPRESSION_TOPIC_SEGMENT
+from leaf.utility.compression import CompressionPolicy
+from leaf.utility.compression import build_compression_policy
+from leaf.utility.fallback_drainer import FallbackDrainer
 from leaf.utility.logger.logger_utils import get_logger
+from leaf.utility.mqtt_connection import SharedMQTTConnection
+from leaf.utility.mqtt_connection import acquire_connection
+from leaf.utility.mqtt_connection import release_connection
+from leaf.utility.reconnect import ConnectionState
+from leaf.utility.reconnect import ReconnectScheduler
+from leaf.utility.reconnect import reconnect_paho_client
+from leaf.utility.serializers import ENCODING_PROPERTY
+from leaf.utility.serializers import get_serializer
+from leaf.utility.topic_classes import TOPIC_CLASSES
+from leaf.utility.topic_classes import classify_topic
 
 logger = get_logger(__name__, log_file="output_module.log")
 
 FIRST_RECONNECT_DELAY = 1
 RECONNECT_RATE = 2
 MAX_RECONNECT_COUNT = 12
-MAX_RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 60
+# Fraction of each reconnect delay that is randomised.
+RECONNECT_JITTER = 0.5
 
+QUEUE_OVERFLOW_POLICIES = ("block", "drop_oldest", "fallback")
+QUEUE_DRAIN_TIMEOUT = 5
 
+INFLIGHT_POLICIES = ("replay", "fallback")
+INFLIGHT_WAIT_TIMEOUT = 5
+EARLY_ACK_LIMIT = 1024
+
+# A topic is given an alias once it has been published this many times.
+TOPIC_ALIAS_MIN_USES = 2
+
+
+class _QueuedMessage(NamedTuple):
+    """
+    A message waiting on the publish queue along with the
+    time it was enqueued, used to measure publish latency.
+    """
+    topic: str
+    data: Optional[Union[str, dict[str, Any]]]
+    retain: bool
+    enqueued_at: float
+    flush: bool = False
+
+
+class _InflightMessage(NamedTuple):
+    """
+    A QoS 1/2 message that the broker hasn't acknowledged yet.
+    """
+    topic: str
+    payload: Any
+    retain: bool
+    sent_at: float
 
 
 class MQTT(OutputModule):
@@ -35,6 +92,32 @@ class MQTT(OutputModule):
     reconnections, and handles message publishing. It supports both
     TCP and WebSocket transports, with optional TLS encryption
     for secure communication.
+    When queue_size is set, transmit only enqueues the message and
+    a dedicated publisher thread performs the encoding and publishing,
+    so a slow broker never blocks the caller.
+    When batch is set, messages on batched topics (measurements by
+    default) are coalesced into a single message per topic, see
+    leaf.utility.batching for the payload format.
+    Messages published with QoS 1 or 2 are tracked until the broker
+    acknowledges them, unacknowledged messages are either left for
+    the client to resend after reconnecting or moved to the fallback.
+    Messages buffered by the fallback while the broker was unreachable
+    are replayed by a background drainer once a topic publishes again.
+    Payloads are encoded with the configured serializer, with MQTT v5
+    the encoding is announced through the content type and a
+    leaf-encoding user property on every message.
+    When compression is set, large payloads on compressed topics
+    (measurements by default) are compressed, signalled by a
+    leaf-compression user property with MQTT v5 or otherwise by a
+    /compressed/<algorithm> topic suffix. Subscribers can undo it
+    with leaf.utility.compression.decompress_message.
+    With MQTT v5, topics published repeatedly at QoS 0 are given topic
+    aliases (up to the broker's limit, least recently used topics give
+    theirs up), sessions and messages can be given an expiry interval
+    and the in-flight window is kept within the broker's receive maximum.
+    With shared_connection, modules using the same broker and
+    credentials share one client and network connection, see
+    leaf.utility.mqtt_connection.
     """
 
     def __init__(
@@ -49,6 +132,20 @@ class MQTT(OutputModule):
         transport: Literal["tcp", "websockets", "unix"] = "tcp",
         tls: bool = False,
         error_holder: Optional[ErrorHolder] = None,
+        queue_size: int = 0,
+        queue_overflow: Literal["block", "drop_oldest", "fallback"] = "block",
+        queue_timeout: Optional[float] = None,
+        batch: Optional[dict[str, Any]] = None,
+        qos: Union[int, dict[str, int]] = 0,
+        max_inflight: int = 20,
+        inflight_policy: Literal["replay", "fallback"] = "replay",
+        drain_rate: float = 20.0,
+        serializer: str = "json",
+        compression: Optional[dict[str, Any]] = None,
+        topic_alias_maximum: int = 16,
+        session_expiry: Optional[int] = None,
+        message_expiry: Optional[Union[int, dict[str, int]]] = None,
+        shared_connection: bool = False,
     ) -> None:
         """
         Initialise the MQTT adapter with broker details,
@@ -65,6 +162,46 @@ class MQTT(OutputModule):
             transport (Literal['tcp', 'websockets', 'unix']): The transport method, either TCP, WebSockets, or Unix socket.
             tls (bool): Boolean flag to enable or disable TLS encryption.
             error_holder (Optional[ErrorHolder]): An instance of ErrorHolder for tracking errors.
+            queue_size (int): Maximum number of messages held by the publish queue.
+                              0 (default) publishes synchronously on the caller's thread.
+            queue_overflow (Literal["block", "drop_oldest", "fallback"]): What to do when
+                              the queue is full: wait for space, discard the oldest
+                              queued message, or hand the new message to the fallback.
+            queue_timeout (Optional[float]): Maximum seconds to wait for space with the
+                              "block" policy before using the fallback. None waits forever.
+            batch (Optional[dict[str, Any]]): Batching options (max_count, max_bytes,
+                              max_linger_ms and per-pattern overrides under topics).
+                              Without topics only measurement topics are batched.
+                              Batching is disabled if not provided.
+            qos (Union[int, dict[str, int]]): QoS level for every message, or per
+                              topic class ("control", "error", "measurement"),
+                              classes left out use QoS 0.
+            max_inflight (int): Maximum number of unacknowledged QoS 1/2 messages,
+                              publishing waits for acknowledgements beyond this.
+            inflight_policy (Literal["replay", "fallback"]): What happens to
+                              unacknowledged messages when the connection drops:
+                              resend them after reconnecting or move them to the
+                              fallback straight away.
+            drain_rate (float): Maximum messages per second replayed from the
+                              fallback after an outage.
+            serializer (str): Payload encoding, see leaf.utility.serializers
+                              ("json", "fastjson", "msgpack" or "cbor").
+            compression (Optional[dict[str, Any]]): Compression options (algorithm
+                              "zlib", "zstd" or "lz4", level, min_bytes and topics
+                              patterns). Without topics only measurement topics are
+                              compressed. Compression is disabled if not provided.
+            topic_alias_maximum (int): Maximum number of topic aliases used (MQTT v5),
+                              0 disables them.
+            session_expiry (Optional[int]): Seconds the broker keeps the session
+                              after a disconnect (MQTT v5), None ends it with the
+                              connection.
+            message_expiry (Optional[Union[int, dict[str, int]]]): Seconds after
+                              which the broker discards undelivered messages, for
+                              every message or per topic class (MQTT v5).
+            shared_connection (bool): Share the client and connection with other
+                              modules using the same broker and credentials. The
+                              client id and session expiry are not used and topic
+                              aliases are disabled, as those belong to a connection.
         """
 
         super().__init__(fallback=fallback, error_holder=error_holder)
@@ -82,6 +219,48 @@ class MQTT(OutputModule):
             )
         if not isinstance(port, int) or not (1 <= port <= 65535):
             raise AdapterBuildError("Port must be an integer between 1 and 65535.")
+        if not isinstance(queue_size, int) or queue_size < 0:
+            raise AdapterBuildError("Queue size must be a non-negative integer.")
+        if queue_overflow not in QUEUE_OVERFLOW_POLICIES:
+            raise AdapterBuildError(f"Unsupported queue overflow policy '{queue_overflow}'.")
+        if not isinstance(max_inflight, int) or max_inflight < 1:
+            raise AdapterBuildError("Maximum in-flight messages must be a positive integer.")
+        if inflight_policy not in INFLIGHT_POLICIES:
+            raise AdapterBuildError(f"Unsupported in-flight policy '{inflight_policy}'.")
+        self._qos: dict[str, int] = self._build_qos(qos)
+        if not isinstance(topic_alias_maximum, int) or not 0 <= topic_alias_maximum <= 65535:
+            raise AdapterBuildError("Topic alias maximum must be an integer between 0 and 65535.")
+        if self.protocol != mqtt.MQTTv5 and (session_expiry or message_expiry):
+            raise AdapterBuildError("Session and message expiry require protocol 'v5'.")
+        if session_expiry is not None and (not isinstance(session_expiry, int) or
+                                           not 0 <= session_expiry <= 0xFFFFFFFF):
+            raise AdapterBuildError("Session expiry must be a non-negative number of seconds.")
+        if shared_connection and session_expiry:
+            raise AdapterBuildError("Session expiry can't be used with a shared connection.")
+        self._message_expiry: dict[str, Optional[int]] = self._build_message_expiry(message_expiry)
+        self._serializer = get_serializer(serializer)
+        self._connect_properties: Optional[Properties] = None
+        if self.protocol == mqtt.MQTTv5 and session_expiry:
+            properties = Properties(PacketTypes.CONNECT)  # type: ignore[no-untyped-call]
+            properties.SessionExpiryInterval = session_expiry
+            self._connect_properties = properties
+        self._publish_properties: dict[tuple[str, bool], Properties] = {}
+        self._topic_alias_maximum: int = topic_alias_maximum
+        self._alias_limit: int = 0
+        self._topic_aliases: OrderedDict[str, int] = OrderedDict()
+        self._alias_topics: dict[int, str] = {}
+        self._topic_uses: dict[str, int] = {}
+        self._alias_lock = threading.Lock()
+        self._compression: Optional[CompressionPolicy] = None
+        self._compress_topics: dict[str, bool] = {}
+        self._compression_lock = threading.Lock()
+        self._compression_stats: dict[str, int] = {
+            "compressed": 0,
+            "raw_bytes": 0,
+            "compressed_bytes": 0,
+        }
+        if compression is not None:
+            self._compression = build_compression_policy(compression)
 
         self._client_id: Optional[str] = clientid
         self._broker: str = broker
@@ -92,44 +271,128 @@ class MQTT(OutputModule):
         self.messages: dict[str, list[str]] = {}
         self.sending_success: dict[str,bool] = {}
         self._is_reconnect: bool = False
+        self.connection_state = ConnectionState()
+        self._reconnector: Optional[ReconnectScheduler] = None
 
-        self.client = mqtt.Client(
-            callback_api_version=CallbackAPIVersion.VERSION2,
-            client_id=clientid,
-            protocol=self.protocol,
-            transport=transport,
-        )
-        self.client.on_connect = self.on_connect
-
-        self.client.on_connect_fail = self.on_connect_fail
-        self.client.on_disconnect = self.on_disconnect
-        self.client.on_log = self.on_log
-        self.client.on_message = self.on_message
+        self._queue: Optional[queue.Queue[_QueuedMessage]] = None
+        self._queue_overflow: str = queue_overflow
+        self._queue_timeout: Optional[float] = queue_timeout
+        self._queue_stats_lock = threading.Lock()
+        self._queue_stats: dict[str, float] = {
+            "enqueued": 0,
+            "published": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "latency_last": 0.0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+        }
+        self._publisher_thread: Optional[threading.Thread] = None
+        self._batcher: Optional[MessageBatcher] = None
+        self._max_inflight: int = max_inflight
+        # Narrowed to the broker's receive maximum once connected.
+        self._inflight_window: int = max_inflight
+        self._inflight_policy: str = inflight_policy
+        self._inflight: dict[int, _InflightMessage] = {}
+        # Acknowledgements that arrived while a QoS 1/2 publish() was still
+        # returning, keyed by mid and tagged with the order they arrived in.
+        self._early_acks: OrderedDict[int, tuple[int, bool]] = OrderedDict()
+        self._ack_seq: int = 0
+        self._publishing: int = 0
+        self._inflight_condition = threading.Condition()
+        self._inflight_stats: dict[str, int] = {"acked": 0, "spilled": 0}
+        if not isinstance(drain_rate, (int, float)) or drain_rate <= 0:
+            raise AdapterBuildError("Drain rate must be a positive number.")
+        self._drain_rate: float = drain_rate
+        self._drainer: Optional[FallbackDrainer] = None
 
         self._username = None
         self._password = None
         if username and password:
             self._username = username
             self._password = password
-        
-        if tls:
+
+        self._transport: Literal["tcp", "websockets", "unix"] = transport
+        self._shared_connection: bool = shared_connection
+        self._connection: Optional[SharedMQTTConnection] = None
+        if shared_connection:
+            self._acquire_connection()
+        else:
+            self.client = mqtt.Client(
+                callback_api_version=CallbackAPIVersion.VERSION2,
+                client_id=clientid,
+                protocol=self.protocol,
+                transport=transport,
+                # Reconnects are scheduled by on_disconnect.
+                reconnect_on_failure=False,
+            )
+            self.client.on_connect = self.on_connect
+
+            self.client.on_connect_fail = self.on_connect_fail
+            self.client.on_disconnect = self.on_disconnect
+            self.client.on_log = self.on_log
+            self.client.on_message = self.on_message
+            self.client.on_publish = self.on_publish
+        self._set_client_inflight(max_inflight)
+
+        if tls and not shared_connection:
             try:
                 self.client.tls_set()
                 self.client.tls_insecure_set(True)
             except Exception as e:
                 raise AdapterBuildError(f"Failed to set up TLS: {e}")
 
+        if queue_size > 0:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._publisher_thread = threading.Thread(
+                target=self._publish_loop,
+                args=(self._queue,),
+                name=f"MQTTPublisher-{broker}",
+                daemon=True,
+            )
+            self._publisher_thread.start()
+
+        self._batch_policies = None if batch is None else build_batch_policies(batch)
+        self._start_batcher()
+
         self.connect()
 
+    def _start_batcher(self) -> None:
+        """
+        Start batching measurements if batching is configured and
+        the batcher isn't running, it is closed on disconnect.
+        """
+        if self._batch_policies is None or \
+                (self._batcher is not None and self._batcher.is_running()):
+            return
+        default_policy, topic_policies = self._batch_policies
+        self._batcher = MessageBatcher(
+            self._send_batch,
+            default_policy,
+            topic_policies,
+            selector=lambda t: classify_topic(t) == "measurement",
+            name=f"MQTTBatcher-{self._broker}",
+            on_error=self._batch_failed,
+        )
+
     def connect(self) -> None:
         """
         Connects to the MQTT broker and sets a thread looping.
         """
         logger.info(f"Connecting to MQTT broker {self._broker}")
+        self._start_batcher()
         try:
+            if self._shared_connection:
+                connection = self._connection
+                if connection is None:
+                    connection = self._acquire_connection()
+                    self._set_client_inflight(self._max_inflight)
+                connection.connect(self)
+                return
             if self._username and self._password:
                         self.client.username_pw_set(self._username, self._password)
-            self.client.connect(self._broker, self._port, 60)
+            self.client.connect(self._broker, self._port, 60,
+                                properties=self._connect_properties)
             self.client.loop_start()
         except (socket_error, gaierror, OSError) as e:
             self._handle_exception(
@@ -148,11 +411,30 @@ class MQTT(OutputModule):
                 f"{self.__class__.__name__} - disconnect called with module disabled."
             )
             return
+        if self._batcher is not None:
+            # Sends what is pending and ends the linger thread, messages
+            # sent until connect() starts a new batcher aren't batched.
+            self._batcher.close()
+        self._wait_for_queue(QUEUE_DRAIN_TIMEOUT)
+        self._wait_for_inflight(INFLIGHT_WAIT_TIMEOUT)
+        if self._drainer is not None:
+            # Started again by the first publish after reconnecting.
+            self._drainer.close()
+            self._drainer = None
+            for topic in self.sending_success:
+                self.sending_success[topic] = False
         try:
-            if self.client.is_connected():
-                self.client.disconnect()
-                time.sleep(0.5)
-            self.client.loop_stop()
+            if self._connection is not None:
+                release_connection(self._connection, self)
+                self._connection = None
+            else:
+                if self._reconnector is not None:
+                    self._reconnector.cancel()
+                if self.client.is_connected():
+                    self.client.disconnect()
+                    time.sleep(0.5)
+                self.client.loop_stop()
+            self._spill_inflight()
             logger.info("Disconnected from MQTT broker.")
         except Exception as e:
             logger.error(f"Failed to disconnect from MQTT broker: {e}")
@@ -162,81 +444,508 @@ class MQTT(OutputModule):
                 )
             )
 
+    def _acquire_connection(self) -> SharedMQTTConnection:
+        """
+        Join the shared connection for this broker and credentials.
+
+        Returns:
+            SharedMQTTConnection: The connection joined.
+        """
+        connection = self._connection = acquire_connection(
+            self,
+            self._broker,
+            self._port,
+            self._username,
+            self._password,
+            self.protocol,
+            self._transport,
+            self._tls,
+            on_connect=self.on_connect,
+            on_disconnect=self.on_disconnect,
+            on_message=self.on_message,
+            on_publish=self.on_publish,
+        )
+        self.client = connection.client
+        return connection
+
+    def _set_client_inflight(self, window: int) -> None:
+        """
+        Set the client's limit of QoS 1/2 messages in flight, a shared
+        client is sized for all the modules using it.
+
+        Args:
+            window (int): This module's in-flight window.
+        """
+        if self._connection is not None:
+            self._connection.set_max_inflight(self, window)
+        else:
+            self.client.max_inflight_messages_set(window)
+
     def transmit(
-        self, topic: str, data: Optional[Union[str, dict]] = None, retain: bool = False
+        self, topic: str, data: Optional[Union[str, dict[str, Any]]] = None, retain: bool = False
     ) -> bool:
         """
         Publish a message to the MQTT broker on a given topic.
+        In queued mode the message is only enqueued and is
+        published later by the publisher thread. Messages on
+        batched topics are held until their batch is flushed.
 
         Args:
             topic (str): The topic to publish the message to.
-            data (Optional[Union[str, dict]]): The message payload to be transmitted.
+            data (Optional[Union[str, dict[str, Any]]]): The message payload to be transmitted.
             retain (bool): Whether to retain the message on the broker.
 
         Returns:
-            bool: True if the message was successfully published, False otherwise.
+            bool: True if the message was successfully published (or queued),
+                  False otherwise.
+        """
+        return self._guarded_transmit(self._transmit, topic, data, retain=retain)
+
+    def _transmit(
+        self, topic: str, data: Optional[Union[str, dict[str, Any]]] = None, retain: bool = False
+    ) -> bool:
+        """
+        Transmit a message, see transmit.
         """
         if not self.is_enabled():
             logger.warning(
                 f"{self.__class__.__name__} - transmit called with module disabled."
             )
             return False
+        if (self._batcher is not None and not retain and
+                self._batcher.add(topic, self._batch_item(data))):
+            self._defer_outcome()
+            return True
+        return self._dispatch(topic, data, retain)
+
+    def transmit_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Publish several messages. Messages on batched topics are
+        added to their batches, which go out when their batch policy
+        says so, or on flush_batch. Other messages are published,
+        or queued, in order, and if the broker can't be reached they
+        all go to the fallback together.
+
+        Args:
+            messages (Iterable[tuple[str, Any]]): Topics and payloads.
+
+        Returns:
+            bool: True if every message was published, queued or
+                  stored by the fallback, False otherwise.
+        """
+        return self._guarded_transmit_many(self._transmit_many, messages)
+
+    def _transmit_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Transmit several messages, see transmit_many.
+        """
+        if not self.is_enabled():
+            logger.warning(
+                f"{self.__class__.__name__} - transmit_many called with module disabled."
+            )
+            return False
+        direct = []
+        for topic, data in messages:
+            if self._batcher is None or not self._batcher.add(topic, self._batch_item(data)):
+                direct.append((topic, data))
+        if not direct:
+            self._defer_outcome()
+        if self._queue is None and direct and not self.client.is_connected():
+            for topic, _ in direct:
+                self.sending_success[topic] = False
+            return self.fallback_many(direct)
+        transmitted = True
+        for topic, data in direct:
+            if not self._dispatch(topic, data):
+                transmitted = False
+        return transmitted
+
+    def _dispatch(
+        self, topic: str, data: Optional[Union[str, dict[str, Any]]] = None, retain: bool = False
+    ) -> bool:
+        """
+        Queue the message in queued mode, otherwise publish it directly.
+
+        Args:
+            topic (str): The topic to publish the message to.
+            data (Optional[Union[str, dict[str, Any]]]): The message payload to be transmitted.
+            retain (bool): Whether to retain the message on the broker.
+
+        Returns:
+            bool: True if the message was published or queued, False otherwise.
+        """
+        if self._queue is not None:
+            return self._enqueue(self._queue, _QueuedMessage(topic, data, retain, time.monotonic()))
+        return self._publish(topic, data, retain)
+
+    def _send_batch(self, topic: str, messages: list[Any]) -> None:
+        """
+        Batcher callback, sends the coalesced messages of a topic.
+
+        Args:
+            topic (str): The topic of the batch.
+            messages (list[Any]): The batched payloads.
+        """
+        self._background_send(self._dispatch, topic, make_batch(messages))
+
+    def _batch_failed(self, topic: str, messages: list[Any], error: Exception) -> None:
+        """
+        Batcher error callback, hands a batch that couldn't be sent
+        to the fallback, as one batch message.
+
+        Args:
+            topic (str): The topic of the batch.
+            messages (list[Any]): The batched payloads.
+            error (Exception): Why it couldn't be sent.
+        """
+        self.sending_success[topic] = False
+        self.fallback(topic, make_batch(messages))
+
+    @staticmethod
+    def _batch_item(data: Optional[Union[str, dict[str, Any]]]) -> Any:
+        """
+        Convert a payload into the object stored in a batch, so
+        JSON strings are embedded as JSON rather than as text.
+
+        Args:
+            data (Optional[Union[str, dict[str, Any]]]): The message payload.
+
+        Returns:
+            Any: The payload as a JSON compatible object.
+        """
+        if data == "":
+            return {}
+        if isinstance(data, str):
+            try:
+                return json.loads(data)
+            except json.JSONDecodeError:
+                return data
+        return data
+
+    def _publish(
+        self, topic: str, data: Optional[Union[str, dict[str, Any]]] = None, retain: bool = False
+    ) -> bool:
+        """
+        Encode and publish a message on the current thread,
+        using the fallback if the broker can't be reached.
+
+        Args:
+            topic (str): The topic to publish the message to.
+            data (Optional[Union[str, dict[str, Any]]]): The message payload to be transmitted.
+            retain (bool): Whether to retain the message on the broker.
+
+        Returns:
+            bool: True if the message was successfully published, False otherwise.
+        """
         # Register the topic in sending_success if not already present
         if topic not in self.sending_success:
             self.sending_success[topic] = False
         # Check if the client is connected before attempting to publish
         if not self.client.is_connected():
+            self.sending_success[topic] = False
             return self.fallback(topic, data)
         if data == "":
             data = {}
-        if isinstance(data, (dict, list)):
-            data = json.dumps(data)
+        payload = data if data is None else self._serializer.encode(data)
+        if isinstance(payload, str):
+            # Fallbacks keep text payloads as sent, binary ones as the original data.
+            data = payload
 
+        qos = self._qos_for(topic)
+        if qos > 0 and not self._reserve_inflight():
+            logger.warning(f"In-flight window full, sending message for {topic} to fallback.")
+            self.sending_success[topic] = False
+            return self.fallback(topic, data)
+        publish_topic, compressed = topic, False
+        if payload is not None and self._should_compress(topic, payload):
+            publish_topic, payload = self._compress(topic, payload)
+            compressed = True
+        started = self._begin_publish() if qos > 0 else None
         try:
-            result = self.client.publish(
-                topic=topic, payload=data, qos=0, retain=retain
-            )
+            result = self._send(publish_topic, payload, qos, retain, compressed)
         except ValueError:
+            if started is not None:
+                self._end_publish(started)
             msg = f"{topic} contains wildcards, likely required instance data missing"
             exception = ClientUnreachableError(
                 msg, output_module=self, severity=SeverityLevel.ERROR
             )
             self._handle_exception(exception)
             return False
+        except Exception:
+            if started is not None:
+                self._end_publish(started)
+            raise
 
         error = self._handle_return_code(result.rc)
         if error is not None:
+            if started is not None:
+                self._end_publish(started)
             self.sending_success[topic] = False
             self._handle_exception(error)
             return self.fallback(topic, data)
+        if started is not None and not self._end_publish(
+            started, result.mid, _InflightMessage(topic, data, retain, time.monotonic())
+        ):
+            self.sending_success[topic] = False
+            return self.fallback(topic, data)
 
-        # If successfully published, check if the fallback has data on the topic
-        # Only do this once to avoid unnecessary calls
+        # The first success on a topic (or the first after an outage)
+        # schedules a background replay of anything the fallback holds.
         if not self.sending_success[topic]:
-            # To prevent recursion in case the fallback also tries to publish
             self.sending_success[topic] = True
-            if self._fallback is not None:
-                while True:
-                    fallback_data = self._fallback.retrieve(topic)
-                    if fallback_data is not None:
-                        logger.info(
-                            f"Fallback data found for topic {topic}, publishing now."
-                        )
-                        self.transmit(topic, fallback_data)
-                        # Sleep 0.05 seconds to allow the message to be processed
-                        time.sleep(0.05)
-                    else:
-                        logger.debug(
-                            f"No fallback data found for topic {topic}, stopping fallback."
-                        )
-                        break
-            # Reset the flag after processing fallback data in case new data arrives later
-            self.sending_success[topic] = False
+            self._request_drain(topic)
 
-        # Reset global failure counter only after successful transmission AND fallback processing
+        # Reset global failure counter only after successful transmission
         OutputModule.reset_failure_count()
         return True
 
+    def _send(
+        self,
+        topic: str,
+        payload: Optional[Union[str, bytes]],
+        qos: int,
+        retain: bool,
+        compressed: bool = False,
+    ) -> mqtt.MQTTMessageInfo:
+        """
+        Hand a message to the client, adding the MQTT v5 properties
+        and replacing the topic by its alias where one is set.
+
+        Args:
+            topic (str): The topic to publish on.
+            payload (Optional[Union[str, bytes]]): The encoded payload.
+            qos (int): The QoS level.
+            retain (bool): Whether to retain the message on the broker.
+            compressed (bool): Whether the payload is compressed.
+
+        Returns:
+            mqtt.MQTTMessageInfo: The result of the publish.
+        """
+        if self.protocol != mqtt.MQTTv5:
+            return self._client_publish(topic=topic, payload=payload, qos=qos,
+                                        retain=retain, properties=None)
+        topic_class = classify_topic(topic)
+        # Aliases only last for one connection, the client resends QoS 1/2
+        # messages after reconnecting so those always carry the full topic.
+        if qos > 0 or not self._alias_limit:
+            return self._client_publish(
+                topic=topic, payload=payload, qos=qos, retain=retain,
+                properties=self._v5_properties(topic_class, compressed),
+            )
+        # Held while publishing so an alias is never used before the
+        # message that sets it has been queued by the client.
+        with self._alias_lock:
+            alias, known = self._topic_alias(topic)
+            result = self._client_publish(
+                topic="" if known else topic, payload=payload, qos=qos,
+                retain=retain,
+                properties=self._v5_properties(topic_class, compressed, alias),
+            )
+            if alias is not None and not known and result.rc == mqtt.MQTT_ERR_SUCCESS:
+                previous = self._alias_topics.get(alias)
+                if previous is not None:
+                    del self._topic_aliases[previous]
+                self._topic_aliases[topic] = alias
+                self._alias_topics[alias] = topic
+                self._topic_uses.pop(topic, None)
+        return result
+
+    def _client_publish(self, **kwargs: Any) -> mqtt.MQTTMessageInfo:
+        """
+        Publish through the shared connection when there is one, so
+        the acknowledgement only comes back to this module.
+
+        Args:
+            **kwargs (Any): Arguments of paho's Client.publish.
+
+        Returns:
+            mqtt.MQTTMessageInfo: The result of the publish.
+        """
+        if self._connection is not None:
+            return self._connection.publish(self, **kwargs)
+        return self.client.publish(**kwargs)
+
+    def _v5_properties(
+        self, topic_class: str, compressed: bool, alias: Optional[int] = None
+    ) -> Properties:
+        """
+        Get the MQTT v5 properties of a message. Properties without
+        a topic alias are built once and shared.
+
+        Args:
+            topic_class (str): The class of the message's topic.
+            compressed (bool): Whether the payload is compressed.
+            alias (Optional[int]): The topic alias to send, if any.
+
+        Returns:
+            Properties: The PUBLISH properties.
+        """
+        if alias is None and (topic_class, compressed) in self._publish_properties:
+            return self._publish_properties[(topic_class, compressed)]
+        properties = Properties(PacketTypes.PUBLISH)  # type: ignore[no-untyped-call]
+        properties.ContentType = self._serializer.content_type
+        user_properties = [(ENCODING_PROPERTY, self._serializer.name)]
+        if compressed and self._compression is not None:
+            user_properties.append((COMPRESSION_PROPERTY, self._compression.compressor.name))
+        properties.UserProperty = user_properties
+        expiry = self._message_expiry[topic_class]
+        if expiry is not None:
+            properties.MessageExpiryInterval = expiry
+        if alias is None:
+            self._publish_properties[(topic_class, compressed)] = properties
+        else:
+            properties.TopicAlias = alias
+        return properties
+
+    def _topic_alias(self, topic: str) -> tuple[Optional[int], bool]:
+        """
+        Find the alias to publish a topic with, must be called
+        with the alias lock held. A topic is given an alias once it
+        has been used TOPIC_ALIAS_MIN_USES times, taking over the
+        alias of the least recently used topic if all are taken.
+
+        Args:
+            topic (str): The topic to publish on.
+
+        Returns:
+            tuple[Optional[int], bool]: The alias, None if the topic has
+                              none, and whether the broker already knows it.
+        """
+        alias = self._topic_aliases.get(topic)
+        if alias is not None:
+            self._topic_aliases.move_to_end(topic)
+            return alias, True
+        uses = self._topic_uses.get(topic, 0) + 1
+        self._topic_uses[topic] = uses
+        if uses < TOPIC_ALIAS_MIN_USES:
+            return None, False
+        if len(self._topic_aliases) < self._alias_limit:
+            return len(self._topic_aliases) + 1, False
+        return next(iter(self._topic_aliases.values())), False
+
+    def _reset_topic_aliases(self, limit: int = 0) -> None:
+        """
+        Forget the topic aliases of the previous connection.
+
+        Args:
+            limit (int): Number of aliases allowed on the new connection.
+        """
+        with self._alias_lock:
+            self._alias_limit = limit
+            self._topic_aliases.clear()
+            self._alias_topics.clear()
+            self._topic_uses.clear()
+
+    def _apply_connack_properties(self, properties: Optional[Any]) -> None:
+        """
+        Adopt the limits the broker announced when the connection
+        was accepted: its topic alias maximum and receive maximum.
+
+        Args:
+            properties (Optional[Any]): The CONNACK properties.
+        """
+        broker_aliases = getattr(properties, "TopicAliasMaximum", 0)
+        if self._shared_connection:
+            # Alias numbers would clash between modules sharing the connection.
+            broker_aliases = 0
+        self._reset_topic_aliases(min(self._topic_alias_maximum, broker_aliases))
+        receive_maximum = getattr(properties, "ReceiveMaximum", 65535)
+        window = min(self._max_inflight, receive_maximum)
+        # The client's own limit can't change on an open connection,
+        # _reserve_inflight keeps publishing within the narrower window.
+        with self._inflight_condition:
+            self._inflight_window = window
+            self._inflight_condition.notify_all()
+        if window < self._max_inflight:
+            logger.info(f"Broker receive maximum limits in-flight messages to {window}.")
+
+    def get_topic_aliases(self) -> dict[str, int]:
+        """
+        Report the topic aliases of the current connection.
+
+        Returns:
+            dict[str, int]: Alias per topic, least recently used first.
+        """
+        with self._alias_lock:
+            return dict(self._topic_aliases)
+
+    def _should_compress(self, topic: str, payload: Union[str, bytes]) -> bool:
+        """
+        Check whether a payload is compressed before publishing.
+
+        Args:
+            topic (str): The topic of the message.
+            payload (Union[str, bytes]): The encoded payload.
+
+        Returns:
+            bool: True if the topic is compressed and the payload is large enough.
+        """
+        if self._compression is None or len(payload) < self._compression.min_bytes:
+            return False
+        selected = self._compress_topics.get(topic)
+        if selected is None:
+            if self._compression.topics is None:
+                selected = classify_topic(topic) == "measurement"
+            else:
+                selected = any(mqtt.topic_matches_sub(pattern, topic)
+                               for pattern in self._compression.topics)
+            self._compress_topics[topic] = selected
+        return selected
+
+    def _compress(self, topic: str, payload: Union[str, bytes]) -> tuple[str, bytes]:
+        """
+        Compress a payload. With MQTT v5 the compression is signalled
+        through the message properties, otherwise through the topic.
+
+        Args:
+            topic (str): The topic of the message.
+            payload (Union[str, bytes]): The encoded payload.
+
+        Returns:
+            tuple[str, bytes]: Topic and payload to publish.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        if self._compression is None:
+            return topic, payload
+        compressor = self._compression.compressor
+        compressed = compressor.compress(payload)
+        with self._compression_lock:
+            self._compression_stats["compressed"] += 1
+            self._compression_stats["raw_bytes"] += len(payload)
+            self._compression_stats["compressed_bytes"] += len(compressed)
+        if self.protocol == mqtt.MQTTv5:
+            return topic, compressed
+        return f"{topic}/{COMPRESSION_TOPIC_SEGMENT}/{compressor.name}", compressed
+
+    def get_compression_stats(self) -> dict[str, Any]:
+        """
+        Report how much compression has saved.
+
+        Returns:
+            dict[str, Any]: Number of compressed messages, their size before
+                            and after compression and the ratio between them.
+                            Empty if compression is disabled.
+        """
+        if self._compression is None:
+            return {}
+        with self._compression_lock:
+            stats: dict[str, Any] = dict(self._compression_stats)
+        stats["ratio"] = (stats["compressed_bytes"] / stats["raw_bytes"]
+                          if stats["raw_bytes"] else 1.0)
+        return stats
+
+    def flush_batch(self, topic: Optional[str] = None) -> None:
+        """
+        Publish the pending batch of a topic now, or of every topic.
+
+        Args:
+            topic (Optional[str]): The topic, all topics if None.
+        """
+        if self._batcher is not None:
+            self._batcher.flush(topic)
+
     def flush(self, topic: str) -> None:
         """
         Clear any retained messages on the broker
@@ -250,8 +959,25 @@ class MQTT(OutputModule):
                 f"{self.__class__.__name__} - flush called with module disabled."
             )
             return
+        if self._batcher is not None:
+            self._batcher.flush(topic)
+        if self._queue is not None:
+            # Keep the flush ordered behind messages already queued for the topic.
+            self._enqueue(self._queue,
+                          _QueuedMessage(topic, None, True, time.monotonic(), flush=True))
+            return
+        self._flush(topic)
+
+    def _flush(self, topic: str) -> None:
+        """
+        Publish an empty retained payload on the current thread.
+
+        Args:
+            topic (str): The topic to clear retained messages for.
+        """
         try:
-            result = self.client.publish(topic=topic, payload=None, qos=0, retain=True)
+            result = self._client_publish(topic=topic, payload=None,
+                                          qos=self._qos_for(topic), retain=True)
             error = self._handle_return_code(result.rc)
             if error is not None:
                 logger.error(
@@ -266,6 +992,476 @@ class MQTT(OutputModule):
             )
             self._handle_exception(exception)
 
+    def _enqueue(self, pending: "queue.Queue[_QueuedMessage]", message: _QueuedMessage) -> bool:
+        """
+        Place a message on the publish queue, applying the
+        overflow policy when the queue is full.
+
+        Args:
+            pending (queue.Queue[_QueuedMessage]): The publish queue.
+            message (_QueuedMessage): The message to queue.
+
+        Returns:
+            bool: True if the message was queued or handed to the fallback,
+                  False otherwise.
+        """
+        if self._queue_overflow == "block":
+            try:
+                pending.put(message, timeout=self._queue_timeout)
+            except queue.Full:
+                return self._spill(message)
+        else:
+            try:
+                pending.put_nowait(message)
+            except queue.Full:
+                if self._queue_overflow == "fallback":
+                    return self._spill(message)
+                try:
+                    pending.get_nowait()
+                    pending.task_done()
+                    self._increment_queue_stat("dropped")
+                except queue.Empty:
+                    pass
+                try:
+                    pending.put_nowait(message)
+                except queue.Full:
+                    self._increment_queue_stat("dropped")
+                    return False
+        # The publisher thread reports whether it got through.
+        self._defer_outcome()
+        self._increment_queue_stat("enqueued")
+        return True
+
+    def _spill(self, message: _QueuedMessage) -> bool:
+        """
+        Hand a message that doesn't fit on the queue to the fallback.
+
+        Args:
+            message (_QueuedMessage): The message that couldn't be queued.
+
+        Returns:
+            bool: True if the fallback accepted the message, False otherwise.
+        """
+        logger.warning(f"Publish queue full, spilling message for {message.topic} to fallback.")
+        self._increment_queue_stat("spilled")
+        self.sending_success[message.topic] = False
+        return self.fallback(message.topic, message.data)
+
+    def _publish_loop(self, pending: "queue.Queue[_QueuedMessage]") -> None:
+        """
+        Publisher thread body, drains the queue one message at a time.
+
+        Args:
+            pending (queue.Queue[_QueuedMessage]): The publish queue.
+        """
+        while True:
+            message = pending.get()
+            try:
+                if message.flush:
+                    self._flush(message.topic)
+                else:
+                    self._background_send(self._publish, message.topic,
+                                          message.data, message.retain)
+            except Exception as e:
+                logger.error(f"Publisher failed to send message on {message.topic}: {e}")
+            finally:
+                latency = time.monotonic() - message.enqueued_at
+                with self._queue_stats_lock:
+                    self._queue_stats["published"] += 1
+                    self._queue_stats["latency_last"] = latency
+                    self._queue_stats["latency_total"] += latency
+                    self._queue_stats["latency_max"] = max(
+                        self._queue_stats["latency_max"], latency
+                    )
+                pending.task_done()
+
+    def _wait_for_queue(self, timeout: float) -> None:
+        """
+        Wait for the publisher thread to empty the queue.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+        """
+        if self._queue is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks > 0:
+            if time.monotonic() > deadline:
+                logger.warning(
+                    f"{self._queue.qsize()} messages still queued for {self._broker}."
+                )
+                return
+            time.sleep(0.05)
+
+    def _increment_queue_stat(self, name: str) -> None:
+        """
+        Increment one of the publish queue counters.
+
+        Args:
+            name (str): The counter to increment.
+        """
+        with self._queue_stats_lock:
+            self._queue_stats[name] += 1
+
+    def get_queue_stats(self) -> dict[str, Any]:
+        """
+        Report the state of the publish queue.
+
+        Returns:
+            dict[str, Any]: Queue depth and capacity, message counters and
+                            enqueue-to-publish latency (seconds). Empty
+                            if the module publishes synchronously.
+        """
+        if self._queue is None:
+            return {}
+        with self._queue_stats_lock:
+            stats = dict(self._queue_stats)
+        total = stats.pop("latency_total")
+        stats["latency_mean"] = total / stats["published"] if stats["published"] else 0.0
+        stats["depth"] = self._queue.qsize()
+        stats["capacity"] = self._queue.maxsize
+        return stats
+
+    def _request_drain(self, topic: str) -> None:
+        """
+        Ask the drainer to replay messages the fallback holds for a topic.
+
+        Args:
+            topic (str): The topic to replay.
+        """
+        if self._fallback is None or not hasattr(self._fallback, "retrieve"):
+            return
+        if self._drainer is None:
+            self._drainer = FallbackDrainer(
+                self._retrieve_fallback,
+                functools.partial(self._background_send, self._publish),
+                self._can_drain,
+                rate=self._drain_rate,
+                name=f"MQTTDrainer-{self._broker}",
+                retrieve_many=(self._retrieve_fallback_many
+                               if hasattr(self._fallback, "retrieve_many") else None),
+                publish_many=functools.partial(self._background_send, self._publish_many),
+            )
+        self._drainer.request(topic)
+
+    def _retrieve_fallback(self, topic: str) -> Optional[Any]:
+        """
+        Take the next buffered message for a topic from the fallback.
+
+        Args:
+            topic (str): The topic to take a message from.
+
+        Returns:
+            Optional[Any]: The message, or None if the fallback has none.
+        """
+        if self._fallback is None:
+            return None
+        retrieve: Callable[[str], Optional[Any]] = getattr(self._fallback, "retrieve")
+        return retrieve(topic)
+
+    def _retrieve_fallback_many(self, topic: str, count: int) -> list[Any]:
+        """
+        Take up to count buffered messages for a topic from the fallback.
+
+        Args:
+            topic (str): The topic to take messages from.
+            count (int): Maximum number of messages.
+
+        Returns:
+            list[Any]: The messages, oldest first, empty if there are none.
+        """
+        if self._fallback is None:
+            return []
+        retrieve_many: Callable[[str, int], list[Any]] = getattr(self._fallback, "retrieve_many")
+        return retrieve_many(topic, count)
+
+    def _publish_many(self, topic: str, messages: list[Any]) -> int:
+        """
+        Publish replayed messages of a topic, as one batch message
+        if the topic is batched.
+
+        Args:
+            topic (str): The topic.
+            messages (list[Any]): The payloads, oldest first.
+
+        Returns:
+            int: The number of messages published.
+        """
+        if len(messages) > 1 and self._batcher is not None and \
+                self._batcher.policy_for(topic) is not None:
+            batch = make_batch([self._batch_item(message) for message in messages])
+            return len(messages) if self._publish(topic, batch) else 0
+        return sum(1 for message in messages if self._publish(topic, message))
+
+    def _can_drain(self) -> bool:
+        """
+        Check whether replayed messages can be published now. Draining
+        also pauses while the publish queue is more than half full so
+        the backlog doesn't crowd out live messages.
+
+        Returns:
+            bool: True if the drainer may publish.
+        """
+        if not self.is_enabled() or not self.client.is_connected():
+            return False
+        if self._queue is not None and self._queue.qsize() > self._queue.maxsize // 2:
+            return False
+        return True
+
+    def replay_buffered(self) -> dict[str, Any]:
+        """
+        Replay what the fallback buffered. The fallback drainer already
+        replays a topic once it publishes again, a second replay would
+        take the same messages from under it and break the order of
+        each topic, so replaying is left to the drainer. Topics the
+        fallback reports a backlog for are handed to it straight away.
+        Fallbacks the drainer can't read from are replayed as by
+        other outputs.
+
+        Returns:
+            dict[str, Any]: The drainer's progress, see get_drain_progress,
+                            or for fallbacks without retrieve the outcome
+                            of the replay, see BufferReplay.get_progress.
+        """
+        if self._fallback is None or not hasattr(self._fallback, "retrieve"):
+            return super().replay_buffered()
+        get_backlog_topics = getattr(self._fallback, "get_backlog_topics", None)
+        if get_backlog_topics is not None:
+            for topic in get_backlog_topics():
+                self._request_drain(topic)
+        return self.get_drain_progress()
+
+    def get_drain_progress(self) -> dict[str, Any]:
+        """
+        Report the progress of replaying messages from the fallback.
+
+        Returns:
+            dict[str, Any]: See FallbackDrainer.get_progress, empty if
+                            nothing has been replayed yet.
+        """
+        if self._drainer is None:
+            return {}
+        return self._drainer.get_progress()
+
+    def _build_qos(self, qos: Union[int, dict[str, int]]) -> dict[str, int]:
+        """
+        Validate the QoS configuration and expand it per topic class.
+
+        Args:
+            qos (Union[int, dict[str, int]]): A QoS level or levels per topic class.
+
+        Returns:
+            dict[str, int]: QoS level for every topic class.
+
+        Raises:
+            AdapterBuildError: If a class or level is invalid.
+        """
+        if isinstance(qos, int):
+            qos = {topic_class: qos for topic_class in TOPIC_CLASSES}
+        if not isinstance(qos, dict):
+            raise AdapterBuildError("QoS must be an integer or a mapping of topic class to QoS.")
+        for topic_class, level in qos.items():
+            if topic_class not in TOPIC_CLASSES:
+                raise AdapterBuildError(f"Unknown topic class '{topic_class}' for QoS.")
+            if level not in (0, 1, 2):
+                raise AdapterBuildError(f"Unsupported QoS level '{level}'.")
+        return {topic_class: qos.get(topic_class, 0) for topic_class in TOPIC_CLASSES}
+
+    def _build_message_expiry(
+        self, expiry: Optional[Union[int, dict[str, int]]]
+    ) -> dict[str, Optional[int]]:
+        """
+        Validate the message expiry configuration and expand it per topic class.
+
+        Args:
+            expiry (Optional[Union[int, dict[str, int]]]): Seconds for every
+                   message or per topic class.
+
+        Returns:
+            dict[str, Optional[int]]: Expiry for every topic class, None
+                                      for classes that don't expire.
+
+        Raises:
+            AdapterBuildError: If a class or interval is invalid.
+        """
+        if expiry is None:
+            expiry = {}
+        elif isinstance(expiry, int):
+            expiry = {topic_class: expiry for topic_class in TOPIC_CLASSES}
+        if not isinstance(expiry, dict):
+            raise AdapterBuildError(
+                "Message expiry must be an integer or a mapping of topic class to seconds."
+            )
+        for topic_class, seconds in expiry.items():
+            if topic_class not in TOPIC_CLASSES:
+                raise AdapterBuildError(f"Unknown topic class '{topic_class}' for message expiry.")
+            if not isinstance(seconds, int) or not 0 < seconds <= 0xFFFFFFFF:
+                raise AdapterBuildError("Message expiry must be a positive number of seconds.")
+        return {topic_class: expiry.get(topic_class) for topic_class in TOPIC_CLASSES}
+
+    def _qos_for(self, topic: str) -> int:
+        """
+        Get the QoS level messages on a topic are published with.
+
+        Args:
+            topic (str): The topic.
+
+        Returns:
+            int: The QoS level.
+        """
+        return self._qos[classify_topic(topic)]
+
+    def _reserve_inflight(self) -> bool:
+        """
+        Wait until the in-flight window has room for another message.
+
+        Returns:
+            bool: True if there is room, False if the wait timed out.
+        """
+        with self._inflight_condition:
+            return self._inflight_condition.wait_for(
+                lambda: len(self._inflight) < self._inflight_window,
+                timeout=INFLIGHT_WAIT_TIMEOUT,
+            )
+
+    def _begin_publish(self) -> int:
+        """
+        Mark a QoS 1/2 publish as under way, so acknowledgements
+        that beat publish() back are kept for _end_publish.
+
+        Returns:
+            int: Arrival number of the latest acknowledgement so far,
+                 anything kept for this publish arrives after it.
+        """
+        with self._inflight_condition:
+            self._publishing += 1
+            return self._ack_seq
+
+    def _end_publish(
+        self,
+        started: int,
+        mid: Optional[int] = None,
+        message: Optional[_InflightMessage] = None,
+    ) -> bool:
+        """
+        Finish a publish begun with _begin_publish and remember the
+        message until the broker acknowledges it.
+
+        Args:
+            started (int): The value returned by _begin_publish.
+            mid (Optional[int]): Message id assigned by the client,
+                                 None if nothing was sent.
+            message (Optional[_InflightMessage]): The published message.
+
+        Returns:
+            bool: False if the broker already rejected the message.
+        """
+        with self._inflight_condition:
+            self._publishing -= 1
+            early = self._early_acks.pop(mid, None) if mid is not None else None
+            if not self._publishing:
+                # Nothing left to claim them, so older ids can't linger
+                # and be mistaken for a later message reusing the id.
+                self._early_acks.clear()
+            if message is None or mid is None:
+                return True
+            # Only an acknowledgement that arrived after this publish
+            # began can be for it, ids are reused once they wrap.
+            if early is None or early[0] <= started:
+                self._inflight[mid] = message
+                return True
+            if not early[1]:
+                self._inflight_stats["acked"] += 1
+                return True
+        logger.warning(f"Broker rejected message on {message.topic}.")
+        return False
+
+    def _wait_for_inflight(self, timeout: float) -> None:
+        """
+        Wait for the broker to acknowledge every in-flight message.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+        """
+        if not self.client.is_connected():
+            return
+        with self._inflight_condition:
+            self._inflight_condition.wait_for(lambda: not self._inflight,
+                                              timeout=timeout)
+
+    def _spill_inflight(self) -> None:
+        """
+        Move every unacknowledged message to the fallback.
+        """
+        with self._inflight_condition:
+            messages = list(self._inflight.values())
+            self._inflight.clear()
+            self._inflight_stats["spilled"] += len(messages)
+            self._inflight_condition.notify_all()
+        if messages:
+            logger.warning(
+                f"Moving {len(messages)} unacknowledged messages to fallback."
+            )
+        for message in messages:
+            self.sending_success[message.topic] = False
+            self.fallback(message.topic, message.payload)
+
+    def get_inflight_stats(self) -> dict[str, int]:
+        """
+        Report on QoS 1/2 messages awaiting acknowledgement.
+
+        Returns:
+            dict[str, int]: Number of messages in flight, the window size and
+                            counts of acknowledged and spilled messages.
+        """
+        with self._inflight_condition:
+            return {
+                "inflight": len(self._inflight),
+                "max_inflight": self._max_inflight,
+                "window": self._inflight_window,
+                **self._inflight_stats,
+            }
+
+    def on_publish(
+        self,
+        client: mqtt.Client,
+        userdata: Any,
+        mid: int,
+        reason_code: Any = None,
+        properties: Optional[Any] = None,
+    ) -> None:
+        """
+        Callback for when the broker has acknowledged a message.
+
+        Args:
+            client (mqtt.Client): The MQTT client instance.
+            userdata (Any): The private user data as set in
+                            Client() or userdata_set().
+            mid (int): The message id of the acknowledged message.
+            reason_code (Any): The acknowledgement reason code (MQTT v5).
+            properties (Optional[Any]): Additional metadata (if any).
+        """
+        with self._inflight_condition:
+            message = self._inflight.pop(mid, None)
+            rejected = getattr(reason_code, "is_failure", False)
+            if message is None:
+                # Either a QoS 0 message or an acknowledgement that beat
+                # _end_publish, only kept while a QoS 1/2 publish is under way.
+                if self._publishing:
+                    self._ack_seq += 1
+                    self._early_acks[mid] = (self._ack_seq, rejected)
+                    self._early_acks.move_to_end(mid)
+                    if len(self._early_acks) > EARLY_ACK_LIMIT:
+                        self._early_acks.popitem(last=False)
+                return
+            self._inflight_condition.notify_all()
+            if not rejected:
+                self._inflight_stats["acked"] += 1
+        if rejected:
+            logger.warning(f"Broker rejected message on {message.topic}: {reason_code}")
+            self.sending_success[message.topic] = False
+            self.fallback(message.topic, message.payload)
+
     def on_connect(
         self,
         client: mqtt.Client,
@@ -286,15 +1482,26 @@ class MQTT(OutputModule):
             rc (int): The connection result code.
             metadata (Optional[Any]): Additional metadata (if any).
         """
+        if rc == 0:
+            outage = self.connection_state.set_connected()
+            attempts = 0
+            if self._reconnector is not None:
+                attempts = self._reconnector.connected()
+            if outage is not None:
+                logger.info(f"Connection to {self._broker} restored after "
+                            f"{outage:.1f}s and {attempts} reconnect attempts.")
         if not self.is_enabled():
             logger.warning(
                 f"{self.__class__.__name__} - on_connect called with module disabled."
             )
             return
+        if self.protocol == mqtt.MQTTv5 and rc == 0:
+            self._apply_connack_properties(metadata)
         if self._is_reconnect:
             logger.info(f"Reconnected to broker {self._username}@{self._broker}")
             self._is_reconnect = False
-            # Fallback data will be sent in transmit method
+            if self._drainer is not None:
+                self._drainer.resume()
         else:
             logger.info(f"Connected to broker {self._username}@{self._broker}")
         
@@ -335,7 +1542,7 @@ class MQTT(OutputModule):
         client: mqtt.Client,
         userdata: Any,
         flags: Any,
-        rc: int,
+        rc: Union[ReasonCode, int],
         properties: Optional[Any] = None,
     ) -> None:
         """
@@ -346,11 +1553,12 @@ class MQTT(OutputModule):
             userdata (Any): The private user data as set in
                             Client() or userdata_set().
             flags (Any): Response flags sent by the broker.
-            rc (int): The disconnection result code.
+            rc (Union[ReasonCode, int]): The disconnection result code.
             properties (Optional[Any]): Additional metadata (if any).
         """
         logger.info(f"Disconnected from broker {self._username}@{self._broker}")
-        global MAX_RECONNECT_COUNT
+        self.connection_state.set_disconnected(outage=rc != mqtt.MQTT_ERR_SUCCESS)
+        self._reset_topic_aliases()
         if not self.is_enabled():
             logger.warning(
                 f"{self.__class__.__name__} - disconnect called with module disabled."
@@ -358,23 +1566,69 @@ class MQTT(OutputModule):
             return
         
         if rc != mqtt.MQTT_ERR_SUCCESS:
-            reconnect_count, reconnect_delay = 0, FIRST_RECONNECT_DELAY
-            while reconnect_count < MAX_RECONNECT_COUNT:
-                time.sleep(reconnect_delay)
-                try:
-                    self._is_reconnect = True
-                    client.reconnect()
-                    return
-                except Exception as e:
-                    logger.error(f"Reconnect attempt {reconnect_count + 1} failed: {e}")
-
-                    reconnect_delay = min(
-                        reconnect_delay * RECONNECT_RATE, MAX_RECONNECT_DELAY
-                    )
-                    reconnect_count += 1
-            self._handle_exception(
-                ClientUnreachableError("Failed to reconnect.", output_module=self)
-            )
+            if self._inflight_policy == "fallback":
+                self._spill_inflight()
+            self._is_reconnect = True
+            if self._shared_connection:
+                # The shared connection schedules its own reconnects.
+                return
+            if self._reconnector is None:
+                self._reconnector = ReconnectScheduler(
+                    self._reconnect,
+                    self._reconnect_failed,
+                    first_delay=FIRST_RECONNECT_DELAY,
+                    multiplier=RECONNECT_RATE,
+                    max_delay=MAX_RECONNECT_DELAY,
+                    max_attempts=MAX_RECONNECT_COUNT,
+                    jitter=RECONNECT_JITTER,
+                    name=f"MQTTReconnect-{self._broker}",
+                )
+            # Returns straight away so paho's network thread isn't held up.
+            self._reconnector.schedule()
+
+    def _reconnect(self) -> None:
+        """
+        One reconnection attempt, run by the reconnect scheduler.
+        """
+        self._is_reconnect = True
+        reconnect_paho_client(self.client)
+
+    def _reconnect_failed(self) -> None:
+        """
+        Called by the reconnect scheduler after the last failed attempt.
+        """
+        self._spill_inflight()
+        self._handle_exception(
+            ClientUnreachableError("Failed to reconnect.", output_module=self)
+        )
+
+    def wait_for_connection(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the client is connected to the broker.
+
+        Args:
+            timeout (Optional[float]): Maximum seconds to wait, None waits forever.
+
+        Returns:
+            bool: True if connected, False if the wait timed out.
+        """
+        return self.connection_state.wait_connected(timeout)
+
+    def get_connection_stats(self) -> dict[str, Any]:
+        """
+        Report on connection outages and reconnection attempts.
+
+        Returns:
+            dict[str, Any]: Outage counts and durations in seconds, see
+                            ConnectionState.get_outage_stats, along with
+                            whether a reconnect is pending and the attempts made.
+        """
+        stats = self.connection_state.get_outage_stats()
+        if self._reconnector is not None:
+            stats.update(self._reconnector.get_stats())
+        else:
+            stats.update({"reconnecting": False, "attempts": 0, "total_attempts": 0})
+        return stats
 
 
     def on_log(
@@ -438,7 +1692,10 @@ class MQTT(OutputModule):
             str: The subscribed topic.
         """
         logger.info(f"Subscribing to {topic}")
-        self.client.subscribe(topic)
+        if self._connection is not None:
+            self._connection.subscribe(self, topic)
+        else:
+            self.client.subscribe(topic)
         return topic
 
     def unsubscribe(self, topic: str) -> str:
@@ -452,7 +1709,10 @@ class MQTT(OutputModule):
             str: The unsubscribed topic.
         """
         logger.info(f"Unsubscribing from {topic}")
-        self.client.unsubscribe(topic)
+        if self._connection is not None:
+            self._connection.unsubscribe(self, topic)
+        else:
+            self.client.unsubscribe(topic)
         return topic
 
     def enable(self) -> bool:
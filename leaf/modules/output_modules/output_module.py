@@ -1,15 +1,60 @@
 from abc import ABC
 from abc import abstractmethod
+import inspect
 import os
 import sys
+import threading
 import time
+from typing import Callable
 from typing import Optional
 from typing import Any
+from typing import Iterable
 
 from leaf.error_handler.exceptions import AdapterLogicError
 from leaf.error_handler.exceptions import ClientUnreachableError
 from leaf.error_handler.exceptions import LEAFError
 from leaf.error_handler.error_holder import ErrorHolder
+from leaf.utility.circuit_breaker import CircuitBreaker
+from leaf.utility.circuit_breaker import CircuitBreakerPolicy
+from leaf.utility.replay import BufferReplay
+from leaf.utility.replay import ReplayPolicy
+
+# Per thread, the calls under way for each output, see _run_call.
+_transmit_calls = threading.local()
+
+
+def accepts_retain(output: "OutputModule") -> bool:
+    """
+    Check whether an output's transmit takes a retain flag, as
+    MQTT's does. Outputs that store messages, such as FILE or KEYDB,
+    don't, so wrappers only pass retain on to those that do.
+
+    Args:
+        output (OutputModule): The output.
+
+    Returns:
+        bool: True if transmit accepts retain.
+    """
+    try:
+        parameters = inspect.signature(output.transmit).parameters
+    except (TypeError, ValueError):
+        return False
+    return "retain" in parameters or any(
+        parameter.kind is inspect.Parameter.VAR_KEYWORD for parameter in parameters.values()
+    )
+
+
+class _Call:
+    """
+    Outcome of a call to an output, set while it runs. A call fails
+    if it uses the fallback or reports the output unreachable, and is
+    deferred if it only queued messages that are sent in the background.
+    """
+    __slots__ = ("failed", "deferred")
+
+    def __init__(self) -> None:
+        self.failed = False
+        self.deferred = False
 
 
 class OutputModule(ABC):
@@ -17,11 +62,26 @@ class OutputModule(ABC):
     Abstract base class for output modules responsible for transmitting
     data to external systems such as databases or network services.
     Supports fallback behavior and connection management.
+
+    Every output can be given a circuit breaker with
+    set_circuit_breaker. Once too many of its transmits fail, the
+    circuit opens and messages go straight to the fallback, without
+    waiting on the unreachable system, until a probe gets through.
+    Output modules take part by calling _guarded_transmit from
+    transmit, and _guarded_transmit_many from transmit_many, and run
+    sends made in the background through _background_send.
+
+    Once the output is back, replay_buffered sends what it and its
+    fallbacks buffered meanwhile, in batches as set with
+    set_replay_policy.
     """
 
     # Class-level failure tracking across all output modules
     _global_failure_count = 0
     _max_failures_before_reboot = int(os.getenv("LEAF_MAX_FAILURES_BEFORE_REBOOT", "5"))
+    _breaker: Optional[CircuitBreaker] = None
+    _replay_policy: ReplayPolicy = ReplayPolicy()
+    _replay: Optional[BufferReplay] = None
 
     def __init__(
         self,
@@ -46,16 +106,40 @@ class OutputModule(ABC):
         self._enabled: Optional[float] = None
 
     @abstractmethod
-    def transmit(self, topic: str, data: str) -> None:
+    def transmit(self, topic: str, data: Any = None) -> bool:
         """
         Transmit data to the output system.
 
         Args:
             topic (str): The topic or destination identifier.
-            data (str): Serialized data to be transmitted.
+            data (Any): Serialized data to be transmitted.
+
+        Returns:
+            bool: True if the data was transmitted or stored by the
+                  fallback, False otherwise.
         """
         pass
 
+    def transmit_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Transmit several messages, in order. Outputs that can send
+        a whole batch at once, in one pipeline, file write or
+        publish, override this, by default each message is
+        transmitted in turn.
+
+        Args:
+            messages (Iterable[tuple[str, Any]]): Topics and data.
+
+        Returns:
+            bool: True if every message was transmitted or stored
+                  by the fallback, False otherwise.
+        """
+        transmitted = True
+        for topic, data in messages:
+            if not self.transmit(topic, data):
+                transmitted = False
+        return transmitted
+
     @abstractmethod
     def pop(self, key: Optional[str] = None) -> Any:
         """
@@ -113,23 +197,41 @@ class OutputModule(ABC):
         if self._fallback is not None:
             self._fallback.subscribe(topic)
 
-    def fallback(self, topic: str, data: str) -> bool:
+    def fallback(self, topic: str, data: Any) -> bool:
         """
         Attempt to transmit data using the fallback module.
 
         Args:
             topic (str): Topic for the message.
-            data (str): Data to transmit.
+            data (Any): Data to transmit.
 
         Returns:
             bool: True if fallback succeeded, False otherwise.
         """
+        self._note_failure()
         if self._fallback is not None:
             return self._fallback.transmit(topic, data)
         else:
             self._handle_no_fallback_available()
             return False
 
+    def fallback_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Attempt to transmit several messages using the fallback module.
+
+        Args:
+            messages (Iterable[tuple[str, Any]]): Topics and data.
+
+        Returns:
+            bool: True if the fallback took every message, False otherwise.
+        """
+        self._note_failure()
+        if self._fallback is not None:
+            return self._fallback.transmit_many(messages)
+        else:
+            self._handle_no_fallback_available()
+            return False
+
     def _handle_no_fallback_available(self) -> None:
         """
         Handle the case when no fallback output mechanisms are available.
@@ -211,17 +313,25 @@ class OutputModule(ABC):
         """
         return self._enabled
 
-    def enable(self) -> None:
+    def enable(self) -> bool:
         """
         Re-enable output transmission.
+
+        Returns:
+            bool: True once enabled.
         """
         self._enabled = None
+        return True
 
-    def disable(self) -> None:
+    def disable(self) -> bool:
         """
         Disable output transmission to prevent data dispatch.
+
+        Returns:
+            bool: True once disabled.
         """
         self._enabled = time.time()
+        return True
 
     def pop_all_messages(self) -> Any:
         """
@@ -246,7 +356,192 @@ class OutputModule(ABC):
         Args:
             exception (LEAFError): Error to be reported or raised.
         """
+        if isinstance(exception, ClientUnreachableError) and exception.client is self:
+            self._note_failure()
         if self._error_holder is not None:
             self._error_holder.add_error(exception)
         else:
             raise exception
+
+    def _note_failure(self) -> None:
+        """
+        Tell the circuit breaker the output failed. During a call
+        the call is marked as failed, otherwise the failure is
+        recorded straight away.
+        """
+        breaker = self._breaker
+        if breaker is None:
+            return
+        call = getattr(_transmit_calls, "calls", {}).get(id(self))
+        if call is not None:
+            call.failed = True
+        else:
+            breaker.record_failure()
+
+    def _guarded_transmit(
+        self, send: Callable[..., bool], topic: str, data: Any = None, **kwargs: Any
+    ) -> bool:
+        """
+        Run a transmit through the output's circuit breaker. Output
+        modules call this from transmit with the method doing the
+        work. While the circuit is open the message goes straight to
+        the fallback without calling send.
+
+        Args:
+            send (Callable[..., bool]): Transmits the message.
+            topic (str): The topic of the message.
+            data (Any): The message.
+            **kwargs (Any): Further arguments of send.
+
+        Returns:
+            bool: The result of send, or of the fallback.
+        """
+        breaker = self._breaker
+        if breaker is None or id(self) in getattr(_transmit_calls, "calls", {}):
+            return send(topic, data, **kwargs)
+        if not breaker.allow():
+            return self.fallback(topic, data)
+        return bool(self._run_call(breaker, send, topic, data, **kwargs))
+
+    def _guarded_transmit_many(
+        self, send: Callable[[list[tuple[str, Any]]], bool],
+        messages: Iterable[tuple[str, Any]]
+    ) -> bool:
+        """
+        Run a transmit_many through the output's circuit breaker,
+        see _guarded_transmit.
+
+        Args:
+            send (Callable[[list[tuple[str, Any]]], bool]): Transmits the messages.
+            messages (Iterable[tuple[str, Any]]): Topics and data.
+
+        Returns:
+            bool: The result of send, or of the fallback.
+        """
+        messages = list(messages)
+        breaker = self._breaker
+        if breaker is None or id(self) in getattr(_transmit_calls, "calls", {}):
+            return send(messages)
+        if not breaker.allow():
+            return self.fallback_many(messages)
+        return bool(self._run_call(breaker, send, messages))
+
+    def _background_send(self, send: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a send made in the background, such as by a publisher
+        thread or a batch flush, recording its outcome with the
+        circuit breaker like a transmit's.
+
+        Args:
+            send (Callable[..., Any]): Sends the messages.
+            *args (Any): Arguments of send.
+            **kwargs (Any): Keyword arguments of send.
+
+        Returns:
+            Any: The result of send.
+        """
+        breaker = self._breaker
+        if breaker is None:
+            return send(*args, **kwargs)
+        return self._run_call(breaker, send, *args, **kwargs)
+
+    def _defer_outcome(self) -> None:
+        """
+        Mark the call under way as only having queued its messages,
+        so its outcome is left to the background send, and a probe
+        of a half open circuit isn't taken as a success.
+        """
+        call = getattr(_transmit_calls, "calls", {}).get(id(self))
+        if call is not None:
+            call.deferred = True
+
+    def _run_call(
+        self, breaker: CircuitBreaker, send: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> Any:
+        """
+        Call send and record with the breaker whether it failed.
+
+        Args:
+            breaker (CircuitBreaker): The output's circuit breaker.
+            send (Callable[..., Any]): The call.
+            *args (Any): Arguments of send.
+            **kwargs (Any): Keyword arguments of send.
+
+        Returns:
+            Any: The result of send.
+        """
+        calls = _transmit_calls.__dict__.setdefault("calls", {})
+        outer = calls.get(id(self))
+        call = calls[id(self)] = _Call()
+        try:
+            result = send(*args, **kwargs)
+        except BaseException:
+            breaker.record_failure()
+            raise
+        finally:
+            if outer is None:
+                del calls[id(self)]
+            else:
+                calls[id(self)] = outer
+        if call.failed:
+            breaker.record_failure()
+        elif not call.deferred:
+            breaker.record_success()
+        return result
+
+    def set_circuit_breaker(self, policy: Optional[CircuitBreakerPolicy]) -> None:
+        """
+        Put a circuit breaker in front of the output, or remove it.
+
+        Args:
+            policy (Optional[CircuitBreakerPolicy]): When to open and
+                   probe, None to remove the breaker.
+        """
+        if policy is None:
+            self._breaker = None
+        else:
+            self._breaker = CircuitBreaker(policy, name=self.__class__.__name__)
+
+    def get_circuit_breaker_stats(self) -> Optional[dict[str, Any]]:
+        """
+        Report the state of the output's circuit breaker and its
+        transitions, see CircuitBreaker.get_stats.
+
+        Returns:
+            Optional[dict[str, Any]]: The metrics, None without a breaker.
+        """
+        if self._breaker is None:
+            return None
+        return self._breaker.get_stats()
+
+    def set_replay_policy(self, policy: ReplayPolicy) -> None:
+        """
+        Set how replay_buffered reads and sends buffered messages.
+
+        Args:
+            policy (ReplayPolicy): Batch size, window and checkpoint.
+        """
+        self._replay_policy = policy
+
+    def replay_buffered(self) -> dict[str, Any]:
+        """
+        Send everything buffered by the module and its fallbacks
+        through the module, returning once all of it was handed over.
+
+        Returns:
+            dict[str, Any]: The outcome, see BufferReplay.get_progress.
+        """
+        self._replay = BufferReplay(self, self._replay_policy)
+        return self._replay.run()
+
+    def get_replay_progress(self) -> Optional[dict[str, Any]]:
+        """
+        Report the progress of the running or last replay, see
+        BufferReplay.get_progress.
+
+        Returns:
+            Optional[dict[str, Any]]: The metrics, None before the first replay.
+        """
+        if self._replay is None:
+            return None
+        return self._replay.get_progress()
@@ -0,0 +1,654 @@
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, Optional
+
+from leaf.error_handler.error_holder import ErrorHolder
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.error_handler.exceptions import ClientUnreachableError
+from leaf.error_handler.exceptions import SeverityLevel
+from leaf.modules.output_modules.output_module import OutputModule
+from leaf.utility.logger.logger_utils import get_logger
+from leaf.utility.topic_classes import classify_topic
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:
+    pa = None
+    pq = None
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+# Files are written under this suffix and renamed once complete.
+TMP_SUFFIX = ".tmp"
+TAG_PREFIX = "tag_"
+FIELD_PREFIX = "field_"
+
+
+def _partition_value(value: Any) -> str:
+    """
+    Make a value safe to use as a directory name.
+
+    Args:
+        value (Any): The partition value.
+
+    Returns:
+        str: The value with anything but letters, digits, "-" and "." replaced.
+    """
+    return re.sub(r"[^\w.-]", "_", str(value)) or "_"
+
+
+def _timestamp_micros(value: Any) -> int:
+    """
+    Convert a point's timestamp to microseconds since the epoch. Numbers
+    are read as seconds, milliseconds, microseconds or nanoseconds by
+    their magnitude, strings as ISO 8601 and naive times as UTC.
+
+    Args:
+        value (Any): The timestamp, the current time if None.
+
+    Returns:
+        int: Microseconds since the epoch.
+
+    Raises:
+        ValueError: If the timestamp can't be read.
+    """
+    if value is None:
+        return int(time.time() * 1_000_000)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1_000_000)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Unknown timestamp {value!r}")
+    magnitude = abs(value)
+    if magnitude >= 1e17:
+        return int(value // 1000)
+    if magnitude >= 1e14:
+        return int(value)
+    if magnitude >= 1e11:
+        return int(value * 1000)
+    return int(value * 1_000_000)
+
+
+class _Partition:
+    """
+    The rows buffered for one instance, measurement and date, kept
+    as columns, and the file they are written to.
+    """
+
+    def __init__(self, directory: str, measurement: str) -> None:
+        self.directory = directory
+        self.measurement = measurement
+        self.columns: dict[str, list[Any]] = {}
+        # The topic of every buffered row, for the fallback.
+        self.topics: list[str] = []
+        self.buffered_at: Optional[float] = None
+        self.writer: Any = None
+        self.schema: Any = None
+        self.path: Optional[str] = None
+        self.file_rows = 0
+        # Topics of the rows in the open file as [topic, count] runs,
+        # to send them to the fallback if it can't be finished.
+        self.file_topics: list[list[Any]] = []
+        self.opened_at = 0.0
+
+    @property
+    def rows(self) -> int:
+        return len(self.topics)
+
+    def append(self, topic: str, row: dict[str, Any]) -> None:
+        """
+        Buffer a row, filling the columns it doesn't have with nulls.
+
+        Args:
+            topic (str): The topic the row came from.
+            row (dict[str, Any]): Column names and values.
+        """
+        rows = self.rows
+        for name, value in row.items():
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = [None] * rows
+            column.append(value)
+        self.topics.append(topic)
+        if len(row) < len(self.columns):
+            for column in self.columns.values():
+                if len(column) == rows:
+                    column.append(None)
+        if self.buffered_at is None:
+            self.buffered_at = time.monotonic()
+
+    def clear(self) -> None:
+        self.columns = {}
+        self.topics = []
+        self.buffered_at = None
+
+    def written(self) -> None:
+        """
+        Move the topics of the buffered rows to those of the open
+        file once the rows were written, and clear the buffer.
+        """
+        for topic in self.topics:
+            if self.file_topics and self.file_topics[-1][0] == topic:
+                self.file_topics[-1][1] += 1
+            else:
+                self.file_topics.append([topic, 1])
+        self.clear()
+
+    def points(self) -> Iterator[tuple[str, dict[str, Any]]]:
+        """
+        Turn the buffered rows back into topics and InfluxPoint dicts.
+
+        Yields:
+            tuple[str, dict[str, Any]]: A topic and point.
+        """
+        return _points(self.measurement, self.columns, self.topics)
+
+
+def _points(measurement: str, columns: dict[str, list[Any]],
+            topics: Iterable[str]) -> Iterator[tuple[str, dict[str, Any]]]:
+    """
+    Turn rows, as columns with timestamps in microseconds, back
+    into topics and InfluxPoint dicts.
+
+    Args:
+        measurement (str): The measurement of the rows.
+        columns (dict[str, list[Any]]): The columns.
+        topics (Iterable[str]): The topic of every row.
+
+    Yields:
+        tuple[str, dict[str, Any]]: A topic and point.
+    """
+    for index, topic in enumerate(topics):
+        point: dict[str, Any] = {"measurement": measurement, "tags": {},
+                                 "fields": {}, "timestamp": None}
+        for name, column in columns.items():
+            value = column[index]
+            if name == "timestamp":
+                point["timestamp"] = value / 1_000_000
+            elif value is None:
+                continue
+            elif name.startswith(TAG_PREFIX):
+                point["tags"][name[len(TAG_PREFIX):]] = value
+            elif name.startswith(FIELD_PREFIX):
+                point["fields"][name[len(FIELD_PREFIX):]] = value
+        yield topic, point
+
+
+class PARQUET(OutputModule):
+    """
+    An archival output module writing measurements to columnar files
+    for later reprocessing with vectorized tools such as pyarrow,
+    pandas, polars or DuckDB. Requires the pyarrow package, installed
+    with the parquet extra.
+
+    Only measurement topics are archived. Every InfluxPoint dict is
+    a row with a timestamp column, the experiment id and a column per
+    tag (``tag_<name>``) and field (``field_<name>``). Rows are
+    buffered in memory as columns per partition and written as a
+    row group of row_group_size rows, or sooner once the oldest has
+    waited flush_interval seconds. Files are partitioned Hive style:
+
+        <directory>/instance_id=<id>/measurement=<name>/date=<YYYY-MM-DD>/part-<n>.parquet
+
+    A file is written under a ``.tmp`` suffix and renamed once it is
+    closed, at rotation or disconnect, so readers only see complete
+    files. Columns a file was started with keep their type, a row
+    group with new columns or types that don't convert starts a new
+    file. Messages can't be popped back out of the archive.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        fallback: Optional[OutputModule] = None,
+        error_holder: Optional[ErrorHolder] = None,
+        format: str = "parquet",
+        compression: str = "zstd",
+        row_group_size: int = 10000,
+        max_file_rows: int = 1000000,
+        max_file_age: float = 3600,
+        flush_interval: float = 60,
+    ) -> None:
+        """
+        Initialize the PARQUET output.
+
+        Args:
+            directory (str): Root directory of the archive, created if missing.
+            fallback (Optional[OutputModule]): Fallback module for
+                     measurements that couldn't be written.
+            error_holder (Optional[ErrorHolder]): Optional error holder
+                         for tracking errors.
+            format (str): "parquet" or "arrow" for Arrow IPC files.
+            compression (str): Compression codec such as "zstd", "lz4",
+                         "snappy" or "none".
+            row_group_size (int): Rows buffered per partition and written
+                         as one row group (record batch for Arrow).
+            max_file_rows (int): Rows after which a file is closed and
+                         a new one started.
+            max_file_age (float): Seconds after which a file is closed
+                         and a new one started.
+            flush_interval (float): Seconds buffered rows wait at most
+                         before they are written as a smaller row group.
+        """
+        super().__init__(fallback=fallback, error_holder=error_holder)
+        if pa is None:
+            raise AdapterBuildError(
+                "The PARQUET output requires the pyarrow package, install it "
+                "with pip install leaf-framework[parquet]."
+            )
+        if format not in FORMATS:
+            raise AdapterBuildError(
+                f"Unknown PARQUET format '{format}', expected one of "
+                f"{', '.join(FORMATS)}."
+            )
+        try:
+            available = compression == "none" or pa.Codec.is_available(compression)
+        except ValueError:
+            available = False
+        if not available:
+            raise AdapterBuildError(f"Compression '{compression}' isn't available.")
+        if format == "arrow" and compression not in ("none", "lz4", "zstd"):
+            raise AdapterBuildError("Arrow files are compressed with lz4, zstd or none.")
+        for name, value in (("row_group_size", row_group_size),
+                            ("max_file_rows", max_file_rows)):
+            if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+                raise AdapterBuildError(f"PARQUET {name} must be a positive integer.")
+        for name, seconds in (("max_file_age", max_file_age),
+                              ("flush_interval", flush_interval)):
+            if not isinstance(seconds, (int, float)) or isinstance(seconds, bool) or seconds <= 0:
+                raise AdapterBuildError(f"PARQUET {name} must be a positive number.")
+
+        self.directory: str = directory
+        self._format: str = format
+        self._compression: Optional[str] = None if compression == "none" else compression
+        self._row_group_size: int = row_group_size
+        self._max_file_rows: int = max_file_rows
+        self._max_file_age: float = max_file_age
+        self._flush_interval: float = flush_interval
+        # {(instance_id, measurement, date): _Partition}
+        self._partitions: dict[tuple[str, str, str], _Partition] = {}
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._stopped.set()
+        self._file_counter = 0
+        self.connect()
+
+    def _handle_write_error(self, error: Exception, path: str) -> None:
+        """
+        Report a failed write to the error handler.
+
+        Args:
+            error (Exception): The exception that occurred.
+            path (str): The file or directory written to.
+        """
+        if isinstance(error, PermissionError):
+            message = f"Permission denied when writing '{path}'"
+            severity = SeverityLevel.CRITICAL
+        else:
+            message = f"Failed to write archive file '{path}': {error}"
+            severity = SeverityLevel.ERROR
+        self._handle_exception(ClientUnreachableError(message,
+                                                      output_module=self,
+                                                      severity=severity))
+
+    def connect(self) -> None:
+        """
+        Create the archive directory and start writing buffered
+        rows in the background.
+        """
+        if not self._stopped.is_set():
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            self._handle_write_error(e, self.directory)
+            return
+        self._stopped.clear()
+        threading.Thread(target=self._flush_loop,
+                         name=f"PARQUETFlusher-{os.path.basename(self.directory)}",
+                         daemon=True).start()
+
+    def disconnect(self) -> None:
+        """
+        Write the buffered rows and close every open file.
+        """
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self.flush_all(close=True)
+        logger.info(f"Closed archive '{self.directory}'.")
+
+    def is_connected(self) -> bool:
+        """
+        Returns:
+            bool: True if the archive is open for writing.
+        """
+        return not self._stopped.is_set()
+
+    def transmit(self, topic: str, data: Optional[Any] = None) -> bool:
+        """
+        Buffer the measurements of a message for the archive. Other
+        messages are ignored.
+
+        Args:
+            topic (str): The message topic.
+            data (Optional[Any]): An InfluxPoint dict, a list of them,
+                                  or either as a JSON string.
+
+        Returns:
+            bool: True if the message was archived, ignored or stored
+                  by the fallback, False if it isn't valid, in which
+                  case none of its points are archived.
+        """
+        return self._guarded_transmit(self._transmit, topic, data)
+
+    def _transmit(self, topic: str, data: Optional[Any] = None) -> bool:
+        """
+        Transmit a message, see transmit.
+        """
+        if data is None or classify_topic(topic) != "measurement":
+            return True
+        if not self.is_connected():
+            return self.fallback(topic, data)
+        if isinstance(data, (str, bytes)):
+            try:
+                data = json.loads(data)
+            except ValueError as e:
+                logger.warning(f"Can't archive message of '{topic}', invalid JSON: {e}")
+                return False
+        points = data if isinstance(data, list) else [data]
+
+        parts = topic.split("/")
+        instance_id = parts[2] if len(parts) > 2 else ""
+        experiment_id = parts[parts.index("experiment") + 1] \
+            if "experiment" in parts[:-1] else None
+        topic_measurement = parts[-1]
+        # Every point is checked before any is buffered, so an invalid
+        # one doesn't leave the message half archived.
+        rows = []
+        for point in points:
+            try:
+                rows.append(self._row(point, instance_id,
+                                      experiment_id, topic_measurement))
+            except (TypeError, ValueError, AttributeError) as e:
+                logger.warning(f"Can't archive measurement of '{topic}': {e}")
+                return False
+        full = []
+        with self._lock:
+            for key, row in rows:
+                partition = self._partitions.get(key)
+                if partition is None:
+                    partition = self._partitions[key] = _Partition(
+                        os.path.join(self.directory,
+                                     *(f"{name}={_partition_value(value)}" for name, value in
+                                       zip(("instance_id", "measurement", "date"), key))),
+                        key[1])
+                partition.append(topic, row)
+                if partition.rows >= self._row_group_size:
+                    full.append(partition)
+            for partition in full:
+                self._write(partition)
+        return True
+
+    def _row(self, point: dict[str, Any], instance_id: str,
+             experiment_id: Optional[str],
+             topic_measurement: str) -> tuple[tuple[str, str, str], dict[str, Any]]:
+        """
+        Turn an InfluxPoint dict into its partition and row.
+
+        Args:
+            point (dict[str, Any]): The point.
+            instance_id (str): The instance it came from.
+            experiment_id (Optional[str]): The experiment it belongs to.
+            topic_measurement (str): The measurement named by the topic.
+
+        Returns:
+            tuple[tuple[str, str, str], dict[str, Any]]: The instance,
+                measurement and date of the point, and its columns.
+
+        Raises:
+            TypeError, ValueError, AttributeError: If the point is invalid.
+        """
+        timestamp = _timestamp_micros(point.get("timestamp"))
+        date = datetime.fromtimestamp(timestamp / 1_000_000, tz=timezone.utc)
+        measurement = point.get("measurement") or topic_measurement
+        row: dict[str, Any] = {"timestamp": timestamp, "experiment_id": experiment_id}
+        for name, value in (point.get("tags") or {}).items():
+            row[TAG_PREFIX + name] = value
+        for name, value in (point.get("fields") or {}).items():
+            row[FIELD_PREFIX + name] = value
+        return (instance_id, str(measurement), date.strftime("%Y-%m-%d")), row
+
+    def _table(self, partition: _Partition) -> Any:
+        """
+        Build an Arrow table from the rows buffered for a partition.
+        A column mixing types that don't convert is stored as strings.
+
+        Args:
+            partition (_Partition): The partition.
+
+        Returns:
+            pa.Table: The rows.
+        """
+        arrays = {}
+        for name in sorted(partition.columns, key=lambda n: (n != "timestamp", n)):
+            values = partition.columns[name]
+            if name == "timestamp":
+                arrays[name] = pa.array(values, type=pa.timestamp("us", tz="UTC"))
+                continue
+            try:
+                arrays[name] = pa.array(values)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                arrays[name] = pa.array([None if v is None else str(v) for v in values],
+                                        type=pa.string())
+        return pa.table(arrays)
+
+    def _conform(self, table: Any, schema: Any) -> Optional[Any]:
+        """
+        Fit a table to the schema of an open file.
+
+        Args:
+            table (pa.Table): The rows.
+            schema (pa.Schema): The file's schema.
+
+        Returns:
+            Optional[pa.Table]: The rows with the file's columns and types,
+                                None if they don't fit.
+        """
+        if table.schema.equals(schema):
+            return table
+        if not set(table.column_names) <= set(schema.names):
+            return None
+        columns = []
+        try:
+            for field in schema:
+                if field.name in table.column_names:
+                    columns.append(table[field.name].cast(field.type))
+                else:
+                    columns.append(pa.nulls(table.num_rows, field.type))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            return None
+        return pa.Table.from_arrays(columns, schema=schema)
+
+    def _open(self, partition: _Partition, schema: Any) -> None:
+        """
+        Start a new file for a partition.
+
+        Args:
+            partition (_Partition): The partition.
+            schema (pa.Schema): The columns of the file.
+        """
+        os.makedirs(partition.directory, exist_ok=True)
+        self._file_counter += 1
+        name = f"part-{int(time.time() * 1000)}-{self._file_counter:04d}" \
+               f"{FORMATS[self._format]}"
+        path = os.path.join(partition.directory, name)
+        if self._format == "parquet":
+            writer = pq.ParquetWriter(path + TMP_SUFFIX, schema,
+                                      compression=self._compression or "none")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=self._compression)
+            writer = pa.ipc.new_file(path + TMP_SUFFIX, schema, options=options)
+        partition.writer = writer
+        partition.schema = schema
+        partition.path = path
+        partition.file_rows = 0
+        partition.file_topics = []
+        partition.opened_at = time.monotonic()
+
+    def _close(self, partition: _Partition) -> None:
+        """
+        Finish the open file of a partition and give it its final name.
+        A file that can't be finished has its rows sent to the fallback
+        and is removed.
+
+        Args:
+            partition (_Partition): The partition.
+        """
+        if partition.writer is None or partition.path is None:
+            return
+        writer, path = partition.writer, partition.path
+        partition.writer = None
+        partition.path = None
+        try:
+            writer.close()
+            os.replace(path + TMP_SUFFIX, path)
+            logger.debug(f"Closed archive file '{path}' with {partition.file_rows} rows.")
+        except (OSError, pa.ArrowException) as e:
+            partition.file_topics, file_topics = [], partition.file_topics
+            self._salvage(partition.measurement, path + TMP_SUFFIX, file_topics)
+            self._handle_write_error(e, path)
+            return
+        partition.file_topics = []
+
+    def _salvage(self, measurement: str, path: str, file_topics: list[list[Any]]) -> None:
+        """
+        Send the rows of a file that couldn't be finished to the
+        fallback and remove it. Rows are lost if the file can't be read.
+
+        Args:
+            measurement (str): The measurement of the rows.
+            path (str): The unfinished file.
+            file_topics (list[list[Any]]): The topics of its rows as
+                        [topic, count] runs.
+        """
+        try:
+            if self._format == "parquet":
+                table = pq.read_table(path)
+            else:
+                with pa.memory_map(path) as source:
+                    table = pa.ipc.open_file(source).read_all()
+        except (OSError, pa.ArrowException) as e:
+            rows = sum(count for _, count in file_topics)
+            logger.error(f"Lost {rows} rows of unreadable archive file '{path}': {e}")
+        else:
+            index = table.schema.get_field_index("timestamp")
+            table = table.set_column(index, "timestamp",
+                                     table["timestamp"].cast(pa.int64()))
+            topics = (topic for topic, count in file_topics for _ in range(count))
+            for topic, point in _points(measurement, table.to_pydict(), topics):
+                self.fallback(topic, point)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Can't remove unfinished archive file '{path}': {e}")
+
+    def _write(self, partition: _Partition) -> None:
+        """
+        Write the rows buffered for a partition as one row group,
+        rotating the file if it is full, too old or the rows don't fit
+        its columns. Rows that can't be written go to the fallback and
+        the file is finished with the row groups written before.
+
+        Args:
+            partition (_Partition): The partition.
+        """
+        if not partition.rows:
+            return
+        try:
+            table = self._table(partition)
+            if partition.writer is not None:
+                conformed = self._conform(table, partition.schema)
+                if conformed is None:
+                    self._close(partition)
+                else:
+                    table = conformed
+            if partition.writer is None:
+                self._open(partition, table.schema)
+            if self._format == "parquet":
+                partition.writer.write_table(table, row_group_size=self._row_group_size)
+            else:
+                partition.writer.write_table(table, max_chunksize=self._row_group_size)
+        except (OSError, pa.ArrowException) as e:
+            for topic, point in partition.points():
+                self.fallback(topic, point)
+            partition.clear()
+            path = partition.path or partition.directory
+            self._close(partition)
+            self._handle_write_error(e, path)
+            return
+        partition.file_rows += table.num_rows
+        partition.written()
+        OutputModule.reset_failure_count()
+        if partition.file_rows >= self._max_file_rows or \
+                time.monotonic() - partition.opened_at >= self._max_file_age:
+            self._close(partition)
+
+    def flush_all(self, close: bool = False) -> None:
+        """
+        Write the rows buffered for every partition.
+
+        Args:
+            close (bool): Also close the open files.
+        """
+        with self._lock:
+            for key, partition in list(self._partitions.items()):
+                self._write(partition)
+                if close:
+                    self._close(partition)
+                if partition.writer is None:
+                    del self._partitions[key]
+
+    def _flush_loop(self) -> None:
+        """
+        Write rows that have waited flush_interval and close files
+        older than max_file_age.
+        """
+        while not self._stopped.wait(min(1.0, self._flush_interval)):
+            now = time.monotonic()
+            try:
+                with self._lock:
+                    for key, partition in list(self._partitions.items()):
+                        if partition.buffered_at is not None and \
+                                now - partition.buffered_at >= self._flush_interval:
+                            self._write(partition)
+                        if partition.writer is not None and \
+                                now - partition.opened_at >= self._max_file_age:
+                            self._close(partition)
+                        if partition.writer is None and not partition.rows:
+                            del self._partitions[key]
+            except Exception as e:
+                logger.error(f"Failed to flush archive: {e}")
+
+    def pop(self, key: Optional[str] = None) -> None:
+        """
+        Archived measurements can't be popped.
+
+        Args:
+            key (Optional[str]): Unused.
+
+        Returns:
+            None
+        """
+        return None
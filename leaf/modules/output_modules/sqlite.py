@@ -0,0 +1,609 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, Optional
+
+from leaf.error_handler.error_holder import ErrorHolder
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.error_handler.exceptions import ClientUnreachableError
+from leaf.error_handler.exceptions import SeverityLevel
+from leaf.modules.output_modules.keydb import decode_message
+from leaf.modules.output_modules.keydb import encode_message
+from leaf.modules.output_modules.output_module import OutputModule
+from leaf.utility.batching import BatchPolicy
+from leaf.utility.batching import build_batch_policies
+from leaf.utility.logger.logger_utils import get_logger
+from leaf.utility.serializers import get_serializer
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+# Rows read and deleted at once when draining the buffer.
+DRAIN_CHUNK_SIZE = 500
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS messages ("
+    " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " topic TEXT NOT NULL,"
+    " payload BLOB NOT NULL,"
+    " created REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS messages_topic_seq ON messages (topic, seq)",
+)
+
+
+class SQLITE(OutputModule):
+    """
+    An output module buffering messages in a local SQLite database,
+    for store-and-forward on machines that don't run KeyDB. The
+    database is in WAL mode, so readers don't block writers, and
+    every message gets an increasing sequence number, so messages
+    come back in the order they were written, per topic through the
+    index on (topic, seq). Values are encoded with the configured
+    serializer as in KEYDB.
+
+    Every write is a transaction, with batching enabled writes are
+    held and inserted together in one transaction once the batch is
+    full or has lingered. Draining reads the buffer in chunks from a
+    sequence number cursor and deletes each chunk once its messages
+    have been handed out.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        fallback: Optional[OutputModule] = None,
+        error_holder: Optional[ErrorHolder] = None,
+        serializer: str = "json",
+        batch: Optional[dict[str, Any]] = None,
+        synchronous: str = "NORMAL",
+        timeout: float = 5.0,
+    ) -> None:
+        """
+        Initialize the SQLITE output and open the database.
+
+        Args:
+            filename (str): Path of the database file, created if missing.
+            fallback (Optional[OutputModule]): Fallback module to use
+                     if the database can't be written.
+            error_holder (Optional[ErrorHolder]): Optional error holder
+                         for tracking errors.
+            serializer (str): Value encoding, see leaf.utility.serializers.
+            batch (Optional[dict[str, Any]]): Hold writes and insert them in
+                         one transaction once max_count messages or max_bytes
+                         are pending, or the oldest has waited max_linger_ms.
+                         Every write is its own transaction when not given.
+            synchronous (str): SQLite synchronous setting, "OFF", "NORMAL"
+                         or "FULL". NORMAL in WAL mode survives a process
+                         crash, FULL also a power cut.
+            timeout (float): Seconds to wait for a lock held by another
+                         connection to the database.
+        """
+        super().__init__(fallback=fallback, error_holder=error_holder)
+        self._serializer = get_serializer(serializer)
+        self.filename: str = filename
+        if not isinstance(synchronous, str) or synchronous.upper() not in SYNCHRONOUS_MODES:
+            raise AdapterBuildError(
+                f"Unknown SQLITE synchronous mode '{synchronous}', expected one of "
+                f"{', '.join(SYNCHRONOUS_MODES)}."
+            )
+        self._synchronous: str = synchronous.upper()
+        self._timeout: float = timeout
+        self._connection: Optional[sqlite3.Connection] = None
+        # The connection is shared by the callers' threads and the flusher.
+        self._lock = threading.RLock()
+
+        self._batch_policy: Optional[BatchPolicy] = None
+        if batch is not None:
+            self._batch_policy, topics = build_batch_policies(batch)
+            if topics is not None:
+                raise AdapterBuildError("SQLITE batches don't take per-topic options.")
+        # [(topic, payload, fallback data)]
+        self._pending: list[tuple[str, bytes, Any]] = []
+        self._pending_bytes: int = 0
+        self._pending_deadline: Optional[float] = None
+        self._batch_condition = threading.Condition()
+        # Held while a batch is written so batches land in order.
+        self._flush_lock = threading.Lock()
+        self._linger_thread: Optional[threading.Thread] = None
+        self._linger_running: bool = False
+        self.connect()
+
+    def _handle_sqlite_error(self, exception: sqlite3.Error) -> None:
+        """
+        Report a SQLite error to the error handler.
+
+        Args:
+            exception (sqlite3.Error): The exception that occurred.
+        """
+        if isinstance(exception, sqlite3.OperationalError):
+            if "locked" in str(exception) or "busy" in str(exception):
+                message = f"SQLite database '{self.filename}' is locked: {exception}"
+                severity = SeverityLevel.WARNING
+            else:
+                message = f"Failed to access SQLite database '{self.filename}': {exception}"
+                severity = SeverityLevel.ERROR
+        elif isinstance(exception, sqlite3.DatabaseError):
+            message = f"SQLite database '{self.filename}' is unusable: {exception}"
+            severity = SeverityLevel.CRITICAL
+        else:
+            message = f"SQLite error for '{self.filename}': {exception}"
+            severity = SeverityLevel.WARNING
+        self._handle_exception(
+            ClientUnreachableError(message, output_module=self, severity=severity)
+        )
+
+    def connect(self) -> None:
+        """
+        Open the database in WAL mode and create the buffer table.
+        """
+        if self._connection is not None:
+            return
+        try:
+            # Transactions are opened explicitly.
+            connection = sqlite3.connect(self.filename, timeout=self._timeout,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(f"PRAGMA synchronous={self._synchronous}")
+            for statement in SCHEMA:
+                connection.execute(statement)
+            with self._lock:
+                self._connection = connection
+            logger.info(f"Opened SQLite buffer '{self.filename}'.")
+        except sqlite3.Error as e:
+            self._handle_sqlite_error(e)
+            return
+        self._start_linger()
+
+    def _start_linger(self) -> None:
+        """
+        Start the thread flushing held writes, if batching is
+        enabled and it isn't running.
+        """
+        if self._batch_policy is None:
+            return
+        with self._batch_condition:
+            if self._linger_running:
+                return
+            self._linger_running = True
+            self._linger_thread = threading.Thread(
+                target=self._linger_loop,
+                name=f"SQLITEFlusher-{os.path.basename(self.filename)}",
+                daemon=True,
+            )
+            self._linger_thread.start()
+
+    def _stop_linger(self) -> None:
+        """
+        Stop the thread flushing held writes and wait for it to end.
+        """
+        with self._batch_condition:
+            self._linger_running = False
+            self._batch_condition.notify_all()
+            thread, self._linger_thread = self._linger_thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def transmit(self, topic: str, data: Optional[Any] = None) -> bool:
+        """
+        Store a message in the database.
+
+        Args:
+            topic (str): The message topic.
+            data (Optional[Any]): A JSON string or a JSON compatible object.
+
+        Returns:
+            bool: True if the message was stored here, held for a batch
+                  or stored by the fallback, False otherwise.
+        """
+        return self._guarded_transmit(self._transmit, topic, data)
+
+    def _transmit(self, topic: str, data: Optional[Any] = None) -> bool:
+        """
+        Transmit a message, see transmit.
+        """
+        encoded = encode_message(self._serializer, data)
+        if encoded is None:
+            return False
+        payload, data = encoded
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+
+        if self._connection is None:
+            return self.fallback(topic, data)
+
+        if self._batch_policy is not None:
+            self._add_to_batch(self._batch_policy, topic, payload, data)
+            return True
+
+        try:
+            self._insert([(topic, payload)])
+            OutputModule.reset_failure_count()
+            return True
+        except sqlite3.Error as e:
+            self._handle_sqlite_error(e)
+            return self.fallback(topic, data)
+
+    def transmit_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Store several messages in one transaction, or add them to
+        the batch with batching enabled.
+
+        Args:
+            messages (Iterable[tuple[str, Any]]): Topics and data.
+
+        Returns:
+            bool: True if every message was stored here, held for a batch
+                  or stored by the fallback, False if any was invalid.
+        """
+        return self._guarded_transmit_many(self._transmit_many, messages)
+
+    def _transmit_many(self, messages: Iterable[tuple[str, Any]]) -> bool:
+        """
+        Transmit several messages, see transmit_many.
+        """
+        valid = True
+        pending = []
+        for topic, data in messages:
+            encoded = encode_message(self._serializer, data)
+            if encoded is None:
+                valid = False
+                continue
+            payload, data = encoded
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+            pending.append((topic, payload, data))
+        if not pending:
+            return valid
+
+        if self._connection is None:
+            return self.fallback_many((topic, data) for topic, _, data in pending) and valid
+
+        if self._batch_policy is not None:
+            for topic, payload, data in pending:
+                self._add_to_batch(self._batch_policy, topic, payload, data)
+            return valid
+
+        try:
+            self._insert([(topic, payload) for topic, payload, _ in pending])
+            OutputModule.reset_failure_count()
+            return valid
+        except sqlite3.Error as e:
+            self._handle_sqlite_error(e)
+            return self.fallback_many((topic, data) for topic, _, data in pending) and valid
+
+    def _insert(self, rows: list[tuple[str, bytes]]) -> None:
+        """
+        Insert messages in one transaction.
+
+        Args:
+            rows (list[tuple[str, bytes]]): Topics and encoded messages, oldest first.
+
+        Raises:
+            sqlite3.Error: If the transaction failed, nothing was inserted.
+        """
+        created = time.time()
+        with self._lock:
+            if self._connection is None:
+                raise sqlite3.OperationalError("database is closed")
+            with self._transaction() as connection:
+                connection.executemany(
+                    "INSERT INTO messages (topic, payload, created) VALUES (?, ?, ?)",
+                    [(topic, payload, created) for topic, payload in rows],
+                )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Run statements in a write transaction, committed when the block
+        ends and rolled back if it raises. BEGIN IMMEDIATE takes the
+        write lock up front, so other connections wait for it with the
+        busy timeout rather than failing halfway through.
+
+        Yields:
+            sqlite3.Connection: The connection.
+        """
+        connection = self._connection
+        if connection is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _add_to_batch(self, policy: BatchPolicy, topic: str, payload: bytes,
+                      data: Any) -> None:
+        """
+        Hold a write until its batch is flushed, flushing
+        straight away once the batch is full.
+
+        Args:
+            policy (BatchPolicy): The output's batch policy.
+            topic (str): The message topic.
+            payload (bytes): The encoded value.
+            data (Any): What to give the fallback if the write fails.
+        """
+        with self._batch_condition:
+            self._pending.append((topic, payload, data))
+            self._pending_bytes += len(payload)
+            if self._pending_deadline is None:
+                self._pending_deadline = time.monotonic() + policy.max_linger_ms / 1000
+                self._batch_condition.notify()
+            full = (len(self._pending) >= policy.max_count or
+                    self._pending_bytes >= policy.max_bytes)
+        if full:
+            self.flush_batch()
+
+    def flush_batch(self) -> None:
+        """
+        Insert every held message in one transaction. If it fails
+        the messages go to the fallback instead.
+        """
+        with self._flush_lock:
+            with self._batch_condition:
+                pending = self._pending
+                if not pending:
+                    return
+                self._pending = []
+                self._pending_bytes = 0
+                self._pending_deadline = None
+            try:
+                self._insert([(topic, payload) for topic, payload, _ in pending])
+                logger.debug(f"Inserted {len(pending)} messages into SQLite.")
+                OutputModule.reset_failure_count()
+                return
+            except sqlite3.Error as e:
+                self._handle_sqlite_error(e)
+        self.fallback_many((topic, data) for topic, _, data in pending)
+
+    def _linger_loop(self) -> None:
+        """
+        Flush the held writes once the oldest has waited its linger
+        time, until _stop_linger is called.
+        """
+        while True:
+            with self._batch_condition:
+                while self._linger_running and (
+                        self._pending_deadline is None or
+                        self._pending_deadline > time.monotonic()):
+                    timeout = None
+                    if self._pending_deadline is not None:
+                        timeout = self._pending_deadline - time.monotonic()
+                    self._batch_condition.wait(timeout)
+                if not self._linger_running:
+                    return
+            try:
+                self.flush_batch()
+            except Exception as e:
+                logger.error(f"Failed to flush SQLite batch: {e}")
+
+    def _decode(self, payload: bytes) -> Any:
+        """
+        Args:
+            payload (bytes): The stored value.
+
+        Returns:
+            Any: A UTF-8 string, or a decoded object for binary serializers.
+        """
+        return decode_message(self._serializer, payload)
+
+    def _take(self, topic: Optional[str], count: int) -> list[tuple[str, bytes]]:
+        """
+        Remove and return the oldest messages in one transaction.
+
+        Args:
+            topic (Optional[str]): Only take messages of this topic.
+            count (int): Maximum number of messages.
+
+        Returns:
+            list[tuple[str, bytes]]: Topics and stored values, oldest first.
+
+        Raises:
+            sqlite3.Error: If the database can't be read or written.
+        """
+        with self._lock:
+            if self._connection is None:
+                return []
+            with self._transaction() as connection:
+                if topic is None:
+                    rows = connection.execute(
+                        "SELECT seq, topic, payload FROM messages ORDER BY seq LIMIT ?",
+                        (count,),
+                    ).fetchall()
+                else:
+                    rows = connection.execute(
+                        "SELECT seq, topic, payload FROM messages WHERE topic = ? "
+                        "ORDER BY seq LIMIT ?",
+                        (topic, count),
+                    ).fetchall()
+                if rows:
+                    connection.execute("DELETE FROM messages WHERE seq IN "
+                                       f"({', '.join('?' * len(rows))})",
+                                       [seq for seq, _, _ in rows])
+        return [(row_topic, payload) for _, row_topic, payload in rows]
+
+    def retrieve(self, topic: str) -> Optional[Any]:
+        """
+        Remove and return the oldest message of a topic.
+
+        Args:
+            topic (str): The topic.
+
+        Returns:
+            Optional[Any]: The message as a UTF-8 string (decoded object
+                           for binary serializers), or None if there is none.
+        """
+        messages = self.retrieve_many(topic, 1)
+        return messages[0] if messages else None
+
+    def retrieve_many(self, topic: str, count: Optional[int] = None) -> list[Any]:
+        """
+        Remove and return up to count messages of a topic, oldest first.
+
+        Args:
+            topic (str): The topic.
+            count (Optional[int]): Maximum number of messages,
+                                   DRAIN_CHUNK_SIZE if not given.
+
+        Returns:
+            list[Any]: The messages, decoded as by retrieve, empty if none.
+        """
+        try:
+            rows = self._take(topic, count or DRAIN_CHUNK_SIZE)
+        except sqlite3.Error as e:
+            self._handle_sqlite_error(e)
+            return []
+        return [self._decode(payload) for _, payload in rows]
+
+    def pop(self, key: Optional[str] = None) -> Optional[tuple[str, Any]]:
+        """
+        Remove and return the oldest message of a topic, or the oldest
+        message of any topic if none is given.
+
+        Args:
+            key (Optional[str]): The topic.
+
+        Returns:
+            Optional[tuple[str, Any]]: The topic and decoded message,
+                                       or None if there is none.
+        """
+        try:
+            rows = self._take(key, 1)
+        except sqlite3.Error as e:
+            self._handle_sqlite_error(e)
+            return None
+        if not rows:
+            return None
+        topic, payload = rows[0]
+        return topic, self._serializer.loads(payload)
+
+    def pop_all_messages(self) -> Any:
+        """
+        Yield every buffered message in the order they were written,
+        followed by those of the fallback. The buffer is read in chunks
+        of DRAIN_CHUNK_SIZE from a sequence number cursor, and a chunk
+        is deleted once all of its messages have been yielded.
+
+        Yields:
+            tuple[str, Any]: Topic and decoded value.
+        """
+        self.flush_batch()
+        cursor = 0
+        while True:
+            try:
+                with self._lock:
+                    if self._connection is None:
+                        break
+                    rows = self._connection.execute(
+                        "SELECT seq, topic, payload FROM messages WHERE seq > ? "
+                        "ORDER BY seq LIMIT ?",
+                        (cursor, DRAIN_CHUNK_SIZE),
+                    ).fetchall()
+            except sqlite3.Error as e:
+                self._handle_sqlite_error(e)
+                break
+            for _, topic, payload in rows:
+                yield topic, self._decode(payload)
+            if not rows:
+                break
+            first, cursor = rows[0][0], rows[-1][0]
+            try:
+                with self._lock:
+                    if self._connection is None:
+                        break
+                    with self._transaction() as connection:
+                        connection.execute("DELETE FROM messages WHERE seq BETWEEN ? AND ?",
+                                           (first, cursor))
+            except sqlite3.Error as e:
+                self._handle_sqlite_error(e)
+                break
+            if len(rows) < DRAIN_CHUNK_SIZE:
+                break
+        if self._fallback is not None:
+            yield from self._fallback.pop_all_messages()
+
+    def get_backlog(self, topic: str) -> int:
+        """
+        Args:
+            topic (str): The topic.
+
+        Returns:
+            int: Number of buffered messages of the topic.
+        """
+        return self._count("SELECT COUNT(*) FROM messages WHERE topic = ?", (topic,))
+
+    def get_backlog_topics(self) -> dict[str, int]:
+        """
+        Returns:
+            dict[str, int]: Topics with buffered messages and their count.
+        """
+        try:
+            with self._lock:
+                if self._connection is None:
+                    return {}
+                rows = self._connection.execute(
+                    "SELECT topic, COUNT(*) FROM messages GROUP BY topic"
+                ).fetchall()
+        except sqlite3.Error as e:
+            self._handle_sqlite_error(e)
+            return {}
+        return dict(rows)
+
+    def _count(self, query: str, parameters: tuple[Any, ...]) -> int:
+        """
+        Args:
+            query (str): A query returning a single count.
+            parameters (tuple[Any, ...]): The query parameters.
+
+        Returns:
+            int: The count, 0 if the database can't be read.
+        """
+        try:
+            with self._lock:
+                if self._connection is None:
+                    return 0
+                count: int = self._connection.execute(query, parameters).fetchone()[0]
+                return count
+        except sqlite3.Error as e:
+            self._handle_sqlite_error(e)
+            return 0
+
+    def is_connected(self) -> bool:
+        """
+        Check that the database can be queried.
+
+        Returns:
+            bool: True if it can.
+        """
+        try:
+            with self._lock:
+                if self._connection is None:
+                    return False
+                self._connection.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def disconnect(self) -> None:
+        """
+        Stop the flusher, insert the held writes and close the database.
+        """
+        if self._connection is None:
+            logger.info("SQLite buffer is already closed.")
+            return
+        self._stop_linger()
+        self.flush_batch()
+        with self._lock:
+            connection, self._connection = self._connection, None
+        try:
+            connection.close()
+            logger.info(f"Closed SQLite buffer '{self.filename}'.")
+        except sqlite3.Error as e:
+            self._handle_sqlite_error(e)
+
@@ -0,0 +1,438 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, NamedTuple, Optional, Union
+
+from leaf.error_handler.error_holder import ErrorHolder
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.output_module import OutputModule
+from leaf.modules.output_modules.output_module import accepts_retain
+from leaf.utility.logger.logger_utils import get_logger
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+OVERFLOW_POLICIES = ("fallback", "drop", "block")
+DEFAULT_QUEUE_SIZE = 1000
+# Time allowed to send what is queued when the output disconnects.
+DRAIN_TIMEOUT = 5
+
+
+class BranchPolicy(NamedTuple):
+    """
+    Queue of a TEE child. When it is full a message goes to the
+    child's fallback, is dropped, or the sender blocks up to
+    block_timeout seconds for space before using the fallback.
+    """
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    overflow: str = "fallback"
+    block_timeout: float = 1.0
+
+
+def build_branch_policy(config: dict[str, Any]) -> BranchPolicy:
+    """
+    Build the queue policy of a TEE child.
+
+    Args:
+        config (dict[str, Any]): queue_size, overflow and block_timeout.
+
+    Returns:
+        BranchPolicy: The policy.
+
+    Raises:
+        AdapterBuildError: If an option is unknown or invalid.
+    """
+    unknown = set(config) - set(BranchPolicy._fields)
+    if unknown:
+        raise AdapterBuildError(f"Unknown TEE options: {', '.join(sorted(unknown))}.")
+    policy = BranchPolicy(**config)
+    if not isinstance(policy.queue_size, int) or isinstance(policy.queue_size, bool) \
+            or policy.queue_size <= 0:
+        raise AdapterBuildError("TEE queue_size must be a positive integer.")
+    if policy.overflow not in OVERFLOW_POLICIES:
+        raise AdapterBuildError(
+            f"Unknown TEE overflow '{policy.overflow}', expected one of "
+            f"{', '.join(OVERFLOW_POLICIES)}."
+        )
+    if not isinstance(policy.block_timeout, (int, float)) \
+            or isinstance(policy.block_timeout, bool) or policy.block_timeout < 0:
+        raise AdapterBuildError("TEE block_timeout must be a non-negative number.")
+    return policy
+
+
+class _Branch:
+    """
+    A child output with its queue and the worker feeding it.
+    """
+
+    def __init__(self, output: OutputModule, policy: BranchPolicy, name: str) -> None:
+        """
+        Set up an empty queue, the worker starts on the first message.
+
+        Args:
+            output (OutputModule): The child output.
+            policy (BranchPolicy): Queue policy of the child.
+            name (str): Name of the child in the statistics.
+        """
+        self.output = output
+        self.policy = policy
+        self.name = name
+        self.retain = accepts_retain(output)
+        self.messages: deque[tuple[str, Any, bool]] = deque()
+        self.condition = threading.Condition()
+        self.worker: Optional[threading.Thread] = None
+        self.running = False
+        self.stats: dict[str, int] = {
+            "sent": 0,
+            "failed": 0,
+            "dropped": 0,
+            "fallback": 0,
+            "max_queued": 0,
+        }
+
+
+class TEE(OutputModule):
+    """
+    Delivers every message to several outputs at once, for example
+    publishing live over MQTT while archiving locally. Each child has
+    its own queue and worker thread, so transmit only enqueues and a
+    slow or failing child never delays the others. A child keeps its
+    own fallback for messages it fails to send, and when its queue
+    is full applies its overflow policy, by default handing the
+    message to its fallback straight away.
+
+    Configured with the codes of the outputs to feed, plain or with
+    queue options, which default to those of the TEE::
+
+        OUTPUTS:
+          - plugin: TEE
+            outputs:
+              - MQTT
+              - plugin: PARQUET
+                queue_size: 10000
+                overflow: drop
+          - plugin: MQTT
+            fallback: KEYDB
+            ...
+
+    Buffered messages stay with each child's fallback. The TEE holds
+    none itself, replay_buffered has every child replay its own
+    fallback, with the child's replay policy, so a message is only
+    sent again to the output that missed it.
+    """
+
+    def __init__(
+        self,
+        outputs: list[Union[OutputModule, dict[str, Any]]],
+        fallback: Optional[OutputModule] = None,
+        error_holder: Optional[ErrorHolder] = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        overflow: str = "fallback",
+        block_timeout: float = 1.0,
+    ) -> None:
+        """
+        Initialize the TEE output.
+
+        Args:
+            outputs (list[Union[OutputModule, dict[str, Any]]]): The child
+                    outputs, or dicts of a child under "output" and its
+                    queue options.
+            fallback (Optional[OutputModule]): Fallback module, unused
+                     as every child has its own.
+            error_holder (Optional[ErrorHolder]): Optional error holder
+                         for tracking errors.
+            queue_size (int): Messages queued per child.
+            overflow (str): What to do with a message when a child's queue
+                         is full, "fallback", "drop" or "block".
+            block_timeout (float): Seconds a sender waits for space with
+                         the block policy before using the fallback.
+        """
+        super().__init__(fallback=fallback, error_holder=error_holder)
+        defaults = {"queue_size": queue_size, "overflow": overflow,
+                    "block_timeout": block_timeout}
+        build_branch_policy(defaults)
+        if not isinstance(outputs, list) or not outputs:
+            raise AdapterBuildError("TEE needs a list of outputs.")
+
+        self._branches: list[_Branch] = []
+        for index, entry in enumerate(outputs):
+            options = dict(defaults)
+            if isinstance(entry, dict):
+                entry = dict(entry)
+                output = entry.pop("output", None)
+                options.update(entry)
+            else:
+                output = entry
+            if not isinstance(output, OutputModule):
+                raise AdapterBuildError(f"TEE output {index} is not an output module.")
+            name = output.__class__.__name__
+            if any(branch.name == name for branch in self._branches):
+                name = f"{name}-{index}"
+            self._branches.append(_Branch(output, build_branch_policy(options), name))
+
+    def transmit(self, topic: str, data: Any = None, retain: bool = False) -> bool:
+        """
+        Queue a message for every child.
+
+        Args:
+            topic (str): The topic.
+            data (Any): The payload.
+            retain (bool): Passed on to the children whose transmit
+                   takes it, such as MQTT, when True.
+
+        Returns:
+            bool: True if every child queued the message or handed
+                  it to its fallback, False if a child dropped it.
+        """
+        return self._guarded_transmit(self._transmit, topic, data, retain=retain)
+
+    def _transmit(self, topic: str, data: Any = None, retain: bool = False) -> bool:
+        """
+        Transmit a message, see transmit.
+        """
+        accepted = True
+        for branch in self._branches:
+            if not self._put(branch, (topic, data, retain)):
+                accepted = False
+        return accepted
+
+    def _put(self, branch: _Branch, message: tuple[str, Any, bool]) -> bool:
+        """
+        Queue a message for a child, applying its overflow policy
+        when the queue is full.
+
+        Args:
+            branch (_Branch): The child.
+            message (tuple[str, Any, bool]): Topic, payload and retain flag.
+
+        Returns:
+            bool: True if queued or handed to the fallback, False if dropped.
+        """
+        policy = branch.policy
+        with branch.condition:
+            if len(branch.messages) >= policy.queue_size and policy.overflow == "block":
+                branch.condition.wait_for(
+                    lambda: len(branch.messages) < policy.queue_size,
+                    policy.block_timeout,
+                )
+            if len(branch.messages) < policy.queue_size:
+                branch.messages.append(message)
+                branch.stats["max_queued"] = max(branch.stats["max_queued"],
+                                                 len(branch.messages))
+                self._ensure_worker(branch)
+                branch.condition.notify_all()
+                return True
+            if policy.overflow == "drop":
+                branch.stats["dropped"] += 1
+            else:
+                branch.stats["fallback"] += 1
+        topic, data, _ = message
+        if policy.overflow == "drop":
+            logger.warning(f"TEE queue of {branch.name} is full, message on {topic} dropped.")
+            return False
+        return branch.output.fallback(topic, data)
+
+    def _ensure_worker(self, branch: _Branch) -> None:
+        """
+        Start the worker of a child, called with its lock held.
+        A worker still draining after a stop carries on instead.
+
+        Args:
+            branch (_Branch): The child.
+        """
+        branch.running = True
+        if branch.worker is not None:
+            return
+        branch.worker = threading.Thread(target=self._worker_loop, args=(branch,),
+                                         name=f"TEE-{branch.name}", daemon=True)
+        branch.worker.start()
+
+    def _worker_loop(self, branch: _Branch) -> None:
+        """
+        Worker thread body, sends a child's queued messages in order.
+
+        Args:
+            branch (_Branch): The child.
+        """
+        output = branch.output
+        while True:
+            with branch.condition:
+                while not branch.messages and branch.running:
+                    branch.condition.wait()
+                if not branch.messages:
+                    branch.worker = None
+                    branch.condition.notify_all()
+                    return
+                topic, data, retain = branch.messages.popleft()
+                # Wake senders blocked on a full queue.
+                branch.condition.notify_all()
+            try:
+                if not output.is_enabled():
+                    result = output.fallback(topic, data)
+                    outcome = "fallback"
+                elif retain and branch.retain:
+                    # branch.retain says transmit takes retain.
+                    transmit: Callable[..., bool] = output.transmit
+                    result = transmit(topic, data, retain=True)
+                    outcome = "sent"
+                else:
+                    result = output.transmit(topic, data)
+                    outcome = "sent"
+                if result is False:
+                    outcome = "failed"
+            except Exception as e:
+                logger.error(f"TEE transmit to {branch.name} on {topic} failed: {e}")
+                outcome = "failed"
+            with branch.condition:
+                branch.stats[outcome] += 1
+
+    def _stop_workers(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        """
+        Send everything still queued and stop the workers, they
+        restart on the next transmit.
+
+        Args:
+            timeout (float): Maximum seconds to wait for all children.
+        """
+        workers = []
+        for branch in self._branches:
+            with branch.condition:
+                branch.running = False
+                branch.condition.notify_all()
+                if branch.worker is not None:
+                    workers.append(branch.worker)
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            if worker is not threading.current_thread():
+                worker.join(max(0.0, deadline - time.monotonic()))
+
+    def get_fanout_stats(self) -> dict[str, dict[str, int]]:
+        """
+        Report per child on messages sent, failed (the child's transmit
+        returned False or raised), dropped or handed to the fallback,
+        the number queued and the most that were ever queued.
+
+        Returns:
+            dict[str, dict[str, int]]: Counters per child.
+        """
+        stats = {}
+        for branch in self._branches:
+            with branch.condition:
+                stats[branch.name] = dict(branch.stats)
+                stats[branch.name]["queued"] = len(branch.messages)
+        return stats
+
+    def get_outputs(self) -> list[OutputModule]:
+        """
+        Returns:
+            list[OutputModule]: The child outputs.
+        """
+        return [branch.output for branch in self._branches]
+
+    def replay_buffered(self) -> dict[str, Any]:
+        """
+        Have every child replay what its fallbacks hold through itself,
+        each in its own thread so a slow child doesn't hold up the others.
+
+        Returns:
+            dict[str, Any]: The outcome per child, see BufferReplay.get_progress.
+        """
+        outcomes: dict[str, Any] = {}
+
+        def replay(branch: _Branch) -> None:
+            try:
+                outcomes[branch.name] = branch.output.replay_buffered()
+            except Exception as e:
+                logger.error(f"TEE replay of {branch.name} failed: {e}")
+
+        threads = [threading.Thread(target=replay, args=(branch,),
+                                    name=f"TEE-replay-{branch.name}", daemon=True)
+                   for branch in self._branches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def get_replay_progress(self) -> Optional[dict[str, Any]]:
+        """
+        Report the replay progress of every child.
+
+        Returns:
+            Optional[dict[str, Any]]: The progress per child that has
+                                      replayed, None before the first replay.
+        """
+        progress = {}
+        for branch in self._branches:
+            child = branch.output.get_replay_progress()
+            if child is not None:
+                progress[branch.name] = child
+        return progress or None
+
+    def pop_all_messages(self) -> Any:
+        """
+        Yield the messages held by every child and its fallbacks. Sending
+        them through the TEE would repeat them on every child, use
+        replay_buffered to send each to the child that missed it.
+
+        Yields:
+            Any: Stored messages one at a time.
+        """
+        for branch in self._branches:
+            yield from branch.output.pop_all_messages()
+
+    def flush(self, topic: str) -> None:
+        """
+        Clear retained messages on a topic in every child.
+
+        Args:
+            topic (str): The topic to clear.
+        """
+        for branch in self._branches:
+            branch.output.flush(topic)
+
+    def subscribe(self, topic: str) -> None:
+        """
+        Subscribe every child to a topic.
+
+        Args:
+            topic (str): The topic to subscribe to.
+        """
+        for branch in self._branches:
+            branch.output.subscribe(topic)
+
+    def pop(self, key: Optional[str] = None) -> None:
+        """
+        The TEE stores nothing itself, see pop_all_messages for
+        what the children hold.
+
+        Args:
+            key (Optional[str]): Unused.
+
+        Returns:
+            None: Always.
+        """
+        return None
+
+    def connect(self) -> None:
+        """
+        Connect every child.
+        """
+        for branch in self._branches:
+            branch.output.connect()
+
+    def disconnect(self) -> None:
+        """
+        Send what is still queued, then disconnect every child.
+        """
+        self._stop_workers()
+        for branch in self._branches:
+            branch.output.disconnect()
+
+    def is_connected(self) -> bool:
+        """
+        Check whether every child is connected.
+
+        Returns:
+            bool: True if all children are connected.
+        """
+        return all(branch.output.is_connected() for branch in self._branches)
@@ -72,10 +72,10 @@ class ProcessModule:
                 phase_data = phase.update(data)
                 if phase_data is None:
                     continue
-                for topic_val, data in phase_data:
-                    if data is None:
-                        continue
-                    self._output.transmit(topic_val, data)
+                self._output.transmit_many(
+                    (topic_val, value) for topic_val, value in phase_data
+                    if value is not None
+                )
 
     def set_interpreter(self, interpreter: 'AbstractInterpreter') -> None:
         """
@@ -98,10 +98,10 @@ def discover_from_config(config: dict[str, Any], external_path: str = None) -> N
 
 
 
-def _collect_output_codes(outputs: list[dict]) -> set[str]:
-    result = set()
+def _collect_output_codes(outputs: list[dict[str, Any]]) -> set[str]:
+    result: set[str] = set()
 
-    def recurse(output):
+    def recurse(output: dict[str, Any]) -> None:
         plugin = output.get("plugin")
         if plugin:
             result.add(plugin.lower())
@@ -110,6 +110,11 @@ def _collect_output_codes(outputs: list[dict]) -> set[str]:
             recurse(fallback)
         elif isinstance(fallback, str):
             result.add(fallback.lower())
+        for child in output.get("outputs") or []:
+            if isinstance(child, dict):
+                recurse(child)
+            elif isinstance(child, str):
+                result.add(child.lower())
 
     for output in outputs:
         recurse(output)
@@ -0,0 +1,162 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Coroutine, Optional
+
+from leaf.utility.logger.logger_utils import get_logger
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+# Seconds synchronous callers wait for a coroutine by default.
+DEFAULT_TIMEOUT = 10
+
+
+class AsyncBridge:
+    """
+    An asyncio event loop running on a daemon thread, so synchronous
+    code can hand it coroutines and event loop code can await them
+    without blocking its own loop. Clients bound to the bridge's loop,
+    such as connection pools, can be shared by everything using it.
+    """
+
+    def __init__(self, name: str = "AsyncBridge") -> None:
+        """
+        Start the loop thread.
+
+        Args:
+            name (str): Name of the loop thread.
+        """
+        self.loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name=name, daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run_loop(self) -> None:
+        """
+        Loop thread body.
+        """
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+        self.loop.close()
+
+    def in_loop(self) -> bool:
+        """
+        Returns:
+            bool: True if called from the bridge's loop thread.
+        """
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> concurrent.futures.Future[Any]:
+        """
+        Schedule a coroutine on the loop without waiting for it.
+
+        Args:
+            coro (Coroutine): The coroutine.
+
+        Returns:
+            concurrent.futures.Future[Any]: Its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, Any],
+            timeout: Optional[float] = DEFAULT_TIMEOUT) -> Any:
+        """
+        Run a coroutine on the loop and wait for its result.
+
+        Args:
+            coro (Coroutine): The coroutine.
+            timeout (Optional[float]): Maximum seconds to wait.
+
+        Returns:
+            Any: The coroutine's result.
+
+        Raises:
+            RuntimeError: If called from the loop thread, which would deadlock.
+            TimeoutError: If the coroutine didn't finish in time, it is cancelled.
+        """
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("Can't wait on the bridge from its own loop, await instead.")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Timed out after {timeout}s.")
+
+    async def run_async(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        """
+        Await a coroutine run on the bridge's loop from any event loop.
+
+        Args:
+            coro (Coroutine): The coroutine.
+
+        Returns:
+            Any: The coroutine's result.
+        """
+        if asyncio.get_running_loop() is self.loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def close(self) -> None:
+        """
+        Stop the loop, cancelling what is still running on it.
+        """
+        async def cancel_tasks() -> None:
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self.loop.is_closed():
+            return
+        try:
+            self.run(cancel_tasks())
+        except (RuntimeError, TimeoutError) as e:
+            logger.warning(f"Failed to cancel bridge tasks: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if not self.in_loop():
+            self._thread.join()
+
+
+_bridge: Optional[AsyncBridge] = None
+_bridge_users: set[int] = set()
+_bridge_lock = threading.Lock()
+
+
+def acquire_bridge(user: object) -> AsyncBridge:
+    """
+    Get the process wide bridge, starting it for the first user.
+
+    Args:
+        user (object): The module that will use the bridge.
+
+    Returns:
+        AsyncBridge: The bridge.
+    """
+    global _bridge
+    with _bridge_lock:
+        if _bridge is None:
+            _bridge = AsyncBridge()
+            logger.info("Started the asyncio bridge loop.")
+        _bridge_users.add(id(user))
+        return _bridge
+
+
+def release_bridge(user: object) -> None:
+    """
+    Unregister a user, stopping the bridge after the last one.
+
+    Args:
+        user (object): The module that used the bridge.
+    """
+    global _bridge
+    with _bridge_lock:
+        _bridge_users.discard(id(user))
+        if _bridge_users or _bridge is None:
+            return
+        bridge, _bridge = _bridge, None
+    logger.info("Stopping the asyncio bridge loop.")
+    bridge.close()
@@ -0,0 +1,386 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, NamedTuple, Optional
+
+from paho.mqtt.client import topic_matches_sub
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.utility.logger.logger_utils import get_logger
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+# Key of the envelope that marks a payload as a batch of messages.
+BATCH_KEY = "leaf_batch"
+
+
+class BatchPolicy(NamedTuple):
+    """
+    Flush triggers for a batch, whichever is reached first.
+    """
+    max_count: int = 100
+    max_bytes: int = 256 * 1024
+    max_linger_ms: int = 1000
+
+
+def build_batch_policies(
+    config: dict[str, Any],
+) -> tuple[BatchPolicy, Optional[dict[str, BatchPolicy]]]:
+    """
+    Build the default and per-topic batch policies from an
+    OUTPUTS configuration block, for example::
+
+        batch:
+          max_count: 96
+          max_linger_ms: 500
+          topics:
+            "+/+/+/experiment/+/measurement/#":
+              max_bytes: 65536
+
+    Args:
+        config (dict[str, Any]): The batch configuration.
+
+    Returns:
+        tuple[BatchPolicy, Optional[dict[str, BatchPolicy]]]: The default
+            policy and the per-topic policies, or None if no topics were given.
+
+    Raises:
+        AdapterBuildError: If an option is unknown or not a positive integer.
+    """
+    config = dict(config)
+    topics = config.pop("topics", None)
+    default = _build_policy(BatchPolicy(), config)
+    if topics is None:
+        return default, None
+    if not isinstance(topics, dict):
+        raise AdapterBuildError("Batch topics must map topic patterns to options.")
+    return default, {pattern: _build_policy(default, options or {})
+                     for pattern, options in topics.items()}
+
+
+def _build_policy(base: BatchPolicy, options: dict[str, Any]) -> BatchPolicy:
+    """
+    Override fields of a policy with the given options.
+
+    Args:
+        base (BatchPolicy): Policy providing defaults for missing options.
+        options (dict[str, Any]): Options to apply.
+
+    Returns:
+        BatchPolicy: The resulting policy.
+    """
+    for name, value in options.items():
+        if name not in BatchPolicy._fields:
+            raise AdapterBuildError(f"Unknown batch option '{name}'.")
+        if not isinstance(value, int) or value <= 0:
+            raise AdapterBuildError(f"Batch option '{name}' must be a positive integer.")
+    return base._replace(**options)
+
+
+def make_batch(messages: list[Any]) -> dict[str, list[Any]]:
+    """
+    Wrap a list of payloads in the batch envelope.
+
+    Args:
+        messages (list[Any]): The coalesced payloads.
+
+    Returns:
+        dict[str, list[Any]]: The batch message.
+    """
+    return {BATCH_KEY: messages}
+
+
+def unbatch(payload: Any) -> list[Any]:
+    """
+    Split a received payload into its individual messages.
+    Payloads that aren't batches are returned as a single message.
+
+    Args:
+        payload (Any): A decoded payload.
+
+    Returns:
+        list[Any]: The messages carried by the payload.
+    """
+    if isinstance(payload, dict) and set(payload) == {BATCH_KEY}:
+        return list(payload[BATCH_KEY])
+    return [payload]
+
+
+def _payload_size(data: Any) -> int:
+    """
+    Estimate the encoded size of a payload in bytes.
+
+    Args:
+        data (Any): The payload.
+
+    Returns:
+        int: Approximate size in bytes.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    if isinstance(data, str):
+        return len(data.encode("utf-8"))
+    return len(json.dumps(data).encode("utf-8"))
+
+
+class _PendingBatch:
+    """
+    Messages waiting to be flushed for a single topic.
+    """
+    def __init__(self, policy: BatchPolicy) -> None:
+        self.policy = policy
+        self.messages: list[Any] = []
+        self.size = 0
+        self.deadline = time.monotonic() + policy.max_linger_ms / 1000
+
+
+class MessageBatcher:
+    """
+    Coalesces messages per topic and hands them to a flush
+    callback once a batch reaches its count or byte limit,
+    or has been waiting for its linger time. A background
+    thread takes care of linger based flushes.
+
+    The callback runs without the batcher's lock held, so a slow
+    flush doesn't hold up messages being added. Flushed batches go
+    out one at a time, in the order they were flushed.
+    """
+
+    def __init__(
+        self,
+        on_flush: Callable[[str, list[Any]], None],
+        default: BatchPolicy = BatchPolicy(),
+        topics: Optional[dict[str, BatchPolicy]] = None,
+        selector: Optional[Callable[[str], bool]] = None,
+        sizer: Callable[[Any], int] = _payload_size,
+        name: str = "MessageBatcher",
+        on_error: Optional[Callable[[str, list[Any], Exception], None]] = None,
+    ) -> None:
+        """
+        Initialise the batcher.
+
+        Args:
+            on_flush (Callable[[str, list[Any]], None]): Called with the topic and
+                      messages of every batch that is flushed.
+            default (BatchPolicy): Policy used when no topic policies are given.
+            topics (Optional[dict[str, BatchPolicy]]): Policies keyed by topic
+                      pattern (MQTT wildcards). Only matching topics are batched.
+            selector (Optional[Callable[[str], bool]]): Decides which topics are
+                      batched with the default policy when topics is None.
+                      Every topic is batched if not provided.
+            sizer (Callable[[Any], int]): Estimates the size of a message in bytes.
+            name (str): Name of the linger thread.
+            on_error (Optional[Callable[[str, list[Any], Exception], None]]): Called
+                      with the topic, messages and error of a batch the flush
+                      callback raised for, such as to hand it to a fallback.
+                      Without it the batch is put back and sent with the next
+                      flush of its topic.
+        """
+        self._on_flush = on_flush
+        self._on_error = on_error
+        self._default = default
+        self._topics = topics
+        self._selector = selector
+        self._sizer = sizer
+        self._policy_cache: dict[str, Optional[BatchPolicy]] = {}
+        self._pending: dict[str, _PendingBatch] = {}
+        # Batches taken from _pending, delivered in order by whichever
+        # thread holds _deliver_lock, without holding _condition.
+        self._ready: deque[tuple[str, list[Any]]] = deque()
+        self._deliver_lock = threading.Lock()
+        self._condition = threading.Condition(threading.RLock())
+        self._running = True
+        self._thread = threading.Thread(target=self._linger_loop,
+                                        name=name, daemon=True)
+        self._thread.start()
+
+    def policy_for(self, topic: str) -> Optional[BatchPolicy]:
+        """
+        Find the policy that applies to a topic.
+
+        Args:
+            topic (str): The topic.
+
+        Returns:
+            Optional[BatchPolicy]: The policy, or None if the topic isn't batched.
+        """
+        if topic in self._policy_cache:
+            return self._policy_cache[topic]
+        policy: Optional[BatchPolicy] = None
+        if self._topics is not None:
+            for pattern, topic_policy in self._topics.items():
+                if topic_matches_sub(pattern, topic):
+                    policy = topic_policy
+                    break
+        elif self._selector is None or self._selector(topic):
+            policy = self._default
+        self._policy_cache[topic] = policy
+        return policy
+
+    def add(self, topic: str, data: Any) -> bool:
+        """
+        Add a message to the batch of its topic.
+
+        Args:
+            topic (str): The topic of the message.
+            data (Any): The message.
+
+        Returns:
+            bool: True if the message was batched, False if the
+                  topic isn't batched and must be sent directly.
+        """
+        policy = self.policy_for(topic)
+        if policy is None or not self._running:
+            return False
+        size = self._sizer(data)
+        with self._condition:
+            pending = self._pending.get(topic)
+            if pending is not None and pending.size + size > policy.max_bytes:
+                self._take(topic)
+                pending = None
+            if pending is None:
+                pending = _PendingBatch(policy)
+                self._pending[topic] = pending
+                self._condition.notify()
+            pending.messages.append(data)
+            pending.size += size
+            if (len(pending.messages) >= policy.max_count or
+                    pending.size >= policy.max_bytes):
+                self._take(topic)
+            full = bool(self._ready)
+        if full:
+            # Another thread already delivering takes this batch along.
+            self._deliver(wait=False)
+        return True
+
+    def flush(self, topic: Optional[str] = None) -> None:
+        """
+        Flush the pending batch of a topic, or of every topic.
+
+        Args:
+            topic (Optional[str]): The topic to flush, all topics if None.
+        """
+        with self._condition:
+            for batch_topic in list(self._pending) if topic is None else [topic]:
+                if batch_topic in self._pending:
+                    self._take(batch_topic)
+        self._deliver(wait=True)
+
+    def _take(self, topic: str) -> None:
+        """
+        Move the pending batch of a topic to the batches to deliver,
+        called with the lock held.
+
+        Args:
+            topic (str): The topic.
+        """
+        self._ready.append((topic, self._pending.pop(topic).messages))
+
+    def _deliver(self, wait: bool) -> None:
+        """
+        Hand the flushed batches to the flush callback, in order.
+        Only one thread delivers at a time.
+
+        Args:
+            wait (bool): Wait for a thread already delivering and
+                   deliver what is left, rather than leaving it to that thread.
+        """
+        while True:
+            if not self._deliver_lock.acquire(blocking=wait):
+                return
+            try:
+                while True:
+                    with self._condition:
+                        if not self._ready:
+                            break
+                        topic, messages = self._ready.popleft()
+                    self._send(topic, messages)
+            finally:
+                self._deliver_lock.release()
+            with self._condition:
+                # A batch flushed while releasing would otherwise be left behind.
+                if not self._ready:
+                    return
+
+    def _send(self, topic: str, messages: list[Any]) -> None:
+        """
+        Call the flush callback for a batch, passing the batch to
+        on_error, or putting it back, if it raises.
+
+        Args:
+            topic (str): The topic of the batch.
+            messages (list[Any]): The messages.
+        """
+        try:
+            self._on_flush(topic, messages)
+            return
+        except Exception as e:
+            error = e
+        logger.error(f"Failed to flush batch of {len(messages)} messages for {topic}: {error}")
+        if self._on_error is not None:
+            try:
+                self._on_error(topic, messages, error)
+            except Exception as e:
+                logger.error(f"Lost batch of {len(messages)} messages for {topic}: {e}")
+            return
+        with self._condition:
+            pending = self._pending.get(topic)
+            if pending is None:
+                policy = self.policy_for(topic) or self._default
+                pending = self._pending[topic] = _PendingBatch(policy)
+                self._condition.notify()
+            pending.messages[:0] = messages
+            pending.size += sum(self._sizer(message) for message in messages)
+
+    def pending_count(self) -> int:
+        """
+        Count the messages waiting in all batches, including
+        flushed batches not yet handed to the flush callback.
+
+        Returns:
+            int: Number of pending messages.
+        """
+        with self._condition:
+            return (sum(len(p.messages) for p in self._pending.values()) +
+                    sum(len(messages) for _, messages in self._ready))
+
+    def is_running(self) -> bool:
+        """
+        Returns:
+            bool: False once the batcher is closed.
+        """
+        return self._running
+
+    def close(self) -> None:
+        """
+        Flush every pending batch and stop the linger thread,
+        waiting for it to end.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self.flush()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _linger_loop(self) -> None:
+        """
+        Flush batches once they have waited for their linger time.
+        """
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                for topic in [t for t, p in self._pending.items() if p.deadline <= now]:
+                    self._take(topic)
+                if not self._ready:
+                    timeout = min((p.deadline for p in self._pending.values()),
+                                  default=now + 1.0) - now
+                    self._condition.wait(max(timeout, 0))
+                    continue
+            try:
+                self._deliver(wait=True)
+            except Exception as e:
+                logger.error(f"Failed to flush batches: {e}")
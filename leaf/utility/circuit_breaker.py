@@ -0,0 +1,268 @@
+import threading
+import time
+from collections import deque
+from typing import Any, NamedTuple, Optional
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.utility.logger.logger_utils import get_logger
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+BREAKER_STATES = (CLOSED, OPEN, HALF_OPEN)
+
+
+class CircuitBreakerPolicy(NamedTuple):
+    """
+    When a circuit breaker opens and how it probes for recovery.
+
+    The circuit opens once at least min_calls calls were made in the
+    last window seconds and failure_rate of them failed. It stays open
+    for probe_interval seconds, then lets probes through one at a time,
+    closing after probes successes in a row. A failed probe opens it
+    again for twice as long, up to max_probe_interval seconds.
+    """
+    window: float = 30.0
+    min_calls: int = 10
+    failure_rate: float = 0.5
+    probe_interval: float = 10.0
+    max_probe_interval: float = 300.0
+    probes: int = 1
+
+
+def build_circuit_breaker_policy(config: Any) -> CircuitBreakerPolicy:
+    """
+    Build a circuit breaker policy from an OUTPUTS configuration
+    block, True for the defaults or a mapping such as::
+
+        circuit_breaker:
+          window: 60
+          min_calls: 20
+          failure_rate: 0.5
+          probe_interval: 5
+
+    Args:
+        config (Any): The circuit breaker configuration.
+
+    Returns:
+        CircuitBreakerPolicy: The policy.
+
+    Raises:
+        AdapterBuildError: If an option is unknown or invalid.
+    """
+    if config is True:
+        config = {}
+    if not isinstance(config, dict):
+        raise AdapterBuildError("circuit_breaker must be true or a mapping of options.")
+    unknown = set(config) - set(CircuitBreakerPolicy._fields)
+    if unknown:
+        raise AdapterBuildError(
+            f"Unknown circuit breaker options: {', '.join(sorted(unknown))}."
+        )
+    policy = CircuitBreakerPolicy(**config)
+    for name in ("min_calls", "probes"):
+        value = getattr(policy, name)
+        if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+            raise AdapterBuildError(f"Circuit breaker {name} must be a positive integer.")
+    for name in ("window", "probe_interval", "max_probe_interval"):
+        value = getattr(policy, name)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+            raise AdapterBuildError(f"Circuit breaker {name} must be a positive number.")
+    if not isinstance(policy.failure_rate, (int, float)) or \
+            not 0 < policy.failure_rate <= 1:
+        raise AdapterBuildError("Circuit breaker failure_rate must be in (0, 1].")
+    if policy.max_probe_interval < policy.probe_interval:
+        raise AdapterBuildError(
+            "Circuit breaker max_probe_interval can't be below probe_interval."
+        )
+    return policy
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of an output's calls and decides whether the
+    next may go through. Closed, calls go through and are counted in
+    one second buckets over the window. Open, calls are refused until
+    the probe interval is over. Half open, one probe at a time goes
+    through and the others are refused until it reports back, or
+    for the probe interval, in case a probe that was only queued
+    never reports.
+    """
+
+    def __init__(self, policy: CircuitBreakerPolicy, name: str = "output") -> None:
+        """
+        Args:
+            policy (CircuitBreakerPolicy): When to open and probe.
+            name (str): Name of the output, for logging.
+        """
+        self.policy = policy
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        # [second, calls, failures], oldest first.
+        self._buckets: deque[list[int]] = deque()
+        self._calls = 0
+        self._failures = 0
+        self._open_until = 0.0
+        self._probe_interval = policy.probe_interval
+        self._probing = False
+        self._probe_started = 0.0
+        self._probe_successes = 0
+        self._changed_at = time.time()
+        self._stats: dict[str, Any] = {
+            "short_circuited": 0,
+            "transitions": {},
+        }
+
+    @property
+    def state(self) -> str:
+        """
+        Returns:
+            str: "closed", "open" or "half_open".
+        """
+        with self._lock:
+            if self._state == OPEN and time.monotonic() >= self._open_until:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Decide whether a call may go through. A call that is let
+        through must report back with record_success or record_failure.
+
+        Returns:
+            bool: False if the call should be short-circuited.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() < self._open_until:
+                    self._stats["short_circuited"] += 1
+                    return False
+                self._transition(HALF_OPEN)
+            now = time.monotonic()
+            if self._probing and now < self._probe_started + self._probe_interval:
+                self._stats["short_circuited"] += 1
+                return False
+            self._probing = True
+            self._probe_started = now
+            return True
+
+    def record_success(self) -> None:
+        """
+        Record a call that succeeded.
+        """
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+                self._probe_successes += 1
+                if self._probe_successes >= self.policy.probes:
+                    self._probe_interval = self.policy.probe_interval
+                    self._transition(CLOSED)
+                return
+            if self._state == CLOSED:
+                self._count(failed=False)
+
+    def record_failure(self) -> None:
+        """
+        Record a call that failed.
+        """
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+                self._probe_interval = min(self._probe_interval * 2,
+                                           self.policy.max_probe_interval)
+                self._open()
+                return
+            if self._state != CLOSED:
+                return
+            self._count(failed=True)
+            if self._calls >= self.policy.min_calls and \
+                    self._failures >= self.policy.failure_rate * self._calls:
+                self._open()
+
+    def reset(self) -> None:
+        """
+        Close the circuit and forget the calls made so far.
+        """
+        with self._lock:
+            self._probe_interval = self.policy.probe_interval
+            self._probing = False
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def _count(self, failed: bool) -> None:
+        """
+        Count a call in the window, called with the lock held.
+
+        Args:
+            failed (bool): The call failed.
+        """
+        now = int(time.monotonic())
+        buckets = self._buckets
+        while buckets and buckets[0][0] <= now - self.policy.window:
+            _, calls, failures = buckets.popleft()
+            self._calls -= calls
+            self._failures -= failures
+        if not buckets or buckets[-1][0] != now:
+            buckets.append([now, 0, 0])
+        buckets[-1][1] += 1
+        self._calls += 1
+        if failed:
+            buckets[-1][2] += 1
+            self._failures += 1
+
+    def _open(self) -> None:
+        """
+        Open the circuit for the current probe interval, called with the lock held.
+        """
+        self._open_until = time.monotonic() + self._probe_interval
+        self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        """
+        Move to a new state, called with the lock held.
+
+        Args:
+            state (str): The new state.
+        """
+        previous = self._state
+        self._state = state
+        self._changed_at = time.time()
+        self._buckets.clear()
+        self._calls = 0
+        self._failures = 0
+        self._probe_successes = 0
+        transition = f"{previous}->{state}"
+        transitions = self._stats["transitions"]
+        transitions[transition] = transitions.get(transition, 0) + 1
+        if state == OPEN:
+            logger.warning(f"Circuit of {self.name} opened, retrying in "
+                           f"{self._probe_interval:g}s.")
+        else:
+            logger.info(f"Circuit of {self.name} is {state.replace('_', ' ')}.")
+
+    def get_stats(self) -> dict[str, Any]:
+        """
+        Report the state, when it last changed (epoch seconds), the
+        calls and failures counted in the current window, the calls
+        short-circuited and the number of each state transition, such
+        as "closed->open".
+
+        Returns:
+            dict[str, Any]: The metrics.
+        """
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "changed_at": self._changed_at,
+                "calls": self._calls,
+                "failures": self._failures,
+                "probe_interval": self._probe_interval,
+                "short_circuited": self._stats["short_circuited"],
+                "transitions": dict(self._stats["transitions"]),
+            }
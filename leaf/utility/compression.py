@@ -0,0 +1,217 @@
+import zlib
+from abc import ABC
+from abc import abstractmethod
+from typing import Any, NamedTuple, Optional, Union
+
+from leaf.error_handler.exceptions import AdapterBuildError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore[assignment, unused-ignore]
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None  # type: ignore[assignment, unused-ignore]
+
+COMPRESSION_PROPERTY = "leaf-compression"
+# Without MQTT v5 properties the algorithm is appended to the topic.
+COMPRESSION_TOPIC_SEGMENT = "compressed"
+
+
+class Compressor(ABC):
+    """
+    Compresses message payloads for transmission.
+    """
+
+    name: str = ""
+
+    def __init__(self, level: Optional[int] = None) -> None:
+        """
+        Args:
+            level (Optional[int]): Compression level, the library default if None.
+        """
+        self.level = level
+
+    @abstractmethod
+    def compress(self, payload: bytes) -> bytes:
+        """
+        Compress a payload.
+
+        Args:
+            payload (bytes): The encoded payload.
+
+        Returns:
+            bytes: The compressed payload.
+        """
+
+    @abstractmethod
+    def decompress(self, payload: bytes) -> bytes:
+        """
+        Decompress a payload.
+
+        Args:
+            payload (bytes): The compressed payload.
+
+        Returns:
+            bytes: The original payload.
+        """
+
+
+class ZlibCompressor(Compressor):
+    """
+    zlib (deflate) from the standard library.
+    """
+
+    name = "zlib"
+
+    def compress(self, payload: bytes) -> bytes:
+        return zlib.compress(payload, -1 if self.level is None else self.level)
+
+    def decompress(self, payload: bytes) -> bytes:
+        return zlib.decompress(payload)
+
+
+class ZstdCompressor(Compressor):
+    """
+    Zstandard, requires the zstandard package.
+    """
+
+    name = "zstd"
+
+    def __init__(self, level: Optional[int] = None) -> None:
+        if zstandard is None:
+            raise AdapterBuildError("zstd compression requires the zstandard package.")
+        super().__init__(level)
+        self._compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, payload: bytes) -> bytes:
+        return self._compressor.compress(payload)
+
+    def decompress(self, payload: bytes) -> bytes:
+        return self._decompressor.decompress(payload)
+
+
+class LZ4Compressor(Compressor):
+    """
+    LZ4 frames, requires the lz4 package.
+    """
+
+    name = "lz4"
+
+    def __init__(self, level: Optional[int] = None) -> None:
+        if lz4 is None:
+            raise AdapterBuildError("lz4 compression requires the lz4 package.")
+        super().__init__(level)
+
+    def compress(self, payload: bytes) -> bytes:
+        compressed: bytes = lz4.frame.compress(payload, compression_level=self.level or 0)
+        return compressed
+
+    def decompress(self, payload: bytes) -> bytes:
+        decompressed: bytes = lz4.frame.decompress(payload)
+        return decompressed
+
+
+COMPRESSORS: dict[str, type[Compressor]] = {
+    compressor.name: compressor
+    for compressor in (ZlibCompressor, ZstdCompressor, LZ4Compressor)
+}
+
+
+class CompressionPolicy(NamedTuple):
+    """
+    Compression options of an output module.
+    """
+    compressor: Compressor
+    min_bytes: int = 1024
+    topics: Optional[tuple[str, ...]] = None
+
+
+def get_compressor(name: str, level: Optional[int] = None) -> Compressor:
+    """
+    Create the compressor registered under a name.
+
+    Args:
+        name (str): The algorithm, one of COMPRESSORS.
+        level (Optional[int]): Compression level.
+
+    Returns:
+        Compressor: The compressor.
+
+    Raises:
+        AdapterBuildError: If the name is unknown or its library is missing.
+    """
+    if name not in COMPRESSORS:
+        raise AdapterBuildError(
+            f"Unknown compression '{name}', expected one of {', '.join(COMPRESSORS)}."
+        )
+    return COMPRESSORS[name](level)
+
+
+def build_compression_policy(config: dict[str, Any]) -> CompressionPolicy:
+    """
+    Validate compression options from the configuration.
+
+    Args:
+        config (dict[str, Any]): algorithm, level, min_bytes and topics
+                                 (subscription patterns to compress).
+
+    Returns:
+        CompressionPolicy: The validated options.
+
+    Raises:
+        AdapterBuildError: If an option is unknown or invalid.
+    """
+    if not isinstance(config, dict):
+        raise AdapterBuildError("Compression options must be a mapping.")
+    unknown = set(config) - {"algorithm", "level", "min_bytes", "topics"}
+    if unknown:
+        raise AdapterBuildError(f"Unknown compression options: {', '.join(sorted(unknown))}.")
+    level = config.get("level")
+    if level is not None and not isinstance(level, int):
+        raise AdapterBuildError("Compression level must be an integer.")
+    min_bytes = config.get("min_bytes", CompressionPolicy._field_defaults["min_bytes"])
+    if not isinstance(min_bytes, int) or min_bytes < 0:
+        raise AdapterBuildError("Compression min_bytes must be a non-negative integer.")
+    topics = config.get("topics")
+    if topics is not None:
+        if isinstance(topics, str):
+            topics = [topics]
+        if not all(isinstance(t, str) and t for t in topics):
+            raise AdapterBuildError("Compression topics must be topic patterns.")
+        topics = tuple(topics)
+    compressor = get_compressor(config.get("algorithm", "zlib"), level)
+    return CompressionPolicy(compressor, min_bytes, topics)
+
+
+def decompress_message(
+    topic: str, payload: Union[bytes, str], properties: Optional[Any] = None
+) -> tuple[str, Union[bytes, str]]:
+    """
+    Undo the compression of a received message. The algorithm is
+    taken from the MQTT v5 user property or the topic suffix, messages
+    that weren't compressed are returned unchanged.
+
+    Args:
+        topic (str): The topic the message was received on.
+        payload (Union[bytes, str]): The received payload.
+        properties (Optional[Any]): The message properties (MQTTMessage.properties).
+
+    Returns:
+        tuple[str, Union[bytes, str]]: The original topic and payload.
+    """
+    name = None
+    for key, value in getattr(properties, "UserProperty", None) or []:
+        if key == COMPRESSION_PROPERTY:
+            name = value
+    if name is None:
+        base, _, suffix = topic.rpartition(f"/{COMPRESSION_TOPIC_SEGMENT}/")
+        if not base or suffix not in COMPRESSORS:
+            return topic, payload
+        topic, name = base, suffix
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return topic, get_compressor(name).decompress(payload)
@@ -0,0 +1,176 @@
+import os
+import time
+from typing import IO, Any, NamedTuple, Union
+
+from leaf.error_handler.exceptions import AdapterBuildError
+
+FSYNC_MODES = ("never", "always", "every", "interval")
+
+
+class FsyncPolicy(NamedTuple):
+    """
+    When written data is forced to disk with fsync:
+
+    - never: left to the operating system, a process crash loses
+      nothing but a power cut can lose recent writes.
+    - always: after every write.
+    - every: after every `records` writes.
+    - interval: at most `interval` seconds after a write.
+    """
+    mode: str = "never"
+    records: int = 100
+    interval: float = 1.0
+
+
+def build_fsync_policy(config: Union[str, dict[str, Any]]) -> FsyncPolicy:
+    """
+    Build an fsync policy from an OUTPUTS configuration value, the
+    mode name or a mapping such as::
+
+        fsync:
+          mode: every
+          records: 100
+
+    Args:
+        config (Union[str, dict[str, Any]]): The fsync configuration.
+
+    Returns:
+        FsyncPolicy: The policy.
+
+    Raises:
+        AdapterBuildError: If an option is unknown or invalid.
+    """
+    if isinstance(config, str):
+        config = {"mode": config}
+    if not isinstance(config, dict):
+        raise AdapterBuildError("fsync must be a mode or a mapping of options.")
+    unknown = set(config) - set(FsyncPolicy._fields)
+    if unknown:
+        raise AdapterBuildError(f"Unknown fsync options: {', '.join(sorted(unknown))}.")
+    policy = FsyncPolicy(**config)
+    if policy.mode not in FSYNC_MODES:
+        raise AdapterBuildError(
+            f"Unknown fsync mode '{policy.mode}', expected one of "
+            f"{', '.join(FSYNC_MODES)}."
+        )
+    if not isinstance(policy.records, int) or isinstance(policy.records, bool) \
+            or policy.records <= 0:
+        raise AdapterBuildError("fsync records must be a positive integer.")
+    if not isinstance(policy.interval, (int, float)) or isinstance(policy.interval, bool) \
+            or policy.interval <= 0:
+        raise AdapterBuildError("fsync interval must be a positive number.")
+    return policy
+
+
+class FileSyncer:
+    """
+    Applies an fsync policy to the writes made to a file.
+    """
+
+    def __init__(self, policy: FsyncPolicy) -> None:
+        """
+        Args:
+            policy (FsyncPolicy): When to fsync.
+        """
+        self.policy = policy
+        self.pending = 0
+        self._synced_at = time.monotonic()
+
+    def written(self, f: IO[Any], records: int = 1) -> None:
+        """
+        Record a flushed write to a file, syncing it if the policy says so.
+
+        Args:
+            f (IO[Any]): The file written to.
+            records (int): Number of records the write held.
+        """
+        if self.record(records):
+            self.sync(f)
+
+    def record(self, records: int = 1) -> bool:
+        """
+        Record a write.
+
+        Args:
+            records (int): Number of records the write held.
+
+        Returns:
+            bool: True if the writes should be synced now.
+        """
+        self.pending += records
+        mode = self.policy.mode
+        return mode == "always" or \
+            (mode == "every" and self.pending >= self.policy.records) or \
+            (mode == "interval" and self.overdue())
+
+    def overdue(self) -> bool:
+        """
+        Returns:
+            bool: True if there are writes older than the sync interval.
+        """
+        return bool(self.pending) and \
+            time.monotonic() - self._synced_at >= self.policy.interval
+
+    def sync(self, f: IO[Any]) -> None:
+        """
+        Force the pending writes of a file to disk.
+
+        Args:
+            f (IO[Any]): The file written to.
+        """
+        if self.pending and self.policy.mode != "never":
+            os.fsync(f.fileno())
+        self.synced()
+
+    def synced(self) -> None:
+        """
+        Record that the pending writes were forced to disk.
+        """
+        self.pending = 0
+        self._synced_at = time.monotonic()
+
+
+def fsync_directory(path: str) -> None:
+    """
+    Make the creation, rename or removal of files in a directory
+    durable. Not every platform can open a directory, such as
+    Windows, where this does nothing.
+
+    Args:
+        path (str): The directory.
+    """
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, content: str, sync: bool = False) -> None:
+    """
+    Replace a file's content so a crash leaves either the old or the
+    new version, never a partly written file. The content is written
+    to a temporary file next to it which is renamed over the file.
+
+    Args:
+        path (str): The file.
+        content (str): The new content.
+        sync (bool): fsync the content and the rename.
+
+    Raises:
+        OSError: If the file can't be written.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(content)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if sync:
+        fsync_directory(os.path.dirname(path))
@@ -0,0 +1,206 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.utility.logger.logger_utils import get_logger
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+PROGRESS_LOG_INTERVAL = 1000
+# Time allowed for a batch being replayed to finish on close.
+CLOSE_TIMEOUT = 5
+# Largest number of messages replayed from a topic at once.
+MAX_BATCH_SIZE = 500
+
+
+class FallbackDrainer:
+    """
+    Replays messages held by a fallback output module on a
+    background thread. Topics are drained round-robin, one message
+    at a time, within a messages-per-second budget so live traffic
+    keeps flowing while a backlog is replayed. Draining pauses
+    whenever the destination isn't ready and resumes where it left
+    off once it is. Given retrieve_many and publish_many, up to a
+    second's budget of a topic is replayed at once instead. close()
+    stops the thread, leaving what is still buffered in the fallback.
+    """
+
+    def __init__(
+        self,
+        retrieve: Callable[[str], Optional[Any]],
+        publish: Callable[[str, Any], bool],
+        is_ready: Callable[[], bool],
+        rate: float = 20.0,
+        name: str = "FallbackDrainer",
+        retrieve_many: Optional[Callable[[str, int], list[Any]]] = None,
+        publish_many: Optional[Callable[[str, list[Any]], int]] = None,
+    ) -> None:
+        """
+        Initialise the drainer.
+
+        Args:
+            retrieve (Callable[[str], Optional[Any]]): Removes and returns the
+                      next buffered message for a topic, None when empty.
+            publish (Callable[[str, Any], bool]): Sends a replayed message.
+            is_ready (Callable[[], bool]): Whether messages can be sent right now.
+            rate (float): Maximum number of replayed messages per second.
+            name (str): Name of the drain thread.
+            retrieve_many (Optional[Callable[[str, int], list[Any]]]): Removes
+                      and returns up to a number of buffered messages for a topic.
+            publish_many (Optional[Callable[[str, list[Any]], int]]): Sends
+                      replayed messages of a topic, returning how many were sent.
+        """
+        if not isinstance(rate, (int, float)) or rate <= 0:
+            raise AdapterBuildError("Drain rate must be a positive number.")
+        self._retrieve = retrieve
+        self._publish = publish
+        self._is_ready = is_ready
+        self._interval = 1.0 / rate
+        self._rate = rate
+        self._retrieve_many = retrieve_many
+        self._publish_many = publish_many
+        self._batch_size = 1
+        if retrieve_many is not None and publish_many is not None:
+            self._batch_size = max(1, min(int(rate), MAX_BATCH_SIZE))
+        self._topics: deque[str] = deque()
+        self._condition = threading.Condition()
+        self._drained = 0
+        self._failed = 0
+        self._started_at: Optional[float] = None
+        self._current_topic: Optional[str] = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._drain_loop,
+                                        name=name, daemon=True)
+        self._thread.start()
+
+    def request(self, topic: str) -> None:
+        """
+        Schedule a topic for draining.
+
+        Args:
+            topic (str): Topic that may have buffered messages.
+        """
+        with self._condition:
+            if topic not in self._topics and topic != self._current_topic:
+                self._topics.append(topic)
+            self._condition.notify()
+
+    def resume(self) -> None:
+        """
+        Wake the drainer, for example once the destination has reconnected.
+        """
+        with self._condition:
+            self._condition.notify()
+
+    def close(self, timeout: float = CLOSE_TIMEOUT) -> None:
+        """
+        Stop draining and wait for the drain thread to end. Topics
+        still waiting are forgotten, their messages stay in the fallback.
+
+        Args:
+            timeout (float): Maximum seconds to wait for the thread.
+        """
+        with self._condition:
+            self._stopped.set()
+            self._topics.clear()
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def is_draining(self) -> bool:
+        """
+        Check whether any topics are waiting to be drained.
+
+        Returns:
+            bool: True if a drain is in progress.
+        """
+        with self._condition:
+            return bool(self._topics) or self._current_topic is not None
+
+    def get_progress(self) -> dict[str, Any]:
+        """
+        Report the progress of the drain.
+
+        Returns:
+            dict[str, Any]: Topics waiting, messages replayed and failed,
+                            the configured budget and the achieved rate.
+        """
+        with self._condition:
+            elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+            return {
+                "pending_topics": len(self._topics) + (self._current_topic is not None),
+                "current_topic": self._current_topic,
+                "drained": self._drained,
+                "failed": self._failed,
+                "rate_limit": self._rate,
+                "rate": self._drained / elapsed if elapsed > 0 else 0.0,
+            }
+
+    def _next_topic(self) -> Optional[str]:
+        """
+        Wait for a topic to drain and for the destination to be ready.
+
+        Returns:
+            Optional[str]: The topic to take the next message from,
+                           None once the drainer is closed.
+        """
+        with self._condition:
+            while not self._stopped.is_set() and \
+                    (not self._topics or not self._is_ready()):
+                # Polls readiness as well, since reconnects may not notify.
+                self._condition.wait(1.0)
+            if self._stopped.is_set():
+                return None
+            self._current_topic = self._topics.popleft()
+            if self._started_at is None:
+                self._started_at = time.monotonic()
+            return self._current_topic
+
+    def _drain_loop(self) -> None:
+        """
+        Drain thread body, replays one message, or batch, per topic in turn.
+        """
+        while True:
+            topic = self._next_topic()
+            if topic is None:
+                return
+            try:
+                if self._batch_size > 1 and self._retrieve_many is not None:
+                    messages = self._retrieve_many(topic, self._batch_size)
+                else:
+                    message = self._retrieve(topic)
+                    messages = [] if message is None else [message]
+            except Exception as e:
+                logger.error(f"Failed to retrieve buffered message for {topic}: {e}")
+                messages = []
+            with self._condition:
+                self._current_topic = None
+                if not messages:
+                    logger.debug(f"No fallback data left for topic {topic}.")
+                    if not self._topics and self._drained:
+                        logger.info(f"Fallback drain complete, {self._drained} "
+                                    f"messages replayed in total.")
+                    continue
+                # Keep the topic in rotation until it is empty.
+                self._topics.append(topic)
+            try:
+                if self._batch_size > 1 and self._publish_many is not None:
+                    sent = self._publish_many(topic, messages)
+                else:
+                    sent = 1 if self._publish(topic, messages[0]) else 0
+            except Exception as e:
+                logger.error(f"Failed to replay {len(messages)} buffered "
+                             f"messages for {topic}: {e}")
+                sent = 0
+            with self._condition:
+                before = self._drained
+                self._drained += sent
+                self._failed += len(messages) - sent
+                if self._drained // PROGRESS_LOG_INTERVAL > before // PROGRESS_LOG_INTERVAL:
+                    logger.info(
+                        f"Replayed {self._drained} buffered messages, "
+                        f"{len(self._topics)} topics pending."
+                    )
+            self._stopped.wait(self._interval * len(messages))
@@ -0,0 +1,849 @@
+import json
+import os
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Iterable, Iterator, NamedTuple, Optional, cast
+
+from leaf.utility.durability import FileSyncer
+from leaf.utility.durability import FsyncPolicy
+from leaf.utility.durability import atomic_write
+from leaf.utility.durability import fsync_directory
+from leaf.utility.logger.logger_utils import get_logger
+from leaf.utility.serializers import Serializer
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+SEGMENT_SUFFIX = ".jsonl"
+DEAD_SUFFIX = ".dead"
+INDEX_SUFFIX = ".idx"
+TMP_SUFFIX = ".tmp"
+CHECKPOINT_FILE = "checkpoint.json"
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+DEFAULT_SEGMENT_AGE = 3600
+DEFAULT_COMPACT_THRESHOLD = 0.5
+DEFAULT_COMPACT_INTERVAL = 60
+
+
+class JournalRecord(NamedTuple):
+    """
+    A message read from the journal and where it is stored.
+    """
+    segment: int
+    offset: int
+    end: int
+    topic: str
+    data: Any
+
+
+class Journal:
+    """
+    An append-only message journal in a directory of newline
+    delimited segment files, one record per line prefixed with the
+    CRC-32 of its content. Appending is a single write to the newest
+    segment, which is rotated once it reaches a size or an age, and
+    is forced to disk according to an fsync policy.
+
+    Records are read in order from the head, a checkpoint of the
+    first record that hasn't been consumed. Consuming the records at
+    the head moves the checkpoint forwards and segments behind it are
+    deleted. Records consumed out of order, such as when one topic is
+    drained, are marked dead in a sidecar file of their segment and
+    skipped by readers.
+
+    Every segment has an index of topic -> record offsets, kept in
+    memory and saved next to the segment once it is rotated, so the
+    records of one topic are read with seeks instead of a scan. A
+    background compactor rewrites rotated segments once the fraction
+    of dead bytes in them passes a threshold, keeping only the live
+    records. The rewritten segment is saved as the segment's next
+    generation, so a crash leaves either the old or the new one.
+
+    A crash can leave the newest segment ending in a torn record,
+    or in records that never reached the disk. Only that corrupt tail
+    is truncated when the journal is opened, corrupt records further
+    back are skipped and dropped when read.
+    """
+
+    def __init__(self, directory: str, serializer: Serializer,
+                 max_segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 max_segment_age: float = DEFAULT_SEGMENT_AGE,
+                 fsync: FsyncPolicy = FsyncPolicy(),
+                 compact_threshold: float = DEFAULT_COMPACT_THRESHOLD,
+                 compact_interval: float = DEFAULT_COMPACT_INTERVAL) -> None:
+        """
+        Initialise the journal, the directory is opened on first use.
+
+        Args:
+            directory (str): Directory holding the segment files.
+            serializer (Serializer): Text serializer for the records.
+            max_segment_bytes (int): Size at which a segment is rotated.
+            max_segment_age (float): Seconds after which a segment is rotated.
+            fsync (FsyncPolicy): When appended records are forced to disk.
+            compact_threshold (float): Fraction of dead bytes at which a
+                               rotated segment is compacted.
+            compact_interval (float): Seconds between compaction runs.
+        """
+        self.directory = directory
+        self._serializer = serializer
+        self._max_segment_bytes = max_segment_bytes
+        self._max_segment_age = max_segment_age
+        self._compact_threshold = compact_threshold
+        self._compact_interval = compact_interval
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._segments: list[int] = []
+        self._generations: dict[int, int] = {}
+        self._head = (1, 0)
+        self._dead: dict[int, dict[int, int]] = {}
+        self._index: dict[int, dict[str, array[int]]] = {}
+        self._positions: dict[tuple[int, str], int] = {}
+        self._readers = 0
+        self._writer: Optional[BinaryIO] = None
+        self._active_size = 0
+        self._opened_at = 0.0
+        self._syncer = FileSyncer(fsync)
+        self._sync_thread: Optional[threading.Thread] = None
+        self._compactor: Optional[threading.Thread] = None
+        self._closing = threading.Event()
+
+    def _path(self, segment: int, suffix: str, generation: Optional[int] = None) -> str:
+        """
+        Args:
+            segment (int): The segment number.
+            suffix (str): The file type, such as SEGMENT_SUFFIX.
+            generation (Optional[int]): The generation, the current one if None.
+
+        Returns:
+            str: Path of the segment's file.
+        """
+        if generation is None:
+            generation = self._generations.get(segment, 0)
+        name = f"{segment:010d}" if not generation else f"{segment:010d}.{generation}"
+        return os.path.join(self.directory, name + suffix)
+
+    def _load(self) -> None:
+        """
+        Read the segments, checkpoint, dead marks and indexes from disk.
+        """
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found: dict[int, list[int]] = {}
+        for name in os.listdir(self.directory):
+            stem, suffix = os.path.splitext(name)
+            if suffix == TMP_SUFFIX:
+                # Left behind by a write a crash interrupted.
+                os.remove(os.path.join(self.directory, name))
+                continue
+            number, _, generation = stem.partition(".")
+            if suffix == SEGMENT_SUFFIX and number.isdigit() \
+                    and (not generation or generation.isdigit()):
+                found.setdefault(int(number), []).append(int(generation or 0))
+        for segment, generations in found.items():
+            self._generations[segment] = max(generations)
+            # Older generations are left by a crash during compaction.
+            for older in generations:
+                if older != self._generations[segment]:
+                    self._delete_files(segment, older)
+        segments = sorted(found)
+        head = (segments[0], 0) if segments else (1, 0)
+        checkpoint = os.path.join(self.directory, CHECKPOINT_FILE)
+        if os.path.exists(checkpoint):
+            try:
+                with open(checkpoint, "r") as f:
+                    saved = json.load(f)
+                saved_head = (int(saved["segment"]), int(saved["offset"]))
+                if int(saved.get("generation", 0)) != self._generations.get(saved_head[0], 0):
+                    # Compacted after the checkpoint, only live records were kept.
+                    saved_head = (saved_head[0], 0)
+                head = max(head, saved_head)
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Ignoring unreadable journal checkpoint "
+                               f"'{checkpoint}': {e}")
+        # Segments behind the checkpoint were consumed before a restart.
+        for segment in [s for s in segments if s < head[0]]:
+            self._delete_files(segment)
+            segments.remove(segment)
+        if head[0] not in segments:
+            later = [s for s in segments if s > head[0]]
+            head = (later[0] if later else head[0], 0)
+            if not later:
+                segments.append(head[0])
+        size = self._recover_tail(segments[-1])
+        if head[0] == segments[-1]:
+            head = (head[0], min(head[1], size))
+        self._segments = segments
+        self._head = head
+        for segment in segments:
+            self._dead[segment] = self._read_dead_marks(segment)
+            if segment != segments[-1]:
+                self._index[segment] = self._read_index(segment)
+        self._loaded = True
+        self._advance_head()
+
+    def _scan(self, segment: int) -> tuple[dict[str, "array[int]"], int, int]:
+        """
+        Index a segment by reading all of its records.
+
+        Args:
+            segment (int): The segment number.
+
+        Returns:
+            tuple[dict[str, array[int]], int, int]: The index, the end of the
+                last intact record and the size of the segment.
+        """
+        index: dict[str, array[int]] = {}
+        size = intact = 0
+        try:
+            with open(self._path(segment, SEGMENT_SUFFIX), "rb") as f:
+                for line in f:
+                    start, size = size, size + len(line)
+                    try:
+                        topic, _ = self._decode(line)
+                    except ValueError:
+                        continue
+                    index.setdefault(topic, array("q")).append(start)
+                    intact = size
+        except FileNotFoundError:
+            pass
+        return index, intact, size
+
+    def _recover_tail(self, segment: int) -> int:
+        """
+        Index the newest segment and truncate it after its last intact record.
+
+        Args:
+            segment (int): The newest segment.
+
+        Returns:
+            int: The size of the segment.
+        """
+        self._index[segment], intact, size = self._scan(segment)
+        if intact < size:
+            path = self._path(segment, SEGMENT_SUFFIX)
+            logger.warning(f"Truncating {size - intact} bytes of torn records "
+                           f"from the end of '{path}'.")
+            with open(path, "r+b") as f:
+                f.truncate(intact)
+                if self._syncer.policy.mode != "never":
+                    os.fsync(f.fileno())
+        return intact
+
+    def _read_index(self, segment: int) -> dict[str, "array[int]"]:
+        """
+        Read the saved index of a rotated segment, rebuilding it if it
+        is missing or unreadable.
+
+        Args:
+            segment (int): The segment number.
+
+        Returns:
+            dict[str, array[int]]: Topics mapped to the offsets of their records.
+        """
+        try:
+            with open(self._path(segment, INDEX_SUFFIX), "r") as f:
+                saved = json.load(f)
+            return {topic: array("q", offsets) for topic, offsets in saved.items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Rebuilding unreadable journal index of segment {segment}: {e}")
+        index = self._scan(segment)[0]
+        self._write_index(segment, index)
+        return index
+
+    def _write_index(self, segment: int, index: dict[str, "array[int]"],
+                     generation: Optional[int] = None) -> None:
+        """
+        Save the index of a rotated segment. It can always be rebuilt
+        from the segment, so it isn't synced.
+
+        Args:
+            segment (int): The segment number.
+            index (dict[str, array[int]]): Topics mapped to record offsets.
+            generation (Optional[int]): The generation, the current one if None.
+        """
+        atomic_write(self._path(segment, INDEX_SUFFIX, generation),
+                     json.dumps({topic: offsets.tolist() for topic, offsets in index.items()}))
+
+    def _encode(self, topic: str, data: Any) -> bytes:
+        """
+        Args:
+            topic (str): The message topic.
+            data (Any): The message payload.
+
+        Returns:
+            bytes: The record line.
+        """
+        # The journal is given text serializers.
+        text = cast(str, self._serializer.dumps({"topic": topic, "data": data}))
+        content = text.encode("utf-8")
+        return b"%08x %s\n" % (zlib.crc32(content), content)
+
+    def _decode(self, line: bytes) -> tuple[str, Any]:
+        """
+        Args:
+            line (bytes): A record line.
+
+        Returns:
+            tuple[str, Any]: The topic and payload.
+
+        Raises:
+            ValueError: If the record is torn or corrupt.
+        """
+        if not line.endswith(b"\n"):
+            raise ValueError("record is incomplete")
+        checksum, _, content = line[:-1].partition(b" ")
+        if len(checksum) != 8 or int(checksum, 16) != zlib.crc32(content):
+            raise ValueError("checksum mismatch")
+        try:
+            record = self._serializer.loads(content)
+            return record["topic"], record["data"]
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"malformed record: {e}")
+
+    def _read_dead_marks(self, segment: int) -> dict[int, int]:
+        """
+        Read the dead marks of a segment.
+
+        Args:
+            segment (int): The segment number.
+
+        Returns:
+            dict[int, int]: Start offsets of dead records mapped to their end.
+        """
+        marks: dict[int, int] = {}
+        try:
+            with open(self._path(segment, DEAD_SUFFIX), "r") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+                        marks[int(parts[0])] = int(parts[1])
+        except FileNotFoundError:
+            pass
+        return marks
+
+    def _start_threads(self) -> None:
+        """
+        Start the compactor, and the sync thread for the interval fsync
+        policy, if they aren't running.
+        """
+        if self._compactor is None:
+            self._closing = threading.Event()
+            self._compactor = threading.Thread(target=self._compact_loop,
+                                               name="JournalCompactor", daemon=True)
+            self._compactor.start()
+        if self._syncer.policy.mode == "interval" and self._sync_thread is None:
+            self._sync_thread = threading.Thread(target=self._sync_loop,
+                                                 name="JournalSync", daemon=True)
+            self._sync_thread.start()
+
+    def _open_writer(self) -> BinaryIO:
+        """
+        Open the newest segment for appending, rotating it first if
+        it is full or too old.
+
+        Returns:
+            BinaryIO: The append handle.
+        """
+        if self._writer is not None:
+            full = self._active_size >= self._max_segment_bytes
+            expired = time.time() - self._opened_at >= self._max_segment_age
+            if self._active_size and (full or expired):
+                self._rotate()
+        if self._writer is None:
+            path = self._path(self._segments[-1], SEGMENT_SUFFIX)
+            created = not os.path.exists(path)
+            self._writer = open(path, "ab")
+            self._active_size = self._writer.tell()
+            self._opened_at = time.time()
+            if created and self._syncer.policy.mode != "never":
+                fsync_directory(self.directory)
+        return self._writer
+
+    def _sync_loop(self) -> None:
+        """
+        Sync thread body for the interval fsync policy, so records
+        appended before a quiet period don't wait for the next append.
+        """
+        closing = self._closing
+        while not closing.wait(self._syncer.policy.interval):
+            with self._lock:
+                if self._writer is None or not self._syncer.overdue():
+                    continue
+                try:
+                    self._syncer.sync(self._writer)
+                except OSError as e:
+                    logger.warning(f"Failed to sync journal '{self.directory}': {e}")
+
+    def _rotate(self) -> None:
+        """
+        Close the newest segment, save its index and start the next one.
+        """
+        if self._writer is not None:
+            self._writer.flush()
+            self._syncer.sync(self._writer)
+            self._writer.close()
+            self._writer = None
+        sealed = self._segments[-1]
+        self._write_index(sealed, self._index[sealed])
+        head = self._head
+        segment = sealed + 1
+        self._segments.append(segment)
+        self._dead[segment] = {}
+        self._index[segment] = {}
+        self._advance_head()
+        self._commit(head)
+
+    def append(self, topic: str, data: Any) -> None:
+        """
+        Append a record to the journal.
+
+        Args:
+            topic (str): The message topic.
+            data (Any): The message payload.
+
+        Raises:
+            OSError: If the segment can't be written.
+        """
+        line = self._encode(topic, data)
+        with self._lock:
+            self._load()
+            self._start_threads()
+            writer = self._open_writer()
+            offset = self._active_size
+            writer.write(line)
+            writer.flush()
+            self._active_size += len(line)
+            self._index[self._segments[-1]].setdefault(topic, array("q")).append(offset)
+            self._syncer.written(writer)
+
+    def append_many(self, records: Iterable[tuple[str, Any]]) -> None:
+        """
+        Append records to the journal with a single flush, and a
+        single fsync where the policy asks for one. Every record is
+        encoded before anything is written.
+
+        Args:
+            records (Iterable[tuple[str, Any]]): Topics and payloads.
+
+        Raises:
+            OSError: If the segment can't be written, records before
+                     the failing one may have been written.
+            TypeError, ValueError: If a payload can't be encoded.
+        """
+        lines = [(topic, self._encode(topic, data)) for topic, data in records]
+        if not lines:
+            return
+        with self._lock:
+            self._load()
+            self._start_threads()
+            for topic, line in lines:
+                writer = self._open_writer()
+                offset = self._active_size
+                writer.write(line)
+                self._active_size += len(line)
+                self._index[self._segments[-1]].setdefault(topic, array("q")).append(offset)
+            writer.flush()
+            self._syncer.written(writer, len(lines))
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        """
+        Keep the compactor from moving records while records that were
+        read are still to be consumed.
+        """
+        with self._lock:
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._readers -= 1
+
+    def records(self, topic: Optional[str] = None) -> Iterator[JournalRecord]:
+        """
+        Stream the records that haven't been consumed, oldest first.
+        Segments are read line by line, or with the index for a topic,
+        and the journal isn't locked between records, so it can be
+        appended to and consumed from while the records are being read.
+
+        Args:
+            topic (Optional[str]): Only read records of this topic.
+
+        Yields:
+            JournalRecord: The records.
+
+        Raises:
+            OSError: If a segment can't be read.
+        """
+        with self.reading():
+            with self._lock:
+                self._load()
+                segment, offset = self._head
+            while True:
+                with self._lock:
+                    if segment > self._segments[-1]:
+                        return
+                    if segment < self._head[0]:
+                        segment, offset = self._head
+                try:
+                    if topic is None:
+                        yield from self._read_segment(segment, offset)
+                    else:
+                        yield from self._read_topic(segment, topic)
+                except FileNotFoundError:
+                    # Consumed and deleted while it was being read.
+                    pass
+                segment, offset = segment + 1, 0
+
+    def _live(self, segment: int, start: int) -> bool:
+        return (segment, start) >= self._head and start not in self._dead.get(segment, ())
+
+    def _read_record(self, segment: int, start: int, line: bytes) -> Optional[JournalRecord]:
+        """
+        Decode a record line, dropping it if it is corrupt.
+
+        Args:
+            segment (int): The segment number.
+            start (int): Offset of the record.
+            line (bytes): The record line.
+
+        Returns:
+            Optional[JournalRecord]: The record, None if it was corrupt.
+        """
+        end = start + len(line)
+        try:
+            topic, data = self._decode(line)
+        except ValueError as e:
+            logger.warning(f"Dropping corrupt journal record at "
+                           f"{self._path(segment, SEGMENT_SUFFIX)}:{start}: {e}")
+            # Consumed so it doesn't hold back the checkpoint.
+            self.consume([JournalRecord(segment, start, end, "", None)])
+            return None
+        return JournalRecord(segment, start, end, topic, data)
+
+    def _read_segment(self, segment: int, offset: int) -> Iterator[JournalRecord]:
+        """
+        Stream the live records of one segment from an offset.
+
+        Args:
+            segment (int): The segment number.
+            offset (int): Offset to start reading at.
+
+        Yields:
+            JournalRecord: The records.
+        """
+        with open(self._path(segment, SEGMENT_SUFFIX), "rb") as f:
+            f.seek(offset)
+            for line in f:
+                start, offset = offset, offset + len(line)
+                if not line.endswith(b"\n") and segment == self._segments[-1]:
+                    # A record that is still being written.
+                    return
+                if self._live(segment, start):
+                    record = self._read_record(segment, start, line)
+                    if record is not None:
+                        yield record
+
+    def _read_topic(self, segment: int, topic: str) -> Iterator[JournalRecord]:
+        """
+        Stream the live records of a topic in one segment, seeking to
+        each one with the index.
+
+        Args:
+            segment (int): The segment number.
+            topic (str): The topic.
+
+        Yields:
+            JournalRecord: The records.
+        """
+        with self._lock:
+            offsets = self._index.get(segment, {}).get(topic)
+            if not offsets:
+                return
+            position = self._positions.get((segment, topic), 0)
+            path = self._path(segment, SEGMENT_SUFFIX)
+        with open(path, "rb") as f:
+            while position < len(offsets):
+                start = offsets[position]
+                position += 1
+                if not self._live(segment, start):
+                    continue
+                f.seek(start)
+                record = self._read_record(segment, start, f.readline())
+                if record is not None:
+                    yield record
+
+    def take(self, topic: Optional[str] = None,
+             limit: Optional[int] = 1) -> list[JournalRecord]:
+        """
+        Read and consume the oldest records.
+
+        Args:
+            topic (Optional[str]): Only take records of this topic.
+            limit (Optional[int]): Maximum number of records, None for all.
+
+        Returns:
+            list[JournalRecord]: The records, empty if there are none.
+
+        Raises:
+            OSError: If the journal can't be read or written.
+        """
+        with self._lock:
+            taken = []
+            for record in self.records(topic):
+                taken.append(record)
+                if limit is not None and len(taken) >= limit:
+                    break
+            self.consume(taken)
+            if topic is not None:
+                # Every earlier record of the topic is consumed, so the
+                # next read can skip them in the index.
+                for record in taken:
+                    offsets = self._index.get(record.segment, {}).get(topic)
+                    if offsets is not None:
+                        self._positions[(record.segment, topic)] = \
+                            bisect_right(offsets, record.offset)
+            return taken
+
+    def consume(self, records: Iterable[JournalRecord]) -> None:
+        """
+        Remove records from the journal. Records at the head move the
+        checkpoint forwards, the others are marked dead.
+
+        Args:
+            records (Iterable[JournalRecord]): Records read from the journal.
+
+        Raises:
+            OSError: If the checkpoint or dead marks can't be written.
+        """
+        with self._lock:
+            self._load()
+            self._start_threads()
+            head = self._head
+            marks: dict[int, list[JournalRecord]] = {}
+            for record in sorted(records, key=lambda r: (r.segment, r.offset)):
+                position = (record.segment, record.offset)
+                dead = self._dead.get(record.segment)
+                if position < self._head or dead is None or record.offset in dead:
+                    continue
+                if position == self._head:
+                    self._head = (record.segment, record.end)
+                    self._advance_head()
+                else:
+                    dead[record.offset] = record.end
+                    marks.setdefault(record.segment, []).append(record)
+            for segment, dead_records in marks.items():
+                if segment < self._head[0]:
+                    continue
+                with open(self._path(segment, DEAD_SUFFIX), "a") as f:
+                    f.writelines(f"{r.offset} {r.end}\n" for r in dead_records)
+            self._commit(head)
+
+    def _advance_head(self) -> None:
+        """
+        Move the head past dead records and past the end of segments
+        that won't be written to again.
+        """
+        while True:
+            segment, offset = self._head
+            dead = self._dead.setdefault(segment, {})
+            if offset in dead:
+                self._head = (segment, dead.pop(offset))
+                continue
+            if segment == self._segments[-1]:
+                return
+            try:
+                size = os.path.getsize(self._path(segment, SEGMENT_SUFFIX))
+            except FileNotFoundError:
+                size = 0
+            if offset < size:
+                return
+            self._head = (self._segments[self._segments.index(segment) + 1], 0)
+
+    def _commit(self, head: Optional[tuple[int, int]]) -> None:
+        """
+        Save the head if it has moved and delete the segments behind it.
+
+        Args:
+            head (Optional[tuple[int, int]]): The previously saved head,
+                 None to save it regardless.
+        """
+        if self._head == head:
+            return
+        self._write_checkpoint()
+        for segment in [s for s in self._segments if s < self._head[0]]:
+            self._delete_files(segment)
+            self._forget(segment)
+
+    def _write_checkpoint(self) -> None:
+        """
+        Atomically replace the checkpoint with the current head.
+        """
+        segment, offset = self._head
+        atomic_write(os.path.join(self.directory, CHECKPOINT_FILE),
+                     json.dumps({"segment": segment, "offset": offset,
+                                 "generation": self._generations.get(segment, 0)}),
+                     sync=self._syncer.policy.mode == "always")
+
+    def _forget(self, segment: int) -> None:
+        """
+        Drop the in-memory state of a deleted segment.
+
+        Args:
+            segment (int): The segment number.
+        """
+        self._segments.remove(segment)
+        self._generations.pop(segment, None)
+        self._dead.pop(segment, None)
+        self._index.pop(segment, None)
+        for key in [k for k in self._positions if k[0] == segment]:
+            del self._positions[key]
+
+    def _delete_files(self, segment: int, generation: Optional[int] = None) -> None:
+        """
+        Delete a segment with its dead marks and index.
+
+        Args:
+            segment (int): The segment number.
+            generation (Optional[int]): The generation, the current one if None.
+        """
+        for suffix in (SEGMENT_SUFFIX, DEAD_SUFFIX, INDEX_SUFFIX):
+            try:
+                os.remove(self._path(segment, suffix, generation))
+            except FileNotFoundError:
+                pass
+
+    def _compact_loop(self) -> None:
+        """
+        Compactor thread body.
+        """
+        closing = self._closing
+        while not closing.wait(self._compact_interval):
+            try:
+                self.compact()
+            except OSError as e:
+                logger.warning(f"Failed to compact journal '{self.directory}': {e}")
+
+    def dead_fraction(self, segment: int) -> float:
+        """
+        Args:
+            segment (int): The segment number.
+
+        Returns:
+            float: Fraction of the segment's bytes held by consumed records.
+        """
+        with self._lock:
+            try:
+                size = os.path.getsize(self._path(segment, SEGMENT_SUFFIX))
+            except FileNotFoundError:
+                return 0.0
+            if not size:
+                return 0.0
+            dead = sum(end - start for start, end in self._dead.get(segment, {}).items())
+            if segment == self._head[0]:
+                dead += self._head[1]
+            return dead / size
+
+    def compact(self) -> int:
+        """
+        Rewrite the rotated segments whose dead fraction has passed the
+        threshold. Segments aren't compacted while records that were
+        read are still to be consumed.
+
+        Returns:
+            int: The number of bytes reclaimed.
+
+        Raises:
+            OSError: If a segment can't be rewritten.
+        """
+        with self._lock:
+            self._load()
+            segments = self._segments[:-1]
+        reclaimed = 0
+        for segment in segments:
+            with self._lock:
+                if self._readers or segment not in self._segments[:-1]:
+                    continue
+                if self.dead_fraction(segment) >= self._compact_threshold:
+                    reclaimed += self._compact_segment(segment)
+        return reclaimed
+
+    def _compact_segment(self, segment: int) -> int:
+        """
+        Copy the live records of a segment into its next generation.
+
+        Args:
+            segment (int): The segment number.
+
+        Returns:
+            int: The number of bytes reclaimed.
+        """
+        generation = self._generations.get(segment, 0) + 1
+        path = self._path(segment, SEGMENT_SUFFIX)
+        new_path = self._path(segment, SEGMENT_SUFFIX, generation)
+        topics = {start: topic for topic, offsets in self._index[segment].items()
+                  for start in offsets if self._live(segment, start)}
+        index: dict[str, array[int]] = {}
+        size = written = 0
+        with open(path, "rb") as src, open(new_path + TMP_SUFFIX, "wb") as dst:
+            for line in src:
+                start, size = size, size + len(line)
+                topic = topics.get(start)
+                if topic is None:
+                    continue
+                index.setdefault(topic, array("q")).append(written)
+                dst.write(line)
+                written += len(line)
+            if self._syncer.policy.mode != "never":
+                dst.flush()
+                os.fsync(dst.fileno())
+        self._write_index(segment, index, generation)
+        os.replace(new_path + TMP_SUFFIX, new_path)
+        if self._syncer.policy.mode != "never":
+            fsync_directory(self.directory)
+
+        previous = self._generations.get(segment, 0)
+        self._generations[segment] = generation
+        self._index[segment] = index
+        self._dead[segment] = {}
+        for key in [k for k in self._positions if k[0] == segment]:
+            del self._positions[key]
+        self._delete_files(segment, previous)
+        if segment == self._head[0]:
+            self._head = (segment, 0)
+            self._advance_head()
+            self._commit(None)
+        logger.info(f"Compacted journal segment {segment}, "
+                    f"reclaimed {size - written} bytes.")
+        return size - written
+
+    def segments(self) -> list[str]:
+        """
+        Returns:
+            list[str]: Paths of the segments that may hold live records.
+        """
+        with self._lock:
+            self._load()
+            return [self._path(s, SEGMENT_SUFFIX) for s in self._segments]
+
+    def close(self) -> None:
+        """
+        Close the append handle and stop the background threads, the
+        journal is reopened when used again.
+        """
+        with self._lock:
+            self._closing.set()
+            self._sync_thread = None
+            self._compactor = None
+            if self._writer is not None:
+                try:
+                    self._syncer.sync(self._writer)
+                finally:
+                    self._writer.close()
+                    self._writer = None
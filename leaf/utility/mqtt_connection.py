@@ -0,0 +1,446 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Literal, NamedTuple, Optional
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+from paho.mqtt.enums import MQTTProtocolVersion
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.utility.logger.logger_utils import get_logger
+from leaf.utility.reconnect import ReconnectScheduler
+from leaf.utility.reconnect import reconnect_paho_client
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+CONNECTION_KEEPALIVE = 60
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 120
+RECONNECT_JITTER = 0.5
+UNCLAIMED_ACK_LIMIT = 1024
+
+
+class ConnectionKey(NamedTuple):
+    """
+    Identifies connections that can be shared.
+    """
+    broker: str
+    port: int
+    username: Optional[str]
+    password: Optional[str]
+    protocol: MQTTProtocolVersion
+    transport: Literal["tcp", "websockets", "unix"]
+    tls: bool
+
+
+class _Consumer(NamedTuple):
+    """
+    Callbacks of a module using a shared connection.
+    """
+    on_connect: Optional[Callable[..., None]]
+    on_disconnect: Optional[Callable[..., None]]
+    on_message: Optional[Callable[..., None]]
+    on_publish: Optional[Callable[..., None]]
+
+
+class SharedMQTTConnection:
+    """
+    One paho client, network thread and TCP connection shared by every
+    module that talks to the same broker with the same credentials.
+    Client callbacks are fanned out to each consumer, publish
+    acknowledgements only go to the consumer that sent the message,
+    subscriptions are reference counted and incoming messages are only routed to
+    the consumers subscribed to a matching topic. Subscriptions are
+    renewed whenever the connection is (re)established. After a
+    connection loss reconnects are retried with a jittered backoff
+    until they succeed or the last consumer leaves.
+    """
+
+    def __init__(self, key: ConnectionKey) -> None:
+        """
+        Create the client, the connection is opened by connect().
+
+        Args:
+            key (ConnectionKey): Broker and credentials of the connection.
+        """
+        self.key = key
+        self.client = mqtt.Client(
+            callback_api_version=CallbackAPIVersion.VERSION2,
+            protocol=key.protocol,
+            transport=key.transport,
+            reconnect_on_failure=False,
+        )
+        if key.username and key.password:
+            self.client.username_pw_set(key.username, key.password)
+        if key.tls:
+            try:
+                self.client.tls_set()
+                self.client.tls_insecure_set(True)
+            except Exception as e:
+                raise AdapterBuildError(f"Failed to set up TLS: {e}")
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_publish = self._on_publish
+
+        self._lock = threading.RLock()
+        self._consumers: dict[int, _Consumer] = {}
+        self._subscriptions: dict[str, set[int]] = {}
+        self._subscription_qos: dict[str, int] = {}
+        self._inflight_windows: dict[int, int] = {}
+        # Consumer of every message sent through publish(), by mid.
+        self._ack_owners: dict[int, int] = {}
+        # Acknowledgements that beat publish() back, tagged with the
+        # order they arrived in and kept while a publish is under way.
+        self._unclaimed_acks: OrderedDict[int, tuple[int, tuple[Any, ...]]] = OrderedDict()
+        self._ack_seq: int = 0
+        self._publishing: int = 0
+        self._started: bool = False
+        self._connack: Optional[tuple[Any, Any, Any]] = None
+        self._reconnector = ReconnectScheduler(
+            lambda: reconnect_paho_client(self.client),
+            lambda: None,
+            first_delay=RECONNECT_MIN_DELAY,
+            max_delay=RECONNECT_MAX_DELAY,
+            max_attempts=None,
+            jitter=RECONNECT_JITTER,
+            name=f"MQTTReconnect-{key.broker}",
+        )
+
+    def add_consumer(
+        self,
+        consumer: object,
+        on_connect: Optional[Callable[..., None]] = None,
+        on_disconnect: Optional[Callable[..., None]] = None,
+        on_message: Optional[Callable[..., None]] = None,
+        on_publish: Optional[Callable[..., None]] = None,
+    ) -> None:
+        """
+        Register a module and the paho callbacks it wants to receive.
+
+        Args:
+            consumer (object): The module using the connection.
+            on_connect (Optional[Callable[..., None]]): paho on_connect callback.
+            on_disconnect (Optional[Callable[..., None]]): paho on_disconnect callback.
+            on_message (Optional[Callable[..., None]]): paho on_message callback,
+                        only called for the consumer's subscriptions.
+            on_publish (Optional[Callable[..., None]]): paho on_publish callback.
+        """
+        with self._lock:
+            self._consumers[id(consumer)] = _Consumer(
+                on_connect, on_disconnect, on_message, on_publish
+            )
+
+    def remove_consumer(self, consumer: object) -> int:
+        """
+        Unregister a module and drop its subscriptions.
+
+        Args:
+            consumer (object): The module using the connection.
+
+        Returns:
+            int: Number of consumers left.
+        """
+        with self._lock:
+            self._consumers.pop(id(consumer), None)
+            self._inflight_windows.pop(id(consumer), None)
+            for mid in [m for m, c in self._ack_owners.items() if c == id(consumer)]:
+                del self._ack_owners[mid]
+            for topic in [t for t, c in self._subscriptions.items() if id(consumer) in c]:
+                self.unsubscribe(consumer, topic)
+            return len(self._consumers)
+
+    def consumer_count(self) -> int:
+        """
+        Returns:
+            int: Number of modules using the connection.
+        """
+        with self._lock:
+            return len(self._consumers)
+
+    def connect(self, consumer: object) -> None:
+        """
+        Open the connection and start the network thread if that
+        hasn't happened yet. A consumer joining an open connection
+        gets its on_connect callback straight away.
+
+        Args:
+            consumer (object): The module using the connection.
+
+        Raises:
+            OSError: If the broker can't be reached.
+        """
+        with self._lock:
+            if not self._started:
+                self.client.connect(self.key.broker, self.key.port, CONNECTION_KEEPALIVE)
+                self.client.loop_start()
+                self._started = True
+                return
+            connack = self._connack if self.client.is_connected() else None
+            joining = self._consumers.get(id(consumer))
+        if connack is not None and joining is not None:
+            # Late joiners don't see the original CONNACK.
+            self._dispatch([joining], "on_connect", self.client, None, *connack)
+
+    def close(self) -> None:
+        """
+        Disconnect and stop the network thread.
+        """
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+        self._reconnector.cancel()
+        if self.client.is_connected():
+            self.client.disconnect()
+        self.client.loop_stop()
+
+    def subscribe(self, consumer: object, topic: str, qos: int = 0) -> None:
+        """
+        Route messages on a topic to a consumer, subscribing with
+        the broker if no other consumer already has.
+
+        Args:
+            consumer (object): The module using the connection.
+            topic (str): The topic, wildcards are allowed.
+            qos (int): The QoS level of the subscription.
+        """
+        with self._lock:
+            consumers = self._subscriptions.setdefault(topic, set())
+            first = not consumers
+            consumers.add(id(consumer))
+            self._subscription_qos[topic] = max(qos, self._subscription_qos.get(topic, 0))
+        if first and self.client.is_connected():
+            self.client.subscribe(topic, qos)
+
+    def unsubscribe(self, consumer: object, topic: str) -> None:
+        """
+        Stop routing messages on a topic to a consumer, unsubscribing
+        with the broker once no consumer wants the topic.
+
+        Args:
+            consumer (object): The module using the connection.
+            topic (str): The topic.
+        """
+        with self._lock:
+            consumers = self._subscriptions.get(topic)
+            if consumers is None:
+                return
+            consumers.discard(id(consumer))
+            if consumers:
+                return
+            del self._subscriptions[topic]
+            del self._subscription_qos[topic]
+        if self.client.is_connected():
+            self.client.unsubscribe(topic)
+
+    def publish(self, consumer: object, **kwargs: Any) -> mqtt.MQTTMessageInfo:
+        """
+        Publish a message for a consumer, its acknowledgement is
+        only passed to that consumer's on_publish callback.
+
+        Args:
+            consumer (object): The module using the connection.
+            **kwargs (Any): Arguments of paho's Client.publish.
+
+        Returns:
+            mqtt.MQTTMessageInfo: The result of the publish.
+        """
+        with self._lock:
+            self._publishing += 1
+            started = self._ack_seq
+        # Not held across publish(), paho calls on_publish with its
+        # own message lock held, which publish() also takes.
+        try:
+            result = self.client.publish(**kwargs)
+        except Exception:
+            with self._lock:
+                self._release_publish()
+            raise
+        with self._lock:
+            early = self._unclaimed_acks.pop(result.mid, None)
+            self._release_publish()
+            # An id is reused once it wraps, only an acknowledgement that
+            # arrived after this publish began can be for this message.
+            if early is None or early[0] <= started:
+                self._ack_owners[result.mid] = id(consumer)
+                return result
+            owner = self._consumers.get(id(consumer))
+        if owner is not None:
+            self._dispatch([owner], "on_publish", *early[1])
+        return result
+
+    def _release_publish(self) -> None:
+        """
+        Count a publish as finished, forgetting unclaimed acknowledgements
+        once none is under way. Called with the lock held.
+        """
+        self._publishing -= 1
+        if not self._publishing:
+            self._unclaimed_acks.clear()
+
+    def set_max_inflight(self, consumer: object, window: int) -> None:
+        """
+        Size the client's in-flight window to the sum of the consumers'
+        windows. The client only allows this before the connection is
+        opened, consumers joining later keep to their own window.
+
+        Args:
+            consumer (object): The module using the connection.
+            window (int): The consumer's in-flight window.
+        """
+        with self._lock:
+            self._inflight_windows[id(consumer)] = window
+            if not self._started:
+                self.client.max_inflight_messages_set(sum(self._inflight_windows.values()))
+
+    def _dispatch(self, consumers: list[_Consumer], callback: str, *args: Any) -> None:
+        """
+        Call a paho callback of several consumers, errors are logged
+        so one consumer can't break the others.
+
+        Args:
+            consumers (list[_Consumer]): The consumers to notify.
+            callback (str): Name of the callback.
+            *args (Any): Callback arguments.
+        """
+        for consumer in consumers:
+            function = getattr(consumer, callback)
+            if function is None:
+                continue
+            try:
+                function(*args)
+            except Exception as e:
+                logger.error(f"Error in shared MQTT {callback} callback: {e}")
+
+    def _on_connect(
+        self, client: mqtt.Client, userdata: Any, flags: Any, rc: Any,
+        properties: Optional[Any] = None,
+    ) -> None:
+        with self._lock:
+            self._connack = (flags, rc, properties)
+            topics = list(self._subscription_qos.items())
+            consumers = list(self._consumers.values())
+        if rc == 0:
+            self._reconnector.connected()
+            for topic, qos in topics:
+                client.subscribe(topic, qos)
+        self._dispatch(consumers, "on_connect", client, userdata, flags, rc, properties)
+
+    def _on_disconnect(
+        self, client: mqtt.Client, userdata: Any, flags: Any, rc: Any,
+        properties: Optional[Any] = None,
+    ) -> None:
+        with self._lock:
+            consumers = list(self._consumers.values())
+            started = self._started
+        if started and rc != mqtt.MQTT_ERR_SUCCESS:
+            self._reconnector.schedule()
+        self._dispatch(consumers, "on_disconnect", client, userdata, flags, rc, properties)
+
+    def _on_publish(
+        self, client: mqtt.Client, userdata: Any, mid: int, rc: Any = None,
+        properties: Optional[Any] = None,
+    ) -> None:
+        args = (client, userdata, mid, rc, properties)
+        with self._lock:
+            owner = self._ack_owners.pop(mid, None)
+            if owner is None:
+                # Sent by a publish() that hasn't returned yet.
+                if self._publishing:
+                    self._ack_seq += 1
+                    self._unclaimed_acks[mid] = (self._ack_seq, args)
+                    self._unclaimed_acks.move_to_end(mid)
+                    if len(self._unclaimed_acks) > UNCLAIMED_ACK_LIMIT:
+                        self._unclaimed_acks.popitem(last=False)
+                return
+            consumer = self._consumers.get(owner)
+        if consumer is not None:
+            self._dispatch([consumer], "on_publish", *args)
+
+    def _on_message(self, client: mqtt.Client, userdata: Any,
+                    msg: mqtt.MQTTMessage) -> None:
+        with self._lock:
+            targets: set[int] = set()
+            for topic, subscribers in self._subscriptions.items():
+                if mqtt.topic_matches_sub(topic, msg.topic):
+                    targets |= subscribers
+            consumers = [self._consumers[c] for c in targets if c in self._consumers]
+        self._dispatch(consumers, "on_message", client, userdata, msg)
+
+
+_connections: dict[ConnectionKey, SharedMQTTConnection] = {}
+_connections_lock = threading.Lock()
+
+
+def acquire_connection(
+    consumer: object,
+    broker: str,
+    port: int = 1883,
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+    protocol: MQTTProtocolVersion = mqtt.MQTTv311,
+    transport: Literal["tcp", "websockets", "unix"] = "tcp",
+    tls: bool = False,
+    **callbacks: Optional[Callable[..., None]],
+) -> SharedMQTTConnection:
+    """
+    Get the shared connection for a broker, creating it for the
+    first consumer, and register the consumer's callbacks with it.
+
+    Args:
+        consumer (object): The module that will use the connection.
+        broker (str): The address of the MQTT broker.
+        port (int): The port of the MQTT broker.
+        username (Optional[str]): Username for authentication.
+        password (Optional[str]): Password for authentication.
+        protocol (MQTTProtocolVersion): paho protocol version.
+        transport (Literal["tcp", "websockets", "unix"]): "tcp", "websockets" or "unix".
+        tls (bool): Whether to use TLS.
+        **callbacks (Optional[Callable[..., None]]): See SharedMQTTConnection.add_consumer.
+
+    Returns:
+        SharedMQTTConnection: The connection, call connect() to open it.
+    """
+    key = ConnectionKey(broker, port, username, password, protocol, transport, tls)
+    with _connections_lock:
+        connection = _connections.get(key)
+        if connection is None:
+            connection = SharedMQTTConnection(key)
+            _connections[key] = connection
+            logger.info(f"Opened shared MQTT connection to {broker}:{port}")
+        connection.add_consumer(consumer, **callbacks)
+    return connection
+
+
+def release_connection(connection: SharedMQTTConnection, consumer: object) -> None:
+    """
+    Unregister a consumer, closing the connection after the last one.
+
+    Args:
+        connection (SharedMQTTConnection): The connection.
+        consumer (object): The module that used the connection.
+    """
+    with _connections_lock:
+        if connection.remove_consumer(consumer) > 0:
+            return
+        if _connections.get(connection.key) is connection:
+            del _connections[connection.key]
+    logger.info(f"Closing shared MQTT connection to {connection.key.broker}:{connection.key.port}")
+    connection.close()
+
+
+def get_connection_stats() -> dict[str, int]:
+    """
+    Report on the shared connections of this process.
+
+    Returns:
+        dict[str, int]: Consumers per "broker:port", summed over
+                        connections with different credentials.
+    """
+    stats: dict[str, int] = {}
+    with _connections_lock:
+        for key, connection in _connections.items():
+            name = f"{key.broker}:{key.port}"
+            stats[name] = stats.get(name, 0) + connection.consumer_count()
+    return stats
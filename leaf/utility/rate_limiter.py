@@ -0,0 +1,520 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, NamedTuple, Optional
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.output_module import OutputModule
+from leaf.modules.output_modules.output_module import accepts_retain
+from leaf.utility.circuit_breaker import CircuitBreakerPolicy
+from leaf.utility.replay import ReplayPolicy
+from leaf.utility.logger.logger_utils import get_logger
+from leaf.utility.topic_classes import TOPIC_CLASSES
+from leaf.utility.topic_classes import TopicClass
+from leaf.utility.topic_classes import classify_topic
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+# Lanes in the order they are served, TOPIC_CLASSES is already
+# ordered control, error, measurement.
+LANE_PRIORITY: tuple[TopicClass, ...] = TOPIC_CLASSES
+OVERFLOW_POLICIES = ("drop", "fallback")
+DEFAULT_LANE_SIZE = 1000
+# Time allowed to send what is queued when the output disconnects.
+DRAIN_TIMEOUT = 5
+
+
+class LaneLimit(NamedTuple):
+    """
+    Token bucket settings of a lane, rate in messages per second
+    and burst the number of messages that can be sent at once.
+    """
+    rate: float
+    burst: float
+
+
+class RateLimitPolicy(NamedTuple):
+    """
+    Rate limits of an instance's output traffic. Lanes without
+    a limit are sent as fast as the output takes them.
+    """
+    lanes: dict[TopicClass, Optional[LaneLimit]]
+    lane_size: int = DEFAULT_LANE_SIZE
+    overflow: str = "drop"
+
+
+def build_rate_limit_policy(config: dict[str, Any]) -> RateLimitPolicy:
+    """
+    Build a rate limit policy from an INSTANCES configuration
+    block, lanes take a rate or a rate and burst, for example::
+
+        rate_limit:
+          error: 5
+          measurement:
+            rate: 100
+            burst: 500
+          lane_size: 2000
+          overflow: fallback
+
+    Args:
+        config (dict[str, Any]): The rate limit configuration.
+
+    Returns:
+        RateLimitPolicy: The policy.
+
+    Raises:
+        AdapterBuildError: If an option is unknown or invalid.
+    """
+    if not isinstance(config, dict):
+        raise AdapterBuildError("Rate limit must map lanes to rates.")
+    config = dict(config)
+    lane_size = config.pop("lane_size", DEFAULT_LANE_SIZE)
+    if not isinstance(lane_size, int) or lane_size <= 0:
+        raise AdapterBuildError("Rate limit lane_size must be a positive integer.")
+    overflow = config.pop("overflow", "drop")
+    if overflow not in OVERFLOW_POLICIES:
+        raise AdapterBuildError(
+            f"Unknown rate limit overflow '{overflow}', expected one of "
+            f"{', '.join(OVERFLOW_POLICIES)}."
+        )
+    unknown = set(config) - set(LANE_PRIORITY)
+    if unknown:
+        raise AdapterBuildError(f"Unknown rate limit lanes: {', '.join(sorted(unknown))}.")
+    lanes = {lane: _build_lane_limit(lane, config.get(lane)) for lane in LANE_PRIORITY}
+    return RateLimitPolicy(lanes, lane_size, overflow)
+
+
+def _build_lane_limit(lane: str, options: Any) -> Optional[LaneLimit]:
+    """
+    Build the limit of a single lane.
+
+    Args:
+        lane (str): Name of the lane.
+        options (Any): None, a rate, or a dict with rate and burst.
+
+    Returns:
+        Optional[LaneLimit]: The limit, None for an unlimited lane.
+    """
+    if options is None:
+        return None
+    if isinstance(options, (int, float)):
+        options = {"rate": options}
+    if not isinstance(options, dict) or "rate" not in options:
+        raise AdapterBuildError(f"Rate limit of lane '{lane}' needs a rate.")
+    unknown = set(options) - set(LaneLimit._fields)
+    if unknown:
+        raise AdapterBuildError(f"Unknown option(s) for lane '{lane}': {', '.join(sorted(unknown))}.")
+    rate = options["rate"]
+    burst = options.get("burst", max(rate, 1))
+    for name, value in (("rate", rate), ("burst", burst)):
+        if not isinstance(value, (int, float)) or value <= 0:
+            raise AdapterBuildError(f"Lane '{lane}' {name} must be a positive number.")
+    if burst < 1:
+        raise AdapterBuildError(f"Lane '{lane}' burst must be at least 1.")
+    return LaneLimit(float(rate), float(burst))
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at a fixed rate up to its burst size.
+    Not thread safe, the caller holds a lock.
+    """
+
+    def __init__(self, limit: LaneLimit) -> None:
+        self._rate = limit.rate
+        self._burst = limit.burst
+        self._tokens = limit.burst
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def try_take(self, now: float) -> bool:
+        """
+        Take a token if one is available.
+
+        Args:
+            now (float): The current monotonic time.
+
+        Returns:
+            bool: True if a token was taken.
+        """
+        self._refill(now)
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def wait_time(self, now: float) -> float:
+        """
+        Args:
+            now (float): The current monotonic time.
+
+        Returns:
+            float: Seconds until a token is available.
+        """
+        self._refill(now)
+        return max(0.0, (1 - self._tokens) / self._rate)
+
+
+class _Lane:
+    """
+    Messages of one class of traffic waiting for a token.
+    """
+
+    def __init__(self, limit: Optional[LaneLimit]) -> None:
+        self.bucket = TokenBucket(limit) if limit is not None else None
+        self.messages: deque[tuple[str, Any, float, bool]] = deque()
+        # When the bucket first refused the lane a token, None while
+        # the lane's messages are sent as they come.
+        self.held_since: Optional[float] = None
+        self.stats: dict[str, float] = {
+            "sent": 0,
+            "delayed": 0,
+            "dropped": 0,
+            "delay_total": 0.0,
+            "delay_max": 0.0,
+        }
+
+
+class RateLimitedOutput(OutputModule):
+    """
+    Sits in front of an output module and feeds it from three
+    priority lanes, control, error and measurement traffic, each
+    with its own token bucket. Transmit only enqueues, a dispatcher
+    thread always serves the highest priority lane that has a
+    message and a token, so an error storm is held to the error
+    lane's rate and can't starve control messages or measurements.
+    Messages that don't fit in a full lane are dropped or handed to
+    the output's fallback. All other calls go to the wrapped output.
+    """
+
+    def __init__(self, output: OutputModule, policy: RateLimitPolicy,
+                 name: str = "RateLimiter") -> None:
+        """
+        Args:
+            output (OutputModule): The output module to feed.
+            policy (RateLimitPolicy): The lane limits.
+            name (str): Name of the dispatcher thread.
+        """
+        super().__init__(error_holder=output._error_holder)
+        self._output = output
+        self._retain = accepts_retain(output)
+        self._policy = policy
+        self._name = name
+        self._lanes: dict[TopicClass, _Lane] = {
+            lane: _Lane(policy.lanes.get(lane)) for lane in LANE_PRIORITY
+        }
+        self._condition = threading.Condition()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._running = False
+
+    def transmit(self, topic: str, data: Any = None, retain: bool = False) -> bool:
+        """
+        Queue a message on the lane of its topic.
+
+        Args:
+            topic (str): The topic.
+            data (Any): The payload.
+            retain (bool): Passed on to the output when True, if
+                   its transmit takes it.
+
+        Returns:
+            bool: True if queued or handed to the fallback, False if dropped.
+        """
+        lane = self._lanes[classify_topic(topic)]
+        with self._condition:
+            if len(lane.messages) < self._policy.lane_size:
+                lane.messages.append((topic, data, time.monotonic(), retain))
+                self._ensure_dispatcher()
+                self._condition.notify()
+                return True
+            lane.stats["dropped"] += 1
+        if self._policy.overflow == "fallback":
+            return self._output.fallback(topic, data)
+        logger.warning(f"Rate limit lane for {topic} is full, message dropped.")
+        return False
+
+    def _ensure_dispatcher(self) -> None:
+        """
+        Start the dispatcher thread, called with the lock held.
+        A dispatcher still draining after a stop carries on instead.
+        """
+        self._running = True
+        if self._dispatcher is not None:
+            return
+        self._dispatcher = threading.Thread(
+            target=self._dispatch_loop, name=self._name, daemon=True
+        )
+        self._dispatcher.start()
+
+    def _next_message(
+        self,
+    ) -> Optional[tuple[_Lane, tuple[str, Any, float, bool], Optional[float]]]:
+        """
+        Wait for the highest priority message that may be sent,
+        called with the lock held.
+
+        Returns:
+            Optional[tuple[_Lane, tuple[str, Any, float, bool], Optional[float]]]:
+                The lane, the message and the seconds the limiter held
+                it back, None if it didn't, or None once stopped with
+                nothing left to send.
+        """
+        while True:
+            now = time.monotonic()
+            wait: Optional[float] = None
+            for lane in self._lanes.values():
+                if not lane.messages:
+                    continue
+                # Limits are lifted to drain the lanes when stopping.
+                if lane.bucket is None or not self._running or lane.bucket.try_take(now):
+                    message = lane.messages.popleft()
+                    held = None
+                    if lane.held_since is not None:
+                        # Refused a token, or queued behind a message that was.
+                        held = now - max(message[2], lane.held_since)
+                        if not lane.messages:
+                            lane.held_since = None
+                    return lane, message, held
+                if lane.held_since is None:
+                    lane.held_since = now
+                lane_wait = lane.bucket.wait_time(now)
+                wait = lane_wait if wait is None else min(wait, lane_wait)
+            if not self._running:
+                return None
+            self._condition.wait(wait)
+
+    def _dispatch_loop(self) -> None:
+        """
+        Dispatcher thread body.
+        """
+        while True:
+            with self._condition:
+                item = self._next_message()
+                if item is None:
+                    self._dispatcher = None
+                    self._condition.notify_all()
+                    return
+            lane, (topic, data, _, retain), held = item
+            try:
+                if retain and self._retain:
+                    # self._retain says transmit takes retain.
+                    transmit: Callable[..., bool] = self._output.transmit
+                    transmit(topic, data, retain=True)
+                else:
+                    self._output.transmit(topic, data)
+            except Exception as e:
+                logger.error(f"Rate limited transmit on {topic} failed: {e}")
+            with self._condition:
+                stats = lane.stats
+                stats["sent"] += 1
+                if held is not None:
+                    stats["delayed"] += 1
+                    stats["delay_total"] += held
+                    stats["delay_max"] = max(stats["delay_max"], held)
+                self._condition.notify_all()
+
+    def _stop_dispatcher(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        """
+        Send everything still queued, ignoring the limits, and stop
+        the dispatcher. It restarts on the next transmit.
+
+        Args:
+            timeout (float): Maximum seconds to wait.
+        """
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._condition.notify_all()
+            dispatcher = self._dispatcher
+        if dispatcher is not None and dispatcher is not threading.current_thread():
+            dispatcher.join(timeout)
+
+    def get_rate_limit_stats(self) -> dict[str, dict[str, float]]:
+        """
+        Report per lane on messages sent, delayed by the limiter or
+        dropped, the time messages were held (seconds) and the number
+        still queued.
+
+        Returns:
+            dict[str, dict[str, float]]: Counters per lane.
+        """
+        with self._condition:
+            stats: dict[str, dict[str, float]] = {}
+            for name, lane in self._lanes.items():
+                stats[name] = dict(lane.stats)
+                stats[name]["queued"] = len(lane.messages)
+            return stats
+
+    def get_output(self) -> OutputModule:
+        """
+        Returns:
+            OutputModule: The wrapped output module.
+        """
+        return self._output
+
+    def flush(self, topic: str) -> None:
+        """
+        Clear retained messages on a topic in the wrapped output.
+
+        Args:
+            topic (str): The topic to clear.
+        """
+        self._output.flush(topic)
+
+    def pop(self, key: Optional[str] = None) -> Any:
+        """
+        Retrieve and remove a message stored by the wrapped output.
+
+        Args:
+            key (Optional[str]): Specific key to pop from its buffer.
+
+        Returns:
+            Any: The message or None.
+        """
+        return self._output.pop(key)
+
+    def connect(self) -> None:
+        """
+        Connect the wrapped output.
+        """
+        self._output.connect()
+
+    def disconnect(self) -> None:
+        """
+        Stop the dispatcher, sending what is queued, then
+        disconnect the wrapped output.
+        """
+        self._stop_dispatcher()
+        self._output.disconnect()
+
+    def is_connected(self) -> bool:
+        """
+        Returns:
+            bool: Whether the wrapped output is connected.
+        """
+        return self._output.is_connected()
+
+    def subscribe(self, topic: str) -> Any:
+        """
+        Subscribe the wrapped output to a topic.
+
+        Args:
+            topic (str): The topic to subscribe to.
+
+        Returns:
+            Any: The result of the wrapped output's subscribe.
+        """
+        return self._output.subscribe(topic)
+
+    def fallback(self, topic: str, data: Any) -> bool:
+        """
+        Hand a message to the wrapped output's fallback.
+
+        Args:
+            topic (str): The topic.
+            data (Any): The payload.
+
+        Returns:
+            bool: True if the fallback stored the message.
+        """
+        return self._output.fallback(topic, data)
+
+    def set_fallback(self, fallback: OutputModule) -> None:
+        """
+        Set the fallback of the wrapped output.
+
+        Args:
+            fallback (OutputModule): The fallback module.
+        """
+        self._output.set_fallback(fallback)
+
+    def is_enabled(self) -> bool:
+        """
+        Returns:
+            bool: Whether the wrapped output is enabled.
+        """
+        return self._output.is_enabled()
+
+    def get_disabled_time(self) -> Optional[float]:
+        """
+        Returns:
+            Optional[float]: When the wrapped output was disabled, if it is.
+        """
+        return self._output.get_disabled_time()
+
+    def enable(self) -> bool:
+        """
+        Enable the wrapped output.
+
+        Returns:
+            bool: The result of the wrapped output's enable.
+        """
+        return self._output.enable()
+
+    def disable(self) -> bool:
+        """
+        Disable the wrapped output.
+
+        Returns:
+            bool: The result of the wrapped output's disable.
+        """
+        return self._output.disable()
+
+    def set_circuit_breaker(self, policy: Optional[CircuitBreakerPolicy]) -> None:
+        """
+        Put a circuit breaker in front of the wrapped output, or remove it.
+
+        Args:
+            policy (Optional[CircuitBreakerPolicy]): When to open and
+                   probe, None to remove the breaker.
+        """
+        self._output.set_circuit_breaker(policy)
+
+    def get_circuit_breaker_stats(self) -> Optional[dict[str, Any]]:
+        """
+        Returns:
+            Optional[dict[str, Any]]: The wrapped output's circuit
+                breaker metrics, None without a breaker.
+        """
+        return self._output.get_circuit_breaker_stats()
+
+    def set_replay_policy(self, policy: ReplayPolicy) -> None:
+        """
+        Set how the wrapped output replays buffered messages.
+
+        Args:
+            policy (ReplayPolicy): Batch size, window and checkpoint.
+        """
+        self._output.set_replay_policy(policy)
+
+    def replay_buffered(self) -> dict[str, Any]:
+        """
+        Have the wrapped output replay what it and its fallbacks
+        buffered. The replay bypasses the rate limits, as the
+        output's own fallback drain does.
+
+        Returns:
+            dict[str, Any]: The outcome, see BufferReplay.get_progress.
+        """
+        return self._output.replay_buffered()
+
+    def get_replay_progress(self) -> Optional[dict[str, Any]]:
+        """
+        Returns:
+            Optional[dict[str, Any]]: The progress of the wrapped
+                output's running or last replay, None before the first.
+        """
+        return self._output.get_replay_progress()
+
+    def pop_all_messages(self) -> Any:
+        """
+        Get every message held by the wrapped output and its fallbacks.
+
+        Returns:
+            Any: A generator of the stored messages.
+        """
+        return self._output.pop_all_messages()
@@ -0,0 +1,318 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from leaf.utility.logger.logger_utils import get_logger
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+
+class ConnectionState:
+    """
+    Connection state of a client that other threads can wait on,
+    along with how long the connection has been lost for.
+    """
+
+    def __init__(self) -> None:
+        self._connected = threading.Event()
+        self._disconnected = threading.Event()
+        self._disconnected.set()
+        self._lock = threading.Lock()
+        self._outage_started: Optional[float] = None
+        self._stats: dict[str, float] = {
+            "outages": 0,
+            "last_outage": 0.0,
+            "longest_outage": 0.0,
+            "total_outage": 0.0,
+        }
+
+    def set_connected(self) -> Optional[float]:
+        """
+        Record that the connection is up.
+
+        Returns:
+            Optional[float]: Seconds the connection was lost for, None
+                             if this ends no outage.
+        """
+        with self._lock:
+            outage = None
+            if self._outage_started is not None:
+                outage = time.monotonic() - self._outage_started
+                self._outage_started = None
+                self._stats["last_outage"] = outage
+                self._stats["longest_outage"] = max(self._stats["longest_outage"], outage)
+                self._stats["total_outage"] += outage
+            self._disconnected.clear()
+            self._connected.set()
+        return outage
+
+    def set_disconnected(self, outage: bool = True) -> None:
+        """
+        Record that the connection is down.
+
+        Args:
+            outage (bool): Whether the connection was lost, rather
+                           than closed on purpose.
+        """
+        with self._lock:
+            if outage and self._outage_started is None and self._connected.is_set():
+                self._outage_started = time.monotonic()
+                self._stats["outages"] += 1
+            self._connected.clear()
+            self._disconnected.set()
+
+    def is_connected(self) -> bool:
+        """
+        Returns:
+            bool: True if the connection is up.
+        """
+        return self._connected.is_set()
+
+    def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the connection is up.
+
+        Args:
+            timeout (Optional[float]): Maximum seconds to wait, None waits forever.
+
+        Returns:
+            bool: True if connected, False if the wait timed out.
+        """
+        return self._connected.wait(timeout)
+
+    def wait_disconnected(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the connection is down.
+
+        Args:
+            timeout (Optional[float]): Maximum seconds to wait, None waits forever.
+
+        Returns:
+            bool: True if disconnected, False if the wait timed out.
+        """
+        return self._disconnected.wait(timeout)
+
+    async def wait_connected_async(self, timeout: Optional[float] = None) -> bool:
+        """
+        Await the connection being up without blocking the event loop.
+
+        Args:
+            timeout (Optional[float]): Maximum seconds to wait, None waits forever.
+
+        Returns:
+            bool: True if connected, False if the wait timed out.
+        """
+        return await asyncio.to_thread(self._connected.wait, timeout)
+
+    def get_outage_stats(self) -> dict[str, Any]:
+        """
+        Report on connection outages.
+
+        Returns:
+            dict[str, Any]: Number of outages, the duration of the last,
+                            longest and all outages (seconds), and of the
+                            ongoing outage, 0 if connected.
+        """
+        with self._lock:
+            stats: dict[str, Any] = dict(self._stats)
+            current = 0.0
+            if self._outage_started is not None:
+                current = time.monotonic() - self._outage_started
+            stats["current_outage"] = current
+            stats["connected"] = self._connected.is_set()
+        return stats
+
+
+class ReconnectScheduler:
+    """
+    Reconnects a client from a timer thread so the client's network
+    thread is never blocked. Attempts back off exponentially and are
+    spread by a random jitter so many clients don't retry in step
+    against a recovering broker.
+    """
+
+    def __init__(
+        self,
+        reconnect: Callable[[], None],
+        on_give_up: Callable[[], None],
+        first_delay: float = 1.0,
+        multiplier: float = 2.0,
+        max_delay: float = 60.0,
+        max_attempts: Optional[int] = 12,
+        jitter: float = 0.5,
+        name: str = "Reconnect",
+    ) -> None:
+        """
+        Args:
+            reconnect (Callable[[], None]): Makes one reconnection attempt,
+                      raising an exception if it fails.
+            on_give_up (Callable[[], None]): Called once max_attempts have failed.
+            first_delay (float): Seconds before the first attempt.
+            multiplier (float): Growth of the delay after each failed attempt.
+            max_delay (float): Upper bound of the delay.
+            max_attempts (Optional[int]): Attempts before giving up, None never gives up.
+            jitter (float): Fraction of each delay that is randomised, between 0 and 1.
+            name (str): Name of the timer threads.
+        """
+        self._reconnect = reconnect
+        self._on_give_up = on_give_up
+        self._first_delay = first_delay
+        self._multiplier = multiplier
+        self._max_delay = max_delay
+        self._max_attempts = max_attempts
+        self._jitter = min(max(jitter, 0.0), 1.0)
+        self._name = name
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._timer: Optional[threading.Timer] = None
+        self._giving_up = False
+        self._attempts = 0
+        self._total_attempts = 0
+
+    def schedule(self) -> None:
+        """
+        Arm the next reconnection attempt. Called when the connection
+        is lost, and again when an attempt that reached the broker is
+        refused or times out, which counts towards max_attempts.
+        """
+        with self._lock:
+            if self._timer is not None or self._giving_up:
+                return
+            if self._idle.is_set():
+                self._idle.clear()
+                self._attempts = 0
+            elif self._max_attempts is not None and self._attempts >= self._max_attempts:
+                self._giving_up = True
+            if not self._giving_up:
+                self._start_timer()
+                return
+        logger.error(f"{self._name}: giving up after {self._attempts} attempts.")
+        try:
+            self._on_give_up()
+        finally:
+            # Only idle once the give up has been handled.
+            with self._lock:
+                self._giving_up = False
+                self._stop()
+
+    def connected(self) -> int:
+        """
+        Stop reconnecting, the connection is back.
+
+        Returns:
+            int: Number of attempts it took.
+        """
+        with self._lock:
+            attempts = self._attempts
+            self._stop()
+        return attempts
+
+    def cancel(self) -> None:
+        """
+        Stop reconnecting, for example when disconnecting on purpose.
+        """
+        with self._lock:
+            self._stop()
+
+    def is_reconnecting(self) -> bool:
+        """
+        Returns:
+            bool: True if a reconnection is pending.
+        """
+        return not self._idle.is_set()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until reconnecting has succeeded, been given up or cancelled.
+
+        Args:
+            timeout (Optional[float]): Maximum seconds to wait.
+
+        Returns:
+            bool: True if idle, False if the wait timed out.
+        """
+        return self._idle.wait(timeout)
+
+    def get_stats(self) -> dict[str, Any]:
+        """
+        Returns:
+            dict[str, Any]: Whether reconnecting, attempts of the current
+                            outage and attempts in total.
+        """
+        with self._lock:
+            return {
+                "reconnecting": not self._idle.is_set(),
+                "attempts": self._attempts,
+                "total_attempts": self._total_attempts,
+            }
+
+    def _delay(self) -> float:
+        """
+        Returns:
+            float: Seconds before the next attempt.
+        """
+        delay = min(self._first_delay * self._multiplier ** self._attempts,
+                    self._max_delay)
+        return delay * (1 - self._jitter * random.random())
+
+    def _start_timer(self) -> None:
+        """
+        Arm the timer for the next attempt, called with the lock held.
+        """
+        delay = self._delay()
+        logger.debug(f"{self._name}: attempt {self._attempts + 1} in {delay:.2f}s")
+        self._timer = threading.Timer(delay, self._attempt)
+        self._timer.name = self._name
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _stop(self) -> None:
+        """
+        Cancel any pending attempt, called with the lock held.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._idle.set()
+
+    def _attempt(self) -> None:
+        """
+        Timer body, makes one attempt and arms the next if it fails.
+        """
+        with self._lock:
+            if self._timer is not threading.current_thread():
+                return
+            self._timer = None
+            self._attempts += 1
+            self._total_attempts += 1
+            attempt = self._attempts
+        try:
+            self._reconnect()
+        except Exception as e:
+            logger.error(f"{self._name}: reconnect attempt {attempt} failed: {e}")
+            self.schedule()
+            return
+        # Success is reported by connected() once the broker accepts,
+        # a refusal or timeout ends in another call to schedule().
+        logger.info(f"{self._name}: reconnect attempt {attempt} sent.")
+
+
+def reconnect_paho_client(client: Any) -> None:
+    """
+    One reconnection attempt for a paho client created with
+    reconnect_on_failure=False, whose network thread stops when the
+    connection is lost. The old thread is joined and a new one started
+    once the socket is open again.
+
+    Args:
+        client (mqtt.Client): The paho client.
+
+    Raises:
+        OSError: If the broker can't be reached.
+    """
+    client.loop_stop()
+    client.reconnect()
+    client.loop_start()
@@ -0,0 +1,494 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional, TextIO, Union
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.utility.durability import FileSyncer
+from leaf.utility.durability import FsyncPolicy
+from leaf.utility.durability import build_fsync_policy
+from leaf.utility.logger.logger_utils import get_logger
+
+if TYPE_CHECKING:
+    from leaf.modules.output_modules.output_module import OutputModule
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+# Seconds between progress reports while replaying.
+PROGRESS_LOG_INTERVAL = 10.0
+
+
+class ReplayPolicy(NamedTuple):
+    """
+    How buffered messages are replayed once an output is back.
+
+    Messages are read in batches of batch_size and handed to the
+    output one topic at a time, at most max_in_flight of them read
+    but not yet sent. With a checkpoint file, the batches in flight
+    are recorded there, fsynced as set by fsync, so a replay that is
+    interrupted sends them again when the next one starts.
+    """
+    batch_size: int = 500
+    max_in_flight: int = 5000
+    checkpoint: Optional[str] = None
+    fsync: Union[str, dict[str, Any]] = "always"
+
+
+def build_replay_policy(config: Any) -> ReplayPolicy:
+    """
+    Build a replay policy from an OUTPUTS configuration block, such as::
+
+        replay:
+          batch_size: 1000
+          max_in_flight: 10000
+          checkpoint: /var/lib/leaf/replay.checkpoint
+
+    Args:
+        config (Any): The replay configuration.
+
+    Returns:
+        ReplayPolicy: The policy.
+
+    Raises:
+        AdapterBuildError: If an option is unknown or invalid.
+    """
+    if not isinstance(config, dict):
+        raise AdapterBuildError("replay must be a mapping of options.")
+    unknown = set(config) - set(ReplayPolicy._fields)
+    if unknown:
+        raise AdapterBuildError(f"Unknown replay options: {', '.join(sorted(unknown))}.")
+    policy = ReplayPolicy(**config)
+    for name in ("batch_size", "max_in_flight"):
+        value = getattr(policy, name)
+        if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+            raise AdapterBuildError(f"Replay {name} must be a positive integer.")
+    if policy.max_in_flight < policy.batch_size:
+        raise AdapterBuildError("Replay max_in_flight can't be below batch_size.")
+    if policy.checkpoint is not None and \
+            (not isinstance(policy.checkpoint, str) or not policy.checkpoint):
+        raise AdapterBuildError("Replay checkpoint must be a file path.")
+    build_fsync_policy(policy.fsync)
+    return policy
+
+
+class ReplayCheckpoint:
+    """
+    Log of the batches a replay has taken from the buffers but not
+    yet sent. A batch is written as a JSON line before it is sent
+    and acknowledged by a second line after, and the file is emptied
+    whenever nothing is left in flight. Batches logged without an
+    acknowledgement are those an interrupted replay had in hand.
+    """
+
+    def __init__(self, path: str, fsync: Union[FsyncPolicy, str, dict[str, Any]] = "always"
+                 ) -> None:
+        """
+        Args:
+            path (str): The checkpoint file.
+            fsync (Union[FsyncPolicy, str, dict[str, Any]]): When the
+                  logged batches are forced to disk.
+        """
+        self.path = path
+        if not isinstance(fsync, FsyncPolicy):
+            fsync = build_fsync_policy(fsync)
+        self._syncer = FileSyncer(fsync)
+        self._file: Optional[TextIO] = None
+        self._pending: set[int] = set()
+        # Batches are logged by the reader and acknowledged by the sender.
+        self._lock = threading.Lock()
+
+    def load(self) -> list[tuple[str, list[Any]]]:
+        """
+        Read the batches an earlier replay left unacknowledged. A
+        line cut short by a crash is ignored.
+
+        Returns:
+            list[tuple[str, list[Any]]]: Topic and messages of each batch,
+                                         in the order they were taken.
+
+        Raises:
+            OSError: If the file can't be read.
+        """
+        batches: dict[int, tuple[str, list[Any]]] = {}
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Ignoring a damaged line of replay checkpoint "
+                                   f"'{self.path}'.")
+                    continue
+                if "ack" in entry:
+                    batches.pop(entry["ack"], None)
+                else:
+                    batches[entry["batch"]] = (entry["topic"], entry["messages"])
+        return list(batches.values())
+
+    def add(self, batch_id: int, topic: str, messages: list[Any]) -> bool:
+        """
+        Log a batch before it is sent.
+
+        Args:
+            batch_id (int): Identifies the batch in its acknowledgement.
+            topic (str): The topic.
+            messages (list[Any]): The messages.
+
+        Returns:
+            bool: False if the messages can't be encoded as JSON, the
+                  batch is then sent without being logged.
+
+        Raises:
+            OSError: If the file can't be written.
+        """
+        try:
+            line = json.dumps({"batch": batch_id, "topic": topic, "messages": messages})
+        except (TypeError, ValueError):
+            logger.warning(f"Batch of {topic} can't be written to the replay checkpoint.")
+            return False
+        with self._lock:
+            f = self._open()
+            f.write(line + "\n")
+            f.flush()
+            self._syncer.written(f)
+            self._pending.add(batch_id)
+        return True
+
+    def ack(self, batch_id: int) -> None:
+        """
+        Acknowledge a batch once it was sent, emptying the file when
+        no other batch is in flight.
+
+        Args:
+            batch_id (int): The batch.
+
+        Raises:
+            OSError: If the file can't be written.
+        """
+        with self._lock:
+            if batch_id not in self._pending:
+                return
+            self._pending.discard(batch_id)
+            f = self._open()
+            if self._pending:
+                f.write(json.dumps({"ack": batch_id}) + "\n")
+                f.flush()
+            else:
+                f.seek(0)
+                f.truncate()
+                self._syncer.sync(f)
+
+    def clear(self) -> None:
+        """
+        Empty the file, once the batches it logged were sent again.
+
+        Raises:
+            OSError: If the file can't be written.
+        """
+        with self._lock:
+            self._pending.clear()
+            if self._file is None and not os.path.exists(self.path):
+                return
+            f = self._open()
+            f.seek(0)
+            f.truncate()
+            f.flush()
+
+    def close(self) -> None:
+        """
+        Close the file, what is still logged stays for the next replay.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._syncer.sync(self._file)
+                self._file.close()
+                self._file = None
+
+    def _open(self) -> TextIO:
+        """
+        Returns:
+            TextIO: The file, opened for appending.
+        """
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "a")
+        return self._file
+
+
+class BufferReplay:
+    """
+    Sends the messages buffered by an output and its fallbacks back
+    through the output once it is reachable again.
+
+    A reader thread streams pop_all_messages, gathers batch_size
+    messages at a time and splits them into one batch per topic,
+    keeping the order of each topic. The calling thread hands each
+    batch to the output's transmit_many. The reader stops whenever
+    max_in_flight messages are read but not sent, so a slow output
+    holds back reading instead of filling memory.
+
+    Buffers remove what they hand out, so with a checkpoint file the
+    batches in flight are recorded there and an interrupted replay
+    sends them again first, at the cost of sending some twice. The
+    replay stops reading once the output is disabled, what is in
+    flight then goes to the output's fallback.
+    """
+
+    def __init__(self, output: "OutputModule", policy: ReplayPolicy = ReplayPolicy(),
+                 name: Optional[str] = None) -> None:
+        """
+        Args:
+            output (OutputModule): The output to replay through.
+            policy (ReplayPolicy): Batch size, window and checkpoint.
+            name (Optional[str]): Name for the logs and the reader thread.
+        """
+        self._output = output
+        self._policy = policy
+        self._name = name or f"Replay-{output.__class__.__name__}"
+        self._checkpoint = (ReplayCheckpoint(policy.checkpoint, policy.fsync)
+                            if policy.checkpoint else None)
+        self._condition = threading.Condition()
+        self._window: deque[tuple[int, str, list[Any]]] = deque()
+        self._in_flight = 0
+        self._reading = False
+        self._stopped = False
+        self._next_batch = 0
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._logged_at = 0.0
+        self._stats: dict[str, int] = {
+            "replayed": 0,
+            "failed": 0,
+            "fallback": 0,
+            "batches": 0,
+            "resumed": 0,
+            "max_in_flight": 0,
+        }
+
+    def run(self) -> dict[str, Any]:
+        """
+        Replay the batches left by an interrupted replay, then every
+        buffered message, returning when all were handed to the output.
+
+        Returns:
+            dict[str, Any]: The final progress, see get_progress.
+        """
+        with self._condition:
+            self._started_at = time.monotonic()
+            self._finished_at = None
+            self._logged_at = self._started_at
+            self._reading = True
+            self._stopped = False
+        self._resume()
+        reader = threading.Thread(target=self._read_loop, name=self._name, daemon=True)
+        reader.start()
+        try:
+            while True:
+                with self._condition:
+                    while not self._window and self._reading:
+                        self._condition.wait()
+                    if not self._window:
+                        break
+                    batch_id, topic, messages = self._window.popleft()
+                self._send(topic, messages)
+                self._ack(batch_id)
+                with self._condition:
+                    self._in_flight -= len(messages)
+                    self._condition.notify_all()
+                self._log_progress()
+        finally:
+            self.stop()
+            reader.join()
+            if self._checkpoint is not None:
+                self._checkpoint.close()
+            with self._condition:
+                self._finished_at = time.monotonic()
+        progress = self.get_progress()
+        logger.info(f"{self._name} replayed {progress['replayed']} messages in "
+                    f"{progress['elapsed']:.1f}s ({progress['rate']:.0f} msg/s), "
+                    f"{progress['failed']} failed, {progress['fallback']} "
+                    f"returned to the fallback.")
+        return progress
+
+    def stop(self) -> None:
+        """
+        Stop reading from the buffers, the batches already read are
+        still sent by run.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def get_progress(self) -> dict[str, Any]:
+        """
+        Report the messages replayed, failed (the output's
+        transmit_many returned False or raised) and handed back to the
+        fallback once the output was disabled, the batches sent, the
+        messages sent again from the checkpoint, those in flight now
+        and at most, the seconds spent and the achieved rate.
+
+        Returns:
+            dict[str, Any]: The metrics.
+        """
+        with self._condition:
+            if self._started_at is None:
+                elapsed = 0.0
+            else:
+                elapsed = (self._finished_at or time.monotonic()) - self._started_at
+            progress: dict[str, Any] = dict(self._stats)
+            progress.update({
+                "in_flight": self._in_flight,
+                "running": self._started_at is not None and self._finished_at is None,
+                "elapsed": elapsed,
+                "rate": self._stats["replayed"] / elapsed if elapsed > 0 else 0.0,
+            })
+            return progress
+
+    def _resume(self) -> None:
+        """
+        Send the batches an interrupted replay left in the checkpoint.
+        """
+        if self._checkpoint is None:
+            return
+        try:
+            batches = self._checkpoint.load()
+        except OSError as e:
+            logger.error(f"Can't read replay checkpoint '{self._checkpoint.path}': {e}")
+            return
+        if batches:
+            logger.info(f"{self._name} resuming {len(batches)} batches from "
+                        f"'{self._checkpoint.path}'.")
+        for topic, messages in batches:
+            self._send(topic, messages)
+            with self._condition:
+                self._stats["resumed"] += len(messages)
+        try:
+            self._checkpoint.clear()
+        except OSError as e:
+            logger.error(f"Can't clear replay checkpoint '{self._checkpoint.path}': {e}")
+
+    def _read_loop(self) -> None:
+        """
+        Reader thread body, streams the buffers into the window.
+        """
+        messages = iter(self._output.pop_all_messages())
+        pending: dict[str, list[Any]] = {}
+        count = 0
+        try:
+            for topic, message in messages:
+                pending.setdefault(topic, []).append(message)
+                count += 1
+                if count >= self._policy.batch_size:
+                    if not self._put_all(pending):
+                        return
+                    pending = {}
+                    count = 0
+            self._put_all(pending)
+        except Exception as e:
+            logger.error(f"{self._name} failed reading buffered messages: {e}")
+            self._put_all(pending)
+        finally:
+            # Lets a buffer drained in chunks keep the chunk not yet handed out.
+            close = getattr(messages, "close", None)
+            if close is not None:
+                close()
+            with self._condition:
+                self._reading = False
+                self._condition.notify_all()
+
+    def _put_all(self, pending: dict[str, list[Any]]) -> bool:
+        """
+        Queue the batch of each topic, waiting for room in the window.
+
+        Args:
+            pending (dict[str, list[Any]]): Messages read, per topic.
+
+        Returns:
+            bool: False if the replay was stopped, the batches are
+                  queued regardless as they were already taken.
+        """
+        policy = self._policy
+        for topic, batch in pending.items():
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopped or not self._in_flight or
+                    self._in_flight + len(batch) <= policy.max_in_flight
+                )
+                batch_id = self._next_batch
+                self._next_batch += 1
+            if self._checkpoint is not None:
+                try:
+                    self._checkpoint.add(batch_id, topic, batch)
+                except OSError as e:
+                    logger.error(f"Can't write replay checkpoint "
+                                 f"'{self._checkpoint.path}': {e}")
+            with self._condition:
+                self._window.append((batch_id, topic, batch))
+                self._in_flight += len(batch)
+                self._stats["max_in_flight"] = max(self._stats["max_in_flight"],
+                                                   self._in_flight)
+                self._condition.notify_all()
+        with self._condition:
+            return not self._stopped
+
+    def _send(self, topic: str, messages: list[Any]) -> None:
+        """
+        Hand a batch to the output, or to its fallback once it is
+        disabled, stopping the reader in that case.
+
+        Args:
+            topic (str): The topic.
+            messages (list[Any]): The messages.
+        """
+        output = self._output
+        batch = [(topic, message) for message in messages]
+        outcome = "replayed"
+        try:
+            if output.is_enabled():
+                result = output.transmit_many(batch)
+            else:
+                result = output.fallback_many(batch)
+                outcome = "fallback"
+                self.stop()
+            if result is False:
+                outcome = "failed"
+        except Exception as e:
+            logger.error(f"{self._name} failed sending {len(batch)} messages "
+                         f"on {topic}: {e}")
+            outcome = "failed"
+        with self._condition:
+            self._stats["batches"] += 1
+            self._stats[outcome] += len(batch)
+        if not output.is_enabled():
+            self.stop()
+
+    def _ack(self, batch_id: int) -> None:
+        """
+        Acknowledge a sent batch in the checkpoint.
+
+        Args:
+            batch_id (int): The batch.
+        """
+        if self._checkpoint is None:
+            return
+        try:
+            self._checkpoint.ack(batch_id)
+        except OSError as e:
+            logger.error(f"Can't write replay checkpoint '{self._checkpoint.path}': {e}")
+
+    def _log_progress(self) -> None:
+        """
+        Report the progress every PROGRESS_LOG_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        if now - self._logged_at < PROGRESS_LOG_INTERVAL:
+            return
+        self._logged_at = now
+        progress = self.get_progress()
+        logger.info(f"{self._name} replayed {progress['replayed']} messages "
+                    f"({progress['rate']:.0f} msg/s), {progress['in_flight']} in flight.")
@@ -0,0 +1,102 @@
+from typing import Any, NamedTuple, Optional
+
+from leaf.error_handler.exceptions import AdapterBuildError
+
+EVICTION_POLICIES = ("drop_oldest", "downsample", "spill")
+DEFAULT_CHECK_INTERVAL = 5
+
+
+class RetentionLimits(NamedTuple):
+    """
+    Caps on buffered messages, None for no cap. max_age is in seconds.
+    """
+    max_count: Optional[int] = None
+    max_bytes: Optional[int] = None
+    max_age: Optional[float] = None
+
+
+class RetentionPolicy(NamedTuple):
+    """
+    Caps per topic and over all topics, and how messages over a cap
+    are evicted, oldest first:
+
+    - drop_oldest: the messages are deleted.
+    - downsample: measurements are thinned out, keeping every other
+      one of the oldest messages, other topics are dropped oldest first.
+    - spill: the messages are moved to the fallback, such as FILE.
+    """
+    topic: RetentionLimits
+    total: RetentionLimits
+    policy: str = "drop_oldest"
+    check_interval: float = DEFAULT_CHECK_INTERVAL
+
+
+def build_retention_policy(config: dict[str, Any]) -> RetentionPolicy:
+    """
+    Build a retention policy from an OUTPUTS configuration block,
+    for example::
+
+        retention:
+          topic:
+            max_count: 100000
+            max_age: 86400
+          total:
+            max_bytes: 536870912
+          policy: spill
+          check_interval: 10
+
+    Args:
+        config (dict[str, Any]): The retention configuration.
+
+    Returns:
+        RetentionPolicy: The policy.
+
+    Raises:
+        AdapterBuildError: If an option is unknown or invalid.
+    """
+    if not isinstance(config, dict):
+        raise AdapterBuildError("Retention must be a mapping of options.")
+    config = dict(config)
+    topic = _build_limits("topic", config.pop("topic", None) or {})
+    total = _build_limits("total", config.pop("total", None) or {})
+    if total.max_age is not None:
+        raise AdapterBuildError("Retention max_age is set per topic.")
+    policy = config.pop("policy", "drop_oldest")
+    if policy not in EVICTION_POLICIES:
+        raise AdapterBuildError(
+            f"Unknown eviction policy '{policy}', expected one of "
+            f"{', '.join(EVICTION_POLICIES)}."
+        )
+    check_interval = config.pop("check_interval", DEFAULT_CHECK_INTERVAL)
+    if not isinstance(check_interval, (int, float)) or check_interval <= 0:
+        raise AdapterBuildError("Retention check_interval must be a positive number.")
+    if config:
+        raise AdapterBuildError(f"Unknown retention options: {', '.join(sorted(config))}.")
+    if topic == RetentionLimits() and total == RetentionLimits():
+        raise AdapterBuildError("Retention needs at least one topic or total cap.")
+    return RetentionPolicy(topic, total, policy, float(check_interval))
+
+
+def _build_limits(scope: str, options: Any) -> RetentionLimits:
+    """
+    Build the caps of one scope.
+
+    Args:
+        scope (str): "topic" or "total".
+        options (Any): The caps.
+
+    Returns:
+        RetentionLimits: The caps.
+    """
+    if not isinstance(options, dict):
+        raise AdapterBuildError(f"Retention {scope} must be a mapping of caps.")
+    unknown = set(options) - set(RetentionLimits._fields)
+    if unknown:
+        raise AdapterBuildError(
+            f"Unknown retention {scope} caps: {', '.join(sorted(unknown))}."
+        )
+    for name, value in options.items():
+        valid = isinstance(value, (int, float)) if name == "max_age" else isinstance(value, int)
+        if not valid or isinstance(value, bool) or value <= 0:
+            raise AdapterBuildError(f"Retention {scope} {name} must be a positive number.")
+    return RetentionLimits(**options)
@@ -11,6 +11,10 @@ from leaf.modules.output_modules.output_module import OutputModule
 from leaf.error_handler.exceptions import AdapterBuildError
 from leaf.error_handler.error_holder import ErrorHolder
 from leaf.adapters.equipment_adapter import EquipmentAdapter
+from leaf.utility.rate_limiter import RateLimitedOutput
+from leaf.utility.rate_limiter import build_rate_limit_policy
+from leaf.utility.circuit_breaker import build_circuit_breaker_policy
+from leaf.utility.replay import build_replay_policy
 from leaf.registry.registry import (
     get_equipment_adapter,
     get_output_adapter,
@@ -42,9 +46,12 @@ def handle_disabled_modules(output: OutputModule, timeout: float) -> None:
 
 
 def output_messages(output_module: OutputModule) -> None:
-    """Transmits all buffered messages after reconnecting output module."""
-    for topic, message in output_module.pop_all_messages():
-        output_module.transmit(topic, message)
+    """Replays all buffered messages after reconnecting output module.
+
+    Outputs that drain their fallback themselves, such as MQTT, hand
+    the replay to their drainer so only one replay reads the fallback.
+    """
+    output_module.replay_buffered()
 
 
 def get_existing_ids(output_module: OutputModule, 
@@ -72,27 +79,47 @@ def build_output_module(config: dict[str, Any],
     outputs = config["OUTPUTS"]
     output_objects = {}
     fallback_codes = set()
+    # Outputs fed by a fan-out output, such as TEE, are built first.
+    child_codes = set()
 
     for out_data in outputs:
         output_code = out_data.pop("plugin")
         fallback_code = out_data.pop("fallback", None)
         if fallback_code:
             fallback_codes.add(fallback_code)
+        breaker_config = out_data.pop("circuit_breaker", None)
+        replay_config = out_data.pop("replay", None)
+        for child in out_data.get("outputs") or []:
+            child_codes.add(child.get("plugin") if isinstance(child, dict) else child)
         output_objects[output_code] = {
             "data": out_data,
             "fallback_code": fallback_code,
+            "circuit_breaker": (build_circuit_breaker_policy(breaker_config)
+                                if breaker_config else None),
+            "replay": (build_replay_policy(replay_config)
+                       if replay_config is not None else None),
             "output": None
         }
 
-    for code, out_data in output_objects.items():
+    build_order = sorted(output_objects, key=lambda c: "outputs" in output_objects[c]["data"])
+    for code in build_order:
+        out_data = output_objects[code]["data"]
+        if "outputs" in out_data:
+            out_data = dict(out_data)
+            out_data["outputs"] = _resolve_child_outputs(out_data["outputs"], output_objects)
         try:
             adapter_cls = get_output_adapter(code)
             output_objects[code]["output"] = adapter_cls(
                 fallback=None, error_holder=error_holder, 
-                **out_data["data"]
+                **out_data
             )
         except TypeError as ex:
             raise AdapterBuildError(f"Code '{code}' missing parameters ({ex.args})")
+        if output_objects[code]["circuit_breaker"] is not None:
+            output_objects[code]["output"].set_circuit_breaker(
+                output_objects[code]["circuit_breaker"])
+        if output_objects[code]["replay"] is not None:
+            output_objects[code]["output"].set_replay_policy(output_objects[code]["replay"])
 
     for code, out_data in output_objects.items():
         if out_data["fallback_code"]:
@@ -102,18 +129,35 @@ def build_output_module(config: dict[str, Any],
             output_objects[code]["output"].set_fallback(output_objects[fallback_code]["output"])
 
     for code in sorted(output_objects):
-        if code not in fallback_codes:
+        if code not in fallback_codes and code not in child_codes:
             return output_objects[code]["output"]
 
     return None
 
 
+def _resolve_child_outputs(children: Any,
+                           output_objects: dict[str, Any]) -> list[Any]:
+    """Replaces the output codes a fan-out output feeds with the built outputs."""
+    if not isinstance(children, list):
+        raise AdapterBuildError("outputs must be a list of output codes.")
+    resolved = []
+    for child in children:
+        options = dict(child) if isinstance(child, dict) else {"plugin": child}
+        child_code = options.pop("plugin", None)
+        child_object = output_objects.get(child_code)
+        if child_object is None or child_object["output"] is None:
+            raise AdapterBuildError(f"Can't find output: {child_code}")
+        resolved.append({"output": child_object["output"], **options})
+    return resolved
+
+
 def process_instance(instance: dict[str, Any], 
                      output: OutputModule) -> EquipmentAdapter:
     """Initializes and validates an equipment adapter from config data."""
     equipment_code = instance.pop("adapter")
     instance_data = instance.pop("data")
     requirements = instance.pop("requirements")
+    rate_limit = instance.pop("rate_limit", None)
 
     if "external_input" in instance:
         ei_data = instance.pop("external_input")
@@ -133,6 +177,11 @@ def process_instance(instance: dict[str, Any],
     if instance_id in get_existing_ids(output):
         logger.warning(f"ID '{instance_id}' is already registered. Adapter may overwrite existing state.")
 
+    if rate_limit is not None:
+        # Each instance gets its own lanes in front of the shared output.
+        output = RateLimitedOutput(output, build_rate_limit_policy(rate_limit),
+                                   name=f"RateLimiter-{instance_id}")
+
     adapter_params = inspect.signature(adapter_cls).parameters
     adapter_param_names = set(adapter_params.keys())
     fixed_params = {"instance_data", "output", "error_holder"}
@@ -0,0 +1,217 @@
+import json
+from abc import ABC
+from abc import abstractmethod
+from typing import Any, Optional, Union
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.utility.logger.logger_utils import get_logger
+
+logger = get_logger(__name__, log_file="output_module.log")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment, unused-ignore]
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None  # type: ignore[assignment, unused-ignore]
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None  # type: ignore[assignment, unused-ignore]
+
+ENCODING_PROPERTY = "leaf-encoding"
+
+
+class Serializer(ABC):
+    """
+    Converts message payloads to and from their wire format.
+    Output modules share serializers so the encoding of a
+    payload can be selected in the configuration.
+    """
+
+    name: str = ""
+    content_type: str = ""
+    binary: bool = False
+
+    @abstractmethod
+    def dumps(self, data: Any, pretty: bool = False) -> Union[str, bytes]:
+        """
+        Encode an object.
+
+        Args:
+            data (Any): The object to encode.
+            pretty (bool): Indent the output, only used by text formats.
+
+        Returns:
+            Union[str, bytes]: The encoded payload, str for text formats.
+        """
+
+    @abstractmethod
+    def loads(self, payload: Union[str, bytes]) -> Any:
+        """
+        Decode a payload.
+
+        Args:
+            payload (Union[str, bytes]): The encoded payload.
+
+        Returns:
+            Any: The decoded object.
+        """
+
+    def encode(self, data: Any) -> Union[str, bytes]:
+        """
+        Encode a message payload. JSON strings are passed through
+        untouched by text formats and converted to objects before
+        encoding by binary formats, other strings are encoded as
+        string values.
+
+        Args:
+            data (Any): The message payload.
+
+        Returns:
+            Union[str, bytes]: The encoded payload.
+        """
+        if isinstance(data, (bytes, bytearray)):
+            return bytes(data)
+        if isinstance(data, str):
+            if not self.binary:
+                return data
+            try:
+                data = json.loads(data)
+            except json.JSONDecodeError:
+                pass
+        return self.dumps(data)
+
+
+class JSONSerializer(Serializer):
+    """
+    JSON using the standard library.
+    """
+
+    name = "json"
+    content_type = "application/json"
+
+    def dumps(self, data: Any, pretty: bool = False) -> str:
+        return json.dumps(data, indent=4 if pretty else None)
+
+    def loads(self, payload: Union[str, bytes]) -> Any:
+        return json.loads(payload)
+
+
+class FastJSONSerializer(JSONSerializer):
+    """
+    JSON using orjson, falls back to the standard library
+    when orjson isn't installed. Payloads are compact so they
+    differ byte-for-byte from the stdlib output.
+    """
+
+    name = "fastjson"
+
+    def __init__(self) -> None:
+        if orjson is None:
+            logger.warning("orjson is not installed, fastjson serializer "
+                           "is using the standard json library.")
+
+    def dumps(self, data: Any, pretty: bool = False) -> str:
+        if orjson is None:
+            return super().dumps(data, pretty)
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option).decode("utf-8")
+
+    def loads(self, payload: Union[str, bytes]) -> Any:
+        if orjson is None:
+            return super().loads(payload)
+        return orjson.loads(payload)
+
+
+class MsgpackSerializer(Serializer):
+    """
+    MessagePack, requires the msgpack package.
+    """
+
+    name = "msgpack"
+    content_type = "application/msgpack"
+    binary = True
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise AdapterBuildError("The msgpack serializer requires the msgpack package.")
+
+    def dumps(self, data: Any, pretty: bool = False) -> bytes:
+        packed: bytes = msgpack.packb(data)
+        return packed
+
+    def loads(self, payload: Union[str, bytes]) -> Any:
+        return msgpack.unpackb(payload)
+
+
+class CBORSerializer(Serializer):
+    """
+    CBOR (RFC 8949), requires the cbor2 package.
+    """
+
+    name = "cbor"
+    content_type = "application/cbor"
+    binary = True
+
+    def __init__(self) -> None:
+        if cbor2 is None:
+            raise AdapterBuildError("The cbor serializer requires the cbor2 package.")
+
+    def dumps(self, data: Any, pretty: bool = False) -> bytes:
+        return cbor2.dumps(data)
+
+    def loads(self, payload: Union[str, bytes]) -> Any:
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        return cbor2.loads(payload)
+
+
+SERIALIZERS: dict[str, type[Serializer]] = {
+    serializer.name: serializer
+    for serializer in (JSONSerializer, FastJSONSerializer,
+                       MsgpackSerializer, CBORSerializer)
+}
+
+
+def get_serializer(name: str) -> Serializer:
+    """
+    Create the serializer registered under a name.
+
+    Args:
+        name (str): The serializer name, one of SERIALIZERS.
+
+    Returns:
+        Serializer: The serializer.
+
+    Raises:
+        AdapterBuildError: If the name is unknown or its library is missing.
+    """
+    if name not in SERIALIZERS:
+        raise AdapterBuildError(
+            f"Unknown serializer '{name}', expected one of {', '.join(SERIALIZERS)}."
+        )
+    return SERIALIZERS[name]()
+
+
+def serializer_from_properties(properties: Optional[Any]) -> Serializer:
+    """
+    Find the serializer of a received MQTT v5 message from its
+    user properties, messages without one are treated as JSON.
+
+    Args:
+        properties (Optional[Any]): The message properties (MQTTMessage.properties).
+
+    Returns:
+        Serializer: The serializer to decode the payload with.
+    """
+    for key, value in getattr(properties, "UserProperty", None) or []:
+        if key == ENCODING_PROPERTY and value in SERIALIZERS:
+            return get_serializer(value)
+    return JSONSerializer()
@@ -0,0 +1,28 @@
+from typing import Literal
+
+TopicClass = Literal["control", "error", "measurement"]
+
+TOPIC_CLASSES: tuple[TopicClass, ...] = ("control", "error", "measurement")
+
+
+def classify_topic(topic: str) -> TopicClass:
+    """
+    Sort a LEAF topic into the class of traffic it carries.
+
+    Measurement topics contain a ``measurement`` level
+    (``.../experiment/<id>/measurement/<name>``), error topics end
+    with ``error`` and everything else (details, running, start,
+    stop) is treated as control traffic.
+
+    Args:
+        topic (str): The topic to classify.
+
+    Returns:
+        TopicClass: One of "control", "error" or "measurement".
+    """
+    parts = topic.split("/")
+    if "measurement" in parts[:-1]:
+        return "measurement"
+    if parts[-1] == "error":
+        return "error"
+    return "control"
@@ -0,0 +1,62 @@
+"""
+Buffered write throughput of the FILE output module in document
+and journal storage under each fsync policy, and the time taken to
+drain the buffer again. Files are written to a temporary directory,
+pass another directory to measure a specific disk.
+
+    python -m tests.benchmarks.bench_file [messages] [directory]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any
+
+from leaf.modules.output_modules.file import FILE
+
+topic = "bench/adapter/instance/experiment/bench/measurement/od"
+payload = {"measurement": "od", "tags": {"well": "A01"},
+           "fields": {"value": 0.0394}, "timestamp": 1700000000}
+
+
+def run(directory: str, messages: int, storage: str,
+        fsync: Any) -> tuple[float, float]:
+    path = tempfile.mkdtemp(dir=directory)
+    try:
+        filename = path if storage == "journal" else os.path.join(path, "buffer.json")
+        module = FILE(filename, storage=storage, fsync=fsync)
+        start = time.perf_counter()
+        for _ in range(messages):
+            module.transmit(topic, payload)
+        module.disconnect()
+        write_rate = messages / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        drained = sum(1 for _ in module.pop_all_messages())
+        drain_rate = drained / (time.perf_counter() - start)
+        module.disconnect()
+        return write_rate, drain_rate
+    finally:
+        shutil.rmtree(path)
+
+
+def main() -> None:
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    directory = sys.argv[2] if len(sys.argv) > 2 else None
+
+    print(f"{'mode':<28}{'messages':>10}{'write msg/s':>14}{'drain msg/s':>14}")
+    for name, storage, fsync, count in (
+            # Every document write rewrites the whole buffer.
+            ("document, never", "document", "never", min(messages, 2000)),
+            ("document, always", "document", "always", min(messages, 500)),
+            ("journal, never", "journal", "never", messages),
+            ("journal, interval 1s", "journal", {"mode": "interval", "interval": 1}, messages),
+            ("journal, every 100", "journal", {"mode": "every", "records": 100}, messages),
+            ("journal, always", "journal", "always", min(messages, 2000))):
+        write_rate, drain_rate = run(directory, count, storage, fsync)
+        print(f"{name:<28}{count:>10}{write_rate:>14.0f}{drain_rate:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
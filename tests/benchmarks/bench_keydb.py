@@ -0,0 +1,68 @@
+"""
+Buffered write throughput of the KEYDB output module with one
+RPUSH per message against pipelined batches and the AsyncKEYDB
+writer task, and the time taken to drain the buffer again. Requires the KeyDB server from
+tests/static_files/test_config_keydb.yaml to be running, the
+benchmark database is flushed.
+
+    python -m tests.benchmarks.bench_keydb [messages]
+"""
+import os
+import sys
+import time
+from typing import Any, Optional
+
+import yaml
+
+from leaf.modules.output_modules.async_keydb import AsyncKEYDB
+from leaf.modules.output_modules.keydb import KEYDB
+
+curr_dir = os.path.dirname(os.path.realpath(__file__))
+topic = "bench/adapter/instance/experiment/bench/measurement/od"
+payload = {"measurement": "od", "tags": {"well": "A01"},
+           "fields": {"value": 0.0394}, "timestamp": 1700000000}
+
+
+def run(config: dict, messages: int,
+        batch: Optional[dict[str, Any]] = None,
+        use_async: bool = False) -> tuple[float, float]:
+    KEYDB(config["host"], int(config["port"]), db=int(config["db"]))._client.flushdb()
+    if use_async:
+        module = AsyncKEYDB(config["host"], int(config["port"]), db=int(config["db"]),
+                            queue_size=messages)
+    else:
+        module = KEYDB(config["host"], int(config["port"]), db=int(config["db"]),
+                       batch=batch)
+    start = time.perf_counter()
+    for _ in range(messages):
+        module.transmit(topic, payload)
+    if use_async:
+        module.flush_writes(timeout=None)
+    else:
+        module.flush_batch()
+    write_rate = messages / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    drained = sum(1 for _ in module.pop_all_messages())
+    drain_rate = drained / (time.perf_counter() - start)
+    module.disconnect()
+    return write_rate, drain_rate
+
+
+def main() -> None:
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with open(os.path.join(curr_dir, "..", "static_files",
+                           "test_config_keydb.yaml")) as f:
+        config = yaml.safe_load(f)["OUTPUTS"][0]
+
+    print(f"{'mode':<24}{'write msg/s':>14}{'drain msg/s':>14}")
+    for name, batch, use_async in (("rpush per message", None, False),
+                                   ("batch 100", {"max_count": 100}, False),
+                                   ("batch 1000", {"max_count": 1000}, False),
+                                   ("async writer", None, True)):
+        write_rate, drain_rate = run(config, messages, batch, use_async)
+        print(f"{name:<24}{write_rate:>14.0f}{drain_rate:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Publish throughput of the MQTT output module with QoS 0 against
+QoS 1 with different in-flight windows. Requires the broker from
+tests/test_config.yaml to be running.
+
+    python -m tests.benchmarks.bench_mqtt_qos [messages]
+"""
+import os
+import sys
+import time
+
+import yaml
+
+from leaf.modules.output_modules.mqtt import MQTT
+
+curr_dir = os.path.dirname(os.path.realpath(__file__))
+topic = "bench/adapter/instance/experiment/bench/measurement/od"
+payload = {"measurement": "od", "tags": {"well": "A01"},
+           "fields": {"value": 0.0394}, "timestamp": 1700000000}
+
+
+def run(config: dict, messages: int, qos: int, max_inflight: int = 20) -> float:
+    module = MQTT(config["broker"], int(config["port"]),
+                  username=config.get("username"),
+                  password=config.get("password"),
+                  qos={"measurement": qos}, max_inflight=max_inflight)
+    time.sleep(1)
+    start = time.perf_counter()
+    for _ in range(messages):
+        module.transmit(topic, payload)
+    if qos > 0:
+        while module.get_inflight_stats()["inflight"] > 0:
+            time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    module.disconnect()
+    return messages / elapsed
+
+
+def main() -> None:
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with open(os.path.join(curr_dir, "..", "test_config.yaml")) as f:
+        config = yaml.safe_load(f)["OUTPUTS"][0]
+
+    print(f"{'mode':<24}{'msg/s':>12}")
+    print(f"{'qos=0':<24}{run(config, messages, 0):>12.0f}")
+    for window in (1, 10, 100):
+        rate = run(config, messages, 1, max_inflight=window)
+        print(f"{f'qos=1 inflight={window}':<24}{rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Bytes on the wire for PUBLISH packets sent by the MQTT output
+module with MQTT v3.1.1, v5 without topic aliases and v5 with
+topic aliases. Packets are sized from what the module hands to
+the client, so no broker is needed.
+
+    python -m tests.benchmarks.bench_mqtt_v5 [messages]
+"""
+import sys
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from leaf.modules.output_modules.mqtt import MQTT
+
+topics = [
+    f"wur_systems_biology/biolector/biolector_1/experiment/exp_2024_06_0{i}"
+    f"/measurement/{name}"
+    for i, name in enumerate(("biomass", "ph", "do", "temperature"))
+]
+payload = {"measurement": "biolector", "tags": {"well": "A01", "filter": "biomass"},
+           "fields": {"value": 0.03937}, "timestamp": 1700000000}
+
+
+def varint_size(value: int) -> int:
+    size = 1
+    while value > 127:
+        value //= 128
+        size += 1
+    return size
+
+
+def packet_size(call, protocol: int) -> int:
+    kwargs = call.kwargs
+    body = 2 + len(kwargs["topic"].encode("utf-8")) + len(kwargs["payload"])
+    if kwargs["qos"] > 0:
+        body += 2
+    if protocol == mqtt.MQTTv5:
+        properties = kwargs["properties"]
+        # pack() includes the property length prefix
+        body += len(properties.pack()) if properties is not None else 1
+    return 1 + varint_size(body) + body
+
+
+def run(messages: int, protocol: str, topic_alias_maximum: int = 0) -> float:
+    client = MagicMock()
+    client.is_connected.return_value = True
+    client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=1)
+    with patch("paho.mqtt.client.Client", return_value=client):
+        module = MQTT("localhost", protocol=protocol,
+                      topic_alias_maximum=topic_alias_maximum)
+    if protocol == "v5":
+        connack = Properties(PacketTypes.CONNACK)
+        connack.TopicAliasMaximum = 10
+        module.on_connect(client, None, None, 0, connack)
+    for i in range(messages):
+        module.transmit(topics[i % len(topics)], payload)
+    total = sum(packet_size(c, module.protocol) for c in client.publish.call_args_list)
+    return total / messages
+
+
+def main() -> None:
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print(f"topic length {len(topics[0])}, payload {len(str(payload))} chars")
+    print(f"{'mode':<24}{'bytes/msg':>12}")
+    print(f"{'v3':<24}{run(messages, 'v3'):>12.1f}")
+    print(f"{'v5 no aliases':<24}{run(messages, 'v5'):>12.1f}")
+    print(f"{'v5 topic aliases':<24}{run(messages, 'v5', 10):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Write throughput and on-disk size of the PARQUET archive in Parquet
+and Arrow IPC format against the FILE journal, for measurements of a
+few wells with a handful of fields each. Requires pyarrow. Files are
+written to a temporary directory, pass another directory to measure
+a specific disk.
+
+    python -m tests.benchmarks.bench_parquet [messages] [directory]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable
+
+from leaf.modules.output_modules.file import FILE
+from leaf.modules.output_modules.output_module import OutputModule
+from leaf.modules.output_modules.parquet import PARQUET
+
+topic = "bench/adapter/instance/experiment/bench/measurement/od"
+
+
+def point(i: int) -> dict:
+    return {"measurement": "od", "tags": {"well": f"A{i % 12:02d}", "unit": "AU"},
+            "fields": {"value": 0.0394 + (i % 1000) / 1e4, "temperature": 37.0,
+                       "gain": i % 4},
+            "timestamp": 1700000000 + i}
+
+
+def size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def run(build: Callable[[str], OutputModule], directory: str,
+        messages: int) -> tuple[float, int]:
+    path = tempfile.mkdtemp(dir=directory)
+    try:
+        module = build(path)
+        start = time.perf_counter()
+        for i in range(messages):
+            module.transmit(topic, point(i))
+        module.disconnect()
+        return messages / (time.perf_counter() - start), size(path)
+    finally:
+        shutil.rmtree(path)
+
+
+def main() -> None:
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    directory = sys.argv[2] if len(sys.argv) > 2 else None
+
+    print(f"{'mode':<24}{'write msg/s':>14}{'bytes/msg':>12}")
+    for name, build in (
+            ("file journal", lambda path: FILE(path, storage="journal")),
+            ("parquet, zstd", lambda path: PARQUET(path)),
+            ("parquet, snappy", lambda path: PARQUET(path, compression="snappy")),
+            ("arrow, lz4", lambda path: PARQUET(path, format="arrow",
+                                                compression="lz4"))):
+        write_rate, total = run(build, directory, messages)
+        print(f"{name:<24}{write_rate:>14.0f}{total / messages:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
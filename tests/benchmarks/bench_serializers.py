@@ -0,0 +1,64 @@
+"""
+Encode cost and payload size of the output serializers on
+measurements built from the BioLector fixture data.
+
+    python -m tests.benchmarks.bench_serializers [repeats]
+"""
+import csv
+import os
+import sys
+import time
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.utility.serializers import SERIALIZERS
+from leaf.utility.serializers import get_serializer
+
+curr_dir = os.path.dirname(os.path.realpath(__file__))
+fixture = os.path.join(curr_dir, "..", "static_files", "biolector1_measurement.csv")
+fields = ("cycle", "time", "amplitude", "phase", "temperature", "humidity",
+          "o2", "co2")
+
+
+def load_measurements() -> list[dict]:
+    measurements = []
+    with open(fixture) as f:
+        for row in csv.reader(f, delimiter=";"):
+            if len(row) < 12 or row[0] == "R":
+                continue
+            try:
+                values = [float(v) for v in row[4:12]]
+            except ValueError:
+                continue
+            measurements.append({
+                "measurement": "biolector",
+                "tags": {"channel": row[0], "well": row[1], "content": row[2]},
+                "fields": dict(zip(fields, values)),
+                "timestamp": 1700000000 + len(measurements),
+            })
+    return measurements
+
+
+def main() -> None:
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    measurements = load_measurements()
+    count = len(measurements) * repeats
+    print(f"{len(measurements)} measurements x {repeats}")
+    print(f"{'serializer':<12}{'us/msg':>10}{'bytes/msg':>12}{'batch bytes':>14}")
+    for name in SERIALIZERS:
+        try:
+            serializer = get_serializer(name)
+        except AdapterBuildError as e:
+            print(f"{name:<12}{'skipped':>10}  {e}")
+            continue
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for measurement in measurements:
+                serializer.encode(measurement)
+        elapsed = time.perf_counter() - start
+        size = sum(len(serializer.encode(m)) for m in measurements) / len(measurements)
+        batch = len(serializer.encode(measurements))
+        print(f"{name:<12}{elapsed / count * 1e6:>10.2f}{size:>12.1f}{batch:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Buffered write throughput of the SQLITE output module with one
+transaction per message against batched inserts, compared with the
+FILE journal and KEYDB, and the time taken to drain each buffer
+again. KEYDB is skipped when the server from
+tests/static_files/test_config_keydb.yaml is not running, the
+benchmark database is flushed.
+
+    python -m tests.benchmarks.bench_sqlite [messages] [directory]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable
+
+import redis
+import yaml
+
+from leaf.modules.output_modules.file import FILE
+from leaf.modules.output_modules.keydb import KEYDB
+from leaf.modules.output_modules.output_module import OutputModule
+from leaf.modules.output_modules.sqlite import SQLITE
+
+curr_dir = os.path.dirname(os.path.realpath(__file__))
+topic = "bench/adapter/instance/experiment/bench/measurement/od"
+payload = {"measurement": "od", "tags": {"well": "A01"},
+           "fields": {"value": 0.0394}, "timestamp": 1700000000}
+
+
+def run(build: Callable[[], OutputModule], messages: int) -> tuple[float, float]:
+    module = build()
+    start = time.perf_counter()
+    for _ in range(messages):
+        module.transmit(topic, payload)
+    flush = getattr(module, "flush_batch", None)
+    if flush is not None:
+        flush()
+    write_rate = messages / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    drained = sum(1 for _ in module.pop_all_messages())
+    drain_rate = drained / (time.perf_counter() - start)
+    module.disconnect()
+    return write_rate, drain_rate
+
+
+def keydb_config() -> dict:
+    with open(os.path.join(curr_dir, "..", "static_files",
+                           "test_config_keydb.yaml")) as f:
+        config = yaml.safe_load(f)["OUTPUTS"][0]
+    try:
+        KEYDB(config["host"], int(config["port"]), db=int(config["db"]))._client.flushdb()
+    except redis.RedisError:
+        return {}
+    return config
+
+
+def main() -> None:
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    directory = tempfile.mkdtemp(dir=sys.argv[2] if len(sys.argv) > 2 else None)
+    database = os.path.join(directory, "buffer.db")
+    config = keydb_config()
+
+    cases = [
+        ("sqlite, per message", lambda: SQLITE(database)),
+        ("sqlite, synchronous FULL", lambda: SQLITE(database, synchronous="FULL")),
+        ("sqlite, batch 1000", lambda: SQLITE(database, batch={"max_count": 1000})),
+        ("file journal", lambda: FILE(os.path.join(directory, "journal"),
+                                      storage="journal")),
+    ]
+    if config:
+        cases += [
+            ("keydb, rpush per message", lambda: KEYDB(
+                config["host"], int(config["port"]), db=int(config["db"]))),
+            ("keydb, batch 1000", lambda: KEYDB(
+                config["host"], int(config["port"]), db=int(config["db"]),
+                batch={"max_count": 1000})),
+        ]
+    else:
+        print("KeyDB is not reachable, skipping KEYDB.")
+
+    print(f"{'mode':<28}{'write msg/s':>14}{'drain msg/s':>14}")
+    try:
+        for name, build in cases:
+            write_rate, drain_rate = run(build, messages)
+            print(f"{name:<28}{write_rate:>14.0f}{drain_rate:>14.0f}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+from typing import Any, Optional
+
+from leaf.modules.output_modules.output_module import OutputModule
+
+
+class MockOutputModule(OutputModule):
+    """
+    In-memory output module used as a fallback when testing other
+    output modules. Messages are held in messages until retrieved,
+    transmitted keeps a record of everything that was received.
+    """
+    def __init__(self, fallback: Optional[OutputModule] = None) -> None:
+        super().__init__(fallback=fallback)
+        self.messages: list[tuple[str, Any]] = []
+        self.transmitted: list[tuple[str, Any]] = []
+
+    def transmit(self, topic: str, data: Any = None) -> bool:
+        return self._guarded_transmit(self._transmit, topic, data)
+
+    def _transmit(self, topic: str, data: Any = None) -> bool:
+        self.messages.append((topic, data))
+        self.transmitted.append((topic, data))
+        return True
+
+    def retrieve(self, topic: str) -> Any:
+        for index, (message_topic, data) in enumerate(self.messages):
+            if message_topic == topic:
+                del self.messages[index]
+                return data
+        return None
+
+    def pop(self, key: Optional[str] = None) -> Optional[tuple[str, Any]]:
+        for index, (message_topic, data) in enumerate(self.messages):
+            if key is None or message_topic == key:
+                del self.messages[index]
+                return message_topic, data
+        return None
+
+    def connect(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        pass
+
+    def is_connected(self) -> bool:
+        return True
@@ -0,0 +1,211 @@
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+
+import paho.mqtt.client as mqtt
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.mqtt import MQTT
+from leaf.utility.batching import BATCH_KEY
+from leaf.utility.batching import BatchPolicy
+from leaf.utility.batching import MessageBatcher
+from leaf.utility.batching import build_batch_policies
+from leaf.utility.batching import unbatch
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+
+
+class TestMessageBatcher(unittest.TestCase):
+    def setUp(self):
+        self.flushed = []
+        self._batchers = []
+
+    def tearDown(self):
+        for batcher in self._batchers:
+            batcher.close()
+
+    def _build(self, **kwargs):
+        batcher = MessageBatcher(lambda t, m: self.flushed.append((t, m)), **kwargs)
+        self._batchers.append(batcher)
+        return batcher
+
+    def test_flush_on_max_count(self):
+        batcher = self._build(default=BatchPolicy(max_count=3, max_linger_ms=60000))
+        for i in range(7):
+            batcher.add("a", i)
+        self.assertEqual(self.flushed, [("a", [0, 1, 2]), ("a", [3, 4, 5])])
+        self.assertEqual(batcher.pending_count(), 1)
+
+    def test_flush_on_max_bytes(self):
+        batcher = self._build(default=BatchPolicy(max_bytes=10, max_linger_ms=60000))
+        batcher.add("a", "1234")
+        batcher.add("a", "5678")
+        batcher.add("a", "9012")
+        self.assertEqual(self.flushed, [("a", ["1234", "5678"])])
+
+    def test_flush_on_linger(self):
+        batcher = self._build(default=BatchPolicy(max_linger_ms=100))
+        batcher.add("a", 1)
+        batcher.add("b", 2)
+        time.sleep(0.5)
+        self.assertCountEqual(self.flushed, [("a", [1]), ("b", [2])])
+
+    def test_topics_are_batched_separately(self):
+        batcher = self._build(default=BatchPolicy(max_count=2, max_linger_ms=60000))
+        batcher.add("a", 1)
+        batcher.add("b", 2)
+        batcher.add("a", 3)
+        self.assertEqual(self.flushed, [("a", [1, 3])])
+
+    def test_topic_policies(self):
+        default, topics = build_batch_policies({
+            "max_count": 5,
+            "max_linger_ms": 60000,
+            "topics": {"+/measurement/#": {"max_count": 2}},
+        })
+        batcher = self._build(default=default, topics=topics)
+        self.assertFalse(batcher.add("x/details", 1))
+        self.assertTrue(batcher.add("x/measurement/od", 1))
+        self.assertTrue(batcher.add("x/measurement/od", 2))
+        self.assertEqual(self.flushed, [("x/measurement/od", [1, 2])])
+        self.assertEqual(topics["+/measurement/#"].max_linger_ms, 60000)
+
+    def test_invalid_options(self):
+        with self.assertRaises(AdapterBuildError):
+            build_batch_policies({"max_size": 5})
+        with self.assertRaises(AdapterBuildError):
+            build_batch_policies({"max_count": 0})
+
+    def test_close_ends_linger_thread(self):
+        batcher = self._build(default=BatchPolicy(max_linger_ms=60000))
+        batcher.add("a", 1)
+        batcher.close()
+        self.assertEqual(self.flushed, [("a", [1])])
+        self.assertFalse(batcher._thread.is_alive())
+        self.assertFalse(batcher.is_running())
+        self.assertFalse(batcher.add("a", 2))
+
+    def test_slow_flush_does_not_block_add(self):
+        release = threading.Event()
+        flushed = []
+
+        def on_flush(topic, messages):
+            if topic == "a":
+                release.wait(5)
+            flushed.append((topic, messages))
+
+        batcher = MessageBatcher(on_flush, default=BatchPolicy(max_count=1,
+                                                               max_linger_ms=60000))
+        self._batchers.append(batcher)
+        sender = threading.Thread(target=batcher.add, args=("a", 1))
+        sender.start()
+        time.sleep(0.1)
+        start = time.monotonic()
+        self.assertTrue(batcher.add("b", 2))
+        self.assertLess(time.monotonic() - start, 0.5)
+        release.set()
+        sender.join(2)
+        # Batches keep the order they were flushed in.
+        self.assertEqual(flushed, [("a", [1]), ("b", [2])])
+
+    def test_failed_flush_goes_to_on_error(self):
+        failed = []
+
+        def on_flush(topic, messages):
+            raise RuntimeError("broken")
+
+        batcher = MessageBatcher(on_flush, default=BatchPolicy(max_count=2,
+                                                               max_linger_ms=60000),
+                                 on_error=lambda t, m, e: failed.append((t, m)))
+        self._batchers.append(batcher)
+        batcher.add("a", 1)
+        batcher.add("a", 2)
+        self.assertEqual(failed, [("a", [1, 2])])
+        self.assertEqual(batcher.pending_count(), 0)
+
+    def test_failed_flush_is_put_back(self):
+        attempts = []
+
+        def on_flush(topic, messages):
+            attempts.append(messages)
+            if len(attempts) == 1:
+                raise RuntimeError("broken")
+            self.flushed.append((topic, messages))
+
+        batcher = MessageBatcher(on_flush, default=BatchPolicy(max_count=2,
+                                                               max_linger_ms=60000))
+        self._batchers.append(batcher)
+        batcher.add("a", 1)
+        batcher.add("a", 2)
+        self.assertEqual(batcher.pending_count(), 2)
+        batcher.add("a", 3)
+        batcher.flush()
+        self.assertEqual(self.flushed, [("a", [1, 2, 3])])
+
+    def test_unbatch(self):
+        self.assertEqual(unbatch({BATCH_KEY: [1, 2]}), [1, 2])
+        self.assertEqual(unbatch({"fields": {}}), [{"fields": {}}])
+        self.assertEqual(unbatch([1, 2]), [[1, 2]])
+
+
+class TestMQTTBatching(unittest.TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.is_connected.return_value = True
+        self.client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS)
+
+    def _build(self, **kwargs):
+        with patch("paho.mqtt.client.Client", return_value=self.client):
+            return MQTT("localhost", **kwargs)
+
+    def _payloads(self):
+        return [(c.kwargs["topic"], json.loads(c.kwargs["payload"]))
+                for c in self.client.publish.call_args_list]
+
+    def test_measurements_are_coalesced(self):
+        module = self._build(batch={"max_count": 3, "max_linger_ms": 60000})
+        for i in range(3):
+            module.transmit(measurement_topic, {"value": i})
+        module.transmit(measurement_topic, '{"value": 3}')
+        self.assertEqual(self._payloads(), [
+            (measurement_topic, {BATCH_KEY: [{"value": 0}, {"value": 1}, {"value": 2}]})
+        ])
+        batcher = module._batcher
+        module.disconnect()
+        self.assertEqual(self._payloads()[-1],
+                         (measurement_topic, {BATCH_KEY: [{"value": 3}]}))
+        self.assertFalse(batcher._thread.is_alive())
+
+        # Reconnecting starts batching again.
+        module.connect()
+        self.assertIsNot(module._batcher, batcher)
+        self.assertTrue(module.transmit(measurement_topic, {"value": 4}))
+        self.assertEqual(module._batcher.pending_count(), 1)
+        module.disconnect()
+
+    def test_control_topics_are_not_batched(self):
+        module = self._build(batch={"max_linger_ms": 60000})
+        module.transmit(details_topic, {"state": "running"})
+        self.assertEqual(self._payloads(), [(details_topic, {"state": "running"})])
+
+    def test_batching_with_queue(self):
+        module = self._build(batch={"max_linger_ms": 50}, queue_size=10)
+        module.transmit(measurement_topic, {"value": 1})
+        module.transmit(measurement_topic, {"value": 2})
+        time.sleep(0.3)
+        module._wait_for_queue(5)
+        self.assertEqual(self._payloads(), [
+            (measurement_topic, {BATCH_KEY: [{"value": 1}, {"value": 2}]})
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.error_handler.exceptions import ClientUnreachableError
+from leaf.utility.circuit_breaker import CircuitBreaker
+from leaf.utility.circuit_breaker import CircuitBreakerPolicy
+from leaf.utility.circuit_breaker import build_circuit_breaker_policy
+from tests.mock_output_module import MockOutputModule
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class UnreachableOutput(MockOutputModule):
+    """
+    Output whose system is down until up is set, each attempt
+    is counted and reported as in the real output modules.
+    """
+    def __init__(self, fallback=None):
+        super().__init__(fallback=fallback)
+        self._error_holder = MagicMock()
+        self.up = False
+        self.attempts = 0
+
+    def _transmit(self, topic, data=None):
+        self.attempts += 1
+        if self.up:
+            return super()._transmit(topic, data)
+        self._handle_exception(ClientUnreachableError("down", output_module=self))
+        return self.fallback(topic, data)
+
+
+class QueuedOutput(UnreachableOutput):
+    """
+    Output that only queues messages, they are sent by send_queued
+    as a publisher thread would.
+    """
+    def __init__(self, fallback=None):
+        super().__init__(fallback=fallback)
+        self.queued = []
+
+    def _transmit(self, topic, data=None):
+        self.queued.append((topic, data))
+        self._defer_outcome()
+        return True
+
+    def send_queued(self):
+        while self.queued:
+            topic, data = self.queued.pop(0)
+            self._background_send(UnreachableOutput._transmit, self, topic, data)
+
+
+class TestCircuitBreakerPolicy(unittest.TestCase):
+    def test_build_policy(self):
+        self.assertEqual(build_circuit_breaker_policy(True), CircuitBreakerPolicy())
+        self.assertEqual(build_circuit_breaker_policy({"window": 60, "min_calls": 4}),
+                         CircuitBreakerPolicy(window=60, min_calls=4))
+        for config in ("on", {"threshold": 1}, {"failure_rate": 1.5},
+                       {"min_calls": 0}, {"probe_interval": 60, "max_probe_interval": 10}):
+            with self.assertRaises(AdapterBuildError):
+                build_circuit_breaker_policy(config)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = patch("leaf.utility.circuit_breaker.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(CircuitBreakerPolicy(
+            window=10, min_calls=4, failure_rate=0.5, probe_interval=5,
+            max_probe_interval=15, probes=2))
+
+    def _calls(self, failures, successes=0):
+        for _ in range(successes):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_success()
+        for _ in range(failures):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+
+    def test_opens_on_failure_rate(self):
+        self._calls(failures=1, successes=2)
+        self.assertEqual(self.breaker.state, "closed")
+        self._calls(failures=1)
+        self.assertEqual(self.breaker.state, "open")
+        self.assertFalse(self.breaker.allow())
+
+    def test_window_forgets_old_calls(self):
+        self._calls(failures=3)
+        self.clock.now += 11
+        self._calls(failures=1, successes=3)
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_lost_probe_is_replaced(self):
+        self._calls(failures=4)
+        self.clock.now += 5
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        # The probe never reported back.
+        self.clock.now += 5
+        self.assertTrue(self.breaker.allow())
+
+    def test_half_open_probes(self):
+        self._calls(failures=4)
+        self.clock.now += 5
+        self.assertEqual(self.breaker.state, "half_open")
+        self.assertTrue(self.breaker.allow())
+        # One probe at a time.
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.get_stats()["probe_interval"], 10)
+        self.clock.now += 9
+        self.assertFalse(self.breaker.allow())
+        self.clock.now += 1
+        self._calls(failures=0, successes=2)
+        self.assertEqual(self.breaker.state, "closed")
+        stats = self.breaker.get_stats()
+        self.assertEqual(stats["transitions"], {"closed->open": 1, "open->half_open": 2,
+                                                "half_open->open": 1, "half_open->closed": 1})
+        self.assertEqual(stats["short_circuited"], 2)
+        self.assertEqual(stats["probe_interval"], 5)
+
+
+class TestOutputCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = patch("leaf.utility.circuit_breaker.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_no_breaker(self):
+        output = UnreachableOutput(fallback=MockOutputModule())
+        for _ in range(20):
+            output.transmit(measurement_topic, {})
+        self.assertEqual(output.attempts, 20)
+        self.assertIsNone(output.get_circuit_breaker_stats())
+
+    def test_short_circuits_to_fallback(self):
+        fallback = MockOutputModule()
+        output = UnreachableOutput(fallback=fallback)
+        output.set_circuit_breaker(CircuitBreakerPolicy(min_calls=3, probe_interval=5))
+        for i in range(10):
+            self.assertTrue(output.transmit(measurement_topic, {"i": i}))
+        self.assertEqual(output.attempts, 3)
+        self.assertEqual(len(fallback.transmitted), 10)
+        self.assertEqual(output.get_circuit_breaker_stats()["short_circuited"], 7)
+
+        output.up = True
+        self.clock.now += 5
+        output.transmit(measurement_topic, {"i": 10})
+        self.assertEqual(output.get_circuit_breaker_stats()["state"], "closed")
+        self.assertEqual(output.transmitted, [(measurement_topic, {"i": 10})])
+
+    def test_failed_fallback_counts_once(self):
+        output = UnreachableOutput()
+        output.set_circuit_breaker(CircuitBreakerPolicy(min_calls=2))
+        with patch.object(output, "_handle_no_fallback_available"):
+            output.transmit(measurement_topic, {})
+            self.assertEqual(output.get_circuit_breaker_stats()["failures"], 1)
+            output.transmit(measurement_topic, {})
+        self.assertEqual(output.get_circuit_breaker_stats()["state"], "open")
+
+    def test_background_failure_is_recorded(self):
+        output = UnreachableOutput()
+        output.set_circuit_breaker(CircuitBreakerPolicy(min_calls=1))
+        output._handle_exception(ClientUnreachableError("batch failed", output_module=output))
+        self.assertEqual(output.get_circuit_breaker_stats()["state"], "open")
+
+    def test_background_sends_are_recorded(self):
+        fallback = MockOutputModule()
+        output = QueuedOutput(fallback=fallback)
+        output.set_circuit_breaker(CircuitBreakerPolicy(min_calls=2, probe_interval=5))
+        for i in range(2):
+            self.assertTrue(output.transmit(measurement_topic, {"i": i}))
+        self.assertEqual(output.get_circuit_breaker_stats()["calls"], 0)
+        output.send_queued()
+        self.assertEqual(output.get_circuit_breaker_stats()["state"], "open")
+        self.assertEqual(len(fallback.transmitted), 2)
+
+    def test_queued_probe_waits_for_send(self):
+        output = QueuedOutput(fallback=MockOutputModule())
+        output.set_circuit_breaker(CircuitBreakerPolicy(min_calls=1, probe_interval=5))
+        output._breaker.record_failure()
+        self.clock.now += 5
+        output.up = True
+        output.transmit(measurement_topic, {"i": 0})
+        # Queuing the probe says nothing about the system.
+        self.assertEqual(output.get_circuit_breaker_stats()["state"], "half_open")
+        output.send_queued()
+        self.assertEqual(output.get_circuit_breaker_stats()["state"], "closed")
+
+
+if __name__ == "__main__":
+    unittest.main()
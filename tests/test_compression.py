@@ -0,0 +1,96 @@
+import json
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+
+import paho.mqtt.client as mqtt
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.mqtt import MQTT
+from leaf.utility import compression
+from leaf.utility.compression import COMPRESSORS
+from leaf.utility.compression import build_compression_policy
+from leaf.utility.compression import decompress_message
+from leaf.utility.compression import get_compressor
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+measurements = [{"measurement": "biolector", "tags": {"well": f"A{i:02}"},
+                 "fields": {"biomass": 0.04 + i / 1000}, "timestamp": 1700000000 + i}
+                for i in range(50)]
+
+
+class TestCompression(unittest.TestCase):
+    def test_round_trip(self):
+        payload = json.dumps(measurements).encode()
+        for name in COMPRESSORS:
+            compressor = get_compressor(name)
+            compressed = compressor.compress(payload)
+            self.assertLess(len(compressed), len(payload))
+            self.assertEqual(compressor.decompress(compressed), payload)
+
+    def test_invalid_options(self):
+        with self.assertRaises(AdapterBuildError):
+            build_compression_policy({"algorithm": "brotli"})
+        with self.assertRaises(AdapterBuildError):
+            build_compression_policy({"min_size": 10})
+        with self.assertRaises(AdapterBuildError):
+            build_compression_policy({"min_bytes": -1})
+        with patch.object(compression, "zstandard", None):
+            with self.assertRaises(AdapterBuildError):
+                build_compression_policy({"algorithm": "zstd"})
+
+    def test_decompress_uncompressed_message(self):
+        self.assertEqual(decompress_message(details_topic, b"{}"), (details_topic, b"{}"))
+
+
+class TestMQTTCompression(unittest.TestCase):
+    def _build(self, **kwargs):
+        self.client = MagicMock()
+        self.client.is_connected.return_value = True
+        self.client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS)
+        with patch("paho.mqtt.client.Client", return_value=self.client):
+            return MQTT("localhost", **kwargs)
+
+    def _received(self):
+        kwargs = self.client.publish.call_args.kwargs
+        topic, payload = decompress_message(kwargs["topic"], kwargs["payload"],
+                                            kwargs["properties"])
+        return topic, json.loads(payload)
+
+    def test_topic_suffix_without_v5(self):
+        module = self._build(compression={"algorithm": "zlib", "min_bytes": 100})
+        module.transmit(measurement_topic, measurements)
+        self.assertEqual(self.client.publish.call_args.kwargs["topic"],
+                         measurement_topic + "/compressed/zlib")
+        self.assertEqual(self._received(), (measurement_topic, measurements))
+        stats = module.get_compression_stats()
+        self.assertEqual(stats["compressed"], 1)
+        self.assertLess(stats["ratio"], 0.5)
+
+    def test_property_with_v5(self):
+        module = self._build(protocol="v5", compression={"algorithm": "lz4"})
+        module.transmit(measurement_topic, measurements)
+        self.assertEqual(self.client.publish.call_args.kwargs["topic"], measurement_topic)
+        self.assertEqual(self._received(), (measurement_topic, measurements))
+
+    def test_small_and_unselected_messages(self):
+        module = self._build(compression={"min_bytes": 500})
+        module.transmit(measurement_topic, measurements[0])
+        module.transmit(details_topic, measurements)
+        topics = [c.kwargs["topic"] for c in self.client.publish.call_args_list]
+        self.assertEqual(topics, [measurement_topic, details_topic])
+        self.assertEqual(module.get_compression_stats()["compressed"], 0)
+
+    def test_topic_patterns(self):
+        module = self._build(compression={"min_bytes": 0, "topics": ["+/+/+/details"]})
+        module.transmit(details_topic, measurements)
+        self.assertEqual(self._received(), (details_topic, measurements))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -326,7 +326,10 @@ class TestExceptionsGeneral(unittest.TestCase):
     @patch("leaf.modules.output_modules.mqtt.mqtt.Client.on_disconnect")
     def test_mqtt_module_on_disconnect_reconnect_failure(self, mock_on_disconnect: MagicMock) -> None:
         mock_on_disconnect.side_effect = ClientUnreachableError("Reconnect failed")
-        self.mqtt_client.on_disconnect(client="test_client",userdata=None,flags=None, rc=2)
+        with patch("leaf.modules.output_modules.mqtt.FIRST_RECONNECT_DELAY", 0):
+            self.mqtt_client.on_disconnect(client="test_client",userdata=None,flags=None, rc=2)
+        # Reconnects are scheduled on another thread.
+        self.assertTrue(self.mqtt_client._reconnector.wait_idle(10))
         self.assertEqual(self.error_holder.add_error.call_count, 2)
 
     @patch("leaf.modules.output_modules.file.open", new_callable=mock_open)
@@ -0,0 +1,180 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+
+import paho.mqtt.client as mqtt
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.mqtt import MQTT
+from leaf.utility.fallback_drainer import FallbackDrainer
+from tests.mock_output_module import MockOutputModule
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestFallbackDrainer(unittest.TestCase):
+    def setUp(self):
+        self.store = MockOutputModule()
+        self.published = []
+        self.ready = threading.Event()
+        self.ready.set()
+
+    def _build(self, rate=1000.0):
+        return FallbackDrainer(self.store.retrieve,
+                               lambda t, d: self.published.append((t, d)) or True,
+                               self.ready.is_set, rate=rate)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(AdapterBuildError):
+            self._build(rate=0)
+
+    def test_drains_topics_round_robin(self):
+        for i in range(3):
+            self.store.transmit("a", f"a{i}")
+            self.store.transmit("b", f"b{i}")
+        drainer = self._build()
+        drainer.request("a")
+        drainer.request("b")
+        self.assertTrue(wait_until(lambda: len(self.published) == 6))
+        self.assertEqual([d for _, d in self.published],
+                         ["a0", "b0", "a1", "b1", "a2", "b2"])
+        self.assertTrue(wait_until(lambda: not drainer.is_draining()))
+        self.assertEqual(drainer.get_progress()["drained"], 6)
+
+    def test_drains_in_batches(self):
+        for i in range(5):
+            self.store.transmit("a", i)
+        batches = []
+
+        def retrieve_many(topic, count):
+            messages = []
+            while len(messages) < count:
+                message = self.store.retrieve(topic)
+                if message is None:
+                    break
+                messages.append(message)
+            return messages
+
+        drainer = FallbackDrainer(self.store.retrieve, MagicMock(), self.ready.is_set,
+                                  rate=2000, retrieve_many=retrieve_many,
+                                  publish_many=lambda t, m: batches.append(m) or len(m))
+        drainer.request("a")
+        self.assertTrue(wait_until(lambda: not drainer.is_draining()))
+        self.assertEqual(batches, [[0, 1, 2, 3, 4]])
+        self.assertEqual(drainer.get_progress()["drained"], 5)
+
+    def test_rate_budget(self):
+        for i in range(5):
+            self.store.transmit("a", i)
+        drainer = self._build(rate=20)
+        start = time.monotonic()
+        drainer.request("a")
+        self.assertTrue(wait_until(lambda: len(self.published) == 5))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_pauses_until_ready(self):
+        self.store.transmit("a", 1)
+        self.ready.clear()
+        drainer = self._build()
+        drainer.request("a")
+        time.sleep(0.2)
+        self.assertEqual(self.published, [])
+        self.assertEqual(drainer.get_progress()["pending_topics"], 1)
+        self.ready.set()
+        drainer.resume()
+        self.assertTrue(wait_until(lambda: self.published == [("a", 1)]))
+
+    def test_publish_error_is_counted(self):
+        for i in range(3):
+            self.store.transmit("a", i)
+
+        def publish(topic, data):
+            if data == 0:
+                raise RuntimeError("broken")
+            self.published.append((topic, data))
+            return True
+
+        drainer = FallbackDrainer(self.store.retrieve, publish, self.ready.is_set, rate=1000.0)
+        drainer.request("a")
+        self.assertTrue(wait_until(lambda: len(self.published) == 2))
+        self.assertTrue(wait_until(lambda: not drainer.is_draining()))
+        progress = drainer.get_progress()
+        self.assertEqual((progress["drained"], progress["failed"]), (2, 1))
+        drainer.close()
+
+    def test_close_stops_the_thread(self):
+        for i in range(5):
+            self.store.transmit("a", i)
+        drainer = self._build(rate=2)
+        drainer.request("a")
+        self.assertTrue(wait_until(lambda: len(self.published) == 1))
+        start = time.monotonic()
+        drainer.close()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(drainer._thread.is_alive())
+        self.assertFalse(drainer.is_draining())
+        self.assertEqual(len(self.store.messages), 4)
+
+
+class TestMQTTFallbackDrain(unittest.TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS)
+        self.fallback = MockOutputModule()
+
+    def test_backlog_is_replayed_in_background(self):
+        self.client.is_connected.return_value = False
+        with patch("paho.mqtt.client.Client", return_value=self.client):
+            module = MQTT("localhost", fallback=self.fallback, drain_rate=50)
+        for i in range(10):
+            module.transmit("test/topic", str(i))
+        self.assertEqual(len(self.fallback.messages), 10)
+
+        self.client.is_connected.return_value = True
+        start = time.monotonic()
+        self.assertTrue(module.transmit("test/topic", "live"))
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        self.assertTrue(wait_until(lambda: not self.fallback.messages))
+        payloads = [c.kwargs["payload"] for c in self.client.publish.call_args_list]
+        self.assertEqual(payloads, ["live"] + [str(i) for i in range(10)])
+        self.assertEqual(module.get_drain_progress()["drained"], 10)
+
+        drainer = module._drainer
+        module.disconnect()
+        self.assertFalse(drainer._thread.is_alive())
+        self.assertIsNone(module._drainer)
+
+    def test_replay_is_left_to_the_drainer(self):
+        self.fallback.get_backlog_topics = lambda: {
+            topic: 1 for topic, _ in self.fallback.messages}
+        self.client.is_connected.return_value = False
+        with patch("paho.mqtt.client.Client", return_value=self.client):
+            module = MQTT("localhost", fallback=self.fallback)
+        for i in range(5):
+            module.transmit("test/topic", str(i))
+
+        self.client.is_connected.return_value = True
+        module.replay_buffered()
+        self.assertTrue(wait_until(lambda: not self.fallback.messages))
+        payloads = [c.kwargs["payload"] for c in self.client.publish.call_args_list]
+        self.assertEqual(payloads, [str(i) for i in range(5)])
+        self.assertIsNone(module.get_replay_progress())
+        module.disconnect()
+
+
+if __name__ == "__main__":
+    unittest.main()
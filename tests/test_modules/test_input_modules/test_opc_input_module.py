@@ -446,9 +446,15 @@ class TestMQTTWatcher(unittest.TestCase):
             username=un,
             password=pw,
         )
-        with patch.object(watcher.client, 'reconnect') as mock_reconnect:
+        with patch.object(watcher.client, 'reconnect') as mock_reconnect, \
+                patch("leaf.modules.input_modules.mqtt_watcher.FIRST_RECONNECT_DELAY", 0):
             watcher.on_disconnect(watcher.client, None, None, 1)
+            # Reconnects are scheduled on another thread.
+            deadline = time.time() + 2
+            while not mock_reconnect.called and time.time() < deadline:
+                time.sleep(0.05)
             self.assertTrue(mock_reconnect.called)
+        watcher.stop()
 
     def test_invalid_protocol(self):
         with self.assertRaises(Exception):
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import redis
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+from leaf.modules.output_modules.async_keydb import AsyncKEYDB
+from leaf.modules.output_modules.keydb import KEYDB
+from leaf.utility.async_bridge import AsyncBridge
+from tests.mock_output_module import MockOutputModule
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+db_num = 6
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def keydb_available() -> bool:
+    try:
+        return redis.Redis(host="localhost", port=6379, db=db_num).ping()
+    except redis.RedisError:
+        return False
+
+
+class TestAsyncBridge(unittest.TestCase):
+    def test_run_and_await(self):
+        bridge = AsyncBridge()
+        self.addCleanup(bridge.close)
+
+        async def add(a, b):
+            await asyncio.sleep(0)
+            return a + b
+
+        self.assertEqual(bridge.run(add(1, 2)), 3)
+        self.assertEqual(asyncio.run(bridge.run_async(add(2, 3))), 5)
+        with self.assertRaises(TimeoutError):
+            bridge.run(asyncio.sleep(1), timeout=0.01)
+
+    def test_run_from_loop_is_refused(self):
+        bridge = AsyncBridge()
+        self.addCleanup(bridge.close)
+
+        async def nested():
+            bridge.run(asyncio.sleep(0))
+
+        with self.assertRaises(RuntimeError):
+            bridge.run(nested())
+
+
+class TestAsyncKEYDBUnreachable(unittest.TestCase):
+    def test_failed_writes_use_fallback(self):
+        fallback = MockOutputModule()
+        module = AsyncKEYDB("localhost", port=1, fallback=fallback,
+                            error_holder=MagicMock())
+        self.assertTrue(module.transmit(measurement_topic, {"v": 1}))
+        module.flush_writes()
+        self.assertEqual(fallback.transmitted, [(measurement_topic, '{"v": 1}')])
+        self.assertFalse(module.is_connected())
+        module.disconnect()
+
+    def test_writer_survives_unexpected_errors(self):
+        fallback = MockOutputModule()
+        module = AsyncKEYDB("localhost", port=1, fallback=fallback,
+                            error_holder=MagicMock())
+        self.addCleanup(module.disconnect)
+        with patch.object(fallback, "transmit", side_effect=RuntimeError("broken")):
+            module.transmit(measurement_topic, {"v": 1})
+            self.assertTrue(wait_for(lambda: not module._queue))
+            time.sleep(0.2)
+        module.transmit(measurement_topic, {"v": 2})
+        self.assertTrue(wait_for(lambda: fallback.transmitted))
+        self.assertEqual(fallback.transmitted, [(measurement_topic, '{"v": 2}')])
+
+
+@unittest.skipUnless(keydb_available(), "KeyDB is not running on localhost:6379")
+class TestAsyncKEYDB(unittest.TestCase):
+    def setUp(self):
+        self.db = redis.Redis(host="localhost", port=6379, db=db_num)
+        self.db.flushdb()
+        self.module = self._build()
+
+    def tearDown(self):
+        self.module.disconnect()
+        self.db.flushdb()
+
+    def _build(self, **kwargs):
+        module = AsyncKEYDB("localhost", db=db_num, error_holder=MagicMock(), **kwargs)
+        return module
+
+    def test_writes_are_queued_and_replayed_in_order(self):
+        for i in range(1200):
+            self.assertTrue(self.module.transmit(measurement_topic, {"i": i}))
+        self.module.transmit(details_topic, {"name": "a"})
+        self.module.flush_writes()
+        self.assertEqual(self.module.get_backlog(measurement_topic), 1200)
+        self.assertTrue(self.module.is_connected())
+        self.assertEqual(self.module.pop(details_topic), (details_topic, {"name": "a"}))
+        drained = list(self.module.pop_all_messages())
+        self.assertEqual(drained, [(measurement_topic, f'{{"i": {i}}}') for i in range(1200)])
+        self.assertEqual(self.module.get_backlog_topics(), {})
+
+    def test_shares_storage_and_pool(self):
+        other = self._build()
+        self.addCleanup(other.disconnect)
+        self.assertIs(other._client.connection_pool, self.module._client.connection_pool)
+        self.module.transmit(measurement_topic, {"i": 0})
+        self.module.flush_writes()
+        keydb = KEYDB("localhost", db=db_num)
+        self.assertEqual(keydb.get_backlog(measurement_topic), 1)
+        self.assertEqual(keydb.retrieve(measurement_topic), '{"i": 0}')
+
+    def test_async_interface(self):
+        async def run():
+            self.assertTrue(await self.module.transmit_async(measurement_topic, {"i": 0}))
+            self.module.transmit(measurement_topic, {"i": 1})
+            self.assertTrue(await self.module.is_connected_async())
+            return [item async for item in self.module.pop_all_messages_async()]
+
+        self.assertEqual(asyncio.run(run()), [(measurement_topic, '{"i": 0}'),
+                                              (measurement_topic, '{"i": 1}')])
+
+    def test_disconnect_writes_queue(self):
+        module = self._build()
+        module.transmit(measurement_topic, {"i": 0})
+        module.disconnect()
+        self.assertEqual(self.db.llen(measurement_topic), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.file import FILE
+from leaf.utility.durability import FsyncPolicy
+from leaf.utility.durability import build_fsync_policy
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+
+
+class TestFILEDurability(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _build(self, **kwargs):
+        return FILE(self.path, storage="journal", error_holder=MagicMock(), **kwargs)
+
+    def _segment(self):
+        names = sorted(n for n in os.listdir(self.path) if n.endswith(".jsonl"))
+        return os.path.join(self.path, names[-1])
+
+    def test_fsync_policy(self):
+        self.assertEqual(build_fsync_policy("always"), FsyncPolicy("always"))
+        self.assertEqual(build_fsync_policy({"mode": "every", "records": 10}),
+                         FsyncPolicy("every", 10))
+        for config in ("sometimes", {"mode": "every", "records": 0}, {"period": 1}):
+            with self.assertRaises(AdapterBuildError):
+                build_fsync_policy(config)
+        with self.assertRaises(AdapterBuildError):
+            self._build(fsync="sometimes")
+
+    def test_fsync_every_n_records(self):
+        module = self._build(fsync={"mode": "every", "records": 3})
+        with patch("leaf.utility.durability.os.fsync") as fsync:
+            for i in range(7):
+                module.transmit(measurement_topic, {"i": i})
+            # The first append also syncs the new segment's directory entry.
+            self.assertEqual(fsync.call_count, 3)
+            module.disconnect()
+            self.assertEqual(fsync.call_count, 4)
+
+    def test_torn_tail_is_truncated(self):
+        module = self._build()
+        for i in range(3):
+            module.transmit(measurement_topic, {"i": i})
+        module.disconnect()
+        size = os.path.getsize(self._segment())
+        with open(self._segment(), "ab") as f:
+            f.write(b'0badc0de {"topic": "inst')
+
+        restarted = self._build()
+        restarted.transmit(measurement_topic, {"i": 3})
+        self.assertEqual([m for _, m in restarted.pop_all_messages()],
+                         [{"i": i} for i in range(4)])
+        self.assertGreater(os.path.getsize(self._segment()), size)
+
+    def test_corrupt_record_is_skipped(self):
+        module = self._build()
+        for i in range(3):
+            module.transmit(measurement_topic, {"i": i})
+        module.disconnect()
+        with open(self._segment(), "r+b") as f:
+            lines = f.read().split(b"\n")
+            lines[1] = lines[1].replace(b'"i": 1', b'"i": 7')
+            f.seek(0)
+            f.write(b"\n".join(lines))
+
+        restarted = self._build()
+        self.assertEqual(restarted.pop(), (measurement_topic, {"i": 0}))
+        self.assertEqual(restarted.pop(), (measurement_topic, {"i": 2}))
+        self.assertIsNone(restarted.pop())
+
+    def test_document_is_replaced_atomically(self):
+        filename = os.path.join(self.directory, "buffer.json")
+        module = FILE(filename, error_holder=MagicMock(), fsync="always", atomic_writes=True)
+        module.transmit(measurement_topic, {"i": 0})
+        with patch("leaf.utility.durability.os.replace", side_effect=OSError("disk full")):
+            module.transmit(measurement_topic, {"i": 1})
+        with open(filename) as f:
+            self.assertEqual(json.load(f), {measurement_topic: [{"i": 0}]})
+
+    def test_corrupt_document_is_kept(self):
+        filename = os.path.join(self.directory, "buffer.json")
+        with open(filename, "w") as f:
+            f.write('{"topic": [1, 2')
+        module = FILE(filename, error_holder=MagicMock())
+        module.transmit(measurement_topic, {"i": 0})
+        kept = [n for n in os.listdir(self.directory) if ".corrupt-" in n]
+        self.assertEqual(len(kept), 1)
+        with open(os.path.join(self.directory, kept[0])) as f:
+            self.assertEqual(f.read(), '{"topic": [1, 2')
+        self.assertEqual(module.retrieve(measurement_topic), [{"i": 0}])
+
+
+if __name__ == "__main__":
+    unittest.main()
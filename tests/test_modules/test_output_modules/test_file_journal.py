@@ -0,0 +1,159 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.file import FILE
+from leaf.utility.journal import Journal
+from tests.mock_output_module import MockOutputModule
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+
+
+class TestFILEJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _build(self, **kwargs):
+        return FILE(self.path, storage="journal", error_holder=MagicMock(), **kwargs)
+
+    def _segments(self):
+        return sorted(n for n in os.listdir(self.path) if n.endswith(".jsonl"))
+
+    def test_invalid_options(self):
+        with self.assertRaises(AdapterBuildError):
+            FILE(self.path, storage="table")
+        with self.assertRaises(AdapterBuildError):
+            self._build(segment_bytes=0)
+
+    def test_transmit_appends(self):
+        module = self._build()
+        module.transmit(measurement_topic, {"i": 0})
+        module.transmit(details_topic, '{"name": "a"}')
+        with open(os.path.join(self.path, self._segments()[0])) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(module.pop(), (measurement_topic, {"i": 0}))
+        self.assertEqual(module.pop(), (details_topic, '{"name": "a"}'))
+        self.assertIsNone(module.pop())
+
+    def test_retrieve_takes_oldest_of_topic(self):
+        module = self._build()
+        for i in range(3):
+            module.transmit(measurement_topic, {"i": i})
+            module.transmit(details_topic, {"d": i})
+        self.assertEqual([module.retrieve(measurement_topic) for _ in range(4)],
+                         [{"i": 0}, {"i": 1}, {"i": 2}, None])
+        self.assertEqual(module.pop(details_topic),
+                         (details_topic, [{"d": 0}, {"d": 1}, {"d": 2}]))
+        self.assertIsNone(module.pop())
+
+    def test_rotation_and_cleanup(self):
+        module = self._build(segment_bytes=200)
+        for i in range(20):
+            module.transmit(measurement_topic, {"i": i})
+        self.assertGreater(len(self._segments()), 1)
+        drained = list(module.pop_all_messages())
+        self.assertEqual(drained, [(measurement_topic, {"i": i}) for i in range(20)])
+        self.assertLessEqual(len(self._segments()), 1)
+        self.assertIsNone(module.pop())
+
+    def test_consumed_records_survive_restart(self):
+        module = self._build(segment_bytes=200)
+        for i in range(10):
+            module.transmit(measurement_topic, {"i": i})
+            module.transmit(details_topic, {"d": i})
+        self.assertEqual(module.retrieve(details_topic), {"d": 0})
+        self.assertEqual(module.pop(), (measurement_topic, {"i": 0}))
+        module.disconnect()
+
+        restarted = self._build(segment_bytes=200)
+        drained = list(restarted.pop_all_messages())
+        self.assertEqual(len(drained), 18)
+        self.assertEqual(drained[:2], [(measurement_topic, {"i": 1}),
+                                       (details_topic, {"d": 1})])
+
+    def test_torn_tail_is_skipped(self):
+        module = self._build()
+        module.transmit(measurement_topic, {"i": 0})
+        module.disconnect()
+        with open(os.path.join(self.path, self._segments()[-1]), "ab") as f:
+            f.write(b'{"topic": "inst')
+
+        restarted = self._build()
+        restarted.transmit(measurement_topic, {"i": 1})
+        self.assertEqual(list(restarted.pop_all_messages()),
+                         [(measurement_topic, {"i": 0}), (measurement_topic, {"i": 1})])
+
+    def test_write_error_uses_fallback(self):
+        fallback = MockOutputModule()
+        with open(self.path, "w") as f:
+            f.write("not a directory")
+        module = FILE(self.path, storage="journal", fallback=fallback,
+                      error_holder=MagicMock())
+        self.assertTrue(module.transmit(measurement_topic, {"i": 0}))
+        self.assertEqual(fallback.transmitted, [(measurement_topic, {"i": 0})])
+
+    def test_topic_reads_seek_with_index(self):
+        module = self._build(segment_bytes=2000)
+        for i in range(100):
+            module.transmit(measurement_topic, {"i": i})
+            if i % 25 == 0:
+                module.transmit(details_topic, {"d": i})
+        module.disconnect()
+        self.assertTrue(any(n.endswith(".idx") for n in os.listdir(self.path)))
+
+        restarted = self._build(segment_bytes=2000)
+        with patch.object(Journal, "_decode", autospec=True,
+                          side_effect=Journal._decode) as decode:
+            self.assertEqual(restarted.pop(details_topic),
+                             (details_topic, [{"d": i} for i in (0, 25, 50, 75)]))
+        # Only the active segment is scanned on opening, then one decode per record.
+        self.assertLess(decode.call_count, 40)
+        self.assertEqual(len(list(restarted.pop_all_messages())), 100)
+
+    def test_compaction(self):
+        module = self._build(segment_bytes=1000, compact_threshold=0.4)
+        for i in range(60):
+            module.transmit(measurement_topic, {"i": i})
+            module.transmit(details_topic, {"d": i})
+        self.assertEqual(len(module.pop(measurement_topic)[1]), 60)
+        before = sum(os.path.getsize(p) for p in module._journal.segments())
+        self.assertGreater(module._journal.compact(), 0)
+        after = sum(os.path.getsize(p) for p in module._journal.segments())
+        self.assertLess(after, before * 0.7)
+        self.assertEqual(module.retrieve(details_topic), {"d": 0})
+        module.disconnect()
+
+        restarted = self._build(segment_bytes=1000)
+        self.assertEqual(list(restarted.pop_all_messages()),
+                         [(details_topic, {"d": i}) for i in range(1, 60)])
+
+    def test_compaction_waits_for_readers(self):
+        module = self._build(segment_bytes=500, compact_threshold=0.1)
+        for i in range(30):
+            module.transmit(measurement_topic, {"i": i})
+            module.transmit(details_topic, {"d": i})
+        drained = module.pop_all_messages()
+        self.assertEqual(next(drained), (measurement_topic, {"i": 0}))
+        module.pop(details_topic)
+        self.assertEqual(module._journal.compact(), 0)
+        self.assertEqual(len(list(drained)), 29)
+        self.assertIsNone(module.pop())
+
+
+if __name__ == "__main__":
+    unittest.main()
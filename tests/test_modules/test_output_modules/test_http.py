@@ -0,0 +1,197 @@
+import gzip
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.http import HTTP
+from tests.mock_output_module import MockOutputModule
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+
+
+class IngestServer(ThreadingHTTPServer):
+    """
+    Stand-in for a REST ingestion endpoint. Responds with the queued
+    statuses, then 200, and records every request it receives.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), IngestHandler)
+        self.statuses = []
+        self.requests = []
+        self.ports = set()
+        self.release = threading.Event()
+        self.release.set()
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            status = server.statuses.pop(0) if server.statuses else 200
+        server.release.wait(5)
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        with server.lock:
+            server.active -= 1
+            server.ports.add(self.client_address[1])
+            server.requests.append((self.path, json.loads(body), dict(self.headers)))
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestHTTP(unittest.TestCase):
+    def setUp(self):
+        self.server = IngestServer()
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.fallback = MockOutputModule()
+        self.error_holder = MagicMock()
+        self.modules = []
+
+    def tearDown(self):
+        self.server.release.set()
+        for module in self.modules:
+            module.disconnect()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _build(self, **kwargs):
+        kwargs.setdefault("url", f"{self.server.url}/leaf")
+        kwargs.setdefault("batch", {"max_count": 100, "max_linger_ms": 60000})
+        module = HTTP(fallback=self.fallback, error_holder=self.error_holder,
+                      backoff=0.01, **kwargs)
+        self.modules.append(module)
+        return module
+
+    def test_invalid_config(self):
+        with self.assertRaises(AdapterBuildError):
+            HTTP()
+        with self.assertRaises(AdapterBuildError):
+            HTTP(self.server.url, max_concurrency=0)
+        with self.assertRaises(AdapterBuildError):
+            HTTP(self.server.url, batch={"topics": {"#": {}}})
+
+    def test_batches_per_endpoint(self):
+        module = self._build(endpoints={"+/+/+/experiment/+/measurement/#":
+                                        f"{self.server.url}/points"})
+        self.assertTrue(module.transmit_many(
+            [(measurement_topic, {"i": i}) for i in range(3)] + [(details_topic, "d")]))
+        self.assertEqual(module.get_http_stats()["batched"], 4)
+        module.flush(measurement_topic)
+        module.flush(details_topic)
+        self.assertTrue(wait_for(lambda: module.get_http_stats()["requests"] == 2))
+        requests = {path: (messages, headers)
+                    for path, messages, headers in self.server.requests}
+        messages, headers = requests["/points"]
+        self.assertEqual(messages, [{"topic": measurement_topic, "data": {"i": i}}
+                                    for i in range(3)])
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertEqual(requests["/leaf"][0], [{"topic": details_topic, "data": "d"}])
+        stats = module.get_http_stats()
+        self.assertEqual((stats["requests"], stats["sent"]), (2, 4))
+        self.assertLess(stats["sent_bytes"], stats["raw_bytes"] + 100)
+
+    def test_reuses_connection(self):
+        module = self._build(batch={"max_count": 1}, max_concurrency=1)
+        for i in range(5):
+            module.transmit(details_topic, i)
+        self.assertTrue(wait_for(lambda: len(self.server.requests) == 5))
+        self.assertEqual(len(self.server.ports), 1)
+        self.assertEqual([m[0]["data"] for _, m, _ in self.server.requests], list(range(5)))
+
+    def test_bounded_concurrency(self):
+        self.server.release.clear()
+        module = self._build(batch={"max_count": 1}, max_concurrency=2)
+        for i in range(6):
+            module.transmit(details_topic, i)
+        self.assertTrue(wait_for(lambda: module.get_http_stats()["in_flight"] == 2))
+        time.sleep(0.1)
+        self.assertEqual(self.server.max_active, 2)
+        self.assertEqual(module.get_http_stats()["queued"], 4)
+        self.server.release.set()
+        self.assertTrue(wait_for(lambda: len(self.server.requests) == 6))
+
+    def test_retries_with_backoff(self):
+        self.server.statuses = [503, 429]
+        module = self._build(batch={"max_count": 1}, compress=False)
+        module.transmit(details_topic, "d")
+        self.assertTrue(wait_for(lambda: module.get_http_stats()["sent"] == 1))
+        self.assertEqual(module.get_http_stats()["retries"], 2)
+        self.assertNotIn("Content-Encoding", self.server.requests[0][2])
+        self.assertEqual(self.fallback.transmitted, [])
+
+    def test_persistent_failure_uses_fallback(self):
+        self.server.statuses = [500] * 3
+        module = self._build(batch={"max_count": 2}, max_retries=2)
+        module.transmit_many([(details_topic, 0), (details_topic, 1)])
+        self.assertTrue(wait_for(lambda: len(self.fallback.transmitted) == 2))
+        self.assertEqual(self.fallback.transmitted, [(details_topic, 0), (details_topic, 1)])
+        stats = module.get_http_stats()
+        self.assertEqual((stats["retries"], stats["failed"]), (2, 1))
+        self.error_holder.add_error.assert_called_once()
+
+    def test_client_error_is_not_retried(self):
+        self.server.statuses = [400]
+        module = self._build(batch={"max_count": 1})
+        module.transmit(details_topic, "d")
+        self.assertTrue(wait_for(lambda: len(self.fallback.transmitted) == 1))
+        self.assertEqual(module.get_http_stats()["retries"], 0)
+
+    def test_unreachable_endpoint_uses_fallback(self):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        module = self._build(url=f"http://127.0.0.1:{port}/leaf",
+                             batch={"max_count": 1}, max_retries=1)
+        module.transmit(details_topic, "d")
+        self.assertTrue(wait_for(lambda: len(self.fallback.transmitted) == 1))
+        self.assertEqual(module.get_http_stats()["retries"], 1)
+
+    def test_disconnect_sends_pending_batches(self):
+        module = self._build()
+        module.transmit(details_topic, "d")
+        module.disconnect()
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertFalse(module.is_connected())
+        self.assertEqual(self.fallback.transmitted, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import redis
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+from leaf.modules.output_modules.keydb import BACKLOG_INDEX_KEY
+from leaf.modules.output_modules.keydb import KEYDB
+from leaf.modules.output_modules.keydb import order_marker_key
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+db_num = 5
+
+
+def keydb_available() -> bool:
+    try:
+        return redis.Redis(host="localhost", port=6379, db=db_num).ping()
+    except redis.RedisError:
+        return False
+
+
+class TestKEYDBHealthCheck(unittest.TestCase):
+    @patch("leaf.modules.output_modules.keydb.redis.StrictRedis")
+    def test_is_connected_only_pings(self, mock_redis):
+        client = mock_redis.return_value
+        module = KEYDB("localhost", error_holder=MagicMock())
+        self.assertTrue(module.is_connected())
+        client.ping.side_effect = redis.ConnectionError("down")
+        self.assertFalse(module.is_connected())
+        client.keys.assert_not_called()
+        client.lpop.assert_not_called()
+        module.disconnect()
+        self.assertFalse(module.is_connected())
+
+
+@unittest.skipUnless(keydb_available(), "KeyDB is not running on localhost:6379")
+class TestKEYDBBacklogIndex(unittest.TestCase):
+    def setUp(self):
+        self.db = redis.Redis(host="localhost", port=6379, db=db_num)
+        self.db.flushdb()
+
+    def tearDown(self):
+        self.db.flushdb()
+
+    def _build(self, **kwargs):
+        return KEYDB("localhost", db=db_num, error_holder=MagicMock(), **kwargs)
+
+    def test_counts_follow_writes_and_reads(self):
+        for storage in ("list", "stream"):
+            self.db.flushdb()
+            module = self._build(storage=storage, stream_consumer="test")
+            for i in range(3):
+                module.transmit(measurement_topic, {"i": i})
+            module.transmit(details_topic, {"d": 1})
+            self.assertEqual(module.get_backlog(measurement_topic), 3)
+            self.assertEqual(module.get_backlog_topics(),
+                             {measurement_topic: 3, details_topic: 1})
+            self.assertEqual(module.pop(details_topic), (details_topic, {"d": 1}))
+            self.assertEqual(module.get_backlog(details_topic), 0)
+            self.assertEqual(len(list(module.pop_all_messages())), 3)
+            self.assertEqual(module.get_backlog_topics(), {})
+            self.assertFalse(self.db.exists(BACKLOG_INDEX_KEY))
+            self.assertIsNone(module.pop())
+
+    def test_failed_take_leaves_list_and_index(self):
+        module = self._build()
+        module.transmit(measurement_topic, {"i": 0})
+        module.transmit(measurement_topic, {"i": 1})
+        with patch.object(redis.client.Pipeline, "execute",
+                          side_effect=redis.ConnectionError("down")):
+            self.assertEqual(module.retrieve_many(measurement_topic), [])
+        self.assertEqual(self.db.llen(measurement_topic), 2)
+        self.assertEqual(module.get_backlog(measurement_topic), 2)
+        self.assertEqual(module.retrieve_many(measurement_topic), ['{"i": 0}', '{"i": 1}'])
+
+    def test_is_connected_keeps_messages(self):
+        module = self._build()
+        module.transmit(measurement_topic, {"i": 0})
+        self.assertTrue(module.is_connected())
+        self.assertEqual(self.db.llen(measurement_topic), 1)
+
+    def test_index_is_rebuilt_before_first_replay(self):
+        self.db.rpush(measurement_topic, '{"i": 0}', '{"i": 1}')
+        self.db.hset(BACKLOG_INDEX_KEY, details_topic, 4)
+        module = self._build()
+        self.assertEqual(module.get_backlog(measurement_topic), 0)
+        self.assertEqual(list(module.pop_all_messages()),
+                         [(measurement_topic, '{"i": 0}'), (measurement_topic, '{"i": 1}')])
+        self.assertFalse(self.db.exists(BACKLOG_INDEX_KEY))
+
+    def test_lists_written_newest_first_are_reordered(self):
+        # Older versions pushed to the head and kept no index.
+        for i in range(3):
+            self.db.lpush(measurement_topic, f'{{"i": {i}}}')
+        # Written by this version before the upgrade check ran.
+        self.db.rpush(details_topic, '{"d": 0}')
+        self.db.hset(BACKLOG_INDEX_KEY, details_topic, 1)
+        self.db.lpush(details_topic, '{"d": -1}')
+        module = self._build(reorder_legacy_lists=True)
+        self.assertEqual(module.get_backlog_topics(), {measurement_topic: 3, details_topic: 2})
+        module.transmit(measurement_topic, {"i": 3})
+        self.assertEqual(module.pop(measurement_topic), (measurement_topic, {"i": 0}))
+        replayed = list(module.pop_all_messages())
+        self.assertEqual([m for k, m in replayed if k == measurement_topic],
+                         ['{"i": 1}', '{"i": 2}', '{"i": 3}'])
+        self.assertEqual([m for k, m in replayed if k == details_topic],
+                         ['{"d": -1}', '{"d": 0}'])
+        self.assertTrue(self.db.exists(order_marker_key(BACKLOG_INDEX_KEY)))
+        # Only done once per database.
+        self.db.lpush(measurement_topic, "b", "a")
+        self._build(reorder_legacy_lists=True)
+        self.assertEqual(self.db.lrange(measurement_topic, 0, -1), [b"a", b"b"])
+
+    def test_lists_are_only_reordered_on_request(self):
+        self.db.lpush("unrelated", "x", "y")
+        module = self._build()
+        module.rebuild_backlog_index()
+        self.assertEqual(self.db.lrange("unrelated", 0, -1), [b"y", b"x"])
+        self.assertFalse(self.db.exists(order_marker_key(BACKLOG_INDEX_KEY)))
+
+    def test_replay_skips_other_keys(self):
+        self.db.rpush("unrelated", "x")
+        module = self._build()
+        module.rebuild_backlog_index()
+        module.transmit(measurement_topic, {"i": 0})
+        self.db.delete("unrelated")
+        with patch.object(module._client, "scan_iter") as scan_iter:
+            self.assertEqual([k for k, _ in module.pop_all_messages()], [measurement_topic])
+        scan_iter.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
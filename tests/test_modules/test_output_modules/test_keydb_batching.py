@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import redis
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+import leaf.modules.output_modules.keydb as keydb_output
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.keydb import KEYDB
+from tests.mock_output_module import MockOutputModule
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+
+
+class TestKEYDBBatching(unittest.TestCase):
+    def setUp(self):
+        self.redis = MagicMock()
+        self.pipeline = self.redis.pipeline.return_value
+        patcher = patch("leaf.modules.output_modules.keydb.redis.StrictRedis",
+                        return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.fallback = MockOutputModule()
+
+    def _build(self, **batch):
+        return KEYDB("localhost", fallback=self.fallback, error_holder=MagicMock(),
+                     batch=batch)
+
+    def test_full_batch_is_one_pipeline(self):
+        module = self._build(max_count=3, max_linger_ms=60000)
+        module.transmit(measurement_topic, {"v": 1})
+        module.transmit(details_topic, {"v": 2})
+        self.pipeline.execute.assert_not_called()
+        module.transmit(measurement_topic, {"v": 3})
+        self.pipeline.execute.assert_called_once()
+        self.assertEqual(
+            [c.args for c in self.pipeline.rpush.call_args_list],
+            [(measurement_topic, json.dumps({"v": 1}), json.dumps({"v": 3})),
+             (details_topic, json.dumps({"v": 2}))],
+        )
+        self.redis.rpush.assert_not_called()
+        self.redis.llen.assert_not_called()
+
+    def test_linger_flush(self):
+        module = self._build(max_count=100, max_linger_ms=50)
+        module.transmit(measurement_topic, {"v": 1})
+        deadline = time.time() + 2
+        while not self.pipeline.execute.called and time.time() < deadline:
+            time.sleep(0.01)
+        self.pipeline.execute.assert_called_once()
+
+    def test_failed_flush_uses_fallback(self):
+        self.pipeline.execute.side_effect = redis.ConnectionError("down")
+        module = self._build(max_count=2, max_linger_ms=60000)
+        module.transmit(measurement_topic, {"v": 1})
+        module.transmit(measurement_topic, '{"v": 2}')
+        self.assertEqual(self.fallback.transmitted,
+                         [(measurement_topic, '{"v": 1}'), (measurement_topic, '{"v": 2}')])
+
+    def test_disconnect_flushes(self):
+        module = self._build(max_linger_ms=60000)
+        module.transmit(measurement_topic, {"v": 1})
+        module.disconnect()
+        self.pipeline.execute.assert_called_once()
+
+    def test_per_topic_options_rejected(self):
+        with self.assertRaises(AdapterBuildError):
+            self._build(topics={"#": {"max_count": 2}})
+
+    def test_bulk_drain(self):
+        values = [json.dumps({"v": i}).encode() for i in range(5)]
+        self.redis.hscan_iter.return_value = [(measurement_topic.encode(), b"5")]
+
+        taken = MagicMock()
+        taken.lrange.side_effect = lambda key, start, end: values[start:end + 1]
+        taken.ltrim.side_effect = lambda key, start, end: values.__delitem__(
+            slice(0, start))
+        self.redis.transaction.side_effect = \
+            lambda take, *keys, value_from_callable=False: take(taken)
+
+        module = KEYDB("localhost")
+        with patch.object(keydb_output, "DRAIN_CHUNK_SIZE", 2):
+            drained = list(module.pop_all_messages())
+        self.assertEqual(drained, [(measurement_topic, json.dumps({"v": i}))
+                                   for i in range(5)])
+        self.assertEqual(taken.lrange.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import json
+import os
+import sys
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import redis
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.error_handler.exceptions import BufferEvictionError
+from leaf.error_handler.exceptions import SeverityLevel
+from leaf.modules.output_modules.keydb import BACKLOG_INDEX_KEY
+from leaf.modules.output_modules.keydb import KEYDB
+from leaf.utility.retention import RetentionLimits
+from leaf.utility.retention import build_retention_policy
+from tests.mock_output_module import MockOutputModule
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+db_num = 7
+
+
+def keydb_available() -> bool:
+    try:
+        return redis.Redis(host="localhost", port=6379, db=db_num).ping()
+    except redis.RedisError:
+        return False
+
+
+class TestRetentionPolicy(unittest.TestCase):
+    def test_build_policy(self):
+        policy = build_retention_policy({"topic": {"max_count": 10, "max_age": 1.5},
+                                         "total": {"max_bytes": 1024},
+                                         "policy": "spill", "check_interval": 1})
+        self.assertEqual(policy.topic, RetentionLimits(max_count=10, max_age=1.5))
+        self.assertEqual(policy.total, RetentionLimits(max_bytes=1024))
+        self.assertEqual((policy.policy, policy.check_interval), ("spill", 1.0))
+
+    def test_invalid_policy(self):
+        for config in ({}, {"topic": {"max_items": 1}}, {"topic": {"max_count": 0}},
+                       {"topic": {"max_count": 1.5}}, {"total": {"max_age": 10}},
+                       {"topic": {"max_count": 1}, "policy": "random"},
+                       {"topic": {"max_count": 1}, "check_interval": 0},
+                       {"topic": {"max_count": 1}, "caps": 1}):
+            with self.assertRaises(AdapterBuildError):
+                build_retention_policy(config)
+
+    def test_streams_are_rejected(self):
+        with self.assertRaises(AdapterBuildError):
+            KEYDB("localhost", storage="stream", retention={"topic": {"max_count": 1}})
+
+
+@unittest.skipUnless(keydb_available(), "KeyDB is not running on localhost:6379")
+class TestKEYDBRetention(unittest.TestCase):
+    def setUp(self):
+        self.db = redis.Redis(host="localhost", port=6379, db=db_num)
+        self.db.flushdb()
+        self.error_holder = MagicMock()
+
+    def tearDown(self):
+        self.db.flushdb()
+
+    def _build(self, policy="drop_oldest", **caps):
+        retention = {"policy": policy, "check_interval": 3600}
+        retention.update(caps)
+        return KEYDB("localhost", db=db_num, error_holder=self.error_holder,
+                     retention=retention)
+
+    def _stored(self, topic):
+        return [json.loads(m)["i"] for m in self.db.lrange(topic, 0, -1)]
+
+    def test_count_cap_drops_oldest(self):
+        module = self._build(topic={"max_count": 4})
+        for i in range(10):
+            module.transmit(measurement_topic, {"i": i})
+        self.assertEqual(module.enforce_retention(), 6)
+        self.assertEqual(self._stored(measurement_topic), [6, 7, 8, 9])
+        self.assertEqual(module.get_backlog(measurement_topic), 4)
+        self.assertEqual(module.get_eviction_stats(),
+                         {measurement_topic: {"topic max_count": 6}})
+        error = self.error_holder.add_error.call_args.args[0]
+        self.assertIsInstance(error, BufferEvictionError)
+        self.assertEqual(error.severity, SeverityLevel.INFO)
+        self.assertEqual(module.enforce_retention(), 0)
+
+    def test_byte_cap(self):
+        module = self._build(topic={"max_bytes": 40})
+        for i in range(10):
+            module.transmit(measurement_topic, {"i": i})
+        module.enforce_retention()
+        # Each message is 8 bytes.
+        self.assertEqual(self._stored(measurement_topic), [5, 6, 7, 8, 9])
+        module.retrieve(measurement_topic)
+        self.assertEqual(int(self.db.hget(f"{BACKLOG_INDEX_KEY}:bytes", measurement_topic)), 32)
+
+    def test_age_cap(self):
+        module = self._build(topic={"max_age": 600})
+        with patch("leaf.modules.output_modules.keydb.time.time",
+                   return_value=time.time() - 3600):
+            for i in range(5):
+                module.transmit(measurement_topic, {"i": i})
+        for i in range(5, 8):
+            module.transmit(measurement_topic, {"i": i})
+        # Messages already read aren't evicted again.
+        module.retrieve(measurement_topic)
+        self.assertEqual(module.enforce_retention(), 4)
+        self.assertEqual(self._stored(measurement_topic), [5, 6, 7])
+        self.assertEqual(module.enforce_retention(), 0)
+
+    def test_downsample_thins_measurements_only(self):
+        module = self._build("downsample", topic={"max_count": 6})
+        for i in range(10):
+            module.transmit(measurement_topic, {"i": i})
+            module.transmit(details_topic, {"i": i})
+        module.enforce_retention()
+        self.assertEqual(self._stored(measurement_topic), [0, 2, 4, 6, 8, 9])
+        self.assertEqual(self._stored(details_topic), [4, 5, 6, 7, 8, 9])
+
+    def test_spill_to_fallback(self):
+        module = self._build("spill", topic={"max_count": 8})
+        fallback = MockOutputModule()
+        module.set_fallback(fallback)
+        for i in range(10):
+            module.transmit(measurement_topic, {"i": i})
+        module.enforce_retention()
+        self.assertEqual(fallback.transmitted, [(measurement_topic, '{"i": 0}'),
+                                                (measurement_topic, '{"i": 1}')])
+
+    def test_total_cap_evicts_measurements_first(self):
+        module = self._build(total={"max_count": 8})
+        for i in range(10):
+            module.transmit(measurement_topic, {"i": i})
+        for i in range(3):
+            module.transmit(details_topic, {"i": i})
+        module.enforce_retention()
+        self.assertEqual(module.get_backlog_topics(),
+                         {measurement_topic: 5, details_topic: 3})
+        self.assertEqual(self._stored(measurement_topic), [5, 6, 7, 8, 9])
+
+    def test_drain_clears_index(self):
+        module = self._build(topic={"max_age": 600})
+        module.transmit(measurement_topic, {"i": 0})
+        list(module.pop_all_messages())
+        self.assertEqual(self.db.keys(f"{BACKLOG_INDEX_KEY}*"), [])
+
+    def test_disconnect_stops_retention_thread(self):
+        module = self._build(topic={"max_count": 4})
+        thread = module._retention_thread
+        self.assertTrue(thread.is_alive())
+        start = time.monotonic()
+        module.disconnect()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(thread.is_alive())
+        module.connect()
+        self.assertTrue(module._retention_thread.is_alive())
+        module.disconnect()
+
+
+if __name__ == "__main__":
+    unittest.main()
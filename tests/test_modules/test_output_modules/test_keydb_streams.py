@@ -0,0 +1,94 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+import redis
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.keydb import KEYDB
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+db_num = 4
+
+
+def keydb_available() -> bool:
+    try:
+        return redis.Redis(host="localhost", port=6379, db=db_num).ping()
+    except redis.RedisError:
+        return False
+
+
+@unittest.skipUnless(keydb_available(), "KeyDB is not running on localhost:6379")
+class TestKEYDBStreams(unittest.TestCase):
+    def setUp(self):
+        self.db = redis.Redis(host="localhost", port=6379, db=db_num)
+        self.db.flushdb()
+
+    def tearDown(self):
+        self.db.flushdb()
+
+    def _build(self, **kwargs):
+        kwargs.setdefault("stream_consumer", "test")
+        return KEYDB("localhost", db=db_num, storage="stream",
+                     error_holder=MagicMock(), **kwargs)
+
+    def test_invalid_options(self):
+        with self.assertRaises(AdapterBuildError):
+            KEYDB("localhost", db=db_num, storage="hash")
+        with self.assertRaises(AdapterBuildError):
+            self._build(stream_maxlen=0)
+
+    def test_replay_is_ordered(self):
+        module = self._build()
+        for i in range(5):
+            module.transmit(measurement_topic, {"i": i})
+        self.assertEqual(self.db.type(measurement_topic), b"stream")
+        self.assertEqual([module.retrieve(measurement_topic) for _ in range(6)],
+                         [f'{{"i": {i}}}' for i in range(5)] + [None])
+        self.assertEqual(self.db.xlen(measurement_topic), 0)
+
+    def test_unacknowledged_entries_are_redelivered(self):
+        module = self._build()
+        for i in range(3):
+            module.transmit(measurement_topic, {"i": i})
+        self.assertEqual(module.retrieve(measurement_topic), '{"i": 0}')
+        # The process dies before coming back for the next message.
+        restarted = self._build()
+        self.assertEqual(restarted.retrieve_many(measurement_topic, 10),
+                         ['{"i": 0}', '{"i": 1}', '{"i": 2}'])
+        self.assertEqual(restarted.retrieve_many(measurement_topic, 10), [])
+        self.assertEqual(self.db.xpending(measurement_topic, "leaf")["pending"], 0)
+
+    def test_drain_in_batches(self):
+        module = self._build(batch={"max_count": 100})
+        for i in range(50):
+            module.transmit(measurement_topic, {"i": i})
+        module.transmit(details_topic, {"name": "a"})
+        module.flush_batch()
+        drained = list(module.pop_all_messages())
+        self.assertEqual(len(drained), 51)
+        self.assertEqual([m for t, m in drained if t == measurement_topic],
+                         [f'{{"i": {i}}}' for i in range(50)])
+        self.assertEqual(self.db.xlen(measurement_topic), 0)
+
+    def test_maxlen_trims(self):
+        module = self._build(stream_maxlen=10)
+        for i in range(1000):
+            module.transmit(measurement_topic, {"i": i})
+        self.assertLess(self.db.xlen(measurement_topic), 1000)
+
+    def test_pop(self):
+        module = self._build()
+        module.transmit(details_topic, {"name": "a"})
+        self.assertEqual(module.pop(), (details_topic, {"name": "a"}))
+        self.assertIsNone(module.pop(details_topic))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from itertools import count
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+import paho.mqtt.client as mqtt
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules import mqtt as mqtt_output
+from leaf.modules.output_modules.mqtt import MQTT
+from tests.mock_output_module import MockOutputModule
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+error_topic = "institute/adapter/instance/error"
+
+
+class TestMQTTQoS(unittest.TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.is_connected.return_value = True
+        mids = count(1)
+        self.client.publish.side_effect = lambda *a, **k: MagicMock(
+            rc=mqtt.MQTT_ERR_SUCCESS, mid=next(mids))
+        self.fallback = MockOutputModule()
+
+    def _build(self, **kwargs):
+        with patch("paho.mqtt.client.Client", return_value=self.client):
+            return MQTT("localhost", fallback=self.fallback, **kwargs)
+
+    def test_invalid_qos(self):
+        with self.assertRaises(AdapterBuildError):
+            self._build(qos=3)
+        with self.assertRaises(AdapterBuildError):
+            self._build(qos={"details": 1})
+        with self.assertRaises(AdapterBuildError):
+            self._build(inflight_policy="drop")
+
+    def test_qos_per_topic_class(self):
+        module = self._build(qos={"measurement": 1, "error": 2})
+        module.transmit(measurement_topic, {"a": 1})
+        module.transmit(details_topic, {"a": 1})
+        module.transmit(error_topic, {"a": 1})
+        levels = [c.kwargs["qos"] for c in self.client.publish.call_args_list]
+        self.assertEqual(levels, [1, 0, 2])
+        self.assertEqual(module.get_inflight_stats()["inflight"], 2)
+
+    def test_acknowledged_messages_are_released(self):
+        module = self._build(qos=1)
+        module.transmit(measurement_topic, {"a": 1})
+        module.transmit(measurement_topic, {"a": 2})
+        module.on_publish(self.client, None, 1)
+        stats = module.get_inflight_stats()
+        self.assertEqual(stats["inflight"], 1)
+        self.assertEqual(stats["acked"], 1)
+
+    def test_ack_before_tracking(self):
+        module = self._build(qos=1)
+
+        def publish(*args, **kwargs):
+            # The network thread acknowledges before publish() returns.
+            module.on_publish(self.client, None, 1)
+            return MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=1)
+
+        self.client.publish.side_effect = publish
+        module.transmit(measurement_topic, {"a": 1})
+        stats = module.get_inflight_stats()
+        self.assertEqual(stats["inflight"], 0)
+        self.assertEqual(stats["acked"], 1)
+
+    def test_stale_ack_does_not_release_later_message(self):
+        module = self._build(qos={"measurement": 1})
+        # A QoS 0 acknowledgement, or one for another client, arriving
+        # while nothing is being published must not be kept for mid 1.
+        module.on_publish(self.client, None, 1)
+        module.transmit(measurement_topic, {"a": 1})
+        self.assertEqual(module.get_inflight_stats()["inflight"], 1)
+
+    def test_ack_from_before_publish_is_not_kept(self):
+        module = self._build(qos=1)
+        mids = iter([1, 2])
+
+        def publish(*args, **kwargs):
+            mid = next(mids)
+            if mid == 1:
+                # Mid 2 from an earlier message is acknowledged while
+                # the first publish is under way, then the id is reused.
+                module.on_publish(self.client, None, 2)
+                module.transmit(measurement_topic, {"a": 2})
+            return MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=mid)
+
+        self.client.publish.side_effect = publish
+        module.transmit(measurement_topic, {"a": 1})
+        self.assertEqual(module.get_inflight_stats()["inflight"], 2)
+
+    def test_window_blocks_until_acknowledged(self):
+        module = self._build(qos=1, max_inflight=2)
+        module.transmit(measurement_topic, "1")
+        module.transmit(measurement_topic, "2")
+
+        sender = threading.Thread(target=module.transmit,
+                                  args=(measurement_topic, "3"))
+        sender.start()
+        time.sleep(0.2)
+        self.assertEqual(self.client.publish.call_count, 2)
+        module.on_publish(self.client, None, 1)
+        sender.join(2)
+        self.assertEqual(self.client.publish.call_count, 3)
+
+    def test_full_window_uses_fallback(self):
+        module = self._build(qos=1, max_inflight=1)
+        module.transmit(measurement_topic, "1")
+        with patch.object(mqtt_output, "INFLIGHT_WAIT_TIMEOUT", 0.1):
+            module.transmit(measurement_topic, "2")
+        self.assertEqual(self.fallback.transmitted, [(measurement_topic, "2")])
+
+    def test_fallback_policy_spills_on_disconnect(self):
+        module = self._build(qos=1, inflight_policy="fallback")
+        module.transmit(measurement_topic, {"a": 1})
+        module.transmit(details_topic, {"a": 2})
+        module.client.reconnect = MagicMock()
+        with patch.object(mqtt_output, "FIRST_RECONNECT_DELAY", 0):
+            module.on_disconnect(self.client, None, None, 7)
+        self.assertEqual(self.fallback.transmitted,
+                         [(measurement_topic, '{"a": 1}'), (details_topic, '{"a": 2}')])
+        self.assertEqual(module.get_inflight_stats()["spilled"], 2)
+
+    def test_replay_policy_keeps_messages_for_client(self):
+        module = self._build(qos=1, inflight_policy="replay")
+        module.transmit(measurement_topic, {"a": 1})
+        module.client.reconnect = MagicMock()
+        with patch.object(mqtt_output, "FIRST_RECONNECT_DELAY", 0):
+            module.on_disconnect(self.client, None, None, 7)
+        self.assertEqual(self.fallback.transmitted, [])
+        self.assertEqual(module.get_inflight_stats()["inflight"], 1)
+        module.on_publish(self.client, None, 1)
+        self.assertEqual(module.get_inflight_stats()["acked"], 1)
+
+    def test_rejected_message_uses_fallback(self):
+        module = self._build(qos=1)
+        module.transmit(measurement_topic, "1")
+        module.on_publish(self.client, None, 1, MagicMock(is_failure=True))
+        self.assertEqual(self.fallback.transmitted, [(measurement_topic, "1")])
+
+
+if __name__ == "__main__":
+    unittest.main()
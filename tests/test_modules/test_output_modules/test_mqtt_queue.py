@@ -0,0 +1,144 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+import paho.mqtt.client as mqtt
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.mqtt import MQTT
+from leaf.utility.circuit_breaker import CircuitBreakerPolicy
+from tests.mock_output_module import MockOutputModule
+
+
+def build_mock_client(publish_delay: float = 0.0) -> MagicMock:
+    client = MagicMock()
+    client.is_connected.return_value = True
+
+    def publish(*args, **kwargs):
+        time.sleep(publish_delay)
+        return MagicMock(rc=mqtt.MQTT_ERR_SUCCESS)
+
+    client.publish.side_effect = publish
+    return client
+
+
+class TestMQTTPublishQueue(unittest.TestCase):
+    def _build(self, client, **kwargs):
+        with patch("paho.mqtt.client.Client", return_value=client):
+            return MQTT("localhost", **kwargs)
+
+    def test_invalid_queue_configuration(self):
+        with self.assertRaises(AdapterBuildError):
+            self._build(build_mock_client(), queue_size=-1)
+        with self.assertRaises(AdapterBuildError):
+            self._build(build_mock_client(), queue_size=5, queue_overflow="unknown")
+
+    def test_synchronous_by_default(self):
+        client = build_mock_client()
+        module = self._build(client)
+        self.assertTrue(module.transmit("test/topic", {"a": 1}))
+        client.publish.assert_called_once()
+        self.assertEqual(module.get_queue_stats(), {})
+
+    def test_transmit_does_not_block_caller(self):
+        client = build_mock_client(publish_delay=0.2)
+        module = self._build(client, queue_size=10)
+        start = time.monotonic()
+        for i in range(5):
+            self.assertTrue(module.transmit("test/topic", {"i": i}))
+        self.assertLess(time.monotonic() - start, 0.2)
+
+        module._wait_for_queue(5)
+        self.assertEqual(client.publish.call_count, 5)
+        stats = module.get_queue_stats()
+        self.assertEqual(stats["depth"], 0)
+        self.assertEqual(stats["published"], 5)
+        self.assertGreater(stats["latency_max"], 0.2)
+        self.assertGreaterEqual(stats["latency_max"], stats["latency_mean"])
+
+    def test_publish_order_is_preserved(self):
+        client = build_mock_client()
+        module = self._build(client, queue_size=100)
+        for i in range(50):
+            module.transmit("test/topic", str(i))
+        module._wait_for_queue(5)
+        payloads = [c.kwargs["payload"] for c in client.publish.call_args_list]
+        self.assertEqual(payloads, [str(i) for i in range(50)])
+
+    def test_drop_oldest_policy(self):
+        client = build_mock_client()
+        release = threading.Event()
+        client.publish.side_effect = lambda *a, **k: (release.wait(5),
+                                                      MagicMock(rc=0))[1]
+        module = self._build(client, queue_size=2, queue_overflow="drop_oldest")
+        for i in range(5):
+            self.assertTrue(module.transmit("test/topic", str(i)))
+            time.sleep(0.05)
+        release.set()
+        module._wait_for_queue(5)
+
+        payloads = [c.kwargs["payload"] for c in client.publish.call_args_list]
+        # The first message was taken by the publisher before the queue filled.
+        self.assertEqual(payloads, ["0", "3", "4"])
+        self.assertEqual(module.get_queue_stats()["dropped"], 2)
+
+    def test_fallback_policy(self):
+        client = build_mock_client()
+        release = threading.Event()
+        client.publish.side_effect = lambda *a, **k: (release.wait(5),
+                                                      MagicMock(rc=0))[1]
+        fallback = MockOutputModule()
+        module = self._build(client, queue_size=1, queue_overflow="fallback",
+                             fallback=fallback)
+        for i in range(4):
+            module.transmit("test/topic", str(i))
+            time.sleep(0.05)
+        release.set()
+        module._wait_for_queue(5)
+
+        self.assertEqual(fallback.transmitted, [("test/topic", "2"), ("test/topic", "3")])
+        self.assertEqual(module.get_queue_stats()["spilled"], 2)
+
+    def test_block_policy_times_out_to_fallback(self):
+        client = build_mock_client()
+        release = threading.Event()
+        client.publish.side_effect = lambda *a, **k: (release.wait(5),
+                                                      MagicMock(rc=0))[1]
+        fallback = MockOutputModule()
+        module = self._build(client, queue_size=1, queue_overflow="block",
+                             queue_timeout=0.1, fallback=fallback)
+        module.transmit("test/topic", "0")
+        time.sleep(0.05)
+        module.transmit("test/topic", "1")
+        module.transmit("test/topic", "2")
+        release.set()
+        module._wait_for_queue(5)
+        self.assertEqual(fallback.transmitted, [("test/topic", "2")])
+
+    def test_publisher_failures_open_circuit(self):
+        client = build_mock_client()
+        client.is_connected.return_value = False
+        fallback = MockOutputModule()
+        module = self._build(client, queue_size=10, fallback=fallback)
+        module.set_circuit_breaker(CircuitBreakerPolicy(min_calls=2))
+        module.transmit("test/topic", "1")
+        module.transmit("test/topic", "2")
+        module._wait_for_queue(5)
+        self.assertEqual(module.get_circuit_breaker_stats()["state"], "open")
+        # Short-circuited without being queued.
+        module.transmit("test/topic", "3")
+        self.assertEqual(fallback.transmitted,
+                         [("test/topic", "1"), ("test/topic", "2"), ("test/topic", "3")])
+        self.assertEqual(module.get_queue_stats()["enqueued"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
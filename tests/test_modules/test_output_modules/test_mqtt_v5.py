@@ -0,0 +1,118 @@
+import os
+import sys
+import unittest
+from itertools import count
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.mqtt import MQTT
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+other_topic = "institute/adapter/instance/experiment/exp1/measurement/ph"
+details_topic = "institute/adapter/instance/details"
+
+
+def connack_properties(topic_alias_maximum=10, receive_maximum=None):
+    properties = Properties(PacketTypes.CONNACK)
+    properties.TopicAliasMaximum = topic_alias_maximum
+    if receive_maximum is not None:
+        properties.ReceiveMaximum = receive_maximum
+    return properties
+
+
+class TestMQTTv5(unittest.TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.is_connected.return_value = True
+        mids = count(1)
+        self.client.publish.side_effect = lambda *a, **k: MagicMock(
+            rc=mqtt.MQTT_ERR_SUCCESS, mid=next(mids))
+
+    def _build(self, connack=None, **kwargs):
+        with patch("paho.mqtt.client.Client", return_value=self.client):
+            module = MQTT("localhost", protocol="v5", **kwargs)
+        if connack is not None:
+            module.on_connect(self.client, None, None, mqtt.ReasonCode(
+                PacketTypes.CONNACK, identifier=0), connack)
+        return module
+
+    def _sent(self):
+        return [(c.kwargs["topic"], getattr(c.kwargs["properties"], "TopicAlias", None))
+                for c in self.client.publish.call_args_list]
+
+    def test_v5_options_need_v5(self):
+        with patch("paho.mqtt.client.Client", return_value=self.client):
+            with self.assertRaises(AdapterBuildError):
+                MQTT("localhost", session_expiry=60)
+        with self.assertRaises(AdapterBuildError):
+            self._build(message_expiry={"details": 10})
+        with self.assertRaises(AdapterBuildError):
+            self._build(topic_alias_maximum=-1)
+
+    def test_hot_topics_get_aliases(self):
+        module = self._build(connack_properties())
+        for _ in range(3):
+            module.transmit(measurement_topic, {"a": 1})
+        self.assertEqual(self._sent(), [(measurement_topic, None),
+                                        (measurement_topic, 1),
+                                        ("", 1)])
+        self.assertEqual(module.get_topic_aliases(), {measurement_topic: 1})
+
+    def test_no_aliases_without_broker_support(self):
+        module = self._build(connack_properties(topic_alias_maximum=0))
+        for _ in range(3):
+            module.transmit(measurement_topic, {"a": 1})
+        self.assertEqual(self._sent(), [(measurement_topic, None)] * 3)
+
+    def test_least_recently_used_alias_is_reassigned(self):
+        module = self._build(connack_properties(topic_alias_maximum=1))
+        for topic in (measurement_topic, measurement_topic,
+                      other_topic, other_topic, measurement_topic):
+            module.transmit(topic, {"a": 1})
+        self.assertEqual(self._sent()[-3:], [(other_topic, None),
+                                             (other_topic, 1),
+                                             (measurement_topic, None)])
+        self.assertEqual(module.get_topic_aliases(), {other_topic: 1})
+
+    def test_qos_messages_use_full_topic(self):
+        module = self._build(connack_properties(), qos={"measurement": 1})
+        for _ in range(3):
+            module.transmit(measurement_topic, {"a": 1})
+        self.assertEqual(self._sent(), [(measurement_topic, None)] * 3)
+
+    def test_aliases_reset_on_disconnect(self):
+        module = self._build(connack_properties())
+        module.transmit(measurement_topic, {"a": 1})
+        module.transmit(measurement_topic, {"a": 1})
+        module.on_disconnect(self.client, None, None, mqtt.MQTT_ERR_SUCCESS)
+        self.assertEqual(module.get_topic_aliases(), {})
+        module.transmit(measurement_topic, {"a": 1})
+        self.assertEqual(self._sent()[-1], (measurement_topic, None))
+
+    def test_receive_maximum_narrows_window(self):
+        module = self._build(connack_properties(receive_maximum=5), max_inflight=20)
+        self.assertEqual(module.get_inflight_stats()["window"], 5)
+        self.client.max_inflight_messages_set.assert_called_once_with(20)
+
+    def test_expiry_properties(self):
+        module = self._build(session_expiry=3600, message_expiry={"measurement": 60})
+        properties = self.client.connect.call_args.kwargs["properties"]
+        self.assertEqual(properties.SessionExpiryInterval, 3600)
+        module.transmit(measurement_topic, {"a": 1})
+        module.transmit(details_topic, {"a": 1})
+        sent = [c.kwargs["properties"] for c in self.client.publish.call_args_list]
+        self.assertEqual(sent[0].MessageExpiryInterval, 60)
+        self.assertFalse(hasattr(sent[1], "MessageExpiryInterval"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.parquet import PARQUET
+from tests.mock_output_module import MockOutputModule
+
+try:
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    ds = None
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+
+
+def point(i, **fields):
+    return {"measurement": "od", "tags": {"well": "A01"},
+            "fields": fields or {"value": float(i)}, "timestamp": 1700000000 + i}
+
+
+@unittest.skipIf(ds is None, "pyarrow is not installed")
+class TestPARQUET(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _build(self, **kwargs):
+        module = PARQUET(self.directory, error_holder=MagicMock(), **kwargs)
+        self.addCleanup(module.disconnect)
+        return module
+
+    def _files(self, suffix=".parquet"):
+        return sorted(os.path.join(root, name)
+                      for root, _, names in os.walk(self.directory)
+                      for name in names if name.endswith(suffix))
+
+    def test_invalid_options(self):
+        for kwargs in ({"format": "csv"}, {"compression": "nope"},
+                       {"format": "arrow", "compression": "snappy"},
+                       {"row_group_size": 0}, {"flush_interval": -1}):
+            with self.assertRaises(AdapterBuildError):
+                PARQUET(self.directory, **kwargs)
+
+    def test_partitioned_row_groups(self):
+        module = self._build(row_group_size=4)
+        for i in range(10):
+            module.transmit(measurement_topic, point(i))
+        module.transmit("institute/adapter/other/experiment/exp1/measurement/od",
+                        '{"measurement": "od", "fields": {"value": 1}, '
+                        '"timestamp": "2024-01-02T03:04:05Z"}')
+        module.transmit("institute/adapter/instance/details", {"ignored": True})
+        # Full row groups are written, the rest waits in memory.
+        self.assertEqual(len(self._files(".parquet.tmp")), 1)
+        self.assertIsNone(module.pop())
+        module.disconnect()
+
+        files = self._files()
+        self.assertEqual([os.path.relpath(os.path.dirname(f), self.directory) for f in files],
+                         [os.path.join("instance_id=instance", "measurement=od",
+                                       "date=2023-11-14"),
+                          os.path.join("instance_id=other", "measurement=od",
+                                       "date=2024-01-02")])
+        self.assertEqual(pq.ParquetFile(files[0]).num_row_groups, 3)
+        rows = ds.dataset(self.directory, partitioning="hive").to_table() \
+            .sort_by("timestamp").to_pylist()
+        self.assertEqual(len(rows), 11)
+        self.assertEqual(rows[0]["experiment_id"], "exp1")
+        self.assertEqual(rows[0]["tag_well"], "A01")
+        self.assertEqual([r["field_value"] for r in rows[:10]], [float(i) for i in range(10)])
+        self.assertIsNone(rows[10]["tag_well"])
+
+    def test_rotation(self):
+        module = self._build(row_group_size=2, max_file_rows=4)
+        for i in range(10):
+            module.transmit(measurement_topic, [point(i)])
+        self.assertEqual(len(self._files()), 2)
+        # New columns that don't fit the open file start another one.
+        module.transmit(measurement_topic, point(10, other="x"))
+        module.transmit(measurement_topic, point(11, other="y"))
+        module.disconnect()
+        self.assertEqual([pq.ParquetFile(f).metadata.num_rows for f in self._files()],
+                         [4, 4, 2, 2])
+
+    def test_arrow_format(self):
+        module = self._build(format="arrow", compression="lz4")
+        module.transmit(measurement_topic, [point(i) for i in range(3)])
+        module.disconnect()
+        self.assertEqual(len(self._files(".arrow")), 1)
+        table = ds.dataset(self.directory, format="ipc", partitioning="hive").to_table()
+        self.assertEqual(table.num_rows, 3)
+
+    def test_flush_interval(self):
+        module = self._build(flush_interval=0.1)
+        module.transmit(measurement_topic, point(0))
+        for _ in range(50):
+            if self._files(".parquet.tmp"):
+                break
+            module._stopped.wait(0.05)
+        self.assertEqual(len(self._files(".parquet.tmp")), 1)
+
+    def test_failed_write_uses_fallback(self):
+        fallback = MockOutputModule()
+        module = self._build(row_group_size=2)
+        module.set_fallback(fallback)
+        with patch("leaf.modules.output_modules.parquet.pq.ParquetWriter",
+                   side_effect=OSError("disk full")):
+            module.transmit(measurement_topic, point(0))
+            module.transmit(measurement_topic, point(1))
+        self.assertEqual([topic for topic, _ in fallback.transmitted],
+                         [measurement_topic] * 2)
+        self.assertEqual(fallback.transmitted[1][1],
+                         {"measurement": "od", "tags": {"well": "A01"},
+                          "fields": {"value": 1.0}, "timestamp": 1700000001.0})
+
+    def test_failed_row_group_finishes_file(self):
+        fallback = MockOutputModule()
+        module = self._build(row_group_size=2)
+        module.set_fallback(fallback)
+        module.transmit(measurement_topic, [point(0), point(1)])
+        writer = module._partitions[next(iter(module._partitions))].writer
+        with patch.object(writer, "write_table", side_effect=OSError("disk full")):
+            module.transmit(measurement_topic, [point(2), point(3)])
+        # The rows written before stay in a finished file.
+        self.assertEqual(self._files(".parquet.tmp"), [])
+        self.assertEqual([pq.ParquetFile(f).metadata.num_rows for f in self._files()], [2])
+        self.assertEqual([p["fields"]["value"] for _, p in fallback.transmitted], [2.0, 3.0])
+
+    def test_unfinished_file_goes_to_fallback(self):
+        fallback = MockOutputModule()
+        module = self._build(row_group_size=2)
+        module.set_fallback(fallback)
+        module.transmit(measurement_topic, [point(0), point(1)])
+        with patch("leaf.modules.output_modules.parquet.os.replace",
+                   side_effect=OSError("read-only")):
+            module.disconnect()
+        self.assertEqual(self._files(".tmp"), [])
+        self.assertEqual(self._files(), [])
+        self.assertEqual(fallback.transmitted,
+                         [(measurement_topic, {"measurement": "od", "tags": {"well": "A01"},
+                                               "fields": {"value": float(i)},
+                                               "timestamp": 1700000000.0 + i})
+                          for i in range(2)])
+
+    def test_invalid_point_archives_nothing(self):
+        module = self._build()
+        self.assertFalse(module.transmit(measurement_topic, [point(0), {"timestamp": "x"}]))
+        self.assertEqual(module._partitions, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
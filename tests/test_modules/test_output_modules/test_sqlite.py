@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import redis
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+import leaf.modules.output_modules.sqlite as sqlite_output
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.keydb import KEYDB
+from leaf.modules.output_modules.sqlite import SQLITE
+from tests.mock_output_module import MockOutputModule
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+
+
+class TestSQLITE(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "buffer.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _build(self, **kwargs):
+        module = SQLITE(self.filename, error_holder=MagicMock(), **kwargs)
+        self.addCleanup(module.disconnect)
+        return module
+
+    def _rows(self):
+        with sqlite3.connect(self.filename) as connection:
+            return connection.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def test_invalid_options(self):
+        with self.assertRaises(AdapterBuildError):
+            SQLITE(self.filename, synchronous="SOMETIMES")
+        with self.assertRaises(AdapterBuildError):
+            SQLITE(self.filename, batch={"topics": {"#": {"max_count": 2}}})
+
+    def test_wal_mode_and_index(self):
+        module = self._build()
+        self.assertTrue(module.is_connected())
+        with sqlite3.connect(self.filename) as connection:
+            self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            indexes = [row[1] for row in connection.execute("PRAGMA index_list(messages)")]
+        self.assertIn("messages_topic_seq", indexes)
+
+    def test_fifo_per_topic(self):
+        module = self._build()
+        for i in range(3):
+            module.transmit(measurement_topic, {"i": i})
+            module.transmit(details_topic, json.dumps({"d": i}))
+        self.assertEqual(module.get_backlog_topics(), {measurement_topic: 3, details_topic: 3})
+        self.assertEqual([module.retrieve(details_topic) for _ in range(4)],
+                         [json.dumps({"d": i}) for i in range(3)] + [None])
+        self.assertEqual(module.pop(), (measurement_topic, {"i": 0}))
+        self.assertEqual(module.pop(measurement_topic), (measurement_topic, {"i": 1}))
+        self.assertEqual(module.get_backlog(measurement_topic), 1)
+
+    def test_batched_inserts(self):
+        module = self._build(batch={"max_count": 3, "max_linger_ms": 60000})
+        module.transmit(measurement_topic, {"i": 0})
+        module.transmit(measurement_topic, {"i": 1})
+        self.assertEqual(self._rows(), 0)
+        module.transmit(measurement_topic, {"i": 2})
+        self.assertEqual(self._rows(), 3)
+        module.transmit(measurement_topic, {"i": 3})
+        thread = module._linger_thread
+        module.disconnect()
+        self.assertEqual(self._rows(), 4)
+        self.assertFalse(thread.is_alive())
+
+    def test_linger_restarts_on_connect(self):
+        module = self._build(batch={"max_count": 10, "max_linger_ms": 50})
+        module.disconnect()
+        module.connect()
+        module.transmit(measurement_topic, {"i": 0})
+        for _ in range(100):
+            if self._rows():
+                break
+            time.sleep(0.02)
+        self.assertEqual(self._rows(), 1)
+
+    def test_drain_deletes_in_chunks(self):
+        module = self._build()
+        for i in range(7):
+            module.transmit(measurement_topic if i % 2 else details_topic, {"i": i})
+        with patch.object(sqlite_output, "DRAIN_CHUNK_SIZE", 3):
+            drained = module.pop_all_messages()
+            for _ in range(4):
+                next(drained)
+            # The first chunk is deleted once all of it was handed out.
+            self.assertEqual(self._rows(), 4)
+            rest = list(drained)
+        self.assertEqual([json.loads(m)["i"] for _, m in rest], [4, 5, 6])
+        self.assertEqual(self._rows(), 0)
+
+    def test_survives_restart(self):
+        module = self._build()
+        module.transmit(measurement_topic, {"i": 0})
+        module.disconnect()
+        self.assertFalse(module.is_connected())
+        self.assertEqual(self._build().pop(), (measurement_topic, {"i": 0}))
+
+    def test_failed_write_uses_fallback(self):
+        fallback = MockOutputModule()
+        module = SQLITE(self.filename, fallback=fallback, error_holder=MagicMock())
+        module._connection.execute("DROP TABLE messages")
+        self.assertTrue(module.transmit(measurement_topic, {"i": 0}))
+        self.assertEqual(fallback.transmitted, [(measurement_topic, '{"i": 0}')])
+        module.disconnect()
+
+    def test_fallback_of_keydb(self):
+        client = MagicMock()
+        client.pipeline.return_value.execute.side_effect = redis.ConnectionError("down")
+        client.hscan_iter.return_value = []
+        store = self._build()
+        with patch("leaf.modules.output_modules.keydb.redis.StrictRedis",
+                   return_value=client):
+            keydb = KEYDB("localhost", error_holder=MagicMock())
+        keydb.set_fallback(store)
+        keydb.transmit(measurement_topic, {"i": 0})
+        self.assertEqual(list(keydb.pop_all_messages()), [(measurement_topic, '{"i": 0}')])
+
+
+if __name__ == "__main__":
+    unittest.main()
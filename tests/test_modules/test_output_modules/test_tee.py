@@ -0,0 +1,166 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.tee import TEE
+from tests.mock_output_module import MockOutputModule
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+
+
+class SlowOutput(MockOutputModule):
+    """
+    Holds every transmit until released.
+    """
+    def __init__(self, fallback=None):
+        super().__init__(fallback=fallback)
+        self.release = threading.Event()
+
+    def transmit(self, topic, data=None):
+        self.release.wait(5)
+        return super().transmit(topic, data)
+
+
+class FailingOutput(MockOutputModule):
+    def transmit(self, topic, data=None):
+        raise RuntimeError("broken")
+
+
+class RetainOutput(MockOutputModule):
+    def __init__(self, fallback=None):
+        super().__init__(fallback=fallback)
+        self.retained = []
+
+    def transmit(self, topic, data=None, retain=False):
+        if retain:
+            self.retained.append((topic, data))
+        return super().transmit(topic, data)
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestTEE(unittest.TestCase):
+    def test_invalid_options(self):
+        for kwargs in ({"outputs": []}, {"outputs": ["MQTT"]},
+                       {"outputs": [MockOutputModule()], "overflow": "wait"},
+                       {"outputs": [{"output": MockOutputModule(), "queue_size": 0}]},
+                       {"outputs": [{"output": MockOutputModule(), "retries": 1}]}):
+            with self.assertRaises(AdapterBuildError):
+                TEE(**kwargs)
+
+    def test_delivers_to_every_output_in_order(self):
+        first, second = MockOutputModule(), MockOutputModule()
+        tee = TEE([first, second], error_holder=MagicMock())
+        for i in range(50):
+            self.assertTrue(tee.transmit(measurement_topic, {"i": i}))
+        tee.disconnect()
+        expected = [(measurement_topic, {"i": i}) for i in range(50)]
+        self.assertEqual(first.transmitted, expected)
+        self.assertEqual(second.transmitted, expected)
+        self.assertEqual(tee.get_fanout_stats()["MockOutputModule-1"]["sent"], 50)
+
+    def test_retain_only_passed_to_outputs_taking_it(self):
+        store, live = MockOutputModule(), RetainOutput()
+        tee = TEE([store, live])
+        tee.transmit(measurement_topic, {"i": 0}, retain=True)
+        tee.disconnect()
+        self.assertEqual(store.transmitted, [(measurement_topic, {"i": 0})])
+        self.assertEqual(live.retained, [(measurement_topic, {"i": 0})])
+        self.assertEqual(tee.get_fanout_stats()["MockOutputModule"]["failed"], 0)
+
+    def test_slow_output_does_not_delay_others(self):
+        fast = MockOutputModule()
+        archive_fallback = MockOutputModule()
+        slow = SlowOutput(fallback=archive_fallback)
+        tee = TEE([fast, {"output": slow, "queue_size": 2}])
+        start = time.monotonic()
+        tee.transmit(measurement_topic, 0)
+        self.assertTrue(wait_for(lambda: tee.get_fanout_stats()["SlowOutput"]["queued"] == 0))
+        for i in range(1, 5):
+            tee.transmit(measurement_topic, i)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertTrue(wait_for(lambda: len(fast.transmitted) == 5))
+        # One message is with the slow output, two are queued and the
+        # rest overflowed to its fallback.
+        self.assertEqual([data for _, data in archive_fallback.transmitted], [3, 4])
+        slow.release.set()
+        tee.disconnect()
+        self.assertEqual([data for _, data in slow.transmitted], [0, 1, 2])
+        stats = tee.get_fanout_stats()["SlowOutput"]
+        self.assertEqual((stats["sent"], stats["fallback"], stats["max_queued"]), (3, 2, 2))
+
+    def test_drop_and_block_overflow(self):
+        slow = SlowOutput()
+        tee = TEE([slow], queue_size=1, overflow="drop")
+        tee.transmit(measurement_topic, 0)
+        self.assertTrue(wait_for(lambda: tee.get_fanout_stats()["SlowOutput"]["queued"] == 0))
+        results = [tee.transmit(measurement_topic, i) for i in range(1, 4)]
+        self.assertEqual(results.count(False), 2)
+        slow.release.set()
+        tee.disconnect()
+        self.assertEqual(tee.get_fanout_stats()["SlowOutput"]["dropped"], 2)
+
+        blocked = SlowOutput()
+        tee = TEE([blocked], queue_size=1, overflow="block", block_timeout=2)
+        tee.transmit(measurement_topic, 0)
+        tee.transmit(measurement_topic, 1)
+        threading.Timer(0.2, blocked.release.set).start()
+        self.assertTrue(tee.transmit(measurement_topic, 2))
+        tee.disconnect()
+        self.assertEqual([data for _, data in blocked.transmitted], [0, 1, 2])
+
+    def test_failing_output_is_isolated(self):
+        healthy = MockOutputModule()
+        tee = TEE([FailingOutput(), healthy])
+        for i in range(3):
+            tee.transmit(measurement_topic, i)
+        tee.disconnect()
+        self.assertEqual(len(healthy.transmitted), 3)
+        self.assertEqual(tee.get_fanout_stats()["FailingOutput"]["failed"], 3)
+
+    def test_disabled_output_uses_its_fallback(self):
+        fallback = MockOutputModule()
+        disabled = MockOutputModule(fallback=fallback)
+        disabled.disable()
+        tee = TEE([disabled])
+        tee.transmit(measurement_topic, 0)
+        tee.disconnect()
+        self.assertEqual(disabled.transmitted, [])
+        self.assertEqual(fallback.transmitted, [(measurement_topic, 0)])
+
+    def test_children_replay_their_own_fallbacks(self):
+        fallback = MockOutputModule()
+        recovered, healthy = MockOutputModule(fallback=fallback), MockOutputModule()
+        tee = TEE([recovered, healthy])
+        fallback.transmit(measurement_topic, 0)
+        fallback.transmit(measurement_topic, 1)
+        outcomes = tee.replay_buffered()
+        self.assertEqual(recovered.transmitted, [(measurement_topic, 0), (measurement_topic, 1)])
+        self.assertEqual(healthy.transmitted, [])
+        self.assertEqual(fallback.messages, [])
+        self.assertEqual(outcomes["MockOutputModule"]["replayed"], 2)
+        self.assertEqual(tee.get_replay_progress()["MockOutputModule"]["replayed"], 2)
+
+    def test_pop_all_messages_reads_every_child(self):
+        fallback = MockOutputModule()
+        tee = TEE([MockOutputModule(fallback=fallback), MockOutputModule()])
+        fallback.transmit(measurement_topic, 0)
+        self.assertIsNone(tee.pop())
+        self.assertEqual(list(tee.pop_all_messages()), [(measurement_topic, 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
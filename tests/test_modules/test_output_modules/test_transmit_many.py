@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import paho.mqtt.client as mqtt
+import redis
+
+sys.path.insert(0, os.path.join(".."))
+sys.path.insert(0, os.path.join("..", ".."))
+sys.path.insert(0, os.path.join("..", "..", ".."))
+
+from leaf.modules.output_modules.file import FILE
+from leaf.modules.output_modules.keydb import KEYDB
+from leaf.modules.output_modules.mqtt import MQTT
+from leaf.modules.output_modules.sqlite import SQLITE
+from leaf.utility.batching import unbatch
+from leaf.utility.circuit_breaker import CircuitBreakerPolicy
+from tests.mock_output_module import MockOutputModule
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+details_topic = "institute/adapter/instance/details"
+
+messages = [(measurement_topic, {"i": 0}), (details_topic, {"d": 0}),
+            (measurement_topic, {"i": 1})]
+
+
+class TestTransmitMany(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fallback = MockOutputModule()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_default_transmits_each_message(self):
+        output = MockOutputModule()
+        self.assertTrue(output.transmit_many(iter(messages)))
+        self.assertEqual(output.transmitted, messages)
+
+    def test_open_circuit_short_circuits(self):
+        output = MockOutputModule(fallback=self.fallback)
+        output.set_circuit_breaker(CircuitBreakerPolicy(min_calls=1))
+        output._breaker.record_failure()
+        self.assertTrue(output.transmit_many(messages))
+        self.assertEqual(output.transmitted, [])
+        self.assertEqual(self.fallback.transmitted, messages)
+
+    def test_keydb_one_pipeline(self):
+        client = MagicMock()
+        pipeline = client.pipeline.return_value
+        with patch("leaf.modules.output_modules.keydb.redis.StrictRedis",
+                   return_value=client):
+            module = KEYDB("localhost", fallback=self.fallback, error_holder=MagicMock())
+        self.assertTrue(module.transmit_many(messages))
+        pipeline.execute.assert_called_once()
+        self.assertEqual([c.args for c in pipeline.rpush.call_args_list],
+                         [(measurement_topic, '{"i": 0}', '{"i": 1}'),
+                          (details_topic, '{"d": 0}')])
+
+        pipeline.execute.side_effect = redis.ConnectionError("down")
+        self.assertTrue(module.transmit_many(messages))
+        self.assertEqual(sorted(self.fallback.transmitted), sorted(
+            (topic, json.dumps(data)) for topic, data in messages))
+
+    def test_file_journal_one_append(self):
+        module = FILE(os.path.join(self.directory, "journal"), storage="journal",
+                      fsync="always", error_holder=MagicMock())
+        with patch("leaf.utility.durability.os.fsync") as fsync:
+            module.transmit(details_topic, {"d": -1})
+            count = fsync.call_count
+            self.assertTrue(module.transmit_many(messages))
+            self.assertEqual(fsync.call_count, count + 1)
+        self.assertEqual(module.retrieve(measurement_topic), {"i": 0})
+        self.assertEqual([m for _, m in module.pop_all_messages()],
+                         [{"d": -1}, {"d": 0}, {"i": 1}])
+        module.disconnect()
+
+    def test_file_document_one_write(self):
+        filename = os.path.join(self.directory, "buffer.json")
+        module = FILE(filename, error_holder=MagicMock())
+        with patch.object(module, "_write_document", wraps=module._write_document) as write:
+            self.assertTrue(module.transmit_many(messages))
+        write.assert_called_once()
+        with open(filename) as f:
+            self.assertEqual(json.load(f), {measurement_topic: [{"i": 0}, {"i": 1}],
+                                            details_topic: [{"d": 0}]})
+
+    def test_sqlite_one_transaction(self):
+        module = SQLITE(os.path.join(self.directory, "buffer.db"),
+                        fallback=self.fallback, error_holder=MagicMock())
+        with patch.object(module, "_insert", wraps=module._insert) as insert:
+            self.assertTrue(module.transmit_many(messages))
+        insert.assert_called_once()
+        self.assertEqual([m for _, m in module.pop_all_messages()],
+                         [json.dumps(data) for _, data in messages])
+        module.disconnect()
+
+    def test_mqtt_batched_topics(self):
+        client = MagicMock()
+        client.is_connected.return_value = True
+        client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS)
+        with patch("paho.mqtt.client.Client", return_value=client):
+            module = MQTT("localhost", batch={"max_count": 100, "max_linger_ms": 60000},
+                          fallback=self.fallback)
+        self.assertTrue(module.transmit_many(messages))
+        self.assertTrue(module.transmit_many(messages))
+        # Batches coalesce across calls until their policy flushes them.
+        self.assertEqual([c.kwargs["topic"] for c in client.publish.call_args_list],
+                         [details_topic, details_topic])
+        module.flush_batch()
+        published = {c.kwargs["topic"]: json.loads(c.kwargs["payload"])
+                     for c in client.publish.call_args_list}
+        self.assertEqual(client.publish.call_count, 3)
+        self.assertEqual(unbatch(published[measurement_topic]),
+                         [{"i": 0}, {"i": 1}, {"i": 0}, {"i": 1}])
+        self.assertEqual(published[details_topic], {"d": 0})
+
+        client.is_connected.return_value = False
+        self.assertTrue(module.transmit_many([(details_topic, {"d": 1}),
+                                              (details_topic, {"d": 2})]))
+        self.assertEqual(self.fallback.transmitted,
+                         [(details_topic, {"d": 1}), (details_topic, {"d": 2})])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+
+import paho.mqtt.client as mqtt
+
+from leaf.modules.output_modules.mqtt import MQTT
+from leaf.utility.mqtt_connection import acquire_connection
+from leaf.utility.mqtt_connection import get_connection_stats
+from leaf.utility.mqtt_connection import release_connection
+
+
+def build_message(topic: str) -> mqtt.MQTTMessage:
+    message = mqtt.MQTTMessage(topic=topic.encode())
+    message.payload = b"{}"
+    return message
+
+
+class TestSharedMQTTConnection(unittest.TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.is_connected.return_value = True
+        self.client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS)
+        patcher = patch("paho.mqtt.client.Client", return_value=self.client)
+        self.client_class = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_outputs_share_one_client(self):
+        first = MQTT("localhost", shared_connection=True)
+        second = MQTT("localhost", shared_connection=True)
+        other = MQTT("localhost", port=1884, shared_connection=True)
+        self.assertEqual(self.client_class.call_count, 2)
+        self.assertIs(first.client, second.client)
+        self.client.connect.assert_any_call("localhost", 1883, 60)
+        self.assertEqual(get_connection_stats(), {"localhost:1883": 2, "localhost:1884": 1})
+
+        first.disconnect()
+        self.client.loop_stop.assert_not_called()
+        second.disconnect()
+        other.disconnect()
+        self.assertEqual(self.client.loop_stop.call_count, 2)
+        self.assertEqual(get_connection_stats(), {})
+
+    def test_messages_are_routed_to_subscribers(self):
+        first, second = object(), object()
+        received = {"first": [], "second": []}
+        connection = acquire_connection(
+            first, "localhost",
+            on_message=lambda c, u, m: received["first"].append(m.topic))
+        acquire_connection(
+            second, "localhost",
+            on_message=lambda c, u, m: received["second"].append(m.topic))
+        connection.subscribe(first, "a/#")
+        connection.subscribe(second, "a/b")
+        connection.subscribe(second, "a/+")
+
+        connection._on_message(self.client, None, build_message("a/b"))
+        connection._on_message(self.client, None, build_message("a/c/d"))
+        self.assertEqual(received, {"first": ["a/b", "a/c/d"], "second": ["a/b"]})
+
+        release_connection(connection, first)
+        release_connection(connection, second)
+
+    def test_subscriptions_are_reference_counted(self):
+        first, second = object(), object()
+        connection = acquire_connection(first, "localhost")
+        acquire_connection(second, "localhost")
+        connection.subscribe(first, "a/b")
+        connection.subscribe(second, "a/b")
+        self.client.subscribe.assert_called_once_with("a/b", 0)
+
+        connection.unsubscribe(first, "a/b")
+        self.client.unsubscribe.assert_not_called()
+        release_connection(connection, second)
+        self.client.unsubscribe.assert_called_once_with("a/b")
+
+        connection._on_connect(self.client, None, None, 0)
+        self.client.subscribe.assert_called_once()
+        release_connection(connection, first)
+
+    def test_subscriptions_are_renewed_on_connect(self):
+        consumer = object()
+        connection = acquire_connection(consumer, "localhost")
+        self.client.is_connected.return_value = False
+        connection.subscribe(consumer, "a/b", qos=1)
+        self.client.subscribe.assert_not_called()
+        connection._on_connect(self.client, None, None, 0)
+        self.client.subscribe.assert_called_once_with("a/b", 1)
+        release_connection(connection, consumer)
+
+    def test_inflight_window_is_shared(self):
+        first, second, late = object(), object(), object()
+        connection = acquire_connection(first, "localhost")
+        acquire_connection(second, "localhost")
+        connection.set_max_inflight(first, 10)
+        connection.set_max_inflight(second, 5)
+        self.client.max_inflight_messages_set.assert_called_with(15)
+        connection.connect(first)
+        acquire_connection(late, "localhost")
+        connection.set_max_inflight(late, 5)
+        self.assertEqual(self.client.max_inflight_messages_set.call_count, 2)
+        for consumer in (first, second, late):
+            release_connection(connection, consumer)
+
+    def test_acks_reach_the_module(self):
+        first = MQTT("localhost", shared_connection=True, qos=1)
+        second = MQTT("localhost", shared_connection=True, qos=1)
+        self.client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=7)
+        first.transmit("a/b", "1")
+        second._connection._on_publish(self.client, None, 7)
+        self.assertEqual(first.get_inflight_stats()["acked"], 1)
+        first.disconnect()
+        second.disconnect()
+
+    def test_acks_go_to_the_publisher(self):
+        first, second = object(), object()
+        acks = {"first": [], "second": []}
+        connection = acquire_connection(
+            first, "localhost", on_publish=lambda c, u, mid, *a: acks["first"].append(mid))
+        acquire_connection(
+            second, "localhost", on_publish=lambda c, u, mid, *a: acks["second"].append(mid))
+        self.client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=3)
+        connection.publish(second, topic="a/b", payload="1", qos=1)
+        connection._on_publish(self.client, None, 3)
+        # Unknown ids, e.g. from before the connection was shared, go nowhere.
+        connection._on_publish(self.client, None, 4)
+        self.assertEqual(acks, {"first": [], "second": [3]})
+        release_connection(connection, first)
+        release_connection(connection, second)
+
+    def test_ack_before_publish_returns(self):
+        consumer = object()
+        acks = []
+        connection = acquire_connection(
+            consumer, "localhost", on_publish=lambda c, u, mid, *a: acks.append(mid))
+
+        def publish(**kwargs):
+            # The network thread acknowledges before publish() returns.
+            connection._on_publish(self.client, None, 5)
+            return MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=5)
+
+        self.client.publish.side_effect = publish
+        connection.publish(consumer, topic="a/b", payload="1")
+        self.assertEqual(acks, [5])
+        self.assertEqual(connection._unclaimed_acks, {})
+        release_connection(connection, consumer)
+
+
+if __name__ == "__main__":
+    unittest.main()
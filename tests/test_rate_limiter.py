@@ -0,0 +1,186 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(".."))
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.utility.circuit_breaker import CircuitBreakerPolicy
+from leaf.utility.rate_limiter import LaneLimit
+from leaf.utility.rate_limiter import RateLimitedOutput
+from leaf.utility.rate_limiter import TokenBucket
+from leaf.utility.rate_limiter import build_rate_limit_policy
+from tests.mock_output_module import MockOutputModule
+
+measurement_topic = "institute/adapter/instance/experiment/exp1/measurement/od"
+error_topic = "institute/adapter/instance/error"
+details_topic = "institute/adapter/instance/details"
+
+
+class BlockingOutput(MockOutputModule):
+    """
+    Output that holds every transmit until released.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.release = threading.Event()
+
+    def transmit(self, topic, data=None):
+        self.release.wait(5)
+        return super().transmit(topic, data)
+
+
+class TestRateLimitPolicy(unittest.TestCase):
+    def test_build_policy(self):
+        policy = build_rate_limit_policy({"error": 5,
+                                          "measurement": {"rate": 100, "burst": 500},
+                                          "lane_size": 10, "overflow": "fallback"})
+        self.assertIsNone(policy.lanes["control"])
+        self.assertEqual(policy.lanes["error"], LaneLimit(5.0, 5.0))
+        self.assertEqual(policy.lanes["measurement"], LaneLimit(100.0, 500.0))
+        self.assertEqual((policy.lane_size, policy.overflow), (10, "fallback"))
+
+    def test_invalid_policy(self):
+        for config in ({"errors": 5}, {"error": 0}, {"error": {"burst": 5}},
+                       {"error": {"rate": 1, "burst": 0.5}}, {"overflow": "block"},
+                       {"lane_size": 0}):
+            with self.assertRaises(AdapterBuildError):
+                build_rate_limit_policy(config)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(LaneLimit(rate=10, burst=2))
+        now = time.monotonic()
+        self.assertTrue(bucket.try_take(now))
+        self.assertTrue(bucket.try_take(now))
+        self.assertFalse(bucket.try_take(now))
+        self.assertAlmostEqual(bucket.wait_time(now), 0.1, places=2)
+        self.assertTrue(bucket.try_take(now + 0.11))
+
+
+class TestRateLimitedOutput(unittest.TestCase):
+    def setUp(self):
+        self.output = BlockingOutput()
+        self._limiters = []
+
+    def tearDown(self):
+        self.output.release.set()
+        for limiter in self._limiters:
+            limiter.disconnect()
+
+    def _build(self, config):
+        limiter = RateLimitedOutput(self.output, build_rate_limit_policy(config))
+        self._limiters.append(limiter)
+        return limiter
+
+    def _wait_sent(self, count, timeout=2):
+        deadline = time.time() + timeout
+        while len(self.output.transmitted) < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_lanes_are_served_by_priority(self):
+        limiter = self._build({})
+        # The first message holds the dispatcher while the lanes fill.
+        limiter.transmit(measurement_topic, "m0")
+        time.sleep(0.05)
+        limiter.transmit(measurement_topic, "m1")
+        limiter.transmit(error_topic, "e1")
+        limiter.transmit(details_topic, "c1")
+        self.output.release.set()
+        self._wait_sent(4)
+        self.assertEqual([d for _, d in self.output.transmitted], ["m0", "c1", "e1", "m1"])
+
+    def test_error_storm_does_not_starve_measurements(self):
+        self.output.release.set()
+        limiter = self._build({"error": {"rate": 20, "burst": 1}})
+        for i in range(50):
+            limiter.transmit(error_topic, i)
+        limiter.transmit(measurement_topic, "m")
+        self._wait_sent(3, timeout=0.5)
+        topics = [t for t, _ in self.output.transmitted]
+        self.assertIn(measurement_topic, topics)
+        self.assertLess(topics.count(error_topic), 20)
+        stats = limiter.get_rate_limit_stats()
+        self.assertGreater(stats["error"]["queued"], 0)
+        self.assertEqual(stats["measurement"]["sent"], 1)
+
+    def _wait_counted(self, limiter, lane, count, timeout=2):
+        deadline = time.time() + timeout
+        while limiter.get_rate_limit_stats()[lane]["sent"] < count and \
+                time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_limited_lane_counts_delays(self):
+        self.output.release.set()
+        # A token every 0.2s, so the last two messages are always held.
+        limiter = self._build({"measurement": {"rate": 5, "burst": 1}})
+        for i in range(3):
+            limiter.transmit(measurement_topic, i)
+        self._wait_counted(limiter, "measurement", 3)
+        stats = limiter.get_rate_limit_stats()["measurement"]
+        self.assertEqual(stats["sent"], 3)
+        self.assertEqual(stats["delayed"], 2)
+        self.assertGreater(stats["delay_max"], 0.1)
+        self.assertLess(stats["delay_total"], 0.7)
+        # The lane is idle again, a message with a token isn't delayed.
+        time.sleep(0.25)
+        limiter.transmit(measurement_topic, 3)
+        self._wait_counted(limiter, "measurement", 4)
+        self.assertEqual(limiter.get_rate_limit_stats()["measurement"]["delayed"], 2)
+
+    def test_full_lane_drops_or_uses_fallback(self):
+        limiter = self._build({"lane_size": 1})
+        limiter.transmit(measurement_topic, "m0")
+        time.sleep(0.05)
+        self.assertTrue(limiter.transmit(measurement_topic, "m1"))
+        self.assertFalse(limiter.transmit(measurement_topic, "m2"))
+        self.assertEqual(limiter.get_rate_limit_stats()["measurement"]["dropped"], 1)
+
+        fallback = MockOutputModule()
+        self.output.set_fallback(fallback)
+        limiter = self._build({"lane_size": 1, "overflow": "fallback"})
+        limiter.transmit(measurement_topic, "m3")
+        time.sleep(0.05)
+        limiter.transmit(measurement_topic, "m4")
+        self.assertTrue(limiter.transmit(measurement_topic, "m5"))
+        self.assertEqual(fallback.transmitted, [(measurement_topic, "m5")])
+
+    def test_disconnect_drains_lanes(self):
+        self.output.release.set()
+        limiter = self._build({"measurement": {"rate": 1, "burst": 1}})
+        for i in range(5):
+            limiter.transmit(measurement_topic, i)
+        limiter.disconnect()
+        self.assertEqual(len(self.output.transmitted), 5)
+        limiter.transmit(measurement_topic, 5)
+        self._wait_sent(6)
+        self.assertEqual(len(self.output.transmitted), 6)
+
+    def test_retain_to_output_without_it(self):
+        self.output.release.set()
+        limiter = self._build({})
+        limiter.transmit(details_topic, "c0", retain=True)
+        limiter.disconnect()
+        self.assertEqual(self.output.transmitted, [(details_topic, "c0")])
+
+    def test_calls_pass_through(self):
+        self.output.release.set()
+        limiter = self._build({})
+        self.assertTrue(limiter.disable())
+        self.assertFalse(self.output.is_enabled())
+        self.assertTrue(limiter.enable())
+        self.assertTrue(self.output.is_enabled())
+        limiter.set_circuit_breaker(CircuitBreakerPolicy())
+        self.assertEqual(limiter.get_circuit_breaker_stats()["state"], "closed")
+        self.assertIsNotNone(self.output.get_circuit_breaker_stats())
+        fallback = MockOutputModule()
+        fallback.messages.append((measurement_topic, "m0"))
+        self.output.set_fallback(fallback)
+        self.assertEqual(limiter.replay_buffered()["replayed"], 1)
+        self.assertIn((measurement_topic, "m0"), self.output.transmitted)
+        self.assertIsNotNone(limiter.get_replay_progress())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+
+import paho.mqtt.client as mqtt
+
+import leaf.modules.output_modules.mqtt as mqtt_output
+from leaf.modules.output_modules.mqtt import MQTT
+from leaf.utility.reconnect import ConnectionState
+from leaf.utility.reconnect import ReconnectScheduler
+
+
+class TestReconnectScheduler(unittest.TestCase):
+    def test_delay_backs_off_with_jitter(self):
+        scheduler = ReconnectScheduler(MagicMock(), MagicMock(), first_delay=1,
+                                       max_delay=8, jitter=0.5)
+        for attempts, ceiling in ((0, 1), (1, 2), (2, 4), (3, 8), (6, 8)):
+            scheduler._attempts = attempts
+            delays = [scheduler._delay() for _ in range(200)]
+            self.assertTrue(all(ceiling / 2 <= d <= ceiling for d in delays))
+            # Clients mustn't retry in lock-step.
+            self.assertGreater(len(set(delays)), 1)
+
+    def test_retries_until_attempt_succeeds(self):
+        reconnect = MagicMock(side_effect=[OSError("down"), OSError("down"), None])
+        scheduler = ReconnectScheduler(reconnect, MagicMock(), first_delay=0)
+        scheduler.schedule()
+        deadline = time.time() + 2
+        while reconnect.call_count < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(reconnect.call_count, 3)
+        self.assertTrue(scheduler.is_reconnecting())
+        self.assertEqual(scheduler.connected(), 3)
+        self.assertFalse(scheduler.is_reconnecting())
+        self.assertEqual(scheduler.get_stats()["total_attempts"], 3)
+
+    def test_gives_up_after_max_attempts(self):
+        reconnect = MagicMock(side_effect=OSError("down"))
+        give_up = MagicMock()
+        scheduler = ReconnectScheduler(reconnect, give_up, first_delay=0, max_attempts=4)
+        scheduler.schedule()
+        self.assertTrue(scheduler.wait_idle(2))
+        self.assertEqual(reconnect.call_count, 4)
+        give_up.assert_called_once()
+
+    def test_refused_attempts_count_towards_max(self):
+        give_up = MagicMock()
+        scheduler = ReconnectScheduler(MagicMock(), give_up, first_delay=0, max_attempts=2)
+        for _ in range(3):
+            scheduler.schedule()
+            time.sleep(0.1)
+        give_up.assert_called_once()
+
+    def test_schedule_does_not_block(self):
+        reconnect = MagicMock()
+        scheduler = ReconnectScheduler(reconnect, MagicMock(), first_delay=10)
+        start = time.monotonic()
+        scheduler.schedule()
+        scheduler.schedule()
+        self.assertLess(time.monotonic() - start, 1)
+        scheduler.cancel()
+        self.assertTrue(scheduler.wait_idle(0))
+        reconnect.assert_not_called()
+
+
+class TestConnectionState(unittest.TestCase):
+    def test_outage_metrics(self):
+        state = ConnectionState()
+        self.assertIsNone(state.set_connected())
+        state.set_disconnected()
+        time.sleep(0.05)
+        self.assertGreater(state.get_outage_stats()["current_outage"], 0)
+        outage = state.set_connected()
+        self.assertGreaterEqual(outage, 0.05)
+        state.set_disconnected(outage=False)
+        state.set_connected()
+        stats = state.get_outage_stats()
+        self.assertEqual(stats["outages"], 1)
+        self.assertEqual(stats["last_outage"], outage)
+        self.assertEqual(stats["current_outage"], 0)
+        self.assertTrue(stats["connected"])
+
+    def test_wait_connected(self):
+        state = ConnectionState()
+        self.assertFalse(state.wait_connected(0.01))
+        threading.Timer(0.05, state.set_connected).start()
+        self.assertTrue(state.wait_connected(2))
+        self.assertTrue(asyncio.run(state.wait_connected_async(0.01)))
+
+
+class TestMQTTReconnect(unittest.TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.is_connected.return_value = True
+        with patch("paho.mqtt.client.Client", return_value=self.client):
+            self.module = MQTT("localhost")
+        self.module.on_connect(self.client, None, None, 0)
+
+    def test_disconnect_schedules_reconnect(self):
+        with patch.object(mqtt_output, "FIRST_RECONNECT_DELAY", 10):
+            start = time.monotonic()
+            self.module.on_disconnect(self.client, None, None, 7)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(self.module.connection_state.is_connected())
+        self.assertTrue(self.module.get_connection_stats()["reconnecting"])
+        self.client.reconnect.assert_not_called()
+
+        self.module.on_connect(self.client, None, None, 0)
+        stats = self.module.get_connection_stats()
+        self.assertFalse(stats["reconnecting"])
+        self.assertEqual(stats["outages"], 1)
+        self.assertTrue(self.module.wait_for_connection(0))
+
+    def test_reconnect_restarts_network_loop(self):
+        with patch.object(mqtt_output, "FIRST_RECONNECT_DELAY", 0):
+            self.module.on_disconnect(self.client, None, None, 7)
+        deadline = time.time() + 2
+        while not self.client.loop_start.call_count > 1 and time.time() < deadline:
+            time.sleep(0.01)
+        self.client.reconnect.assert_called_once()
+        self.assertEqual(self.client.loop_start.call_count, 2)
+
+    def test_clean_disconnect_does_not_reconnect(self):
+        self.module.on_disconnect(self.client, None, None, mqtt.MQTT_ERR_SUCCESS)
+        self.assertIsNone(self.module._reconnector)
+        self.assertEqual(self.module.get_connection_stats()["outages"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
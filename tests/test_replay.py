@@ -0,0 +1,139 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(".."))
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.file import FILE
+from leaf.utility.replay import BufferReplay
+from leaf.utility.replay import ReplayCheckpoint
+from leaf.utility.replay import ReplayPolicy
+from leaf.utility.replay import build_replay_policy
+from tests.mock_output_module import MockOutputModule
+
+
+class BatchOutput(MockOutputModule):
+    """
+    Output recording the batches it is given, each call waits
+    for release to be set.
+    """
+    def __init__(self, fallback=None):
+        super().__init__(fallback=fallback)
+        self.batches = []
+        self.sending = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def transmit_many(self, messages):
+        messages = list(messages)
+        self.sending.set()
+        self.release.wait(5)
+        self.batches.append((messages[0][0], [data for _, data in messages]))
+        return True
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = MockOutputModule()
+        self.output = BatchOutput(fallback=self.store)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_build_replay_policy(self):
+        self.assertEqual(build_replay_policy({"batch_size": 10}).batch_size, 10)
+        for config in ({"batch_size": 0}, {"batch_size": 10, "max_in_flight": 5},
+                       {"window": 1}, {"fsync": "sometimes"}, True):
+            with self.assertRaises(AdapterBuildError):
+                build_replay_policy(config)
+
+    def test_batches_per_topic_in_order(self):
+        for topic, data in [("a", 0), ("b", 0), ("a", 1), ("b", 1), ("a", 2)]:
+            self.store.transmit(topic, data)
+        self.output.set_replay_policy(ReplayPolicy(batch_size=4, max_in_flight=8))
+        progress = self.output.replay_buffered()
+        self.assertEqual(self.output.batches, [("a", [0, 1]), ("b", [0, 1]), ("a", [2])])
+        self.assertEqual(self.store.messages, [])
+        self.assertEqual(progress["replayed"], 5)
+        self.assertEqual(progress["batches"], 3)
+        self.assertFalse(progress["running"])
+        self.assertEqual(self.output.get_replay_progress()["replayed"], 5)
+
+    def test_window_holds_back_reading(self):
+        for i in range(20):
+            self.store.transmit("a", i)
+        self.output.release.clear()
+        replay = BufferReplay(self.output, ReplayPolicy(batch_size=2, max_in_flight=4))
+        thread = threading.Thread(target=replay.run)
+        thread.start()
+        self.assertTrue(self.output.sending.wait(5))
+        # One batch being sent and a full window at most.
+        self.assertGreaterEqual(len(self.store.messages), 20 - 2 - 4)
+        self.output.release.set()
+        thread.join(5)
+        self.assertEqual([d for _, batch in self.output.batches for d in batch],
+                         list(range(20)))
+        self.assertLessEqual(replay.get_progress()["max_in_flight"], 4)
+
+    def test_checkpoint_resumes_interrupted_replay(self):
+        path = os.path.join(self.directory, "replay.checkpoint")
+        checkpoint = ReplayCheckpoint(path)
+        checkpoint.add(0, "a", [0])
+        checkpoint.add(1, "a", [1, 2])
+        checkpoint.ack(0)
+        checkpoint.close()
+        with open(path, "a") as f:
+            f.write('{"batch": 2, "topic"')
+        self.store.transmit("a", 3)
+
+        policy = ReplayPolicy(checkpoint=path, fsync="never")
+        progress = BufferReplay(self.output, policy).run()
+        self.assertEqual(self.output.batches, [("a", [1, 2]), ("a", [3])])
+        self.assertEqual(progress["resumed"], 2)
+        self.assertEqual(ReplayCheckpoint(path).load(), [])
+
+    def test_checkpoint_holds_batches_in_flight(self):
+        path = os.path.join(self.directory, "replay.checkpoint")
+        self.store.transmit("a", 0)
+        self.output.release.clear()
+        replay = BufferReplay(self.output, ReplayPolicy(checkpoint=path, fsync="never"))
+        thread = threading.Thread(target=replay.run)
+        thread.start()
+        self.assertTrue(self.output.sending.wait(5))
+        self.assertEqual(ReplayCheckpoint(path).load(), [("a", [0])])
+        self.output.release.set()
+        thread.join(5)
+        self.assertEqual(os.path.getsize(path), 0)
+
+    def test_stops_reading_once_disabled(self):
+        for i in range(10):
+            self.store.transmit("a", i)
+        output = self.output
+
+        def transmit_many(messages):
+            output.disable()
+            return BatchOutput.transmit_many(output, messages)
+
+        output.transmit_many = transmit_many
+        progress = BufferReplay(output, ReplayPolicy(batch_size=2, max_in_flight=2)).run()
+        sent = [d for _, batch in output.batches for d in batch]
+        self.assertEqual(sent, [0, 1])
+        self.assertEqual(sorted(sent + [d for _, d in self.store.messages]), list(range(10)))
+        self.assertEqual(progress["replayed"], 2)
+        self.assertEqual(progress["fallback"], 2)
+
+    def test_file_document_drains_topic_by_topic(self):
+        module = FILE(os.path.join(self.directory, "buffer.json"), error_holder=MagicMock())
+        module.transmit_many([("a", 0), ("b", 0), ("a", 1)])
+        self.assertEqual(list(module.pop_all_messages()), [("a", 0), ("a", 1), ("b", 0)])
+        self.assertIsNone(module.pop())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,6 +17,10 @@ from leaf.modules.output_modules.file import FILE
 from tests.mock_mqtt_client import MockBioreactorClient
 from leaf_register.metadata import MetadataManager
 from leaf.utility.running_utilities import handle_disabled_modules
+from leaf.utility.running_utilities import build_output_module
+from leaf.modules.output_modules.tee import TEE
+from leaf.error_handler.exceptions import AdapterBuildError
+from unittest.mock import patch
 from leaf.utility.logger.logger_utils import get_logger
 
 logger = get_logger(__name__, log_file="test_run_utilities.log", error_log_file="test_run_utilities_error.log")
@@ -163,5 +167,55 @@ class TestRunUtilities(unittest.TestCase):
     '''
 
 
+class TestBuildOutputModule(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        outputs = {"TEE": TEE, "FILE": FILE, "KEYDB": KEYDB}
+        patcher = patch("leaf.utility.running_utilities.get_output_adapter",
+                        side_effect=outputs.__getitem__)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_tee_outputs(self):
+        config = {"OUTPUTS": [
+            {"plugin": "TEE",
+             "outputs": ["KEYDB", {"plugin": "FILE", "queue_size": 10, "overflow": "drop"}]},
+            {"plugin": "KEYDB", "host": db_host, "fallback": "FILE"},
+            {"plugin": "FILE", "filename": os.path.join(self.temp_dir.name, "local.json")},
+        ]}
+        output = build_output_module(config, None)
+        self.assertIsInstance(output, TEE)
+        keydb, file = output.get_outputs()
+        self.assertIsInstance(keydb, KEYDB)
+        self.assertIsInstance(file, FILE)
+        self.assertIs(keydb._fallback, file)
+        self.assertEqual(output.get_fanout_stats()["FILE"]["queued"], 0)
+
+    def test_circuit_breaker(self):
+        config = {"OUTPUTS": [{"plugin": "FILE",
+                               "filename": os.path.join(self.temp_dir.name, "local.json"),
+                               "circuit_breaker": {"min_calls": 5}}]}
+        output = build_output_module(config, None)
+        self.assertEqual(output.get_circuit_breaker_stats()["state"], "closed")
+
+    def test_replay_policy(self):
+        config = {"OUTPUTS": [{"plugin": "FILE",
+                               "filename": os.path.join(self.temp_dir.name, "local.json"),
+                               "replay": {"batch_size": 100, "max_in_flight": 1000}}]}
+        output = build_output_module(config, None)
+        self.assertEqual(output._replay_policy.batch_size, 100)
+        self.assertEqual(output.replay_buffered()["replayed"], 0)
+
+    def test_tee_missing_output(self):
+        config = {"OUTPUTS": [{"plugin": "TEE", "outputs": ["FILE", "KEYDB"]},
+                              {"plugin": "FILE",
+                               "filename": os.path.join(self.temp_dir.name, "local.json")}]}
+        with self.assertRaises(AdapterBuildError):
+            build_output_module(config, None)
+
+
 if __name__ == "__main__":
     unittest.main()
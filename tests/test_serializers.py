@@ -0,0 +1,112 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(".."))
+
+import paho.mqtt.client as mqtt
+
+from leaf.error_handler.exceptions import AdapterBuildError
+from leaf.modules.output_modules.file import FILE
+from leaf.modules.output_modules.keydb import KEYDB
+from leaf.modules.output_modules.mqtt import MQTT
+from leaf.utility import serializers
+from leaf.utility.serializers import ENCODING_PROPERTY
+from leaf.utility.serializers import SERIALIZERS
+from leaf.utility.serializers import get_serializer
+from leaf.utility.serializers import serializer_from_properties
+
+measurement = {"measurement": "biolector", "tags": {"well": "A01"},
+               "fields": {"biomass": 0.03937, "ph": 460.11}, "timestamp": 1700000000}
+
+
+class TestSerializers(unittest.TestCase):
+    def test_round_trip(self):
+        for name in SERIALIZERS:
+            serializer = get_serializer(name)
+            payload = serializer.dumps(measurement)
+            self.assertIsInstance(payload, bytes if serializer.binary else str)
+            self.assertEqual(serializer.loads(payload), measurement)
+
+    def test_unknown_serializer(self):
+        with self.assertRaises(AdapterBuildError):
+            get_serializer("yaml")
+
+    def test_missing_backend(self):
+        with patch.object(serializers, "msgpack", None):
+            with self.assertRaises(AdapterBuildError):
+                get_serializer("msgpack")
+        with patch.object(serializers, "orjson", None):
+            self.assertEqual(get_serializer("fastjson").dumps({"a": 1}), '{"a": 1}')
+
+    def test_encode_strings(self):
+        self.assertEqual(get_serializer("json").encode('{"a": 1}'), '{"a": 1}')
+        msgpack = get_serializer("msgpack")
+        self.assertEqual(msgpack.loads(msgpack.encode('{"a": 1}')), {"a": 1})
+        self.assertEqual(msgpack.loads(msgpack.encode("text")), "text")
+
+    def test_serializer_from_properties(self):
+        properties = MagicMock(UserProperty=[(ENCODING_PROPERTY, "cbor")])
+        self.assertEqual(serializer_from_properties(properties).name, "cbor")
+        self.assertEqual(serializer_from_properties(None).name, "json")
+
+
+class TestOutputSerializers(unittest.TestCase):
+    def _build_mqtt(self, **kwargs):
+        client = MagicMock()
+        client.is_connected.return_value = True
+        client.publish.return_value = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS)
+        with patch("paho.mqtt.client.Client", return_value=client):
+            return MQTT("localhost", **kwargs), client
+
+    def test_mqtt_v5_announces_encoding(self):
+        module, client = self._build_mqtt(protocol="v5", serializer="msgpack")
+        module.transmit("a/b", measurement)
+        kwargs = client.publish.call_args.kwargs
+        self.assertEqual(get_serializer("msgpack").loads(kwargs["payload"]), measurement)
+        self.assertEqual(kwargs["properties"].ContentType, "application/msgpack")
+        self.assertEqual(serializer_from_properties(kwargs["properties"]).name, "msgpack")
+
+    def test_mqtt_v3_json_is_unchanged(self):
+        module, client = self._build_mqtt()
+        module.transmit("a/b", measurement)
+        kwargs = client.publish.call_args.kwargs
+        self.assertEqual(kwargs["payload"], json.dumps(measurement))
+        self.assertIsNone(kwargs["properties"])
+
+    @patch("leaf.modules.output_modules.keydb.redis.StrictRedis")
+    def test_keydb_serializer(self, mock_redis):
+        store = []
+        mock_redis.return_value.pipeline.return_value.rpush.side_effect = \
+            lambda k, v: store.append(v)
+        taken = MagicMock()
+        taken.lrange.side_effect = lambda k, start, end: store[start:end + 1]
+        taken.ltrim.side_effect = lambda k, start, end: store.__delitem__(slice(0, start))
+        mock_redis.return_value.transaction.side_effect = \
+            lambda take, *keys, value_from_callable=False: take(taken)
+
+        module = KEYDB("localhost", serializer="cbor")
+        self.assertTrue(module.transmit("key", json.dumps(measurement)))
+        self.assertIsInstance(store[0], bytes)
+        self.assertEqual(module.retrieve("key"), measurement)
+
+        module = KEYDB("localhost")
+        self.assertTrue(module.transmit("key", '{"a":1}'))
+        self.assertFalse(module.transmit("key", "not json"))
+        self.assertEqual(store, ['{"a":1}'])
+
+    def test_file_serializer(self):
+        with self.assertRaises(AdapterBuildError):
+            FILE("unused.json", serializer="msgpack")
+        with tempfile.TemporaryDirectory() as tmp:
+            module = FILE(os.path.join(tmp, "out.json"), serializer="fastjson")
+            module.transmit("a/b", measurement)
+            self.assertEqual(module.retrieve("a/b"), [measurement])
+
+
+if __name__ == "__main__":
+    unittest.main()